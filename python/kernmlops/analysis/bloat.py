@@ -7,7 +7,7 @@ from plotnine import aes, geom_point, geom_step, ggplot, labs
 def filter_process_trace(process_trace_df: pl.DataFrame) -> pl.DataFrame :
     df = process_trace_df
     # Filter just the processes
-    df = df.filter(pl.col("tgid") == pl.col("pid")).drop("collection_id")
+    df = df.filter(pl.col("tgid") == pl.col("pid")).drop("collection_id", strict=False)
 
     # Find the last name of each process
     start_df = df.sort(pl.col("ts_ns"), descending = True)
@@ -40,7 +40,7 @@ def process_trace_start_end_ts(process_trace_df: pl.DataFrame, proc_name: str, i
     return pid, start_ns, end_ns
 
 def clean_rss_pid(rss_df: pl.DataFrame, pid: int) -> pl.DataFrame:
-    df = rss_df.drop(["pid", "collection_id"]).sort(pl.col("ts_ns"))
+    df = rss_df.drop(["pid", "collection_id"], strict=False).sort(pl.col("ts_ns"))
     df = df.filter(pl.col("tgid") == pid)
     df = df.with_columns(pl.when(pl.col("member") == "MM_FILEPAGES")
                      .then(pl.col("count"))
@@ -3,6 +3,8 @@ from pathlib import Path
 from typing import cast
 
 import pexpect
+from data_import import CollectionCatalog
+from data_schema import dataset
 
 """ Collector class has helper methods to interact with kermit"""
 class Collector:
@@ -22,15 +24,21 @@ class Collector:
     @staticmethod
     def _after_run_generate_file_data() -> dict[str, list[Path]]:
         start_path : Path = Path("./data")
-        list_of_collect_id_dirs = start_path.glob("*/*/*")
-        latest_collect_id = max(list_of_collect_id_dirs, key=os.path.getctime)
-        list_of_files = latest_collect_id.glob("*.*.parquet")
+        catalogs = [CollectionCatalog(dataset_dir) for dataset_dir in start_path.iterdir() if dataset_dir.is_dir()]
+        latest = [
+            (catalog, collection_id)
+            for catalog in catalogs
+            if (collection_id := catalog.latest()) is not None
+        ]
+        if not latest:
+            return {}
+        catalog, collection_id = max(
+            latest,
+            key=lambda catalog_id: catalog_id[0].collections(prefix=catalog_id[1])["start_time_sec"][0],
+        )
         output = {}
-        for f in list_of_files:
-            index = str(f).removeprefix(str(f.parent) + "/").split(".")[0]
-            if index not in output.keys():
-                output[index] = []
-            output[index].append(f)
+        for (_, index), partition in catalog.table_paths(collection_ids=[collection_id]).items():
+            output[index] = dataset.partition_files(partition)
         return output
 
     def wait(self) -> dict[str, list[Path]]:
@@ -4,7 +4,7 @@ import polars as pl
 def filter_process_trace(process_trace_df: pl.DataFrame) -> pl.DataFrame :
     df = process_trace_df
     # Filter just the processes
-    df = df.filter(pl.col("tgid") == pl.col("pid")).drop("collection_id")
+    df = df.filter(pl.col("tgid") == pl.col("pid")).drop("collection_id", strict=False)
 
     # Find the last name of each process
     start_df = df.sort(pl.col("ts_ns"), descending = True)
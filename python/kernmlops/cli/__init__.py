@@ -1,12 +1,15 @@
 import sys
 import traceback
 from dataclasses import asdict
+from functools import partial
 from pathlib import Path
+from time import sleep
 
 import click
 import data_collection
 import data_import
 import data_schema
+import polars as pl
 import yaml
 from cli import collect
 from cli.config import KernmlopsConfig
@@ -136,16 +139,277 @@ def cli_collect_dump(input_dir: Path, benchmark_name: str | None):
     type=bool,
     help="Use matplotlib to graph data",
 )
-def cli_collect_graph(input_dir: Path, output_dir: Path | None, collection_id: str, no_trends: bool, use_matplot: bool):
+@click.option(
+    "-t",
+    "--table",
+    "tables",
+    multiple=True,
+    help="Tables to graph, defaults to all",
+    type=str,
+)
+@click.option(
+    "--time-range",
+    "time_range_us",
+    default=None,
+    nargs=2,
+    help="Only load rows in [start, end) uptime microseconds",
+    type=int,
+)
+@click.option(
+    "--tgid",
+    "tgids",
+    multiple=True,
+    help="Only load rows of these tgids",
+    type=int,
+)
+def cli_collect_graph(
+    input_dir: Path,
+    output_dir: Path | None,
+    collection_id: str,
+    no_trends: bool,
+    use_matplot: bool,
+    tables: tuple[str, ...],
+    time_range_us: tuple[int, int] | None,
+    tgids: tuple[int, ...],
+):
     """Debug tool to graph collected data."""
+    collection_id = data_import.CollectionCatalog(input_dir).resolve(collection_id)
     collection_data = data_schema.CollectionData.from_data(
         data_dir=input_dir,
         collection_id=collection_id,
         table_types=data_schema.table_types,
+        time_range_us=time_range_us,
+        tgids=list(tgids) or None,
+        tables=list(tables) or None,
     )
     collection_data.dump(output_dir=output_dir, no_trends=no_trends, use_matplot=use_matplot)
 
 
+@cli_collect.command("list")
+@click.option(
+    "-d",
+    "--input-dir",
+    "input_dir",
+    default=Path("data/curated"),
+    required=True,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-b",
+    "--benchmark",
+    "benchmark_name",
+    default=None,
+    required=False,
+    help="Benchmark to filter by",
+    type=str,
+)
+@click.option(
+    "-c",
+    "--collection-id",
+    "collection_id",
+    default=None,
+    required=False,
+    help="Collection id prefix to filter by",
+    type=str,
+)
+@click.option(
+    "--rebuild",
+    "rebuild",
+    default=False,
+    is_flag=True,
+    type=bool,
+    help="Index every collection in the dataset before listing",
+)
+def cli_collect_list(input_dir: Path, benchmark_name: str | None, collection_id: str | None, rebuild: bool):
+    """Lists collections recorded in the dataset catalog, newest first."""
+    catalog = data_import.CollectionCatalog(input_dir)
+    if rebuild:
+        print(f"indexed {catalog.rebuild()} collections")
+    with pl.Config(tbl_cols=-1, tbl_rows=-1):
+        print(catalog.collections(benchmark=benchmark_name, prefix=collection_id))
+
+
+@cli_collect.command("compact")
+@click.option(
+    "-d",
+    "--input-dir",
+    "input_dir",
+    default=Path("data/curated"),
+    required=True,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-c",
+    "--collection-id",
+    "collection_id",
+    default=None,
+    required=False,
+    help="Collection id to compact, can be a unique prefix, default is every collection",
+    type=str,
+)
+@click.option(
+    "-f",
+    "--config-file",
+    "config_file",
+    default=DEFAULT_CONFIG_FILE,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-w",
+    "--watch",
+    "watch_sec",
+    default=None,
+    type=float,
+    help="Keep compacting newly finished collections every this many seconds",
+)
+def cli_collect_compact(input_dir: Path, collection_id: str | None, config_file: Path, watch_sec: float | None):
+    """Merges each table of a collection into one file sorted by time."""
+    config = KernmlopsConfig().merge(yaml.safe_load(config_file.read_text()))
+    write_options = partial(data_collection.TableWriteOptions.from_config, config=config.collector_config)
+    collection_ids = None
+    if collection_id is not None:
+        collection_ids = [data_import.CollectionCatalog(input_dir).resolve(collection_id)]
+    while True:
+        for compacted_path in data_collection.compact_dataset(input_dir, collection_ids, write_options=write_options):
+            print(f"compacted {compacted_path}")
+        if watch_sec is None:
+            return
+        sleep(watch_sec)
+
+
+@cli_collect.command("recover")
+@click.option(
+    "-d",
+    "--input-dir",
+    "input_dir",
+    default=Path("data/curated"),
+    required=True,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-f",
+    "--config-file",
+    "config_file",
+    default=DEFAULT_CONFIG_FILE,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--all-partitions",
+    "all_partitions",
+    default=False,
+    is_flag=True,
+    type=bool,
+    help="Look for journals in every partition of the dataset instead of unfinished cataloged collections",
+)
+def cli_collect_recover(input_dir: Path, config_file: Path, all_partitions: bool):
+    """Finishes the tables of collections that were interrupted, running collections are left alone."""
+    config = KernmlopsConfig().merge(yaml.safe_load(config_file.read_text()))
+    write_options = partial(data_collection.TableWriteOptions.from_config, config=config.collector_config)
+    catalog = None if all_partitions else data_import.CollectionCatalog(input_dir)
+    recovered = data_collection.recover_partial_tables(input_dir, write_options=write_options, catalog=catalog)
+    print(f"recovered {len(recovered)} tables")
+
+
+@cli_collect.command("bench-output")
+@click.option(
+    "-d",
+    "--input-dir",
+    "input_dir",
+    default=Path("data/curated"),
+    required=True,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-c",
+    "--collection-id",
+    "collection_id",
+    required=True,
+    help="Collection whose tables are rewritten",
+    type=str,
+)
+@click.option(
+    "-f",
+    "--config-file",
+    "config_file",
+    default=DEFAULT_CONFIG_FILE,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-n",
+    "--trials",
+    "trials",
+    default=3,
+    type=int,
+    help="Writes per table, the fastest is reported",
+)
+def cli_collect_bench_output(input_dir: Path, collection_id: str, config_file: Path, trials: int):
+    """Compares bytes per event and write throughput of configured table output to polars defaults."""
+    config = KernmlopsConfig().merge(yaml.safe_load(config_file.read_text()))
+    tables = dict[str, pl.DataFrame]()
+    for table_name in data_schema.dataset.table_names(input_dir):
+        for partition in data_schema.dataset.table_partitions(input_dir, table_name, collection_ids=[collection_id]):
+            tables[table_name] = pl.read_parquet(data_schema.dataset.partition_files(partition))
+    results = data_collection.benchmark_table_writes(
+        tables,
+        config.collector_config,
+        trials=trials,
+    )
+    total_default_bytes = 0
+    total_configured_bytes = 0
+    for default, configured in results:
+        total_default_bytes += default.bytes
+        total_configured_bytes += configured.bytes
+        print(
+            f"{configured.table_name}: {configured.rows} events, "
+            f"{default.bytes_per_event():.2f} -> {configured.bytes_per_event():.2f} bytes/event, "
+            f"{default.mb_per_sec():.1f} -> {configured.mb_per_sec():.1f} MB/s, "
+            f"{default.rows_per_sec():.0f} -> {configured.rows_per_sec():.0f} events/s"
+        )
+        for column, encoded_bytes in sorted(configured.encoded_bytes.items(), key=lambda item: -item[1]):
+            print(f"  {column}: {default.encoded_bytes.get(column, 0)} -> {encoded_bytes} bytes")
+    print(f"total: {total_default_bytes} -> {total_configured_bytes} bytes")
+
+
+@cli_collect.command("bench-pmu")
+@click.option(
+    "-r",
+    "--rows",
+    "rows",
+    default=5_000_000,
+    type=int,
+    help="Synthetic pmu readings to convert",
+)
+@click.option(
+    "-p",
+    "--cpus",
+    "cpus",
+    default=192,
+    type=int,
+)
+@click.option(
+    "-n",
+    "--trials",
+    "trials",
+    default=3,
+    type=int,
+    help="Conversions per implementation, the fastest is reported",
+)
+def cli_collect_bench_pmu(rows: int, cpus: int, trials: int):
+    """Compares per cpu and single plan conversion of cumulative pmu readings into deltas."""
+    result = data_schema.perf.benchmark_cumulative_pma(
+        data_schema.perf.synthetic_pmu_table(rows, cpus),
+        trials=trials,
+    )
+    print(
+        f"{result.rows} readings over {result.cpus} cpus: "
+        f"per cpu {result.by_cpu_sec:.3f}s, single plan {result.single_plan_sec:.3f}s, "
+        f"{result.speedup():.2f}x, results {'match' if result.equal else 'differ'}"
+    )
+
+
 @cli_collect.command("perf-list")
 def cli_collect_perf():
     """Lists perf counter names for use in supporting new computers."""
@@ -1,14 +1,18 @@
 import os
 import signal
 import sys
+import traceback
+from collections.abc import Callable, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from pathlib import Path
+from functools import partial
 from queue import Queue
 from threading import Event, Lock, Thread
-from time import sleep
+from time import sleep, time
 from typing import cast
 
 import data_collection
+import data_import
 import data_schema
 import polars as pl
 from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
@@ -33,13 +37,18 @@ def poll_instrumentation(
   queue: Queue,
   run_event: Event,
   poll_rate: float = .5,
+  hook_sample_intervals: Mapping[str, float] | None = None,
 ) -> int:
 
+    poller = data_collection.HookPoller(
+        bpf_programs,
+        sample_interval=poll_rate,
+        hook_sample_intervals=hook_sample_intervals,
+    )
+    poller.start()
     return_code = None
-    while return_code is None and run_event.is_set():
+    while return_code is None and run_event.is_set() and not poller.failed():
         try:
-            for bpf_program in bpf_programs:
-                bpf_program.poll()
             if poll_rate > 0:
                 sleep(poll_rate)
             return_code = benchmark.poll()
@@ -50,13 +59,13 @@ def poll_instrumentation(
     if not run_event.is_set():
         benchmark.kill()
         return_code = 0 if benchmark.name() == "faux" else 1
+    elif poller.failed() and return_code is None:
+        # the collection would silently miss the events of the hook that failed
+        benchmark.kill()
+        return_code = 1
 
-    # Poll again to clean out all buffers
-    for bpf_program in bpf_programs:
-        try:
-            bpf_program.poll()
-        except Exception:
-            pass
+    # Stop polling threads, this drains all buffers one last time
+    poller.stop()
     return_code = return_code if return_code is not None else 1
     queue.put(return_code)
     return return_code
@@ -64,35 +73,101 @@ def poll_instrumentation(
 def signal_handler_factory(event: Event):
     return lambda x,y: event.clear()
 
-def output_collections_to_file(collection_id: str, collection_tables : list[data_schema.CollectionTable], bpf_programs: list[BPFProgram], name: str,
-                               benchmark_name: str, verbose: bool, output_dir: Path, ids: tuple[int,int] | None = None):
-    for bpf_program in bpf_programs:
-        collection_tables.extend(bpf_program.pop_data())
-    for collection_table in collection_tables:
+def run_each(calls: list[Callable[[], None]]):
+    """Runs every call even if an earlier one raised, failures are raised chained once all of them ran."""
+    if not calls:
+        return
+    try:
+        calls[0]()
+    finally:
+        run_each(calls[1:])
+
+def swap_collection_data(collection_id: str, bpf_programs: list[BPFProgram],
+                         table_builders: list[Callable[[], list[data_schema.CollectionTable]]],
+                         loss_tracker: data_collection.EventLossTracker | None = None):
+    # one failing hook must not drop the builders of the others, callers still build the builders
+    # added before a failure is raised, perf rate builders hold tickets that later flushes wait on
+    if loss_tracker is not None:
+        loss_tables = loss_tracker.pop_data(collection_id)
+        table_builders.append(lambda: loss_tables)
+    run_each([
+        lambda bpf_program=bpf_program: table_builders.append(bpf_program.swap_data())
+        for bpf_program in bpf_programs
+    ])
+
+def build_collection_tables(collection_tables: list[data_schema.CollectionTable],
+                            table_builders: list[Callable[[], list[data_schema.CollectionTable]]],
+                            verbose: bool):
+    # every builder has to run even if an earlier one failed
+    run_each([
+        lambda build_tables=build_tables: collection_tables.extend(build_tables())
+        for build_tables in table_builders
+    ])
+    if verbose:
         with pl.Config(tbl_cols=-1):
-            if verbose:
+            for collection_table in collection_tables:
                 print(f"{collection_table.name()}: {collection_table.table}")
-        full_path = Path(output_dir/benchmark_name/collection_id/f"{collection_table.name()}.{name}.parquet")
-        collection_table.table.write_parquet(full_path)
-        if ids is not None:
-            os.chown(full_path, ids[0], ids[1])
     return collection_tables
 
-def output_data_thread(collection_id: str, bpf_programs: list[BPFProgram], benchmark_name: str, run_event: Event,
-                       verbose: bool, output_dir: Path, lock: Lock, ended: bool, output_interval: int | float, user_id: int, group_id: int):
-    num : int = 0
+def write_collection_tables(collection_tables: list[data_schema.CollectionTable],
+                            table_builders: list[Callable[[], list[data_schema.CollectionTable]]],
+                            writer: data_collection.TableStreamWriter, verbose: bool):
+    try:
+        build_collection_tables(collection_tables, table_builders, verbose)
+    finally:
+        for collection_table in collection_tables:
+            writer.write(collection_table)
+    return collection_tables
+
+def output_collections_to_file(collection_id: str, collection_tables : list[data_schema.CollectionTable], bpf_programs: list[BPFProgram],
+                               writer: data_collection.TableStreamWriter, verbose: bool,
+                               loss_tracker: data_collection.EventLossTracker | None = None):
+    table_builders = list[Callable[[], list[data_schema.CollectionTable]]]()
+    try:
+        swap_collection_data(collection_id, bpf_programs, table_builders, loss_tracker)
+    finally:
+        write_collection_tables(collection_tables, table_builders, writer, verbose)
+    return collection_tables
+
+def flush_collections_to_file(flush_ticket: int,
+                              table_builders: list[Callable[[], list[data_schema.CollectionTable]]],
+                              writer: data_collection.TableStreamWriter, verbose: bool):
+    collection_tables = list[data_schema.CollectionTable]()
+    try:
+        build_collection_tables(collection_tables, table_builders, verbose)
+    finally:
+        # later flushes wait on this ticket, so it is written even if building failed
+        writer.write_flush(flush_ticket, collection_tables)
+
+def report_flush_failure(flush: Future[None]):
+    # the flush pool keeps exceptions in the future, nothing else waits on it
+    error = flush.exception()
+    if error is not None:
+        # TODO(Patrick): use logging
+        print(f"warning: could not flush collection tables: {error}")
+        traceback.print_exception(error)
+
+def output_data_thread(collection_id: str, bpf_programs: list[BPFProgram], run_event: Event,
+                       verbose: bool, writer: data_collection.TableStreamWriter, lock: Lock, ended: bool, output_interval: int | float,
+                       loss_tracker: data_collection.EventLossTracker, flush_pool: ThreadPoolExecutor):
     sleep(output_interval)
     while run_event.is_set():
         lock.acquire()
         try:
-            if(ended):
+            if(ended or not run_event.is_set()):
                 lock.release()
                 return
-            output_collections_to_file(collection_id, [], bpf_programs, str(num), benchmark_name, verbose, output_dir, (user_id, group_id))
+            # only the swap happens under the lock, building and writing tables runs on the flush pool
+            table_builders = list[Callable[[], list[data_schema.CollectionTable]]]()
+            try:
+                swap_collection_data(collection_id, bpf_programs, table_builders, loss_tracker)
+            finally:
+                flush = flush_pool.submit(flush_collections_to_file, writer.take_flush_ticket(), table_builders,
+                                          writer, verbose)
+                flush.add_done_callback(report_flush_failure)
         except Exception as e:
             print(e)
         lock.release()
-        num += 1
         sleep(output_interval)
 
 def run_collect(
@@ -106,21 +181,37 @@ def run_collect(
     benchmark.setup()
 
     generic_config = cast(data_collection.GenericCollectorConfig, getattr(collector_config, "generic"))
-    bpf_programs = generic_config.get_hooks()
+    bpf_programs = generic_config.get_hooks(collector_config)
     system_info = data_collection.machine_info().to_polars()
     system_info = system_info.unnest(system_info.columns)
     collection_id = system_info["collection_id"][0]
     output_dir = generic_config.get_output_dir() / "curated" if bpf_programs else generic_config.get_output_dir() / "baseline"
+    loss_tracker = data_collection.EventLossTracker(bpf_programs)
+    (user_id, group_id) = get_user_group_ids()
+    write_options = partial(data_collection.TableWriteOptions.from_config, config=generic_config)
+    # surface bad overrides before the benchmark runs rather than when its tables are written
+    for table_name in generic_config.table_write_options:
+        write_options(table_name)
     queue = Queue(maxsize=1)
     run_event = Event()
     run_event.set()
 
-    for bpf_program in bpf_programs:
-        bpf_program.load(collection_id)
-        if verbose:
-            print(f"{bpf_program.name()} BPF program loaded")
+    load_start = time()
+    # hooks open the target map the tracker pins, so it is loaded first and closed last
+    target_tracker = data_collection.bpf.TargetTracker.from_config(collector_config)
+    target_tracker.load()
+    try:
+        load_times = data_collection.load_hooks(bpf_programs, collection_id, workers=generic_config.load_workers)
+    except BaseException:
+        target_tracker.close()
+        raise
     if verbose:
-        print("Finished loading BPF programs")
+        for load_time in load_times:
+            print(
+                f"{load_time.name} BPF program loaded, "
+                f"prepared in {load_time.prepare_sec:.2f}s and attached in {load_time.load_sec:.2f}s"
+            )
+        print(f"Finished loading BPF programs in {time() - load_start:.2f}s")
 
     # Configure signal capture
     signal.signal(signal.SIGINT, signal_handler_factory(run_event))
@@ -133,7 +224,8 @@ def run_collect(
     read_thread.start()
 
     # Create polling thread
-    poll_thread = Thread(target = poll_instrumentation, args = (benchmark, bpf_programs, queue, run_event, generic_config.poll_rate))
+    poll_thread = Thread(target = poll_instrumentation, args = (benchmark, bpf_programs, queue, run_event, generic_config.poll_rate,
+                                                              generic_config.hook_sample_intervals))
     poll_thread.start()
 
     # Create output thread
@@ -143,15 +235,28 @@ def run_collect(
         output_interval = output_interval_parse
     ended = False
     output_lock = Lock()
-    (user_id, group_id) = get_user_group_ids()
-    Path(output_dir/benchmark.name()/collection_id).mkdir(parents=True, exist_ok=True)
+    flush_pool = ThreadPoolExecutor(max_workers=generic_config.flush_workers, thread_name_prefix="flush")
+    output_dir.mkdir(parents=True, exist_ok=True)
     os.chown(generic_config.get_output_dir(), user_id, group_id)
     os.chown(output_dir, user_id, group_id)
-    os.chown(Path(output_dir/benchmark.name()), user_id, group_id)
-    os.chown(Path(output_dir/benchmark.name()/collection_id), user_id, group_id)
-    output_thread = Thread(target = output_data_thread, args = (collection_id, bpf_programs, benchmark.name(),
-                                                                run_event, generic_config.output_dfs, output_dir,
-                                                                output_lock, ended, output_interval, user_id, group_id))
+    catalog = data_import.CollectionCatalog(output_dir)
+    # tables of collections that crashed are still journals, the catalog lists the unfinished ones
+    data_collection.recover_partial_tables(output_dir, (user_id, group_id), write_options, catalog)
+    catalog.start_collection(
+        collection_id=collection_id,
+        benchmark=benchmark.name(),
+        hooks=[hook.name() for hook in bpf_programs],
+        hostname=system_info["hostname"][0],
+        kernel_version=system_info["kernel_version"][0],
+        start_time_sec=time(),
+    )
+    os.chown(catalog.path, user_id, group_id)
+    # tables land in output_dir/table=<name>/benchmark=<name>/collection_id=<id>/
+    writer = data_collection.TableStreamWriter(output_dir, benchmark.name(), collection_id, (user_id, group_id),
+                                               write_options, catalog)
+    output_thread = Thread(target = output_data_thread, args = (collection_id, bpf_programs, run_event,
+                                                                generic_config.output_dfs, writer, output_lock, ended,
+                                                                output_interval, loss_tracker, flush_pool))
     output_thread.daemon = True
     output_thread.start()
 
@@ -165,12 +270,29 @@ def run_collect(
 
     collection_time_sec = (datetime.now() - tick).total_seconds()
     poll_thread.join()
+    # event counters live in the BPF programs so the last interval is read before closing them
+    output_lock.acquire()
+    loss_tables = loss_tracker.pop_data(collection_id)
+    output_lock.release()
     for bpf_program in bpf_programs:
         bpf_program.close()
+    target_tracker.close()
 
     if verbose:
         print(f"Benchmark ran for {collection_time_sec}s")
 
+    event_loss_rate = loss_tracker.loss_rate()
+    event_loss_exceeded = event_loss_rate > generic_config.max_event_loss_rate
+    if event_loss_exceeded:
+        # TODO(Patrick): use logging
+        print(
+            f"warning: lost {loss_tracker.lost_events} of "
+            f"{loss_tracker.submitted_events + loss_tracker.lost_events} events "
+            f"({event_loss_rate:.2%}), above max_event_loss_rate {generic_config.max_event_loss_rate:.2%}"
+        )
+        if generic_config.reject_lossy_collections and return_code == 0:
+            return_code = 1
+
     collection_tables: list[data_schema.CollectionTable] = [
         data_schema.SystemInfoTable.from_df(
             system_info.with_columns([
@@ -178,16 +300,34 @@ def run_collect(
                 pl.lit(os.getpid()).alias("collection_pid"),
                 pl.lit(benchmark.name()).alias("benchmark_name"),
                 pl.lit([hook.name() for hook in bpf_programs]).cast(pl.List(pl.String())).alias("hooks"),
+                pl.lit(loss_tracker.submitted_events).alias("submitted_events"),
+                pl.lit(loss_tracker.lost_events).alias("lost_events"),
+                pl.lit(event_loss_rate).alias("event_loss_rate"),
+                pl.lit(event_loss_exceeded).alias("event_loss_exceeded"),
             ])
         )
-    ]
+    ] + loss_tables
 
     output_lock.acquire()
     ended = True
-    collection_tables = output_collections_to_file(collection_id, collection_tables, bpf_programs, "end",
-                                                   benchmark.name(), generic_config.output_dfs, output_dir,
-                                                   (user_id, group_id))
+    # stops the output thread from submitting flushes once the pool shuts down
+    run_event.clear()
     output_lock.release()
+    # wait for interval flushes still being written so the last rows are appended after them
+    flush_pool.shutdown(wait=True)
+    try:
+        collection_tables = output_collections_to_file(collection_id, collection_tables, bpf_programs, writer,
+                                                       generic_config.output_dfs)
+    finally:
+        # the tables of hooks that did not fail are kept even if the last flush of another one raised
+        writer.close()
+        catalog.finish_collection(
+            collection_id,
+            collection_time_sec=collection_time_sec,
+            submitted_events=loss_tracker.submitted_events,
+            lost_events=loss_tracker.lost_events,
+            event_loss_rate=event_loss_rate,
+        )
     collection_data = data_schema.CollectionData.from_tables(collection_tables)
 
     if generic_config.output_graphs:
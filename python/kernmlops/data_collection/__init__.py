@@ -1,26 +1,72 @@
 from dataclasses import dataclass, field, make_dataclass
 from pathlib import Path
+from typing import Any, Literal
 
 from data_collection import bpf_instrumentation as bpf
+from data_collection.compaction import compact_dataset
+from data_collection.event_loss import EventLossTracker
+from data_collection.hook_loader import HookLoadTime, load_hooks
+from data_collection.hook_poller import HookPoller
 from data_collection.system_info import machine_info
+from data_collection.table_writer import TableStreamWriter, recover_partial_tables
+from data_collection.write_options import TableWriteOptions, benchmark_table_writes
 from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
 class GenericCollectorConfig(ConfigBase):
     poll_rate: float = 0.5
+    # seconds between polls of a hook, hooks not listed use poll_rate and event hooks wake on events
+    hook_sample_intervals: dict[str, float] = field(default_factory=dict)
     output_interval: str = "1m"
     output_dir: str = "data"
     output_dfs: bool = False
+    # parquet layout of every table, table_write_options overrides these per table with the same keys
+    # e.g. {"quanta_runtime": {"compression": "lz4", "delta_columns": ["ts_uptime_us"]}}
+    output_compression: Literal["none", "snappy", "gzip", "brotli", "lz4", "zstd"] = "zstd"
+    output_compression_level: int | None = None
+    # null dictionary encodes every column without an explicit encoding, a list restricts it to those
+    output_dictionary_columns: list[str] | None = None
+    output_delta_columns: list[str] = field(
+        default_factory=lambda: ["ts_uptime_us", "start_ts_ns", "end_ts_ns", "finish_ts_uptime_us"]
+    )
+    output_byte_stream_split_columns: list[str] = field(default_factory=list)
+    output_statistics: bool = True
+    table_write_options: dict[str, dict[str, Any]] = field(default_factory=dict)
+    # threads that build and write interval tables so flushing never stalls event draining
+    flush_workers: int = 2
+    # threads that prepare hooks at start up, 1 prepares them one after another; concurrent
+    # BCC compiles share LLVM state and are not known to be safe, raise it only for prebuilt objects
+    load_workers: int = 1
     output_graphs: bool = False
     hooks: list[str] = field(default_factory=bpf.hook_names)
+    # ring buffers fall back to perf buffers on kernels older than 5.8
+    event_transport: Literal["perf_buffer", "ring_buffer"] = "ring_buffer"
+    hook_event_transports: dict[str, str] = field(default_factory=dict)
+    ring_buffer_pages: int = 1024
+    # hooks with an object built by `make bpf-objects` load it with libbpf instead of compiling with BCC
+    prebuilt_bpf_objects: bool = True
+    # collections that drop more than this fraction of events are flagged in system_info
+    max_event_loss_rate: float = 0.01
+    reject_lossy_collections: bool = False
+    # hooks listed here aggregate latencies into in kernel histograms instead of streaming events
+    histogram_hooks: list[str] = field(default_factory=list)
+    histogram_scale: Literal["log2", "linear"] = "log2"
+    histogram_linear_step_us: int = 100
+    histogram_linear_buckets: int = 64
+    # processes whose events hooks with a kernel side filter keep: all, benchmark (what the collector
+    # starts), cgroup (target_cgroup under /sys/fs/cgroup) or pids (target_pids), descendants are
+    # tracked as they fork and the collector itself is always left out
+    target: Literal["all", "benchmark", "cgroup", "pids"] = "all"
+    target_cgroup: str = ""
+    target_pids: list[int] = field(default_factory=list)
 
     def get_output_dir(self) -> Path:
         return Path(self.output_dir)
 
-    def get_hooks(self) -> list[bpf.BPFProgram]:
+    def get_hooks(self, collector_config: ConfigBase) -> list[bpf.BPFProgram]:
         return [
-            hook()
+            hook.from_config(collector_config)
             for hook_name, hook in bpf.all_hooks.items()
             if hook_name in self.hooks
         ]
@@ -35,6 +81,10 @@ CollectorConfig = make_dataclass(
             GenericCollectorConfig,
             field(default=GenericCollectorConfig()),
         )
+    ] + [
+        (name, ConfigBase, field(default=hook_config))
+        for name, hook in bpf.all_hooks.items()
+        if (hook_config := hook.default_config()) is not None
     ],
     frozen=True,
 )
@@ -43,6 +93,15 @@ CollectorConfig = make_dataclass(
 __all__ = [
     "bpf",
     "machine_info",
+    "EventLossTracker",
+    "HookLoadTime",
+    "HookPoller",
+    "load_hooks",
+    "TableStreamWriter",
+    "recover_partial_tables",
+    "TableWriteOptions",
+    "compact_dataset",
+    "benchmark_table_writes",
     "CollectorConfig",
     "GenericCollectorConfig",
 ]
@@ -32,6 +32,7 @@ from data_collection.bpf_instrumentation.quanta_runtime_hook import QuantaRuntim
 from data_collection.bpf_instrumentation.scheduler_core import (
     SchedulerCoreBPFHook,
 )
+from data_collection.bpf_instrumentation.target_filter import TargetTracker
 from data_collection.bpf_instrumentation.unmap_range import UnmapRangeBPFHook
 from data_collection.bpf_instrumentation.zswap_runtime_hook import ZswapRuntimeBPFHook
 
@@ -63,4 +64,5 @@ __all__ = [
     "BPFProgram",
     "CustomHWConfigManager",
     "QuantaRuntimeBPFHook",
+    "TargetTracker",
 ]
@@ -1,37 +1,32 @@
-from dataclasses import dataclass
+import time
+from collections.abc import Callable
 from pathlib import Path
 from typing import cast
 
 import polars as pl
 from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import ColumnarAccumulator
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.histogram import (
+  HISTOGRAM_SLOTS,
+  HistogramAggregation,
+)
+from data_collection.bpf_instrumentation.raw_events import RawEventArena, struct_dtype
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import UPTIME_TIMESTAMP, CollectionTable
-from data_schema.block_io import BlockIOLatencyTable, BlockIOQueueTable, BlockIOTable
-
-
-@dataclass(frozen=True)
-class BlockIOQueueData:
-  cpu: int
-  device: int
-  sector: int
-  segments: int
-  block_io_bytes: int
-  block_io_start_uptime_us: int
-  block_io_flags: int
-  queue_length_segment_ios: int
-  queue_length_4k_ios: int
-
-@dataclass(frozen=True)
-class BlockIOLatencyData:
-  cpu: int
-  device: int
-  sector: int
-  segments: int
-  block_io_bytes: int
-  block_io_end_uptime_us: int
-  block_latency_us: int
-  block_io_latency_us: int
-  block_io_flags: int
+from data_schema.block_io import (
+  BlockIOLatencyHistogramTable,
+  BlockIOLatencyTable,
+  BlockIOQueueTable,
+  BlockIOTable,
+)
+from kernmlops_config import ConfigBase
+
 
 class BlockIOBPFHook(BPFProgram):
 
@@ -39,8 +34,25 @@ class BlockIOBPFHook(BPFProgram):
   def name(cls) -> str:
     return "block_io"
 
-  def __init__(self):
-    bpf_text = open(Path(__file__).parent / "bpf/blk_io.bpf.c", "r").read()
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "BlockIOBPFHook":
+    return BlockIOBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      histograms=HistogramAggregation.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(
+      self,
+      transport: EventTransport | None = None,
+      histograms: HistogramAggregation | None = None,
+      target_filter: TargetFilter | None = None,
+  ):
+    self.transport = transport or EventTransport()
+    self.histograms = histograms or HistogramAggregation()
+    self.target_filter = target_filter or TargetFilter()
+    bpf_source = Path(__file__).parent / "bpf/blk_io.bpf.c"
+    bpf_text = open(bpf_source, "r").read()
 
     # code substitutions
     if BPF.kernel_struct_has_field(b'request', b'rq_disk') == 1:
@@ -48,88 +60,145 @@ class BlockIOBPFHook(BPFProgram):
     else:
         bpf_text = bpf_text.replace('__RQ_DISK__', 'q->disk')
     self.bpf_text = bpf_text
-    self.block_io_queue_data = list[BlockIOQueueData]()
-    self.block_io_latency_data = list[BlockIOLatencyData]()
+    # u64 sectors of -1 are decoded as signed, see RawEventArena
+    self.block_io_queue_data = RawEventArena(
+      struct_dtype(bpf_source, "block_io_start_perf_event_t"),
+      {
+        "cpu": "cpu",
+        "device": "device",
+        "sector": "sector",
+        "segments": "segments",
+        "block_io_bytes": "block_io_bytes",
+        UPTIME_TIMESTAMP: "block_io_start_uptime_us",
+        "block_io_flags": "block_io_flags",
+        "queue_length_segment_ios": "queue_length_segments",
+        "queue_length_4k_ios": "queue_length_4ks",
+      },
+    )
+    self.block_io_latency_data = RawEventArena(
+      struct_dtype(bpf_source, "block_io_end_perf_event_t"),
+      {
+        "cpu": "cpu",
+        "device": "device",
+        "sector": "sector",
+        "segments": "segments",
+        "block_io_bytes": "block_io_bytes",
+        UPTIME_TIMESTAMP: "block_io_end_uptime_us",
+        "block_latency_us": "block_latency_us",
+        "block_io_latency_us": "block_io_latency_us",
+        "block_io_flags": "block_io_flags",
+      },
+    )
+    self.block_io_histogram_data = ColumnarAccumulator.for_table(BlockIOLatencyHistogramTable)
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.histograms.core_settings() | self.target_filter.core_settings(),
+      max_entries={
+        "block_latency_histogram": self.histograms.max_entries,
+        "block_io_latency_histogram": self.histograms.max_entries,
+      } | self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      key_structs={
+        "block_latency_histogram": "block_io_histogram_key",
+        "block_io_latency_histogram": "block_io_histogram_key",
+      },
+    ) or self.transport.compile(
+      TARGET_FILTER + HISTOGRAM_SLOTS + self.bpf_text,
+      cflags=self.histograms.cflags() + self.target_filter.cflags(),
+    )
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
-    self.bpf["block_io_starts"].open_perf_buffer(self._queue_event_handler, page_cnt=64)
-    self.bpf["block_io_ends"].open_perf_buffer(self._latency_event_handler, page_cnt=64)
+    if self.histograms.enabled:
+      return
+    self.transport.open(self.bpf, "block_io_starts", self._queue_event_handler, page_cnt=64)
+    self.transport.open(self.bpf, "block_io_ends", self._latency_event_handler, page_cnt=64)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    return not self.histograms.enabled
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    if self.histograms.enabled:
+      self._poll_histograms()
+    else:
+      self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(self, latency_df: pl.DataFrame, queue_df: pl.DataFrame) -> list[CollectionTable]:
     return list[CollectionTable]([
       BlockIOTable.from_tables(
         latency_table=cast(
           BlockIOLatencyTable,
-          BlockIOLatencyTable.from_df_id(
-            pl.DataFrame(self.block_io_latency_data).rename({
-              "block_io_end_uptime_us": UPTIME_TIMESTAMP,
-            }),
-            collection_id=self.collection_id,
-          ),
+          BlockIOLatencyTable.from_df_id(latency_df, collection_id=self.collection_id),
         ),
         queue_table=cast(
           BlockIOQueueTable,
-          BlockIOQueueTable.from_df_id(
-            pl.DataFrame(self.block_io_queue_data).rename({
-              "block_io_start_uptime_us": UPTIME_TIMESTAMP,
-            }),
-            collection_id=self.collection_id,
-          ),
+          BlockIOQueueTable.from_df_id(queue_df, collection_id=self.collection_id),
         ),
       ),
     ])
 
+  def _histogram_tables(self, histogram_df: pl.DataFrame) -> list[CollectionTable]:
+    return [
+      BlockIOLatencyHistogramTable.from_df_id(histogram_df, collection_id=self.collection_id),
+    ]
+
+  def data(self) -> list[CollectionTable]:
+    if self.histograms.enabled:
+      return self._histogram_tables(self.block_io_histogram_data.to_df())
+    return self._tables(self.block_io_latency_data.to_df(), self.block_io_queue_data.to_df())
+
   def clear(self):
     self.block_io_queue_data.clear()
     self.block_io_latency_data.clear()
+    self.block_io_histogram_data.clear()
+
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    if self.histograms.enabled:
+      histogram_df = self.block_io_histogram_data.swap()
+      return lambda: self._histogram_tables(histogram_df())
+    latency_df = self.block_io_latency_data.swap()
+    queue_df = self.block_io_queue_data.swap()
+    return lambda: self._tables(latency_df(), queue_df())
 
   def pop_data(self) -> list[CollectionTable]:
-    block_io_tables = self.data()
-    self.clear()
-    return block_io_tables
+    return self.swap_data()()
+
+  def _poll_histograms(self):
+    ts_uptime_us = int(time.clock_gettime_ns(time.CLOCK_BOOTTIME) / 1000)
+    # both latencies share a row per device, operation and bucket, summed over cpus
+    bucket_counts = dict[tuple[int, int, int], list[int]]()
+    for latency_index, histogram_name in enumerate(
+      ("block_latency_histogram", "block_io_latency_histogram")
+    ):
+      for key, counts in self.histograms.pop_counts(self.bpf[histogram_name]):
+        bucket = bucket_counts.setdefault((key.device, key.op, key.slot), [0, 0])
+        bucket[latency_index] += sum(counts)
+    for (device, op, slot), (block_latency_count, block_io_latency_count) in sorted(
+      bucket_counts.items()
+    ):
+      bucket_low_us, bucket_high_us = self.histograms.bucket_bounds(slot)
+      self.block_io_histogram_data.append(
+        device,
+        op,
+        ts_uptime_us,
+        slot,
+        bucket_low_us,
+        bucket_high_us,
+        block_latency_count,
+        block_io_latency_count,
+      )
 
   def _queue_event_handler(self, cpu, block_io_start_perf_event, size):
-    event = self.bpf["block_io_starts"].event(block_io_start_perf_event)
-    sector = event.sector
-    if sector == 18446744073709551615: # this is -1 in a u64
-      sector = -1
-    self.block_io_queue_data.append(
-      BlockIOQueueData(
-        cpu=cpu,
-        device=event.device,
-        sector=sector,
-        segments=event.segments,
-        block_io_bytes=event.block_io_bytes,
-        block_io_start_uptime_us=event.block_io_start_uptime_us,
-        block_io_flags=event.block_io_flags,
-        queue_length_segment_ios=event.queue_length_segments,
-        queue_length_4k_ios=event.queue_length_4ks,
-      )
-    )
+    self.block_io_queue_data.append(block_io_start_perf_event, size)
 
   def _latency_event_handler(self, cpu, block_io_end_perf_event, size):
-    event = self.bpf["block_io_ends"].event(block_io_end_perf_event)
-    sector = event.sector
-    if sector == 18446744073709551615: # this is -1 in a u64
-      sector = -1
-    self.block_io_latency_data.append(
-      BlockIOLatencyData(
-        cpu=cpu,
-        device=event.device,
-        sector=sector,
-        segments=event.segments,
-        block_io_bytes=event.block_io_bytes,
-        block_io_end_uptime_us=event.block_io_end_uptime_us,
-        block_latency_us=event.block_latency_us,
-        block_io_latency_us=event.block_io_latency_us,
-        block_io_flags=event.block_io_flags,
-      )
-    )
+    self.block_io_latency_data.append(block_io_end_perf_event, size)
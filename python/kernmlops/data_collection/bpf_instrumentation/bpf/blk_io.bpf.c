@@ -9,6 +9,7 @@
 #include <uapi/linux/ptrace.h>
 
 typedef struct block_io_start_perf_event {
+  u32 cpu;
   u32 device;
   u64 sector;
   u32 segments;
@@ -20,6 +21,7 @@ typedef struct block_io_start_perf_event {
 } block_io_start_perf_event_t;
 
 typedef struct block_io_end_perf_event {
+  u32 cpu;
   u32 device;
   u64 sector;
   u32 segments;
@@ -35,6 +37,12 @@ struct queue_lengths {
   int queue_length_4ks;
 };
 
+typedef struct block_io_histogram_key {
+  u32 device;
+  u32 op;
+  u32 slot;
+} block_io_histogram_key_t;
+
 struct start_key {
   u32 dev;
   u64 sector;
@@ -44,8 +52,18 @@ BPF_HASH(device_queue, u32, struct queue_lengths);
 // we maintain started_4k_ios separately so we can manage scenarios where there is
 // existing outstanding io for a device when this BPF program is installed
 BPF_HASH(started_4k_ios, struct start_key, u32, 1024);
+// ios issued by processes the collection does not target, their completion is dropped as well
+BPF_HASH(filtered_ios, struct start_key, u8, 1024);
+#if AGGREGATE_HISTOGRAMS
+BPF_PERCPU_HASH(block_latency_histogram, block_io_histogram_key_t, u64, HISTOGRAM_MAX_ENTRIES);
+BPF_PERCPU_HASH(block_io_latency_histogram, block_io_histogram_key_t, u64, HISTOGRAM_MAX_ENTRIES);
+#elif USE_RINGBUF
+BPF_RINGBUF_OUTPUT(block_io_starts, RINGBUF_PAGES);
+BPF_RINGBUF_OUTPUT(block_io_ends, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(block_io_starts);
 BPF_PERF_OUTPUT(block_io_ends);
+#endif
 
 static dev_t ddevt(struct gendisk* disk) {
   return (disk->major << 20) | disk->first_minor;
@@ -104,23 +122,71 @@ RAW_TRACEPOINT_PROBE(block_rq_issue) {
   int queue_length_4ks = q_lengths->queue_length_4ks;
   int queue_length_segments = q_lengths->queue_length_segments;
 
+  // requests are issued in the context of the task that submitted them unless they were queued,
+  // the queue lengths above still count every io of the device
+  if (target_filtered(bpf_get_current_pid_tgid() >> 32)) {
+    u8 filtered = 1;
+    filtered_ios.update(&start, &filtered);
+    return 0;
+  }
+
+#if !AGGREGATE_HISTOGRAMS
   // store io data
-  struct block_io_start_perf_event data;
-  __builtin_memset(&data, 0, sizeof(data));
-  data.device = device;
-  data.sector = sector;
-  data.segments = segments;
-  data.block_io_bytes = bytes;
+  struct block_io_start_perf_event* data;
+#if USE_RINGBUF
+  data = block_io_starts.ringbuf_reserve(sizeof(struct block_io_start_perf_event));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  struct block_io_start_perf_event start_event;
+  data = &start_event;
+#endif
+  __builtin_memset(data, 0, sizeof(struct block_io_start_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->device = device;
+  data->sector = sector;
+  data->segments = segments;
+  data->block_io_bytes = bytes;
   // TODO(Patrick): avoid division and multiplication
-  data.block_io_start_uptime_us = ts / 1000;
-  data.block_io_flags = flags;
-  data.queue_length_4ks = queue_length_4ks;
-  data.queue_length_segments = queue_length_segments;
+  data->block_io_start_uptime_us = ts / 1000;
+  data->block_io_flags = flags;
+  data->queue_length_4ks = queue_length_4ks;
+  data->queue_length_segments = queue_length_segments;
 
-  block_io_starts.perf_submit(ctx, &data, sizeof(data));
+#if USE_RINGBUF
+  block_io_starts.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(
+      block_io_starts.perf_submit(ctx, data, sizeof(struct block_io_start_perf_event)));
+#endif
+#endif
 
   return 0;
 }
+
+// takes a finished io off the queue lengths of its device
+static void finish_queued_io(struct start_key* start, u32 bytes, u32 segments) {
+  struct queue_lengths* q_lengths = device_queue.lookup(&start->dev);
+  // if the queue has not been initialized, finish early
+  if (!q_lengths) {
+    return;
+  }
+  // ensure that the finished block io was tracked when it was inserted
+  if (!started_4k_ios.lookup(start)) {
+    return;
+  }
+  // clear the inserted state
+  started_4k_ios.delete(start);
+
+  // update device queue length to not include this finished io
+  int block_4ks = block_4k_ios(bytes);
+  __sync_fetch_and_add(&q_lengths->queue_length_4ks, -block_4ks);
+  __sync_fetch_and_add(&q_lengths->queue_length_segments, -segments);
+}
+
 // fin: 172972899196. issue: 172972899111
 // https://elixir.bootlin.com/linux/v5.6/source/include/trace/events/block.h#L116
 RAW_TRACEPOINT_PROBE(block_rq_complete) {
@@ -137,42 +203,70 @@ RAW_TRACEPOINT_PROBE(block_rq_complete) {
   u64 io_delta = ts - io_start_time_ns;
   u64 delta = ts - start_time_ns;
 
-  // store io data
-  struct block_io_end_perf_event data;
-  __builtin_memset(&data, 0, sizeof(data));
-  data.device = device;
-  data.sector = sector;
-  data.segments = segments;
-  data.block_io_bytes = bytes;
-  // TODO(Patrick): avoid division and multiplication
-  data.block_io_end_uptime_us = ts / 1000;
-  data.block_latency_us = delta / 1000;
-  data.block_io_latency_us = io_delta / 1000;
-  data.block_io_flags = flags;
-
-  block_io_ends.perf_submit(ctx, &data, sizeof(data));
-
-  // get device queue for request that just finished
-  struct queue_lengths* q_lengths = device_queue.lookup(&device);
-  // if the queue has not been initialized, finish early
-  if (!q_lengths) {
-    return 0;
-  }
-  // ensure that the finished block io was tracked when it was inserted
   struct start_key start;
   __builtin_memset(&start, 0, sizeof(start));
   start.dev = device;
   start.sector = sector;
-  if (!started_4k_ios.lookup(&start)) {
+  finish_queued_io(&start, bytes, segments);
+  if (filtered_ios.lookup(&start)) {
+    filtered_ios.delete(&start);
     return 0;
   }
-  // clear the inserted state
-  started_4k_ios.delete(&start);
 
-  // update device queue length to not include this finished io
-  int block_4ks = block_4k_ios(bytes);
-  __sync_fetch_and_add(&q_lengths->queue_length_4ks, -block_4ks);
-  __sync_fetch_and_add(&q_lengths->queue_length_segments, -segments);
+#if AGGREGATE_HISTOGRAMS
+  u64 zero = 0;
+  block_io_histogram_key_t key;
+  __builtin_memset(&key, 0, sizeof(key));
+  key.device = device;
+  key.op = flags & REQ_OP_MASK;
+  key.slot = histogram_slot(delta / 1000);
+  u64* count = block_latency_histogram.lookup_or_try_init(&key, &zero);
+  if (count) {
+    (*count)++;
+    count_submitted_event();
+  } else {
+    count_lost_event();
+  }
+  key.slot = histogram_slot(io_delta / 1000);
+  count = block_io_latency_histogram.lookup_or_try_init(&key, &zero);
+  if (count) {
+    (*count)++;
+    count_submitted_event();
+  } else {
+    count_lost_event();
+  }
+#else
+  // store io data
+  struct block_io_end_perf_event* data;
+#if USE_RINGBUF
+  data = block_io_ends.ringbuf_reserve(sizeof(struct block_io_end_perf_event));
+  if (!data)
+    count_lost_event();
+#else
+  struct block_io_end_perf_event end_event;
+  data = &end_event;
+#endif
+  if (data) {
+    __builtin_memset(data, 0, sizeof(struct block_io_end_perf_event));
+    data->cpu = bpf_get_smp_processor_id();
+    data->device = device;
+    data->sector = sector;
+    data->segments = segments;
+    data->block_io_bytes = bytes;
+    // TODO(Patrick): avoid division and multiplication
+    data->block_io_end_uptime_us = ts / 1000;
+    data->block_latency_us = delta / 1000;
+    data->block_io_latency_us = io_delta / 1000;
+    data->block_io_flags = flags;
+
+#if USE_RINGBUF
+    block_io_ends.ringbuf_submit(data, 0);
+    count_submitted_event();
+#else
+    count_perf_submit(block_io_ends.perf_submit(ctx, data, sizeof(struct block_io_end_perf_event)));
+#endif
+  }
+#endif
 
   return 0;
 }
@@ -52,11 +52,19 @@ struct cbmm_action {
 
 BPF_HASH(cbmm_action_hash, u64, struct cbmm_action, 1024);
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(cbmm_eager, RINGBUF_PAGES);
+BPF_RINGBUF_OUTPUT(cbmm_prezero, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(cbmm_eager);
 BPF_PERF_OUTPUT(cbmm_prezero);
+#endif
 
 static void insert_mm_estimate_changes(int action) {
   u64 tgid_pid = bpf_get_current_pid_tgid();
+  // later probes only look at decisions stored here
+  if (target_filtered(tgid_pid >> 32))
+    return;
   struct cbmm_action stored_action;
   memset(&stored_action, 0, sizeof(struct cbmm_action));
   stored_action.action = action;
@@ -77,28 +85,59 @@ int kprobe__mm_estimate_changes(struct pt_regs* ctx, struct mm_action* action,
 }
 
 static void mm_decide_push_eager(struct pt_regs* ctx, int decision, struct cbmm_action action) {
-  struct cbmm_eager_paging_inputs inputs;
-  memset(&inputs, 0, sizeof(inputs));
-  inputs.decision = decision;
-  inputs.freq_cycles = action.eager.freq_cycles;
-  inputs.greatest_range_benefit = action.eager.greatest_range_benefit;
-  cbmm_eager.perf_submit(ctx, &inputs, sizeof(inputs));
+  struct cbmm_eager_paging_inputs* inputs;
+#if USE_RINGBUF
+  inputs = cbmm_eager.ringbuf_reserve(sizeof(struct cbmm_eager_paging_inputs));
+  if (!inputs) {
+    count_lost_event();
+    return;
+  }
+#else
+  struct cbmm_eager_paging_inputs eager_inputs;
+  inputs = &eager_inputs;
+#endif
+  memset(inputs, 0, sizeof(struct cbmm_eager_paging_inputs));
+  inputs->decision = decision;
+  inputs->freq_cycles = action.eager.freq_cycles;
+  inputs->greatest_range_benefit = action.eager.greatest_range_benefit;
+#if USE_RINGBUF
+  cbmm_eager.ringbuf_submit(inputs, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(cbmm_eager.perf_submit(ctx, inputs, sizeof(struct cbmm_eager_paging_inputs)));
+#endif
 }
 
 static void mm_decide_push_prezero(struct pt_regs* ctx, int decision, struct cbmm_action action) {
-  struct cbmm_async_prezeroing_inputs inputs;
-  memset(&inputs, 0, sizeof(inputs));
-  inputs.decision = decision;
-  inputs.load = action.prezero.load_info;
-  inputs.daemon_cost = action.prezero.daemon_cost;
-  inputs.prezero_n = action.prezero.prezero_n;
-  // inputs.nfree = action.prezero.nfree;
-  // inputs.critical_section_cost = action.prezero.critical_section_cost;
-  inputs.critical_section_cost = 150 * 2;
-  inputs.nfree = 10 * 3000 * 1000 / inputs.critical_section_cost;
-  inputs.zeroing_per_page_cost = action.prezero.zeroing_per_page_cost;
-  inputs.recent_used = action.prezero.recent_used;
-  cbmm_prezero.perf_submit(ctx, &inputs, sizeof(inputs));
+  struct cbmm_async_prezeroing_inputs* inputs;
+#if USE_RINGBUF
+  inputs = cbmm_prezero.ringbuf_reserve(sizeof(struct cbmm_async_prezeroing_inputs));
+  if (!inputs) {
+    count_lost_event();
+    return;
+  }
+#else
+  struct cbmm_async_prezeroing_inputs prezero_inputs;
+  inputs = &prezero_inputs;
+#endif
+  memset(inputs, 0, sizeof(struct cbmm_async_prezeroing_inputs));
+  inputs->decision = decision;
+  inputs->load = action.prezero.load_info;
+  inputs->daemon_cost = action.prezero.daemon_cost;
+  inputs->prezero_n = action.prezero.prezero_n;
+  // inputs->nfree = action.prezero.nfree;
+  // inputs->critical_section_cost = action.prezero.critical_section_cost;
+  inputs->critical_section_cost = 150 * 2;
+  inputs->nfree = 10 * 3000 * 1000 / inputs->critical_section_cost;
+  inputs->zeroing_per_page_cost = action.prezero.zeroing_per_page_cost;
+  inputs->recent_used = action.prezero.recent_used;
+#if USE_RINGBUF
+  cbmm_prezero.ringbuf_submit(inputs, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(
+      cbmm_prezero.perf_submit(ctx, inputs, sizeof(struct cbmm_async_prezeroing_inputs)));
+#endif
 }
 
 int kretprobe__mm_decide(struct pt_regs* ctx) {
@@ -30,29 +30,55 @@ typedef struct trace_mm_khugepaged_scan_pmd_struct {
   u32 unmapped;
 } trace_mm_khugepaged_scan_pmd_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(trace_mm_khugepaged_scan_pmds, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(trace_mm_khugepaged_scan_pmds);
+#endif
 
 RAW_TRACEPOINT_PROBE(mm_khugepaged_scan_pmd) {
   u64 start = bpf_ktime_get_ns();
-  trace_mm_khugepaged_scan_pmd_t data;
-  __builtin_memset(&data, 0, sizeof(data));
   struct mm_struct* mm = (struct mm_struct*)ctx->args[0];
-  data.start_ts_ns = start;
-  data.mm = (u64)ctx->args[0];
-  data.tgid = mm->owner->tgid;
-  data.pid = mm->owner->pid;
-  data.page = (u64)ctx->args[1];
-  data.writeable = ctx->args[2];
-  data.referenced = ctx->args[3];
-  data.none_or_zero = ctx->args[4];
-  data.status = ctx->args[5];
-  data.unmapped = ctx->args[6];
-  data.end_ts_ns = bpf_ktime_get_ns();
-  trace_mm_khugepaged_scan_pmds.perf_submit(ctx, &data, sizeof(data));
+  if (target_filtered(mm->owner->tgid))
+    return 0;
+  trace_mm_khugepaged_scan_pmd_t* data;
+#if USE_RINGBUF
+  data = trace_mm_khugepaged_scan_pmds.ringbuf_reserve(sizeof(trace_mm_khugepaged_scan_pmd_t));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  trace_mm_khugepaged_scan_pmd_t scan_event;
+  data = &scan_event;
+#endif
+  __builtin_memset(data, 0, sizeof(trace_mm_khugepaged_scan_pmd_t));
+  data->start_ts_ns = start;
+  data->mm = (u64)ctx->args[0];
+  data->tgid = mm->owner->tgid;
+  data->pid = mm->owner->pid;
+  data->page = (u64)ctx->args[1];
+  data->writeable = ctx->args[2];
+  data->referenced = ctx->args[3];
+  data->none_or_zero = ctx->args[4];
+  data->status = ctx->args[5];
+  data->unmapped = ctx->args[6];
+  data->end_ts_ns = bpf_ktime_get_ns();
+#if USE_RINGBUF
+  trace_mm_khugepaged_scan_pmds.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(
+      trace_mm_khugepaged_scan_pmds.perf_submit(ctx, data, sizeof(trace_mm_khugepaged_scan_pmd_t)));
+#endif
   return 0;
 }
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(collapse_huge_pages, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(collapse_huge_pages);
+#endif
 
 typedef struct collapse_huge_page_struct {
   u32 pid;
@@ -69,18 +95,35 @@ typedef struct collapse_huge_page_struct {
 int kprobe_collapse_huge_page(struct pt_regs* ctx, struct mm_struct* mm, u64 address,
                               int referenced, int unmapped, struct collapse_control* cc) {
   u64 start = bpf_ktime_get_ns();
-  collapse_huge_page_t data;
-  __builtin_memset(&data, 0, sizeof(data));
-  data.mm = (u64)mm;
-  data.address = address;
-  data.referenced = referenced;
-  data.unmapped = unmapped;
-  data.pid = mm->owner->pid;
-  data.tgid = mm->owner->tgid;
-  data.cc = (u64)cc;
-  data.start_ts_ns = start;
-  data.end_ts_ns = bpf_ktime_get_ns();
-  collapse_huge_pages.perf_submit(ctx, &data, sizeof(data));
+  if (target_filtered(mm->owner->tgid))
+    return 0;
+  collapse_huge_page_t* data;
+#if USE_RINGBUF
+  data = collapse_huge_pages.ringbuf_reserve(sizeof(collapse_huge_page_t));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  collapse_huge_page_t collapse_event;
+  data = &collapse_event;
+#endif
+  __builtin_memset(data, 0, sizeof(collapse_huge_page_t));
+  data->mm = (u64)mm;
+  data->address = address;
+  data->referenced = referenced;
+  data->unmapped = unmapped;
+  data->pid = mm->owner->pid;
+  data->tgid = mm->owner->tgid;
+  data->cc = (u64)cc;
+  data->start_ts_ns = start;
+  data->end_ts_ns = bpf_ktime_get_ns();
+#if USE_RINGBUF
+  collapse_huge_pages.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(collapse_huge_pages.perf_submit(ctx, data, sizeof(collapse_huge_page_t)));
+#endif
   return 0;
 }
 
@@ -94,20 +137,42 @@ typedef struct trace_mm_collapse_huge_page_struct {
   u32 status;
 } trace_mm_collapse_huge_page_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(trace_mm_collapse_huge_pages, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(trace_mm_collapse_huge_pages);
+#endif
 // If this succeeds a folio was allocated meaning there was space
 
 RAW_TRACEPOINT_PROBE(mm_collapse_huge_page) {
   u64 start = bpf_ktime_get_ns();
-  trace_mm_collapse_huge_page_t data;
-  __builtin_memset(&data, 0, sizeof(data));
   struct mm_struct* mm = (struct mm_struct*)ctx->args[0];
-  data.isolated = (u32)ctx->args[1];
-  data.status = (u32)ctx->args[2];
-  data.pid = mm->owner->pid;
-  data.tgid = mm->owner->tgid;
-  data.start_ts_ns = start;
-  data.end_ts_ns = bpf_ktime_get_ns();
-  trace_mm_collapse_huge_pages.perf_submit(ctx, &data, sizeof(data));
+  if (target_filtered(mm->owner->tgid))
+    return 0;
+  trace_mm_collapse_huge_page_t* data;
+#if USE_RINGBUF
+  data = trace_mm_collapse_huge_pages.ringbuf_reserve(sizeof(trace_mm_collapse_huge_page_t));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  trace_mm_collapse_huge_page_t trace_event;
+  data = &trace_event;
+#endif
+  __builtin_memset(data, 0, sizeof(trace_mm_collapse_huge_page_t));
+  data->isolated = (u32)ctx->args[1];
+  data->status = (u32)ctx->args[2];
+  data->pid = mm->owner->pid;
+  data->tgid = mm->owner->tgid;
+  data->start_ts_ns = start;
+  data->end_ts_ns = bpf_ktime_get_ns();
+#if USE_RINGBUF
+  trace_mm_collapse_huge_pages.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(
+      trace_mm_collapse_huge_pages.perf_submit(ctx, data, sizeof(trace_mm_collapse_huge_page_t)));
+#endif
   return 0;
 }
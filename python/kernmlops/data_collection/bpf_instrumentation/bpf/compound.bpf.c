@@ -5,31 +5,71 @@
 typedef struct compound_perf_event {
   u64 timestamp;       // timestamp in microseconds
   u64 stack_hash;      // hash of the stack trace
-  char event_name[32]; // name of the event (function name)
+  u32 event_id;        // index of the probed function in the configured kernel events
 } compound_perf_event_t;
 
+typedef struct compound_stack_key {
+  u32 event_id;
+  s32 stack_id;
+} compound_stack_key_t;
+
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(compound_events, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(compound_events);
-BPF_STACK_TRACE(stack_traces, 1024);
+#endif
+BPF_STACK_TRACE(stack_traces, STACK_TRACE_ENTRIES);
+#if COUNT_STACKS
+BPF_PERCPU_HASH(compound_stack_counts, struct compound_stack_key, u64, STACK_COUNT_ENTRIES);
+#endif
 
-int trace_function_call(struct pt_regs* ctx) {
+static __always_inline int trace_function_call(struct pt_regs* ctx, u32 event_id) {
   u32 pid = bpf_get_current_pid_tgid();
+  u32 tgid = bpf_get_current_pid_tgid() >> 32;
 
-  if (FILTER || pid == 0)
+  if (target_filtered(tgid) || pid == 0)
     return 0;
 
-  struct compound_perf_event data = {};
-  data.timestamp = bpf_ktime_get_ns() / 1000; // Convert to microseconds
+#if COUNT_STACKS
+  // stacks are symbolized once per collection, so without BPF_F_REUSE_STACKID a colliding
+  // stack is counted under a negative id instead of replacing one already symbolized
+  struct compound_stack_key key = {};
+  key.event_id = event_id;
+  key.stack_id = stack_traces.get_stackid(ctx, 0);
+  compound_stack_counts.increment(key);
+  return 0;
+#else
+  struct compound_perf_event* data;
+#if USE_RINGBUF
+  data = compound_events.ringbuf_reserve(sizeof(struct compound_perf_event));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  struct compound_perf_event compound_event;
+  data = &compound_event;
+#endif
+  __builtin_memset(data, 0, sizeof(struct compound_perf_event));
+  data->timestamp = bpf_ktime_get_ns() / 1000; // Convert to microseconds
+  data->event_id = event_id;
 
   // Get stack trace and hash it
   int stack_id = stack_traces.get_stackid(ctx, BPF_F_REUSE_STACKID);
   if (stack_id >= 0) {
-    data.stack_hash = (u64)stack_id;
+    data->stack_hash = (u64)stack_id;
   } else {
-    data.stack_hash = 0;
+    data->stack_hash = 0;
   }
 
   // Submit the event
-  compound_events.perf_submit(ctx, &data, sizeof(data));
+#if USE_RINGBUF
+  compound_events.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(compound_events.perf_submit(ctx, data, sizeof(struct compound_perf_event)));
+#endif
 
   return 0;
+#endif
 }
@@ -0,0 +1,301 @@
+// Copyright (c) 2015 Brendan Gregg.
+// Licensed under the Apache License, Version 2.0 (the "License")
+// CO-RE build of bpf/blk_io.bpf.c for ring buffer transports, hooks the same tracepoints,
+// events keep the layout of block_io_start_perf_event_t and block_io_end_perf_event_t
+
+#include "histogram.bpf.h"
+#include "target_filter.bpf.h"
+
+struct block_io_start_perf_event {
+  u32 cpu;
+  u32 device;
+  u64 sector;
+  u32 segments;
+  u32 block_io_bytes;
+  u64 block_io_start_uptime_us;
+  u64 block_io_flags;
+  int queue_length_segments;
+  int queue_length_4ks;
+};
+
+struct block_io_end_perf_event {
+  u32 cpu;
+  u32 device;
+  u64 sector;
+  u32 segments;
+  u32 block_io_bytes;
+  u64 block_io_end_uptime_us;
+  u64 block_latency_us;
+  u64 block_io_latency_us;
+  u64 block_io_flags;
+};
+
+struct block_io_histogram_key {
+  u32 device;
+  u32 op;
+  u32 slot;
+};
+
+struct queue_lengths {
+  int queue_length_segments;
+  int queue_length_4ks;
+};
+
+struct start_key {
+  u32 dev;
+  u64 sector;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, HASH_DEFAULT_ENTRIES);
+  __type(key, u32);
+  __type(value, struct queue_lengths);
+} device_queue SEC(".maps");
+
+// we maintain started_4k_ios separately so we can manage scenarios where there is
+// existing outstanding io for a device when this BPF program is installed
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, 1024);
+  __type(key, struct start_key);
+  __type(value, u32);
+} started_4k_ios SEC(".maps");
+
+// ios issued by processes the collection does not target, their completion is dropped as well
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, 1024);
+  __type(key, struct start_key);
+  __type(value, u8);
+} filtered_ios SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_PERCPU_HASH);
+  __uint(max_entries, HISTOGRAM_DEFAULT_ENTRIES);
+  __type(key, struct block_io_histogram_key);
+  __type(value, u64);
+} block_latency_histogram SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_PERCPU_HASH);
+  __uint(max_entries, HISTOGRAM_DEFAULT_ENTRIES);
+  __type(key, struct block_io_histogram_key);
+  __type(value, u64);
+} block_io_latency_histogram SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} block_io_starts SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} block_io_ends SEC(".maps");
+
+// request->rq_disk was replaced by request->q->disk in linux 5.17
+struct request___rq_disk {
+  struct gendisk* rq_disk;
+} __attribute__((preserve_access_index));
+
+// RQF_* flags are macros that do not show up in BTF before linux 6.8, where they became an enum,
+// the flavor lets the object load on kernels without it
+enum rqf_flags___kernmlops { __RQF_SPECIAL_PAYLOAD___kernmlops = 0 };
+
+// RQF_SPECIAL_PAYLOAD as a macro
+#define RQF_SPECIAL_PAYLOAD_MACRO (1 << 18)
+
+// include/linux/blk_types.h
+#define REQ_OP_MASK ((1 << 8) - 1)
+
+static __always_inline u32 ddevt(struct request* req) {
+  struct gendisk* disk;
+  if (bpf_core_field_exists(((struct request___rq_disk*)req)->rq_disk))
+    disk = BPF_CORE_READ((struct request___rq_disk*)req, rq_disk);
+  else
+    disk = BPF_CORE_READ(req, q, disk);
+  return (BPF_CORE_READ(disk, major) << 20) | BPF_CORE_READ(disk, first_minor);
+}
+
+static __always_inline int block_4k_ios(u32 bytes) {
+  return (bytes + 4095) >> 12;
+}
+
+// copied from linux kernel
+static __always_inline unsigned short blk_rq_nr_phys_segments_dup(struct request* rq) {
+  u32 cmd_flags = rq->cmd_flags;
+  u32 idle_fua_meta = (1 << bpf_core_enum_value(enum req_flag_bits, __REQ_IDLE)) |
+                      (1 << bpf_core_enum_value(enum req_flag_bits, __REQ_FUA)) |
+                      (1 << bpf_core_enum_value(enum req_flag_bits, __REQ_META));
+  if ((cmd_flags & idle_fua_meta) == idle_fua_meta)
+    return 0;
+  u32 special_payload = RQF_SPECIAL_PAYLOAD_MACRO;
+  if (bpf_core_enum_value_exists(enum rqf_flags___kernmlops, __RQF_SPECIAL_PAYLOAD___kernmlops))
+    special_payload =
+        1 << bpf_core_enum_value(enum rqf_flags___kernmlops, __RQF_SPECIAL_PAYLOAD___kernmlops);
+  if ((u32)rq->rq_flags & special_payload)
+    return 1;
+  return rq->nr_phys_segments;
+}
+
+// when a block request is issued to the hardware driver
+// block_rq_issue: https://elixir.bootlin.com/linux/v5.6/source/include/trace/events/block.h#L207
+SEC("tp_btf/block_rq_issue")
+int BPF_PROG(block_rq_issue, struct request* req) {
+  u32 device = ddevt(req);
+  u64 sector = req->__sector;
+  u64 flags = req->cmd_flags;
+  u32 segments = blk_rq_nr_phys_segments_dup(req);
+  u32 bytes = req->__data_len;
+
+  u64 ts = bpf_ktime_get_ns();
+
+  struct queue_lengths init_entry;
+  __builtin_memset(&init_entry, 0, sizeof(init_entry));
+  struct queue_lengths* q_lengths = lookup_or_try_init(&device_queue, &device, &init_entry);
+  if (!q_lengths) {
+    return 0;
+  }
+  int block_4ks = block_4k_ios(bytes);
+  struct start_key start;
+  __builtin_memset(&start, 0, sizeof(start));
+  start.dev = device;
+  start.sector = sector;
+  bpf_map_update_elem(&started_4k_ios, &start, &block_4ks, BPF_ANY);
+
+  __sync_fetch_and_add(&q_lengths->queue_length_4ks, block_4ks);
+  __sync_fetch_and_add(&q_lengths->queue_length_segments, segments);
+  // may be noisy by the atomic function cannot return a value
+  // https://github.com/llvm/llvm-project/issues/91888
+  int queue_length_4ks = q_lengths->queue_length_4ks;
+  int queue_length_segments = q_lengths->queue_length_segments;
+
+  // requests are issued in the context of the task that submitted them unless they were queued,
+  // the queue lengths above still count every io of the device
+  if (target_filtered(bpf_get_current_pid_tgid() >> 32)) {
+    u8 filtered = 1;
+    bpf_map_update_elem(&filtered_ios, &start, &filtered, BPF_ANY);
+    return 0;
+  }
+  if (settings.aggregate_histograms)
+    return 0;
+
+  // store io data
+  struct block_io_start_perf_event* data =
+      bpf_ringbuf_reserve(&block_io_starts, sizeof(struct block_io_start_perf_event), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct block_io_start_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->device = device;
+  data->sector = sector;
+  data->segments = segments;
+  data->block_io_bytes = bytes;
+  // TODO(Patrick): avoid division and multiplication
+  data->block_io_start_uptime_us = ts / 1000;
+  data->block_io_flags = flags;
+  data->queue_length_4ks = queue_length_4ks;
+  data->queue_length_segments = queue_length_segments;
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+// takes a finished io off the queue lengths of its device
+static __always_inline void finish_queued_io(struct start_key* start, u32 bytes, u32 segments) {
+  struct queue_lengths* q_lengths = bpf_map_lookup_elem(&device_queue, &start->dev);
+  // if the queue has not been initialized, finish early
+  if (!q_lengths) {
+    return;
+  }
+  // ensure that the finished block io was tracked when it was inserted
+  if (!bpf_map_lookup_elem(&started_4k_ios, start)) {
+    return;
+  }
+  // clear the inserted state
+  bpf_map_delete_elem(&started_4k_ios, start);
+
+  // update device queue length to not include this finished io
+  int block_4ks = block_4k_ios(bytes);
+  __sync_fetch_and_add(&q_lengths->queue_length_4ks, -block_4ks);
+  __sync_fetch_and_add(&q_lengths->queue_length_segments, -segments);
+}
+
+// https://elixir.bootlin.com/linux/v5.6/source/include/trace/events/block.h#L116
+SEC("tp_btf/block_rq_complete")
+int BPF_PROG(block_rq_complete, struct request* req) {
+  u32 device = ddevt(req);
+  u64 sector = req->__sector;
+  u64 flags = req->cmd_flags;
+  u32 segments = blk_rq_nr_phys_segments_dup(req);
+  u32 bytes = req->__data_len;
+
+  u64 start_time_ns = req->start_time_ns;
+  u64 io_start_time_ns = req->io_start_time_ns;
+  u64 ts = bpf_ktime_get_ns();
+  u64 io_delta = ts - io_start_time_ns;
+  u64 delta = ts - start_time_ns;
+
+  struct start_key start;
+  __builtin_memset(&start, 0, sizeof(start));
+  start.dev = device;
+  start.sector = sector;
+  finish_queued_io(&start, bytes, segments);
+  if (bpf_map_lookup_elem(&filtered_ios, &start)) {
+    bpf_map_delete_elem(&filtered_ios, &start);
+    return 0;
+  }
+
+  if (settings.aggregate_histograms) {
+    u64 zero = 0;
+    struct block_io_histogram_key key;
+    __builtin_memset(&key, 0, sizeof(key));
+    key.device = device;
+    key.op = flags & REQ_OP_MASK;
+    key.slot = histogram_slot(delta / 1000);
+    u64* count = lookup_or_try_init(&block_latency_histogram, &key, &zero);
+    if (count) {
+      (*count)++;
+      count_submitted_event();
+    } else {
+      count_lost_event();
+    }
+    key.slot = histogram_slot(io_delta / 1000);
+    count = lookup_or_try_init(&block_io_latency_histogram, &key, &zero);
+    if (count) {
+      (*count)++;
+      count_submitted_event();
+    } else {
+      count_lost_event();
+    }
+  }
+
+  // store io data
+  struct block_io_end_perf_event* data = NULL;
+  if (!settings.aggregate_histograms) {
+    data = bpf_ringbuf_reserve(&block_io_ends, sizeof(struct block_io_end_perf_event), 0);
+    if (!data)
+      count_lost_event();
+  }
+  if (data) {
+    __builtin_memset(data, 0, sizeof(struct block_io_end_perf_event));
+    data->cpu = bpf_get_smp_processor_id();
+    data->device = device;
+    data->sector = sector;
+    data->segments = segments;
+    data->block_io_bytes = bytes;
+    // TODO(Patrick): avoid division and multiplication
+    data->block_io_end_uptime_us = ts / 1000;
+    data->block_latency_us = delta / 1000;
+    data->block_io_latency_us = io_delta / 1000;
+    data->block_io_flags = flags;
+    bpf_ringbuf_submit(data, 0);
+    count_submitted_event();
+  }
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
@@ -0,0 +1,235 @@
+// CO-RE build of bpf/cbmm.bpf.c for ring buffer transports, probes the same kernel functions,
+// events keep the layout of the BCC program. Only built for CBMM kernels, `make bpf-objects`
+// copies the MM_ACTION_* macros of their mm_econ.h, which BTF does not carry.
+
+#include "target_filter.bpf.h"
+#include "mm_econ_actions.h"
+
+// the parts of struct mm_action and struct mm_cost_delta of mm_econ.h that are read
+struct mm_action___cbmm {
+  int action;
+  u64 prezero_n;
+} __attribute__((preserve_access_index));
+
+struct mm_cost_delta___cbmm {
+  u64 cost;
+  u64 benefit;
+} __attribute__((preserve_access_index));
+
+// include/linux/sched/loadavg.h
+#define FSHIFT      11
+#define LOAD_INT(x) ((x) >> FSHIFT)
+
+struct cbmm_eager_paging {
+  /* Cost related info */
+  struct mm_cost_delta___cbmm* cost;
+  u64 freq_cycles;
+
+  /* Benefit Related info */
+  u64 greatest_range_benefit;
+};
+
+struct cbmm_eager_paging_inputs {
+  u64 freq_cycles;
+  u64 greatest_range_benefit;
+  int decision;
+};
+
+struct cbmm_async_prezeroing {
+  struct mm_cost_delta___cbmm* cost;
+  struct mm_action___cbmm* action;
+  unsigned long* load;
+  u64 load_info;
+  u64 daemon_cost;
+  u64 prezero_n;
+  u64 nfree;
+  u64 critical_section_cost;
+  u64 zeroing_per_page_cost;
+  u64 recent_used;
+};
+
+struct cbmm_async_prezeroing_inputs {
+  u64 load;
+  u64 daemon_cost;
+  u64 prezero_n;
+  u64 nfree;
+  u64 critical_section_cost;
+  u64 zeroing_per_page_cost;
+  u64 recent_used;
+  int decision;
+};
+
+struct cbmm_action {
+  int action;
+  struct cbmm_eager_paging eager;
+  struct cbmm_async_prezeroing prezero;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, 1024);
+  __type(key, u64);
+  __type(value, struct cbmm_action);
+} cbmm_action_hash SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} cbmm_eager SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} cbmm_prezero SEC(".maps");
+
+static __always_inline void insert_mm_estimate_changes(int action) {
+  u64 tgid_pid = bpf_get_current_pid_tgid();
+  // later probes only look at decisions stored here
+  if (target_filtered(tgid_pid >> 32))
+    return;
+  struct cbmm_action stored_action;
+  __builtin_memset(&stored_action, 0, sizeof(struct cbmm_action));
+  stored_action.action = action;
+  lookup_or_try_init(&cbmm_action_hash, &tgid_pid, &stored_action);
+}
+
+// kprobe__ functions are attached by BCC when compiling, and again by the hook
+SEC("kprobe/mm_estimate_changes")
+int BPF_KPROBE(kprobe__mm_estimate_changes, struct mm_action___cbmm* action,
+               struct mm_cost_delta___cbmm* cost) {
+  int kind = BPF_CORE_READ(action, action);
+  switch (kind) {
+    case MM_ACTION_EAGER_PAGING:
+    case MM_ACTION_RUN_PREZEROING:
+      insert_mm_estimate_changes(kind);
+      break;
+    default:
+      break;
+  }
+  return 0;
+}
+
+static __always_inline void mm_decide_push_eager(int decision, struct cbmm_action* action) {
+  struct cbmm_eager_paging_inputs* inputs =
+      bpf_ringbuf_reserve(&cbmm_eager, sizeof(struct cbmm_eager_paging_inputs), 0);
+  if (!inputs) {
+    count_lost_event();
+    return;
+  }
+  __builtin_memset(inputs, 0, sizeof(struct cbmm_eager_paging_inputs));
+  inputs->decision = decision;
+  inputs->freq_cycles = action->eager.freq_cycles;
+  inputs->greatest_range_benefit = action->eager.greatest_range_benefit;
+  bpf_ringbuf_submit(inputs, 0);
+  count_submitted_event();
+}
+
+static __always_inline void mm_decide_push_prezero(int decision, struct cbmm_action* action) {
+  struct cbmm_async_prezeroing_inputs* inputs =
+      bpf_ringbuf_reserve(&cbmm_prezero, sizeof(struct cbmm_async_prezeroing_inputs), 0);
+  if (!inputs) {
+    count_lost_event();
+    return;
+  }
+  __builtin_memset(inputs, 0, sizeof(struct cbmm_async_prezeroing_inputs));
+  inputs->decision = decision;
+  inputs->load = action->prezero.load_info;
+  inputs->daemon_cost = action->prezero.daemon_cost;
+  inputs->prezero_n = action->prezero.prezero_n;
+  inputs->critical_section_cost = 150 * 2;
+  inputs->nfree = 10 * 3000 * 1000 / inputs->critical_section_cost;
+  inputs->zeroing_per_page_cost = action->prezero.zeroing_per_page_cost;
+  inputs->recent_used = action->prezero.recent_used;
+  bpf_ringbuf_submit(inputs, 0);
+  count_submitted_event();
+}
+
+SEC("kretprobe/mm_decide")
+int BPF_KRETPROBE(kretprobe__mm_decide, int decision) {
+  u64 tgid_pid = bpf_get_current_pid_tgid();
+  struct cbmm_action* storage_action = NULL;
+  if (!(storage_action = bpf_map_lookup_elem(&cbmm_action_hash, &tgid_pid)))
+    return 0;
+  switch (storage_action->action) {
+    case MM_ACTION_EAGER_PAGING:
+      mm_decide_push_eager(decision, storage_action);
+      break;
+    case MM_ACTION_RUN_PREZEROING:
+      mm_decide_push_prezero(decision, storage_action);
+      break;
+    default:
+      break;
+  }
+  bpf_map_delete_elem(&cbmm_action_hash, &tgid_pid);
+  return 0;
+}
+
+SEC("kprobe/mm_estimate_eager_page_cost_benefit")
+int BPF_KPROBE(kprobe__mm_estimate_eager_page_cost_benefit, struct mm_action___cbmm* action,
+               struct mm_cost_delta___cbmm* cost) {
+  u64 tgid_pid = bpf_get_current_pid_tgid();
+  struct cbmm_action* storage_action = NULL;
+  if (!(storage_action = bpf_map_lookup_elem(&cbmm_action_hash, &tgid_pid)))
+    return 0;
+  storage_action->eager.cost = cost;
+  return 0;
+}
+
+SEC("kretprobe/mm_estimate_eager_page_cost_benefit")
+int BPF_KRETPROBE(kretprobe__mm_estimate_eager_page_cost_benefit) {
+  u64 tgid_pid = bpf_get_current_pid_tgid();
+  struct cbmm_action* storage_action = NULL;
+  if (!(storage_action = bpf_map_lookup_elem(&cbmm_action_hash, &tgid_pid)))
+    return 0;
+  storage_action->eager.freq_cycles = BPF_CORE_READ(storage_action->eager.cost, cost);
+  storage_action->eager.greatest_range_benefit = BPF_CORE_READ(storage_action->eager.cost, benefit);
+  return 0;
+}
+
+SEC("kprobe/mm_estimate_daemon_cost")
+int BPF_KPROBE(kprobe__mm_estimate_daemon_cost, struct mm_action___cbmm* action,
+               struct mm_cost_delta___cbmm* cost) {
+  u64 tgid_pid = bpf_get_current_pid_tgid();
+  struct cbmm_action* storage_action = NULL;
+  if (!(storage_action = bpf_map_lookup_elem(&cbmm_action_hash, &tgid_pid)))
+    return 0;
+  storage_action->prezero.prezero_n = BPF_CORE_READ(action, prezero_n);
+  storage_action->prezero.daemon_cost = 1000000;
+  return 0;
+}
+
+SEC("kprobe/get_avenrun")
+int BPF_KPROBE(kprobe__get_avenrun, unsigned long* loads, unsigned long offset, int shift) {
+  u64 tgid_pid = bpf_get_current_pid_tgid();
+  struct cbmm_action* storage_action = NULL;
+  if (!(storage_action = bpf_map_lookup_elem(&cbmm_action_hash, &tgid_pid)))
+    return 0;
+  storage_action->prezero.load = loads;
+  return 0;
+}
+
+SEC("kretprobe/get_avenrun")
+int BPF_KRETPROBE(kretprobe__get_avenrun) {
+  u64 tgid_pid = bpf_get_current_pid_tgid();
+  struct cbmm_action* storage_action = NULL;
+  if (!(storage_action = bpf_map_lookup_elem(&cbmm_action_hash, &tgid_pid)))
+    return 0;
+  unsigned long blah = 0;
+  bpf_probe_read_kernel(&blah, sizeof(blah), storage_action->prezero.load);
+  unsigned long load = LOAD_INT(blah);
+  storage_action->prezero.load_info = (u64)load;
+  return 0;
+}
+
+SEC("kretprobe/mm_estimated_prezeroed_used")
+int BPF_KRETPROBE(kretprobe__mm_estimated_prezeroed_used, long recent_used) {
+  u64 tgid_pid = bpf_get_current_pid_tgid();
+  struct cbmm_action* storage_action = NULL;
+  if (!(storage_action = bpf_map_lookup_elem(&cbmm_action_hash, &tgid_pid)))
+    return 0;
+  storage_action->prezero.zeroing_per_page_cost = 1000000;
+  storage_action->prezero.recent_used = recent_used;
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
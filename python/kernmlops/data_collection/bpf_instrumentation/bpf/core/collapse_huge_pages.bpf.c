@@ -0,0 +1,139 @@
+// CO-RE build of bpf/collapse_huge_page.bpf.c for ring buffer transports, hooks the same
+// tracepoints and kernel functions, events keep the layout of the BCC program
+
+#include "target_filter.bpf.h"
+
+struct trace_mm_khugepaged_scan_pmd_struct {
+  u32 pid;
+  u32 tgid;
+  u64 start_ts_ns;
+  u64 end_ts_ns;
+  u64 mm;
+  u64 page;
+  u32 writeable;
+  u32 referenced;
+  u32 none_or_zero;
+  u32 status;
+  u32 unmapped;
+};
+
+struct collapse_huge_page_struct {
+  u32 pid;
+  u32 tgid;
+  u64 start_ts_ns;
+  u64 end_ts_ns;
+  u64 mm;
+  u64 address;
+  u32 referenced;
+  u32 unmapped;
+  u64 cc;
+};
+
+struct trace_mm_collapse_huge_page_struct {
+  u32 pid;
+  u32 tgid;
+  u64 start_ts_ns;
+  u64 end_ts_ns;
+  u64 mm;
+  u32 isolated;
+  u32 status;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} trace_mm_khugepaged_scan_pmds SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} collapse_huge_pages SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} trace_mm_collapse_huge_pages SEC(".maps");
+
+SEC("raw_tp/mm_khugepaged_scan_pmd")
+int raw_tracepoint__mm_khugepaged_scan_pmd(struct bpf_raw_tracepoint_args* ctx) {
+  u64 start = bpf_ktime_get_ns();
+  struct mm_struct* mm = (struct mm_struct*)ctx->args[0];
+  if (target_filtered(BPF_CORE_READ(mm, owner, tgid)))
+    return 0;
+  struct trace_mm_khugepaged_scan_pmd_struct* data = bpf_ringbuf_reserve(
+      &trace_mm_khugepaged_scan_pmds, sizeof(struct trace_mm_khugepaged_scan_pmd_struct), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct trace_mm_khugepaged_scan_pmd_struct));
+  data->start_ts_ns = start;
+  data->mm = (u64)ctx->args[0];
+  data->tgid = BPF_CORE_READ(mm, owner, tgid);
+  data->pid = BPF_CORE_READ(mm, owner, pid);
+  data->page = (u64)ctx->args[1];
+  data->writeable = ctx->args[2];
+  data->referenced = ctx->args[3];
+  data->none_or_zero = ctx->args[4];
+  data->status = ctx->args[5];
+  data->unmapped = ctx->args[6];
+  data->end_ts_ns = bpf_ktime_get_ns();
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+SEC("kprobe")
+int BPF_KPROBE(kprobe_collapse_huge_page, struct mm_struct* mm, u64 address, int referenced,
+               int unmapped, struct collapse_control* cc) {
+  u64 start = bpf_ktime_get_ns();
+  if (target_filtered(BPF_CORE_READ(mm, owner, tgid)))
+    return 0;
+  struct collapse_huge_page_struct* data =
+      bpf_ringbuf_reserve(&collapse_huge_pages, sizeof(struct collapse_huge_page_struct), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct collapse_huge_page_struct));
+  data->mm = (u64)mm;
+  data->address = address;
+  data->referenced = referenced;
+  data->unmapped = unmapped;
+  data->pid = BPF_CORE_READ(mm, owner, pid);
+  data->tgid = BPF_CORE_READ(mm, owner, tgid);
+  data->cc = (u64)cc;
+  data->start_ts_ns = start;
+  data->end_ts_ns = bpf_ktime_get_ns();
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+// If this succeeds a folio was allocated meaning there was space
+
+SEC("raw_tp/mm_collapse_huge_page")
+int raw_tracepoint__mm_collapse_huge_page(struct bpf_raw_tracepoint_args* ctx) {
+  u64 start = bpf_ktime_get_ns();
+  struct mm_struct* mm = (struct mm_struct*)ctx->args[0];
+  if (target_filtered(BPF_CORE_READ(mm, owner, tgid)))
+    return 0;
+  struct trace_mm_collapse_huge_page_struct* data = bpf_ringbuf_reserve(
+      &trace_mm_collapse_huge_pages, sizeof(struct trace_mm_collapse_huge_page_struct), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct trace_mm_collapse_huge_page_struct));
+  data->isolated = (u32)ctx->args[1];
+  data->status = (u32)ctx->args[2];
+  data->pid = BPF_CORE_READ(mm, owner, pid);
+  data->tgid = BPF_CORE_READ(mm, owner, tgid);
+  data->start_ts_ns = start;
+  data->end_ts_ns = bpf_ktime_get_ns();
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
@@ -0,0 +1,86 @@
+// CO-RE build of bpf/compound.bpf.c for ring buffer transports, events keep the layout of
+// compound_perf_event_t. Every probe shares one program that reads its event id from the
+// attach cookie, so the object does not depend on the number of kernel events.
+
+#include "target_filter.bpf.h"
+
+struct compound_perf_event {
+  u64 timestamp;  // timestamp in microseconds
+  u64 stack_hash; // hash of the stack trace
+  u32 event_id;   // index of the probed function in the configured kernel events
+};
+
+struct compound_stack_key {
+  u32 event_id;
+  s32 stack_id;
+};
+
+// include/uapi/linux/perf_event.h
+#define PERF_MAX_STACK_DEPTH 127
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} compound_events SEC(".maps");
+
+// resized by the loader to stack_trace_entries and stack_count_entries
+struct {
+  __uint(type, BPF_MAP_TYPE_STACK_TRACE);
+  __uint(max_entries, 16384);
+  __uint(key_size, sizeof(u32));
+  __uint(value_size, PERF_MAX_STACK_DEPTH * sizeof(u64));
+} stack_traces SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_PERCPU_HASH);
+  __uint(max_entries, 10240);
+  __type(key, struct compound_stack_key);
+  __type(value, u64);
+} compound_stack_counts SEC(".maps");
+
+SEC("kprobe")
+int trace_event(struct pt_regs* ctx) {
+  u32 pid = bpf_get_current_pid_tgid();
+  u32 tgid = bpf_get_current_pid_tgid() >> 32;
+  u32 event_id = bpf_get_attach_cookie(ctx);
+
+  if (target_filtered(tgid) || pid == 0)
+    return 0;
+
+  if (settings.count_stacks) {
+    // stacks are symbolized once per collection, so without BPF_F_REUSE_STACKID a colliding
+    // stack is counted under a negative id instead of replacing one already symbolized
+    struct compound_stack_key key = {};
+    key.event_id = event_id;
+    key.stack_id = bpf_get_stackid(ctx, &stack_traces, 0);
+    u64 zero = 0;
+    u64* count = lookup_or_try_init(&compound_stack_counts, &key, &zero);
+    if (count)
+      (*count)++;
+    return 0;
+  }
+
+  struct compound_perf_event* data =
+      bpf_ringbuf_reserve(&compound_events, sizeof(struct compound_perf_event), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct compound_perf_event));
+  data->timestamp = bpf_ktime_get_ns() / 1000; // Convert to microseconds
+  data->event_id = event_id;
+
+  // Get stack trace and hash it
+  int stack_id = bpf_get_stackid(ctx, &stack_traces, BPF_F_REUSE_STACKID);
+  if (stack_id >= 0) {
+    data->stack_hash = (u64)stack_id;
+  } else {
+    data->stack_hash = 0;
+  }
+
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
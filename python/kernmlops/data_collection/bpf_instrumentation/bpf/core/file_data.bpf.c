@@ -0,0 +1,114 @@
+// CO-RE build of bpf/file_data.bpf.c for ring buffer transports, probes the same kernel
+// functions, events keep the layout of file_open_perf_event_t
+
+#include "target_filter.bpf.h"
+
+// Adapted from: https://github.com/iovisor/bcc/blob/master/tools/filelife.py
+
+struct file_open_perf_event {
+  u32 cpu;
+  u32 pid;
+  u32 tgid;
+  u64 ts_uptime_us;
+  u32 file_inode;
+  u64 file_size_bytes;
+  char file_name[40];
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} file_open_events SEC(".maps");
+
+// vfs_create takes an idmap since linux 6.3 and a user namespace since 5.12, detected like the
+// BCC hook does through struct renamedata
+struct renamedata___idmap {
+  struct mnt_idmap* new_mnt_idmap;
+} __attribute__((preserve_access_index));
+
+struct renamedata___userns {
+  struct user_namespace* old_mnt_userns;
+} __attribute__((preserve_access_index));
+
+// dentry->d_iname became the d_shortname union in linux 6.14
+union shortname_store___kernmlops {
+  unsigned char string[40];
+} __attribute__((preserve_access_index));
+
+struct dentry___d_shortname {
+  union shortname_store___kernmlops d_shortname;
+} __attribute__((preserve_access_index));
+
+struct dentry___d_iname {
+  unsigned char d_iname[40];
+} __attribute__((preserve_access_index));
+
+// include/linux/fs.h
+#define FMODE_CREATED (1 << 20)
+
+static __always_inline int probe_dentry(struct dentry* dentry, bool created) {
+  u32 pid = bpf_get_current_pid_tgid();
+  u32 tgid = bpf_get_current_pid_tgid() >> 32;
+  if (target_filtered(tgid) || pid == 0)
+    return 0;
+
+  u64 ts = bpf_ktime_get_ns();
+  u64 file_size = BPF_CORE_READ(dentry, d_inode, i_size);
+  if (!(created || file_size > 0)) {
+    return 0;
+  }
+
+  struct file_open_perf_event* data =
+      bpf_ringbuf_reserve(&file_open_events, sizeof(struct file_open_perf_event), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct file_open_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
+  // TODO(Patrick): avoid division and multiplication
+  data->ts_uptime_us = ts / 1000;
+  data->file_inode = BPF_CORE_READ(dentry, d_inode, i_ino);
+  data->file_size_bytes = file_size;
+  if (bpf_core_field_exists(((struct dentry___d_iname*)dentry)->d_iname))
+    bpf_probe_read_kernel(&data->file_name, sizeof(data->file_name),
+                          ((struct dentry___d_iname*)dentry)->d_iname);
+  else
+    bpf_probe_read_kernel(&data->file_name, sizeof(data->file_name),
+                          ((struct dentry___d_shortname*)dentry)->d_shortname.string);
+
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+SEC("kprobe")
+int trace_create(struct pt_regs* ctx) {
+  // both are read so the compiler cannot turn the choice into a variable offset into ctx
+  struct dentry* dentry = (struct dentry*)PT_REGS_PARM2(ctx);
+  struct dentry* namespaced_dentry = (struct dentry*)PT_REGS_PARM3(ctx);
+  barrier_var(dentry);
+  barrier_var(namespaced_dentry);
+  if (bpf_core_field_exists(struct renamedata___idmap, new_mnt_idmap) ||
+      bpf_core_field_exists(struct renamedata___userns, old_mnt_userns))
+    dentry = namespaced_dentry;
+  return probe_dentry(dentry, true);
+}
+
+// trace file security_inode_create time
+SEC("kprobe")
+int BPF_KPROBE(trace_security_inode_create, struct inode* dir, struct dentry* dentry) {
+  return probe_dentry(dentry, true);
+}
+
+// trace file open time
+SEC("kprobe")
+int BPF_KPROBE(trace_open, struct path* path, struct file* file) {
+  struct dentry* dentry = BPF_CORE_READ(path, dentry);
+  bool created = BPF_CORE_READ(file, f_mode) & FMODE_CREATED;
+  return probe_dentry(dentry, created);
+}
+
+char LICENSE[] SEC("license") = "GPL";
@@ -0,0 +1,51 @@
+// CO-RE build of bpf/file_opening.bpf.c for ring buffer transports, probes the same kernel
+// function with the same argument layout, events keep the layout of file_opening_perf_event_t
+
+#include "target_filter.bpf.h"
+
+struct file_opening_perf_event {
+  u32 cpu;
+  u32 pid;
+  u32 tgid;
+  u64 ts_uptime_us;
+  char filename[255];
+  int flags;
+  int mode;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} file_opening_events SEC(".maps");
+
+SEC("kprobe")
+int BPF_KPROBE(trace_sys_openat, int dfd, const char* filename, int flags, umode_t mode) {
+  u32 pid = bpf_get_current_pid_tgid();
+  u32 tgid = bpf_get_current_pid_tgid() >> 32;
+
+  if (target_filtered(tgid) || pid == 0)
+    return 0;
+
+  struct file_opening_perf_event* data =
+      bpf_ringbuf_reserve(&file_opening_events, sizeof(struct file_opening_perf_event), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct file_opening_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
+  data->ts_uptime_us = bpf_ktime_get_ns() / 1000;
+  data->flags = flags;
+  data->mode = mode;
+
+  // Copy the filename (safely)
+  bpf_probe_read_user_str(&data->filename, sizeof(data->filename), filename);
+
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
@@ -0,0 +1,48 @@
+// Counterpart of HISTOGRAM_SLOTS in histogram.py, objects aggregate into per cpu hash maps when
+// settings.aggregate_histograms is set.
+
+#ifndef KERNMLOPS_HISTOGRAM_BPF_H
+#define KERNMLOPS_HISTOGRAM_BPF_H
+
+#include "kernmlops.bpf.h"
+
+// resized by the loader to HistogramAggregation.max_entries
+#define HISTOGRAM_DEFAULT_ENTRIES 10240
+
+// bpf_log2 and bpf_log2l of BCC's helpers.h
+static __always_inline unsigned int histogram_log2(unsigned int v) {
+  unsigned int r;
+  unsigned int shift;
+
+  r = (v > 0xFFFF) << 4;
+  v >>= r;
+  shift = (v > 0xFF) << 3;
+  v >>= shift;
+  r |= shift;
+  shift = (v > 0xF) << 2;
+  v >>= shift;
+  r |= shift;
+  shift = (v > 0x3) << 1;
+  v >>= shift;
+  r |= shift;
+  r |= (v >> 1);
+  return r;
+}
+
+static __always_inline unsigned int histogram_log2l(u64 v) {
+  unsigned int hi = v >> 32;
+  if (hi)
+    return histogram_log2(hi) + 32 + 1;
+  else
+    return histogram_log2(v) + 1;
+}
+
+static __always_inline u32 histogram_slot(u64 value) {
+  if (settings.histogram_linear) {
+    u64 slot = value / settings.histogram_linear_step;
+    return slot < settings.histogram_max_slot ? slot : settings.histogram_max_slot;
+  }
+  return histogram_log2l(value);
+}
+
+#endif
@@ -0,0 +1,70 @@
+// Shared by the CO-RE objects loaded with libbpf, the counterpart of EVENT_COUNTERS in transport.py
+// for BCC programs.
+
+#ifndef KERNMLOPS_BPF_H
+#define KERNMLOPS_BPF_H
+
+#include "vmlinux.h"
+
+#include <bpf/bpf_core_read.h>
+#include <bpf/bpf_helpers.h>
+#include <bpf/bpf_tracing.h>
+
+// filled in by CoreObject before loading, see CoreSettings in core_object.py, these replace the
+// cflags BCC programs are compiled with
+struct kernmlops_settings {
+  u32 aggregate_histograms;
+  u32 histogram_linear;
+  u32 histogram_linear_step;
+  u32 histogram_max_slot;
+  u32 count_stacks;
+  u32 filter_targets;
+  u32 filter_cgroup;
+  u32 collector_tgid;
+  u32 target_cgroup_level;
+  u64 target_cgroup_id;
+};
+
+// in a section of its own so the loader can replace it without knowing the other constants
+const volatile struct kernmlops_settings settings SEC(".rodata.settings") = {};
+
+// sized by the loader, BPF_MAP_TYPE_RINGBUF needs a page aligned default
+#define RINGBUF_DEFAULT_SIZE 4096
+
+// default size of BCC's BPF_HASH
+#define HASH_DEFAULT_ENTRIES 10240
+
+#define EVENT_SUBMITTED 0
+#define EVENT_LOST      1
+
+struct {
+  __uint(type, BPF_MAP_TYPE_PERCPU_ARRAY);
+  __uint(max_entries, 2);
+  __type(key, u32);
+  __type(value, u64);
+} event_counts SEC(".maps");
+
+static __always_inline void count_event(u32 outcome) {
+  u64* count = bpf_map_lookup_elem(&event_counts, &outcome);
+  if (count)
+    (*count)++;
+}
+
+static __always_inline void count_submitted_event() {
+  count_event(EVENT_SUBMITTED);
+}
+
+static __always_inline void count_lost_event() {
+  count_event(EVENT_LOST);
+}
+
+// like lookup_or_try_init of BCC tables
+static __always_inline void* lookup_or_try_init(void* map, const void* key, const void* init) {
+  void* value = bpf_map_lookup_elem(map, key);
+  if (value)
+    return value;
+  bpf_map_update_elem(map, key, init, BPF_NOEXIST);
+  return bpf_map_lookup_elem(map, key);
+}
+
+#endif
@@ -0,0 +1,109 @@
+// CO-RE build of bpf/madvise.bpf.c for ring buffer transports, probes the same kernel functions,
+// events keep the layout of madvise_output_t
+
+#include "target_filter.bpf.h"
+
+struct madvise_output {
+  u32 tgid;
+  u64 ts_ns;
+  u64 address;
+  u64 length;
+  int advice;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} madvise_output SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, 32768);
+  __type(key, u32);
+  __type(value, struct madvise_output);
+} madvise_hash SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, 32768);
+  __type(key, u32);
+  __type(value, struct madvise_output);
+} munmap_hash SEC(".maps");
+
+static __always_inline void submit_madvise_output(struct madvise_output* data) {
+  struct madvise_output* output =
+      bpf_ringbuf_reserve(&madvise_output, sizeof(struct madvise_output), 0);
+  if (!output)
+    count_lost_event();
+  if (output) {
+    __builtin_memcpy(output, data, sizeof(struct madvise_output));
+    bpf_ringbuf_submit(output, 0);
+    count_submitted_event();
+  }
+}
+
+// kprobe__ functions are attached by BCC when compiling, and again by the hook
+SEC("kprobe/do_madvise")
+int BPF_KPROBE(kprobe__do_madvise, struct mm_struct* mm, unsigned long addr, size_t length,
+               int advice) {
+  u32 pid = bpf_get_current_pid_tgid();
+  struct madvise_output data;
+  __builtin_memset(&data, 0, sizeof(data));
+  data.tgid = BPF_CORE_READ(mm, owner, tgid);
+  if (target_filtered(data.tgid))
+    return 0;
+  data.ts_ns = bpf_ktime_get_ns();
+  data.address = (u64)addr;
+  data.length = (u64)length;
+  data.advice = advice;
+  bpf_map_update_elem(&madvise_hash, &pid, &data, BPF_NOEXIST);
+  return 0;
+}
+
+SEC("kretprobe/do_madvise")
+int BPF_KRETPROBE(kretprobe__do_madvise, int ret) {
+  u32 pid = bpf_get_current_pid_tgid();
+  struct madvise_output* data;
+  if (ret != 0)
+    bpf_map_delete_elem(&madvise_hash, &pid);
+  return 0;
+  if ((data = bpf_map_lookup_elem(&madvise_hash, &pid)) == NULL)
+    bpf_map_delete_elem(&madvise_hash, &pid);
+  return 0;
+  submit_madvise_output(data);
+  bpf_map_delete_elem(&madvise_hash, &pid);
+  return 0;
+}
+
+SEC("kprobe/do_vmi_align_munmap")
+int BPF_KPROBE(kprobe__do_vmi_align_munmap, struct vm_area_struct* vma, struct mm_struct* mm,
+               unsigned long start, unsigned long end) {
+  u32 pid = bpf_get_current_pid_tgid();
+  struct madvise_output data;
+  __builtin_memset(&data, 0, sizeof(data));
+  data.tgid = BPF_CORE_READ(mm, owner, tgid);
+  if (target_filtered(data.tgid))
+    return 0;
+  data.ts_ns = bpf_ktime_get_ns();
+  data.address = (u64)start;
+  data.length = (u64)(end - start);
+  data.advice = -1;
+  bpf_map_update_elem(&munmap_hash, &pid, &data, BPF_NOEXIST);
+  return 0;
+}
+
+SEC("kretprobe/do_vmi_align_munmap")
+int BPF_KRETPROBE(kretprobe__do_vmi_align_munmap, int ret) {
+  struct madvise_output* data;
+  u32 pid = bpf_get_current_pid_tgid();
+  if ((data = bpf_map_lookup_elem(&munmap_hash, &pid)) == NULL)
+    return 0;
+  if (ret != 0)
+    bpf_map_delete_elem(&munmap_hash, &pid);
+  return 0;
+  submit_madvise_output(data);
+  bpf_map_delete_elem(&munmap_hash, &pid);
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
@@ -0,0 +1,71 @@
+// CO-RE build of bpf/mm_trace_rss_stat.bpf.c for ring buffer transports, hooks the same
+// tracepoints, events keep the layout of rss_stat_output_t
+
+#include "target_filter.bpf.h"
+
+struct rss_stat_output {
+  u32 pid;
+  u32 tgid;
+  u64 ts;
+  int member;
+  u64 counter_value;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} rss_stat_output SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, 32768);
+  __type(key, u32);
+  __type(value, struct rss_stat_output);
+} rss_stat_hash SEC(".maps");
+
+// ASSUMPTION, raw runs before non-raw (should be correct)
+
+#define PAGE_SZ 12
+
+SEC("raw_tp/rss_stat")
+int raw_tracepoint__rss_stat(struct bpf_raw_tracepoint_args* ctx) {
+  struct rss_stat_output stack_data;
+  u32 pid = bpf_get_current_pid_tgid();
+  __builtin_memset(&stack_data, 0, sizeof(stack_data));
+
+  struct mm_struct* mm = (struct mm_struct*)ctx->args[0];
+  stack_data.pid = BPF_CORE_READ(mm, owner, pid);
+  stack_data.tgid = BPF_CORE_READ(mm, owner, tgid);
+  if (target_filtered(stack_data.tgid))
+    return 0;
+
+  bpf_map_update_elem(&rss_stat_hash, &pid, &stack_data, BPF_NOEXIST);
+  return 0;
+}
+
+SEC("tp/kmem/rss_stat")
+int tracepoint__kmem__rss_stat(struct trace_event_raw_rss_stat* args) {
+  struct rss_stat_output* data;
+  u32 pid = bpf_get_current_pid_tgid();
+  if ((data = bpf_map_lookup_elem(&rss_stat_hash, &pid)) == NULL) {
+    return 0;
+  }
+
+  data->member = BPF_CORE_READ(args, member);
+  data->counter_value = (BPF_CORE_READ(args, size)) >> PAGE_SZ;
+  data->ts = bpf_ktime_get_ns();
+
+  struct rss_stat_output* output =
+      bpf_ringbuf_reserve(&rss_stat_output, sizeof(struct rss_stat_output), 0);
+  if (!output)
+    count_lost_event();
+  if (output) {
+    __builtin_memcpy(output, data, sizeof(struct rss_stat_output));
+    bpf_ringbuf_submit(output, 0);
+    count_submitted_event();
+  }
+  bpf_map_delete_elem(&rss_stat_hash, &pid);
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
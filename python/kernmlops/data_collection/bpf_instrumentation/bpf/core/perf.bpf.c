@@ -0,0 +1,52 @@
+// CO-RE build of the PERF_HANDLER programs in perf/perf_hook.py for ring buffer transports.
+// Every counter shares one program and ring buffer, the attach cookie is the index of the
+// counter and is recorded in the event, the rest keeps the layout of perf_event_data.
+
+#include "kernmlops.bpf.h"
+
+struct perf_sample_event {
+  u32 cpu;
+  u32 pid;
+  u32 tgid;
+  u64 ts_uptime_us;
+  u32 count;
+  u64 enabled_time_us;
+  u64 running_time_us;
+  u32 counter;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} perf_samples SEC(".maps");
+
+SEC("perf_event")
+int perf_sample(struct bpf_perf_event_data* ctx) {
+  struct bpf_perf_event_value value_buf;
+  if (bpf_perf_prog_read_value(ctx, (void*)&value_buf, sizeof(struct bpf_perf_event_value))) {
+    return 0;
+  }
+  struct perf_sample_event* data =
+      bpf_ringbuf_reserve(&perf_samples, sizeof(struct perf_sample_event), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct perf_sample_event));
+  u32 pid = bpf_get_current_pid_tgid();
+  u32 tgid = bpf_get_current_pid_tgid() >> 32;
+  u64 ts = bpf_ktime_get_ns();
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
+  data->ts_uptime_us = ts / 1000;
+  data->count = value_buf.counter;
+  data->enabled_time_us = value_buf.enabled / 1000;
+  data->running_time_us = value_buf.running / 1000;
+  data->counter = bpf_get_attach_cookie(ctx);
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
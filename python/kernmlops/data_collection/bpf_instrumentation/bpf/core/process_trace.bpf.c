@@ -0,0 +1,95 @@
+// CO-RE build of bpf/fork_and_exit.bpf.c for ring buffer transports, probes the same kernel
+// functions, events keep the layout of start_data_t and stop_data_t
+
+#include "target_filter.bpf.h"
+
+struct start_data {
+  u32 pid;
+  u32 tgid;
+  u64 ts;
+  char buff[16];
+};
+
+struct stop_data {
+  u32 pid;
+  u32 tgid;
+  u64 ts;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} copy_task_events SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} release_task_events SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} exec_events SEC(".maps");
+
+// IS_ERR of include/linux/err.h
+#define MAX_ERRNO 4095
+
+SEC("kretprobe")
+int BPF_KRETPROBE(kretprobe_copy_process, struct task_struct* task) {
+  if ((unsigned long)task >= (unsigned long)-MAX_ERRNO)
+    return 0;
+  // new processes are kept when their parent is a target
+  if (target_filtered(bpf_get_current_pid_tgid() >> 32))
+    return 0;
+  struct start_data* data = bpf_ringbuf_reserve(&copy_task_events, sizeof(struct start_data), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  bpf_get_current_comm(&data->buff, sizeof(data->buff));
+  data->ts = bpf_ktime_get_ns();
+  data->pid = BPF_CORE_READ(task, pid);
+  data->tgid = BPF_CORE_READ(task, tgid);
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+SEC("kprobe")
+int BPF_KPROBE(kprobe_do_exit, long code) {
+  if (target_filtered(bpf_get_current_pid_tgid() >> 32))
+    return 0;
+  struct task_struct* task = (struct task_struct*)bpf_get_current_task();
+  struct stop_data* data = bpf_ringbuf_reserve(&release_task_events, sizeof(struct stop_data), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  data->ts = bpf_ktime_get_ns();
+  data->pid = BPF_CORE_READ(task, pid);
+  data->tgid = BPF_CORE_READ(task, tgid);
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+SEC("kretprobe")
+int BPF_KRETPROBE(kretprobe_exec, long ret) {
+  if (ret != 0 || target_filtered(bpf_get_current_pid_tgid() >> 32))
+    return 0;
+
+  struct start_data* data = bpf_ringbuf_reserve(&exec_events, sizeof(struct start_data), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  bpf_get_current_comm(data->buff, sizeof(data->buff));
+  data->pid = bpf_get_current_pid_tgid() >> 32;
+  data->tgid = (u32)bpf_get_current_pid_tgid();
+  data->ts = bpf_ktime_get_ns();
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
@@ -0,0 +1,148 @@
+// SPDX-License-Identifier: GPL-2.0
+// Copyright (c) 2020 Wenbo Zhang
+// CO-RE build of bpf/sched_quanta_runtime.bpf.c for ring buffer transports, probes the same
+// kernel functions, events keep the layout of quanta_runtime_perf_event_t
+
+#include "histogram.bpf.h"
+#include "target_filter.bpf.h"
+
+struct quanta_runtime_perf_event {
+  u32 cpu;
+  u32 pid;
+  u32 tgid;
+  u64 quanta_end_uptime_us;
+  u32 quanta_run_length_us;
+};
+
+struct quanta_histogram_key {
+  u32 tgid;
+  u32 slot;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, HASH_DEFAULT_ENTRIES);
+  __type(key, u32);
+  __type(value, u64);
+} run_start SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, HASH_DEFAULT_ENTRIES);
+  __type(key, u32);
+  __type(value, u64);
+} queue_start SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_PERCPU_HASH);
+  __uint(max_entries, HISTOGRAM_DEFAULT_ENTRIES);
+  __type(key, struct quanta_histogram_key);
+  __type(value, u64);
+} quanta_runtime_histogram SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_PERCPU_HASH);
+  __uint(max_entries, HISTOGRAM_DEFAULT_ENTRIES);
+  __type(key, struct quanta_histogram_key);
+  __type(value, u64);
+} quanta_queue_histogram SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} quanta_runtimes SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} quanta_queue_times SEC(".maps");
+
+static __always_inline void record_quanta(void* histogram, void* ring_buffer, u32 pid, u32 tgid,
+                                          u64 ts, u64 delta) {
+  if (settings.aggregate_histograms) {
+    struct quanta_histogram_key key = {.tgid = tgid, .slot = histogram_slot(delta / 1000)};
+    u64 zero = 0;
+    u64* count = lookup_or_try_init(histogram, &key, &zero);
+    if (count) {
+      (*count)++;
+      count_submitted_event();
+    } else {
+      count_lost_event();
+    }
+    return;
+  }
+  struct quanta_runtime_perf_event* data =
+      bpf_ringbuf_reserve(ring_buffer, sizeof(struct quanta_runtime_perf_event), 0);
+  if (!data) {
+    count_lost_event();
+    return;
+  }
+  __builtin_memset(data, 0, sizeof(struct quanta_runtime_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
+  // TODO(Patrick): avoid division and multiplication
+  data->quanta_end_uptime_us = ts / 1000;
+  data->quanta_run_length_us = delta / 1000;
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+}
+
+// attached by the hook, like the BCC program without USE_TRACEPOINT
+SEC("kprobe")
+int BPF_KPROBE(trace_wake_up_new_task, struct task_struct* p) {
+  u64 ts = bpf_ktime_get_ns();
+  u32 pid = BPF_CORE_READ(p, pid);
+  bpf_map_update_elem(&queue_start, &pid, &ts, BPF_ANY);
+  return 0;
+}
+
+SEC("kprobe")
+int BPF_KPROBE(trace_ttwu_do_wakeup, struct rq* rq, struct task_struct* p, int wake_flags) {
+  u64 ts = bpf_ktime_get_ns();
+
+  u32 tgid = BPF_CORE_READ(p, tgid);
+  u32 pid = BPF_CORE_READ(p, pid);
+  if (target_filtered(tgid) || pid == 0)
+    return 0;
+  // update queue time to now since initial time spent blocked
+  bpf_map_update_elem(&queue_start, &pid, &ts, BPF_ANY);
+  return 0;
+}
+
+SEC("kprobe")
+int BPF_KPROBE(trace_run, struct task_struct* prev) {
+  u32 next_pid = bpf_get_current_pid_tgid();
+  u32 next_tgid = bpf_get_current_pid_tgid() >> 32;
+
+  u64 ts = bpf_ktime_get_ns();
+
+  // ivcsw: treat next task like an enqueue event and store timestamp
+  if (!(target_filtered(next_tgid) || next_pid == 0)) {
+    // fetch timestamp and calculate delta
+    u64* tsp = bpf_map_lookup_elem(&queue_start, &next_pid);
+    if (tsp != 0) {
+      record_quanta(&quanta_queue_histogram, &quanta_queue_times, next_pid, next_tgid, ts,
+                    ts - *tsp);
+      bpf_map_delete_elem(&queue_start, &next_pid);
+    }
+    bpf_map_update_elem(&run_start, &next_pid, &ts, BPF_ANY);
+  }
+
+  u32 tgid = BPF_CORE_READ(prev, tgid);
+  u32 pid = BPF_CORE_READ(prev, pid);
+  if (target_filtered(tgid) || pid == 0)
+    return 0;
+
+  // fetch timestamp and calculate delta
+  u64* tsp = bpf_map_lookup_elem(&run_start, &pid);
+  if (tsp == 0) {
+    return 0; // missed enqueue
+  }
+  record_quanta(&quanta_runtime_histogram, &quanta_runtimes, pid, tgid, ts, ts - *tsp);
+  bpf_map_delete_elem(&run_start, &pid);
+  bpf_map_update_elem(&queue_start, &pid, &ts, BPF_ANY);
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
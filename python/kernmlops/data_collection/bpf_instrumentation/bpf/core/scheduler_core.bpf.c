@@ -0,0 +1,82 @@
+// CO-RE build of bpf/scheduler_core.bpf.c for ring buffer transports, probes the same kernel
+// function offsets, events keep the layout of scheduler_core_perf_event_t
+
+#include "target_filter.bpf.h"
+
+// Branch types for TCP receive processing
+#define PICK_ENTRY                  0
+#define PICK_IDLE                   1
+#define PICK_DONE                   2
+#define PICK_WHILE_IS_GROUP         3
+#define PICK_WHILE_DIFFERENT_GROUPS 4
+
+struct scheduler_core_perf_event {
+  u32 cpu;
+  u32 pid;
+  u32 tgid;
+  u64 ts_uptime_us;
+  char comm[16];
+  int flags;
+  int mode;
+  u8 event_type;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} scheduler_core_events SEC(".maps");
+
+static __always_inline int submit_scheduler_core_event(u8 event_type) {
+  u32 pid = bpf_get_current_pid_tgid();
+  u32 tgid = bpf_get_current_pid_tgid() >> 32;
+
+  if (target_filtered(tgid) || pid == 0)
+    return 0;
+
+  struct scheduler_core_perf_event* data =
+      bpf_ringbuf_reserve(&scheduler_core_events, sizeof(struct scheduler_core_perf_event), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  __builtin_memset(data, 0, sizeof(struct scheduler_core_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
+  data->ts_uptime_us = bpf_ktime_get_ns() / 1000;
+  data->event_type = event_type;
+
+  // Get the process name
+  bpf_get_current_comm(&data->comm, sizeof(data->comm));
+
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+SEC("kprobe")
+int entry(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(PICK_ENTRY);
+}
+
+SEC("kprobe")
+int idle(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(PICK_IDLE);
+}
+
+SEC("kprobe")
+int done(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(PICK_DONE);
+}
+
+SEC("kprobe")
+int while_is_group(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(PICK_WHILE_IS_GROUP);
+}
+
+SEC("kprobe")
+int while_different_groups(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(PICK_WHILE_DIFFERENT_GROUPS);
+}
+
+char LICENSE[] SEC("license") = "GPL";
@@ -0,0 +1,41 @@
+// CO-RE counterpart of TARGET_FILTER in target_filter.py, hooks drop the events of processes the
+// collection does not target with `if (target_filtered(tgid) || ...)`.
+
+#ifndef TARGET_FILTER_BPF_H
+#define TARGET_FILTER_BPF_H
+
+#include "kernmlops.bpf.h"
+
+// thread groups whose events are kept, shared by every hook through the pin path the loader gives
+// it and filled by the target_tracker object, unused and left unpinned without settings.filter_targets
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, 1);
+  __type(key, u32);
+  __type(value, u8);
+} target_tgids SEC(".maps");
+
+static __always_inline bool target_current_cgroup() {
+  if (!settings.filter_cgroup)
+    return false;
+  return bpf_get_current_ancestor_cgroup_id(settings.target_cgroup_level) ==
+         settings.target_cgroup_id;
+}
+
+static __always_inline bool target_filtered(u32 tgid) {
+  if (tgid == settings.collector_tgid)
+    return true;
+  if (!settings.filter_targets)
+    return false;
+  if (bpf_map_lookup_elem(&target_tgids, &tgid))
+    return false;
+  // processes moved into the cgroup after the collection started are tracked once they hit a probe
+  if (tgid == bpf_get_current_pid_tgid() >> 32 && target_current_cgroup()) {
+    u8 tracked = 1;
+    bpf_map_update_elem(&target_tgids, &tgid, &tracked, BPF_ANY);
+    return false;
+  }
+  return true;
+}
+
+#endif
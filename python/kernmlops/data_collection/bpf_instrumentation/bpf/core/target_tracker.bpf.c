@@ -0,0 +1,36 @@
+// CO-RE build of TARGET_TRACKER in target_filter.py, creates the target_tgids map every filtered hook
+// shares and keeps it up to date as target processes fork and exit.
+
+#include "kernmlops.bpf.h"
+#include "target_filter.bpf.h"
+
+static __always_inline void track_child(u32 child_pid, u32 child_tgid) {
+  u32 parent_tgid = bpf_get_current_pid_tgid() >> 32;
+  // new threads join the thread group of their parent, only new processes are tracked
+  if (child_tgid == parent_tgid || child_pid != child_tgid)
+    return;
+  if (bpf_map_lookup_elem(&target_tgids, &parent_tgid) || target_current_cgroup()) {
+    u8 tracked = 1;
+    bpf_map_update_elem(&target_tgids, &child_tgid, &tracked, BPF_ANY);
+  }
+}
+
+SEC("raw_tp/sched_process_fork")
+int BPF_PROG(track_fork, struct task_struct* parent, struct task_struct* child) {
+  track_child(BPF_CORE_READ(child, pid), BPF_CORE_READ(child, tgid));
+  return 0;
+}
+
+SEC("tp/sched/sched_process_exit")
+int track_exit(void* ctx) {
+  // the group leader can exit before its threads, the tgid is dropped once the last thread exits
+  // so that a recycled pid is not taken for a target
+  struct task_struct* task = (struct task_struct*)bpf_get_current_task();
+  if (BPF_CORE_READ(task, signal, live.counter) == 0) {
+    u32 tgid = bpf_get_current_pid_tgid() >> 32;
+    bpf_map_delete_elem(&target_tgids, &tgid);
+  }
+  return 0;
+}
+
+char LICENSE[] SEC("license") = "GPL";
@@ -0,0 +1,52 @@
+// CO-RE build of bpf/unmap_range.bpf.c for ring buffer transports, probes the same kernel
+// functions, events keep the layout of unmap_range_output_t
+
+#include "target_filter.bpf.h"
+
+struct unmap_range_output {
+  u32 tgid;
+  u64 ts_ns;
+  u64 start;
+  u64 end;
+  int huge;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} unmap_range_output SEC(".maps");
+
+static __always_inline int submit_unmap_range(struct vm_area_struct* vma, unsigned long start,
+                                              unsigned long end, bool huge) {
+  if (target_filtered(BPF_CORE_READ(vma, vm_mm, owner, tgid)))
+    return 0;
+  struct unmap_range_output* data =
+      bpf_ringbuf_reserve(&unmap_range_output, sizeof(struct unmap_range_output), 0);
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+  data->tgid = BPF_CORE_READ(vma, vm_mm, owner, tgid);
+  data->ts_ns = bpf_ktime_get_ns();
+  data->start = start;
+  data->end = end;
+  data->huge = huge;
+  bpf_ringbuf_submit(data, 0);
+  count_submitted_event();
+  return 0;
+}
+
+// kprobe__ functions are attached by BCC when compiling, and again by the hook
+SEC("kprobe/unmap_page_range")
+int BPF_KPROBE(kprobe__unmap_page_range, struct mmu_gather* tlb, struct vm_area_struct* vma,
+               unsigned long start, unsigned long end) {
+  return submit_unmap_range(vma, start, end, false);
+}
+
+SEC("kprobe/unmap_hugepage_range")
+int BPF_KPROBE(kprobe__unmap_hugepage_range, struct mmu_gather* tlb, struct vm_area_struct* vma,
+               unsigned long start, unsigned long end) {
+  return submit_unmap_range(vma, start, end, true);
+}
+
+char LICENSE[] SEC("license") = "GPL";
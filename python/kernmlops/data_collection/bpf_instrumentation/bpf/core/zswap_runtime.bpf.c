@@ -0,0 +1,113 @@
+// CO-RE build of bpf/zswap_runtime.bpf.c for ring buffer transports, probes the same kernel
+// functions, events keep the layout of zswap_event_t
+
+#include "target_filter.bpf.h"
+
+struct zswap_event {
+  u32 pid;
+  u32 tgid;
+  u64 start_ts;
+  u64 end_ts;
+};
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} zswap_store_events SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} zswap_load_events SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_RINGBUF);
+  __uint(max_entries, RINGBUF_DEFAULT_SIZE);
+} zswap_invalidate_events SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, HASH_DEFAULT_ENTRIES);
+  __type(key, u64);
+  __type(value, u64);
+} stores SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, HASH_DEFAULT_ENTRIES);
+  __type(key, u64);
+  __type(value, u64);
+} loads SEC(".maps");
+
+struct {
+  __uint(type, BPF_MAP_TYPE_HASH);
+  __uint(max_entries, HASH_DEFAULT_ENTRIES);
+  __type(key, u64);
+  __type(value, u64);
+} invalidates SEC(".maps");
+
+// IS_ERR of include/linux/err.h
+#define MAX_ERRNO 4095
+
+static __always_inline int zswap_entry(void* starts) {
+  u64 id = bpf_get_current_pid_tgid();
+  if (target_filtered(id >> 32))
+    return 0;
+  u64 start_ts = bpf_ktime_get_ns();
+  bpf_map_update_elem(starts, &id, &start_ts, BPF_ANY);
+  return 0;
+}
+
+static __always_inline int zswap_return(void* starts, void* ring_buffer, unsigned long ret) {
+  u64 id = bpf_get_current_pid_tgid();
+  u64* start_ts = bpf_map_lookup_elem(starts, &id);
+  if (start_ts == 0)
+    return 0;
+  if (ret >= (unsigned long)-MAX_ERRNO)
+    return 0;
+  struct zswap_event* event = bpf_ringbuf_reserve(ring_buffer, sizeof(struct zswap_event), 0);
+  if (!event)
+    count_lost_event();
+  if (event) {
+    event->pid = (u32)(id);
+    event->tgid = (u32)(id >> 32);
+    event->start_ts = *start_ts;
+    event->end_ts = bpf_ktime_get_ns();
+    bpf_ringbuf_submit(event, 0);
+    count_submitted_event();
+  }
+  bpf_map_delete_elem(starts, &id);
+  return 0;
+}
+
+SEC("kprobe")
+int BPF_KPROBE(trace_zswap_store_entry) {
+  return zswap_entry(&stores);
+}
+
+SEC("kretprobe")
+int BPF_KRETPROBE(trace_zswap_store_return, unsigned long ret) {
+  return zswap_return(&stores, &zswap_store_events, ret);
+}
+
+SEC("kprobe")
+int BPF_KPROBE(trace_zswap_load_entry) {
+  return zswap_entry(&loads);
+}
+
+SEC("kretprobe")
+int BPF_KRETPROBE(trace_zswap_load_return, unsigned long ret) {
+  return zswap_return(&loads, &zswap_load_events, ret);
+}
+
+SEC("kprobe")
+int BPF_KPROBE(trace_zswap_invalidate_entry) {
+  return zswap_entry(&invalidates);
+}
+
+SEC("kretprobe")
+int BPF_KRETPROBE(trace_zswap_invalidate_return, unsigned long ret) {
+  return zswap_return(&invalidates, &zswap_invalidate_events, ret);
+}
+
+char LICENSE[] SEC("license") = "GPL";
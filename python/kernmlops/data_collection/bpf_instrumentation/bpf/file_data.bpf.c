@@ -5,6 +5,7 @@
 // Adapted from: https://github.com/iovisor/bcc/blob/master/tools/filelife.py
 
 typedef struct file_open_perf_event {
+  u32 cpu;
   u32 pid;
   u32 tgid;
   u64 ts_uptime_us;
@@ -13,12 +14,16 @@ typedef struct file_open_perf_event {
   char file_name[DNAME_INLINE_LEN];
 } file_open_perf_event_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(file_open_events, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(file_open_events);
+#endif
 
 static int probe_dentry(struct pt_regs* ctx, struct dentry* dentry, bool created) {
   u32 pid = bpf_get_current_pid_tgid();
   u32 tgid = bpf_get_current_pid_tgid() >> 32;
-  if (FILTER || pid == 0)
+  if (target_filtered(tgid) || pid == 0)
     return 0;
 
   u64 ts = bpf_ktime_get_ns();
@@ -27,17 +32,33 @@ static int probe_dentry(struct pt_regs* ctx, struct dentry* dentry, bool created
     return 0;
   }
 
-  struct file_open_perf_event data;
-  __builtin_memset(&data, 0, sizeof(data));
-  data.pid = pid;
-  data.tgid = tgid;
+  struct file_open_perf_event* data;
+#if USE_RINGBUF
+  data = file_open_events.ringbuf_reserve(sizeof(struct file_open_perf_event));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  struct file_open_perf_event open_event;
+  data = &open_event;
+#endif
+  __builtin_memset(data, 0, sizeof(struct file_open_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
   // TODO(Patrick): avoid division and multiplication
-  data.ts_uptime_us = ts / 1000;
-  data.file_inode = dentry->d_inode->i_ino;
-  data.file_size_bytes = file_size;
-  bpf_probe_read(&data.file_name, DNAME_INLINE_LEN, (const void*)&dentry->d_iname);
+  data->ts_uptime_us = ts / 1000;
+  data->file_inode = dentry->d_inode->i_ino;
+  data->file_size_bytes = file_size;
+  bpf_probe_read(&data->file_name, DNAME_INLINE_LEN, (const void*)&dentry->d_iname);
 
-  file_open_events.perf_submit(ctx, &data, sizeof(data));
+#if USE_RINGBUF
+  file_open_events.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(file_open_events.perf_submit(ctx, data, sizeof(struct file_open_perf_event)));
+#endif
 
   return 0;
 }
@@ -3,6 +3,7 @@
 #include <uapi/linux/ptrace.h>
 
 typedef struct file_opening_perf_event {
+  u32 cpu;
   u32 pid;
   u32 tgid;
   u64 ts_uptime_us;
@@ -11,27 +12,49 @@ typedef struct file_opening_perf_event {
   int mode;
 } file_opening_perf_event_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(file_opening_events, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(file_opening_events);
+#endif
 
 int trace_sys_openat(struct pt_regs* ctx, int dfd, const char* filename, int flags, umode_t mode) {
   u32 pid = bpf_get_current_pid_tgid();
   u32 tgid = bpf_get_current_pid_tgid() >> 32;
 
-  // Filter if needed (currently accepting all - same pattern as other hooks)
-  if (FILTER || pid == 0)
+  // Drop events of processes the collection does not target
+  if (target_filtered(tgid) || pid == 0)
     return 0;
 
-  struct file_opening_perf_event data = {};
-  data.pid = pid;
-  data.tgid = tgid;
-  data.ts_uptime_us = bpf_ktime_get_ns() / 1000;
-  data.flags = flags;
-  data.mode = mode;
+  struct file_opening_perf_event* data;
+#if USE_RINGBUF
+  data = file_opening_events.ringbuf_reserve(sizeof(struct file_opening_perf_event));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  struct file_opening_perf_event opening_event;
+  data = &opening_event;
+#endif
+  __builtin_memset(data, 0, sizeof(struct file_opening_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
+  data->ts_uptime_us = bpf_ktime_get_ns() / 1000;
+  data->flags = flags;
+  data->mode = mode;
 
   // Copy the filename (safely)
-  bpf_probe_read_user_str(&data.filename, sizeof(data.filename), filename);
+  bpf_probe_read_user_str(&data->filename, sizeof(data->filename), filename);
 
-  file_opening_events.perf_submit(ctx, &data, sizeof(data));
+#if USE_RINGBUF
+  file_opening_events.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(
+      file_opening_events.perf_submit(ctx, data, sizeof(struct file_opening_perf_event)));
+#endif
 
   return 0;
 }
@@ -13,45 +13,101 @@ typedef struct stop_data {
   u64 ts;
 } stop_data_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(copy_task_events, RINGBUF_PAGES);
+BPF_RINGBUF_OUTPUT(release_task_events, RINGBUF_PAGES);
+BPF_RINGBUF_OUTPUT(exec_events, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(copy_task_events);
 BPF_PERF_OUTPUT(release_task_events);
 BPF_PERF_OUTPUT(exec_events);
+#endif
 
 int kretprobe_copy_process(struct pt_regs* ctx) {
   struct task_struct* task;
   if (IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
     return 0;
-  start_data_t data;
-  bpf_get_current_comm(&data.buff, sizeof(data.buff));
-  data.ts = bpf_ktime_get_ns();
-  data.pid = task->pid;
-  data.tgid = task->tgid;
-  copy_task_events.perf_submit(ctx, &data, sizeof(data));
+  // new processes are kept when their parent is a target
+  if (target_filtered(bpf_get_current_pid_tgid() >> 32))
+    return 0;
+  start_data_t* data;
+#if USE_RINGBUF
+  data = copy_task_events.ringbuf_reserve(sizeof(start_data_t));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  start_data_t start_event;
+  data = &start_event;
+#endif
+  bpf_get_current_comm(&data->buff, sizeof(data->buff));
+  data->ts = bpf_ktime_get_ns();
+  data->pid = task->pid;
+  data->tgid = task->tgid;
+#if USE_RINGBUF
+  copy_task_events.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(copy_task_events.perf_submit(ctx, data, sizeof(start_data_t)));
+#endif
   return 0;
 }
 
 int kprobe_do_exit(struct pt_regs* ctx, long code) {
+  if (target_filtered(bpf_get_current_pid_tgid() >> 32))
+    return 0;
   struct task_struct* task = (struct task_struct*)bpf_get_current_task();
-  stop_data_t data;
-  data.ts = bpf_ktime_get_ns();
-  data.pid = task->pid;
-  data.tgid = task->tgid;
-  release_task_events.perf_submit(ctx, &data, sizeof(data));
+  stop_data_t* data;
+#if USE_RINGBUF
+  data = release_task_events.ringbuf_reserve(sizeof(stop_data_t));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  stop_data_t stop_event;
+  data = &stop_event;
+#endif
+  data->ts = bpf_ktime_get_ns();
+  data->pid = task->pid;
+  data->tgid = task->tgid;
+#if USE_RINGBUF
+  release_task_events.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(release_task_events.perf_submit(ctx, data, sizeof(stop_data_t)));
+#endif
   return 0;
 }
 
 typedef start_data_t exec_data_t;
 
 int kretprobe_exec(struct pt_regs* ctx) {
-  if (PT_REGS_RC(ctx) != 0)
+  if (PT_REGS_RC(ctx) != 0 || target_filtered(bpf_get_current_pid_tgid() >> 32))
     return 0;
 
-  exec_data_t data;
-  bpf_get_current_comm(data.buff, sizeof(data.buff));
-  data.pid = bpf_get_current_pid_tgid() >> 32;
-  data.tgid = (u32)bpf_get_current_pid_tgid();
-  data.ts = bpf_ktime_get_ns();
-  exec_events.perf_submit(ctx, &data, sizeof(data));
+  exec_data_t* data;
+#if USE_RINGBUF
+  data = exec_events.ringbuf_reserve(sizeof(exec_data_t));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  exec_data_t exec_event;
+  data = &exec_event;
+#endif
+  bpf_get_current_comm(data->buff, sizeof(data->buff));
+  data->pid = bpf_get_current_pid_tgid() >> 32;
+  data->tgid = (u32)bpf_get_current_pid_tgid();
+  data->ts = bpf_ktime_get_ns();
+#if USE_RINGBUF
+  exec_events.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(exec_events.perf_submit(ctx, data, sizeof(exec_data_t)));
+#endif
 
   return 0;
 }
@@ -9,7 +9,26 @@ typedef struct madvise_output {
   int advice;
 } madvise_output_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(madvise_output, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(madvise_output);
+#endif
+
+static void submit_madvise_output(struct pt_regs* ctx, madvise_output_t* data) {
+#if USE_RINGBUF
+  madvise_output_t* output = madvise_output.ringbuf_reserve(sizeof(madvise_output_t));
+  if (!output)
+    count_lost_event();
+  if (output) {
+    __builtin_memcpy(output, data, sizeof(madvise_output_t));
+    madvise_output.ringbuf_submit(output, 0);
+    count_submitted_event();
+  }
+#else
+  count_perf_submit(madvise_output.perf_submit(ctx, data, sizeof(madvise_output_t)));
+#endif
+}
 
 BPF_HASH(madvise_hash, u32, madvise_output_t, 32768);
 BPF_HASH(munmap_hash, u32, madvise_output_t, 32768);
@@ -20,6 +39,8 @@ int kprobe__do_madvise(struct pt_regs* ctx, struct mm_struct* mm, unsigned long
   madvise_output_t data;
   memset((void*)&data, 0, sizeof(data));
   data.tgid = mm->owner->tgid;
+  if (target_filtered(data.tgid))
+    return 0;
   data.ts_ns = bpf_ktime_get_ns();
   data.address = (u64)addr;
   data.length = (u64)length;
@@ -37,7 +58,7 @@ int kretprobe__do_madvise(struct pt_regs* ctx) {
   if ((data = madvise_hash.lookup(&pid)) == NULL)
     madvise_hash.delete(&pid);
   return 0;
-  madvise_output.perf_submit(ctx, data, sizeof(madvise_output_t));
+  submit_madvise_output(ctx, data);
   madvise_hash.delete(&pid);
   return 0;
 }
@@ -49,6 +70,8 @@ int kprobe__do_vmi_align_munmap(struct pt_regs* ctx, struct vm_area_struct* vma,
   madvise_output_t data;
   memset((void*)&data, 0, sizeof(data));
   data.tgid = mm->owner->tgid;
+  if (target_filtered(data.tgid))
+    return 0;
   data.ts_ns = bpf_ktime_get_ns();
   data.address = (u64)start;
   data.length = (u64)(end - start);
@@ -65,7 +88,7 @@ int kretprobe__do_vmi_align_munmap(struct pt_regs* ctx) {
   if (((int)PT_REGS_RC(ctx)) != 0)
     munmap_hash.delete(&pid);
   return 0;
-  madvise_output.perf_submit(ctx, data, sizeof(madvise_output_t));
+  submit_madvise_output(ctx, data);
   munmap_hash.delete(&pid);
   return 0;
 }
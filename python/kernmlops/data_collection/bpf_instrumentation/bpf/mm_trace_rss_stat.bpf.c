@@ -9,7 +9,11 @@ typedef struct rss_stat_output {
   u64 counter_value;
 } rss_stat_output_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(rss_stat_output, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(rss_stat_output);
+#endif
 
 BPF_HASH(rss_stat_hash, u32, rss_stat_output_t, 32768);
 
@@ -25,6 +29,8 @@ RAW_TRACEPOINT_PROBE(rss_stat) {
   struct mm_struct* mm = (struct mm_struct*)ctx->args[0];
   stack_data.pid = mm->owner->pid;
   stack_data.tgid = mm->owner->tgid;
+  if (target_filtered(stack_data.tgid))
+    return 0;
 
   rss_stat_hash.insert(&pid, &stack_data);
   return 0;
@@ -41,7 +47,18 @@ TRACEPOINT_PROBE(kmem, rss_stat) {
   data->counter_value = (args->size) >> PAGE_SZ;
   data->ts = bpf_ktime_get_ns();
 
-  rss_stat_output.perf_submit(args, data, sizeof(rss_stat_output_t));
+#if USE_RINGBUF
+  rss_stat_output_t* output = rss_stat_output.ringbuf_reserve(sizeof(rss_stat_output_t));
+  if (!output)
+    count_lost_event();
+  if (output) {
+    __builtin_memcpy(output, data, sizeof(rss_stat_output_t));
+    rss_stat_output.ringbuf_submit(output, 0);
+    count_submitted_event();
+  }
+#else
+  count_perf_submit(rss_stat_output.perf_submit(args, data, sizeof(rss_stat_output_t)));
+#endif
   rss_stat_hash.delete(&pid);
   return 0;
 }
@@ -10,16 +10,30 @@
 #include <uapi/linux/ptrace.h>
 
 typedef struct quanta_runtime_perf_event {
+  u32 cpu;
   u32 pid;
   u32 tgid;
   u64 quanta_end_uptime_us;
   u32 quanta_run_length_us;
 } quanta_runtime_perf_event_t;
 
+typedef struct quanta_histogram_key {
+  u32 tgid;
+  u32 slot;
+} quanta_histogram_key_t;
+
 BPF_HASH(run_start, u32);
 BPF_HASH(queue_start, u32);
+#if AGGREGATE_HISTOGRAMS
+BPF_PERCPU_HASH(quanta_runtime_histogram, quanta_histogram_key_t, u64, HISTOGRAM_MAX_ENTRIES);
+BPF_PERCPU_HASH(quanta_queue_histogram, quanta_histogram_key_t, u64, HISTOGRAM_MAX_ENTRIES);
+#elif USE_RINGBUF
+BPF_RINGBUF_OUTPUT(quanta_runtimes, RINGBUF_PAGES);
+BPF_RINGBUF_OUTPUT(quanta_queue_times, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(quanta_runtimes);
 BPF_PERF_OUTPUT(quanta_queue_times);
+#endif
 
 #if USE_TRACEPOINT
 RAW_TRACEPOINT_PROBE(sched_wakeup_new) {
@@ -44,7 +58,7 @@ int trace_ttwu_do_wakeup(struct pt_regs* ctx, struct rq* rq, struct task_struct*
 
   u32 tgid = p->tgid;
   u32 pid = p->pid;
-  if (FILTER || pid == 0)
+  if (target_filtered(tgid) || pid == 0)
     return 0;
   // update queue time to now since initial time spent blocked
   queue_start.update(&pid, &ts);
@@ -67,22 +81,51 @@ int trace_run(struct pt_regs* ctx, struct task_struct* prev) {
   u64 ts = bpf_ktime_get_ns();
 
   // ivcsw: treat next task like an enqueue event and store timestamp
-  if (!(FILTER || next_pid == 0)) {
+  if (!(target_filtered(next_tgid) || next_pid == 0)) {
     // fetch timestamp and calculate delta
     u64 *tsp, delta;
     tsp = queue_start.lookup(&next_pid);
     if (tsp != 0) {
       delta = ts - *tsp;
 
-      struct quanta_runtime_perf_event data;
-      __builtin_memset(&data, 0, sizeof(data));
-      data.pid = next_pid;
-      data.tgid = next_tgid;
-      // TODO(Patrick): avoid division and multiplication
-      data.quanta_end_uptime_us = ts / 1000;
-      data.quanta_run_length_us = delta / 1000;
-      // TODO(Patrick): consider only submitting if greater than 10us or so
-      quanta_queue_times.perf_submit(ctx, &data, sizeof(data));
+#if AGGREGATE_HISTOGRAMS
+      quanta_histogram_key_t key = {.tgid = next_tgid, .slot = histogram_slot(delta / 1000)};
+      u64 zero = 0;
+      u64* count = quanta_queue_histogram.lookup_or_try_init(&key, &zero);
+      if (count) {
+        (*count)++;
+        count_submitted_event();
+      } else {
+        count_lost_event();
+      }
+#else
+      struct quanta_runtime_perf_event* data;
+#if USE_RINGBUF
+      data = quanta_queue_times.ringbuf_reserve(sizeof(struct quanta_runtime_perf_event));
+      if (!data)
+        count_lost_event();
+#else
+      struct quanta_runtime_perf_event queue_event;
+      data = &queue_event;
+#endif
+      if (data) {
+        __builtin_memset(data, 0, sizeof(struct quanta_runtime_perf_event));
+        data->cpu = bpf_get_smp_processor_id();
+        data->pid = next_pid;
+        data->tgid = next_tgid;
+        // TODO(Patrick): avoid division and multiplication
+        data->quanta_end_uptime_us = ts / 1000;
+        data->quanta_run_length_us = delta / 1000;
+        // TODO(Patrick): consider only submitting if greater than 10us or so
+#if USE_RINGBUF
+        quanta_queue_times.ringbuf_submit(data, 0);
+        count_submitted_event();
+#else
+        count_perf_submit(
+            quanta_queue_times.perf_submit(ctx, data, sizeof(struct quanta_runtime_perf_event)));
+#endif
+      }
+#endif
       queue_start.delete(&next_pid);
     }
     run_start.update(&next_pid, &ts);
@@ -90,7 +133,7 @@ int trace_run(struct pt_regs* ctx, struct task_struct* prev) {
 
   u32 tgid = prev->tgid;
   u32 pid = prev->pid;
-  if (FILTER || pid == 0)
+  if (target_filtered(tgid) || pid == 0)
     return 0;
   u64 *tsp, delta;
 
@@ -101,15 +144,43 @@ int trace_run(struct pt_regs* ctx, struct task_struct* prev) {
   }
   delta = ts - *tsp;
 
-  struct quanta_runtime_perf_event data;
-  __builtin_memset(&data, 0, sizeof(data));
-  data.pid = pid;
-  data.tgid = tgid;
-  // TODO(Patrick): avoid division and multiplication
-  data.quanta_end_uptime_us = ts / 1000;
-  data.quanta_run_length_us = delta / 1000;
-
-  quanta_runtimes.perf_submit(ctx, &data, sizeof(data));
+#if AGGREGATE_HISTOGRAMS
+  quanta_histogram_key_t key = {.tgid = tgid, .slot = histogram_slot(delta / 1000)};
+  u64 zero = 0;
+  u64* count = quanta_runtime_histogram.lookup_or_try_init(&key, &zero);
+  if (count) {
+    (*count)++;
+    count_submitted_event();
+  } else {
+    count_lost_event();
+  }
+#else
+  struct quanta_runtime_perf_event* data;
+#if USE_RINGBUF
+  data = quanta_runtimes.ringbuf_reserve(sizeof(struct quanta_runtime_perf_event));
+  if (!data)
+    count_lost_event();
+#else
+  struct quanta_runtime_perf_event runtime_event;
+  data = &runtime_event;
+#endif
+  if (data) {
+    __builtin_memset(data, 0, sizeof(struct quanta_runtime_perf_event));
+    data->cpu = bpf_get_smp_processor_id();
+    data->pid = pid;
+    data->tgid = tgid;
+    // TODO(Patrick): avoid division and multiplication
+    data->quanta_end_uptime_us = ts / 1000;
+    data->quanta_run_length_us = delta / 1000;
+#if USE_RINGBUF
+    quanta_runtimes.ringbuf_submit(data, 0);
+    count_submitted_event();
+#else
+    count_perf_submit(
+        quanta_runtimes.perf_submit(ctx, data, sizeof(struct quanta_runtime_perf_event)));
+#endif
+  }
+#endif
   run_start.delete(&pid);
   queue_start.update(&pid, &ts);
   return 0;
@@ -10,6 +10,7 @@
 #define PICK_WHILE_DIFFERENT_GROUPS 4
 
 typedef struct scheduler_core_perf_event {
+  u32 cpu;
   u32 pid;
   u32 tgid;
   u64 ts_uptime_us;
@@ -19,126 +20,71 @@ typedef struct scheduler_core_perf_event {
   u8 event_type;
 } scheduler_core_perf_event_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(scheduler_core_events, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(scheduler_core_events);
+#endif
 
-int entry(struct pt_regs* ctx) {
+static int submit_scheduler_core_event(struct pt_regs* ctx, u8 event_type) {
   u32 pid = bpf_get_current_pid_tgid();
   u32 tgid = bpf_get_current_pid_tgid() >> 32;
 
-  if (FILTER || pid == 0)
+  if (target_filtered(tgid) || pid == 0)
     return 0;
 
-  struct scheduler_core_perf_event data = {};
-  data.pid = pid;
-  data.tgid = tgid;
-  data.ts_uptime_us = bpf_ktime_get_ns() / 1000;
-  data.event_type = PICK_ENTRY;
-
-  // Get the process name
-  bpf_get_current_comm(&data.comm, sizeof(data.comm));
-
-  // IMPORTANT: Don't try to set event_name in BPF code
-  // We'll set it in the Python handler function
-
-  // Submit the event
-  scheduler_core_events.perf_submit(ctx, &data, sizeof(data));
-
-  return 0;
-}
-
-int idle(struct pt_regs* ctx) {
-  u32 pid = bpf_get_current_pid_tgid();
-  u32 tgid = bpf_get_current_pid_tgid() >> 32;
-
-  if (FILTER || pid == 0)
+  struct scheduler_core_perf_event* data;
+#if USE_RINGBUF
+  data = scheduler_core_events.ringbuf_reserve(sizeof(struct scheduler_core_perf_event));
+  if (!data) {
+    count_lost_event();
     return 0;
-
-  struct scheduler_core_perf_event data = {};
-  data.pid = pid;
-  data.tgid = tgid;
-  data.ts_uptime_us = bpf_ktime_get_ns() / 1000;
-  data.event_type = PICK_IDLE;
+  }
+#else
+  struct scheduler_core_perf_event core_event;
+  data = &core_event;
+#endif
+  __builtin_memset(data, 0, sizeof(struct scheduler_core_perf_event));
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
+  data->ts_uptime_us = bpf_ktime_get_ns() / 1000;
+  data->event_type = event_type;
 
   // Get the process name
-  bpf_get_current_comm(&data.comm, sizeof(data.comm));
+  bpf_get_current_comm(&data->comm, sizeof(data->comm));
 
   // IMPORTANT: Don't try to set event_name in BPF code
   // We'll set it in the Python handler function
 
   // Submit the event
-  scheduler_core_events.perf_submit(ctx, &data, sizeof(data));
+#if USE_RINGBUF
+  scheduler_core_events.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(
+      scheduler_core_events.perf_submit(ctx, data, sizeof(struct scheduler_core_perf_event)));
+#endif
 
   return 0;
 }
-int done(struct pt_regs* ctx) {
-  u32 pid = bpf_get_current_pid_tgid();
-  u32 tgid = bpf_get_current_pid_tgid() >> 32;
-
-  if (FILTER || pid == 0)
-    return 0;
-
-  struct scheduler_core_perf_event data = {};
-  data.pid = pid;
-  data.tgid = tgid;
-  data.ts_uptime_us = bpf_ktime_get_ns() / 1000;
-  data.event_type = PICK_DONE;
-
-  // Get the process name
-  bpf_get_current_comm(&data.comm, sizeof(data.comm));
-
-  // IMPORTANT: Don't try to set event_name in BPF code
-  // We'll set it in the Python handler function
 
-  // Submit the event
-  scheduler_core_events.perf_submit(ctx, &data, sizeof(data));
-
-  return 0;
+int entry(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(ctx, PICK_ENTRY);
 }
-int while_is_group(struct pt_regs* ctx) {
-  u32 pid = bpf_get_current_pid_tgid();
-  u32 tgid = bpf_get_current_pid_tgid() >> 32;
-
-  if (FILTER || pid == 0)
-    return 0;
-
-  struct scheduler_core_perf_event data = {};
-  data.pid = pid;
-  data.tgid = tgid;
-  data.ts_uptime_us = bpf_ktime_get_ns() / 1000;
-  data.event_type = PICK_WHILE_IS_GROUP;
-
-  // Get the process name
-  bpf_get_current_comm(&data.comm, sizeof(data.comm));
 
-  // IMPORTANT: Don't try to set event_name in BPF code
-  // We'll set it in the Python handler function
-
-  // Submit the event
-  scheduler_core_events.perf_submit(ctx, &data, sizeof(data));
-
-  return 0;
+int idle(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(ctx, PICK_IDLE);
 }
-int while_different_groups(struct pt_regs* ctx) {
-  u32 pid = bpf_get_current_pid_tgid();
-  u32 tgid = bpf_get_current_pid_tgid() >> 32;
-
-  if (FILTER || pid == 0)
-    return 0;
 
-  struct scheduler_core_perf_event data = {};
-  data.pid = pid;
-  data.tgid = tgid;
-  data.ts_uptime_us = bpf_ktime_get_ns() / 1000;
-  data.event_type = PICK_WHILE_DIFFERENT_GROUPS;
-
-  // Get the process name
-  bpf_get_current_comm(&data.comm, sizeof(data.comm));
-
-  // IMPORTANT: Don't try to set event_name in BPF code
-  // We'll set it in the Python handler function
+int done(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(ctx, PICK_DONE);
+}
 
-  // Submit the event
-  scheduler_core_events.perf_submit(ctx, &data, sizeof(data));
+int while_is_group(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(ctx, PICK_WHILE_IS_GROUP);
+}
 
-  return 0;
+int while_different_groups(struct pt_regs* ctx) {
+  return submit_scheduler_core_event(ctx, PICK_WHILE_DIFFERENT_GROUPS);
 }
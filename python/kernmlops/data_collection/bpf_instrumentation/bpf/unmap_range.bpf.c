@@ -9,29 +9,67 @@ typedef struct unmap_range_output {
   int huge;
 } unmap_range_output_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(unmap_range_output, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(unmap_range_output);
+#endif
 
 int kprobe__unmap_page_range(struct pt_regs* ctx, struct mm_gather* tlb, struct vm_area_struct* vma,
                              unsigned long start, unsigned long end, struct zap_details* details) {
-  unmap_range_output_t data;
-  data.tgid = vma->vm_mm->owner->tgid;
-  data.ts_ns = bpf_ktime_get_ns();
-  data.start = start;
-  data.end = end;
-  data.huge = false;
-  unmap_range_output.perf_submit(ctx, &data, sizeof(unmap_range_output_t));
+  if (target_filtered(vma->vm_mm->owner->tgid))
+    return 0;
+  unmap_range_output_t* data;
+#if USE_RINGBUF
+  data = unmap_range_output.ringbuf_reserve(sizeof(unmap_range_output_t));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  unmap_range_output_t range_event;
+  data = &range_event;
+#endif
+  data->tgid = vma->vm_mm->owner->tgid;
+  data->ts_ns = bpf_ktime_get_ns();
+  data->start = start;
+  data->end = end;
+  data->huge = false;
+#if USE_RINGBUF
+  unmap_range_output.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(unmap_range_output.perf_submit(ctx, data, sizeof(unmap_range_output_t)));
+#endif
   return 0;
 }
 
 int kprobe__unmap_hugepage_range(struct pt_regs* ctx, struct mm_gather* tlb,
                                  struct vm_area_struct* vma, unsigned long start, unsigned long end,
                                  struct page* ref_page, zap_flags_t zap_flags) {
-  unmap_range_output_t data;
-  data.tgid = vma->vm_mm->owner->tgid;
-  data.ts_ns = bpf_ktime_get_ns();
-  data.start = start;
-  data.end = end;
-  data.huge = true;
-  unmap_range_output.perf_submit(ctx, &data, sizeof(unmap_range_output_t));
+  if (target_filtered(vma->vm_mm->owner->tgid))
+    return 0;
+  unmap_range_output_t* data;
+#if USE_RINGBUF
+  data = unmap_range_output.ringbuf_reserve(sizeof(unmap_range_output_t));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  unmap_range_output_t range_event;
+  data = &range_event;
+#endif
+  data->tgid = vma->vm_mm->owner->tgid;
+  data->ts_ns = bpf_ktime_get_ns();
+  data->start = start;
+  data->end = end;
+  data->huge = true;
+#if USE_RINGBUF
+  unmap_range_output.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(unmap_range_output.perf_submit(ctx, data, sizeof(unmap_range_output_t)));
+#endif
   return 0;
 }
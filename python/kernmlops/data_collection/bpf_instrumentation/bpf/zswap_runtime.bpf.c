@@ -8,9 +8,15 @@ typedef struct zswap_event {
   u64 end_ts;
 } zswap_event_t;
 
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(zswap_store_events, RINGBUF_PAGES);
+BPF_RINGBUF_OUTPUT(zswap_load_events, RINGBUF_PAGES);
+BPF_RINGBUF_OUTPUT(zswap_invalidate_events, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(zswap_store_events);
 BPF_PERF_OUTPUT(zswap_load_events);
 BPF_PERF_OUTPUT(zswap_invalidate_events);
+#endif
 
 BPF_HASH(stores, u64, u64);
 BPF_HASH(loads, u64, u64);
@@ -18,6 +24,8 @@ BPF_HASH(invalidates, u64, u64);
 
 int trace_zswap_store_entry(struct pt_regs* ctx) {
   u64 id = bpf_get_current_pid_tgid();
+  if (target_filtered(id >> 32))
+    return 0;
   u64 start_ts = bpf_ktime_get_ns();
   stores.update(&id, &start_ts);
   return 0;
@@ -31,18 +39,35 @@ int trace_zswap_store_return(struct pt_regs* ctx) {
   struct task_struct* task;
   if (IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
     return 0;
-  zswap_event_t event;
-  event.pid = (u32)(id);
-  event.tgid = (u32)(id >> 32);
-  event.start_ts = *start_ts;
-  event.end_ts = bpf_ktime_get_ns();
-  zswap_store_events.perf_submit(ctx, &event, sizeof(event));
+  zswap_event_t* event;
+#if USE_RINGBUF
+  event = zswap_store_events.ringbuf_reserve(sizeof(zswap_event_t));
+  if (!event)
+    count_lost_event();
+#else
+  zswap_event_t stack_event;
+  event = &stack_event;
+#endif
+  if (event) {
+    event->pid = (u32)(id);
+    event->tgid = (u32)(id >> 32);
+    event->start_ts = *start_ts;
+    event->end_ts = bpf_ktime_get_ns();
+#if USE_RINGBUF
+    zswap_store_events.ringbuf_submit(event, 0);
+    count_submitted_event();
+#else
+    count_perf_submit(zswap_store_events.perf_submit(ctx, event, sizeof(zswap_event_t)));
+#endif
+  }
   stores.delete(&id);
   return 0;
 }
 
 int trace_zswap_load_entry(struct pt_regs* ctx) {
   u64 id = bpf_get_current_pid_tgid();
+  if (target_filtered(id >> 32))
+    return 0;
   u64 start_ts = bpf_ktime_get_ns();
   loads.update(&id, &start_ts);
   return 0;
@@ -56,18 +81,35 @@ int trace_zswap_load_return(struct pt_regs* ctx) {
   struct task_struct* task;
   if (IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
     return 0;
-  zswap_event_t event;
-  event.pid = (u32)(id);
-  event.tgid = (u32)(id >> 32);
-  event.start_ts = *start_ts;
-  event.end_ts = bpf_ktime_get_ns();
-  zswap_load_events.perf_submit(ctx, &event, sizeof(event));
+  zswap_event_t* event;
+#if USE_RINGBUF
+  event = zswap_load_events.ringbuf_reserve(sizeof(zswap_event_t));
+  if (!event)
+    count_lost_event();
+#else
+  zswap_event_t stack_event;
+  event = &stack_event;
+#endif
+  if (event) {
+    event->pid = (u32)(id);
+    event->tgid = (u32)(id >> 32);
+    event->start_ts = *start_ts;
+    event->end_ts = bpf_ktime_get_ns();
+#if USE_RINGBUF
+    zswap_load_events.ringbuf_submit(event, 0);
+    count_submitted_event();
+#else
+    count_perf_submit(zswap_load_events.perf_submit(ctx, event, sizeof(zswap_event_t)));
+#endif
+  }
   loads.delete(&id);
   return 0;
 }
 
 int trace_zswap_invalidate_entry(struct pt_regs* ctx) {
   u64 id = bpf_get_current_pid_tgid();
+  if (target_filtered(id >> 32))
+    return 0;
   u64 start_ts = bpf_ktime_get_ns();
   invalidates.update(&id, &start_ts);
   return 0;
@@ -81,12 +123,27 @@ int trace_zswap_invalidate_return(struct pt_regs* ctx) {
   struct task_struct* task;
   if (IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
     return 0;
-  zswap_event_t event;
-  event.pid = (u32)(id);
-  event.tgid = (u32)(id >> 32);
-  event.start_ts = *start_ts;
-  event.end_ts = bpf_ktime_get_ns();
-  zswap_invalidate_events.perf_submit(ctx, &event, sizeof(event));
+  zswap_event_t* event;
+#if USE_RINGBUF
+  event = zswap_invalidate_events.ringbuf_reserve(sizeof(zswap_event_t));
+  if (!event)
+    count_lost_event();
+#else
+  zswap_event_t stack_event;
+  event = &stack_event;
+#endif
+  if (event) {
+    event->pid = (u32)(id);
+    event->tgid = (u32)(id >> 32);
+    event->start_ts = *start_ts;
+    event->end_ts = bpf_ktime_get_ns();
+#if USE_RINGBUF
+    zswap_invalidate_events.ringbuf_submit(event, 0);
+    count_submitted_event();
+#else
+    count_perf_submit(zswap_invalidate_events.perf_submit(ctx, event, sizeof(zswap_event_t)));
+#endif
+  }
   invalidates.delete(&id);
   return 0;
 }
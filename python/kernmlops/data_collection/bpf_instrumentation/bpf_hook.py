@@ -1,7 +1,10 @@
 """Abstract definition of a BPF program."""
 
+from collections.abc import Callable
 
+from data_collection.bpf_instrumentation.transport import EventCounts
 from data_schema import CollectionTable
+from kernmlops_config import ConfigBase
 from typing_extensions import Final, Protocol
 
 POLL_TIMEOUT_MS: Final[int] = 5
@@ -13,12 +16,37 @@ class BPFProgram(Protocol):
   @classmethod
   def name(cls) -> str: ...
 
-  def load(self, collection_id: str) -> None: ...
+  @classmethod
+  def default_config(cls) -> ConfigBase | None:
+    """Settings of the hook, kept in the collector config section named after it."""
+    return None
+
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "BPFProgram":
+    """Creates the hook from the full collector config, hooks without settings ignore it."""
+    return cls()
+
+  def prepare(self) -> None:
+    """Slow setup like compiling, hooks are prepared concurrently before any of them is loaded."""
+
+  def load(self, collection_id: str) -> None:
+    """Attaches the prepared hook, hooks are loaded one at a time in order."""
+    ...
 
-  def poll(self) -> None: ...
+  def drains_events(self) -> bool:
+    """Event hooks block in `poll` until events arrive and are drained from a dedicated thread."""
+    return False
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS) -> None:
+    """Drains events for up to `timeout_ms`, samplers take one sample and ignore the timeout."""
+    ...
 
   def close(self) -> None: ...
 
+  def event_counts(self) -> list[EventCounts]:
+    """Cumulative per cpu submitted and lost events, hooks that do not stream events report none."""
+    return []
+
   def data(self) -> list[CollectionTable]: ...
 
   # def last_k_ms(self, ms: int) -> list[CollectionTable]: ...
@@ -35,3 +63,11 @@ class BPFProgram(Protocol):
   def clear(self): ...
 
   def pop_data(self) -> list[CollectionTable]: ...
+
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    """Swaps out the accumulated data and returns a function that builds its tables.
+
+    Swapping must be quick since the hook keeps collecting, building is left to flush workers.
+    """
+    tables = self.pop_data()
+    return lambda: tables
@@ -1,14 +1,22 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+    TARGET_FILTER,
+    TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable
 from data_schema.generic_table import (
     CBMMEagerDataTable,
     CBMMPrezeroingDataTable,
 )
+from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
@@ -35,15 +43,36 @@ class CBMMBPFHook(BPFProgram):
     def name(cls) -> str:
         return "cbmm"
 
-    def __init__(self):
+    @classmethod
+    def from_config(cls, config: ConfigBase) -> "CBMMBPFHook":
+        return CBMMBPFHook(
+            transport=EventTransport.from_config(cls.name(), config),
+            target_filter=TargetFilter.from_config(config),
+        )
+
+    def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+        self.transport = transport or EventTransport()
+        self.target_filter = target_filter or TargetFilter()
         self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
         self.bpf_text = open(Path(__file__).parent / "bpf/cbmm.bpf.c", "r").read()
-        self.cbmm_eager = list[CBMMEagerTracingRuntimeData]()
-        self.cbmm_prezero = list[CBMMPrezeroingTracingRuntimeData]()
+        self.cbmm_eager = EventList[CBMMEagerTracingRuntimeData]()
+        self.cbmm_prezero = EventList[CBMMPrezeroingTracingRuntimeData]()
+
+    def prepare(self):
+        self.bpf = load_prebuilt(
+            self.name(),
+            self.transport,
+            settings=self.target_filter.core_settings(),
+            max_entries=self.target_filter.core_max_entries(),
+            pinned_maps=self.target_filter.pinned_maps(),
+            event_structs={
+                "cbmm_eager": "cbmm_eager_paging_inputs",
+                "cbmm_prezero": "cbmm_async_prezeroing_inputs",
+            },
+        ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
     def load(self, collection_id: str):
         self.collection_id = collection_id
-        self.bpf = BPF(text = self.bpf_text)
         self.bpf.attach_kprobe(event=b"mm_estimate_changes", fn_name=b"kprobe__mm_estimate_changes")
         self.bpf.attach_kretprobe(event=b"mm_decide", fn_name=b"kretprobe__mm_decide")
         self.bpf.attach_kprobe(event=b"mm_estimate_eager_page_cost_benefit", fn_name=b"kprobe__mm_estimate_eager_page_cost_benefit")
@@ -54,31 +83,47 @@ class CBMMBPFHook(BPFProgram):
         #self.bpf.attach_kprobe(event=b"mm_estimate_async_prezeroing_lock_contention_cost",
         #   fn_name=b"kprobe__mm_estimate_async_prezeroing_lock_contention_cost")
         self.bpf.attach_kretprobe(event=b"mm_estimated_prezeroed_used", fn_name=b"kretprobe__mm_estimated_prezeroed_used")
-        self.bpf["cbmm_eager"].open_perf_buffer(self._cbmm_eager_eh, page_cnt=64)
-        self.bpf["cbmm_prezero"].open_perf_buffer(self._cbmm_prezero_eh, page_cnt=64)
+        self.transport.open(self.bpf, "cbmm_eager", self._cbmm_eager_eh, page_cnt=64)
+        self.transport.open(self.bpf, "cbmm_prezero", self._cbmm_prezero_eh, page_cnt=64)
+
+    def drains_events(self) -> bool:
+        return True
 
-    def poll(self):
-        self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+        self.transport.poll(self.bpf, timeout_ms)
 
     def close(self):
         self.bpf.cleanup()
 
-    def data(self) -> list[CollectionTable]:
+    def event_counts(self) -> list[EventCounts]:
+        return self.transport.event_counts(self.bpf)
+
+    def _tables(
+        self,
+        cbmm_eager: list[CBMMEagerTracingRuntimeData],
+        cbmm_prezero: list[CBMMPrezeroingTracingRuntimeData],
+    ) -> list[CollectionTable]:
         return [
             CBMMPrezeroingDataTable.from_df_id(
-                pl.DataFrame(self.cbmm_prezero),
+                pl.DataFrame(cbmm_prezero),
                 collection_id=self.collection_id,
             ),
             CBMMEagerDataTable.from_df_id(
-                pl.DataFrame(self.cbmm_eager),
+                pl.DataFrame(cbmm_eager),
                 collection_id=self.collection_id,
             ),
         ]
 
+    def data(self) -> list[CollectionTable]:
+        return self._tables(self.cbmm_eager.snapshot(), self.cbmm_prezero.snapshot())
+
+    def swap_data(self) -> Callable[[], list[CollectionTable]]:
+        cbmm_eager = self.cbmm_eager.swap()
+        cbmm_prezero = self.cbmm_prezero.swap()
+        return lambda: self._tables(cbmm_eager, cbmm_prezero)
+
     def pop_data(self) -> list[CollectionTable]:
-        tables = self.data()
-        self.clear()
-        return tables
+        return self.swap_data()()
 
     def clear(self):
         self.cbmm_eager.clear()
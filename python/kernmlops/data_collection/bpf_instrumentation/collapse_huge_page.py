@@ -1,10 +1,17 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 from typing import cast
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable
 from data_schema.generic_table import (
   CollapseHugePageDataTableRaw,
@@ -14,6 +21,7 @@ from data_schema.generic_table import (
 from data_schema.huge_pages import (
   CollapseHugePageDataTable,
 )
+from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
@@ -59,60 +67,106 @@ class CollapseHugePageBPFHook(BPFProgram):
   def name(cls) -> str:
     return "collapse_huge_pages"
 
-  def __init__(self):
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "CollapseHugePageBPFHook":
+    return CollapseHugePageBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+    self.transport = transport or EventTransport()
+    self.target_filter = target_filter or TargetFilter()
     self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
     self.bpf_text = open(Path(__file__).parent / "bpf/collapse_huge_page.bpf.c", "r").read()
-    self.collapse_huge_pages = list[CollapseHugePageRuntimeData]()
-    self.trace_mm_collapse_huge_pages = list[TraceMMCollapseHugePageRuntimeData]()
-    self.trace_mm_khugepaged_scan_pmds = list[TraceMMKhugepagedScanPMDRuntimeData]()
+    self.collapse_huge_pages = EventList[CollapseHugePageRuntimeData]()
+    self.trace_mm_collapse_huge_pages = EventList[TraceMMCollapseHugePageRuntimeData]()
+    self.trace_mm_khugepaged_scan_pmds = EventList[TraceMMKhugepagedScanPMDRuntimeData]()
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.target_filter.core_settings(),
+      max_entries=self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      event_structs={
+        "trace_mm_khugepaged_scan_pmds": "trace_mm_khugepaged_scan_pmd_struct",
+        "trace_mm_collapse_huge_pages": "trace_mm_collapse_huge_page_struct",
+        "collapse_huge_pages": "collapse_huge_page_struct",
+      },
+    ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
     #self.bpf.attach_raw_tracepoint(tp=b"mm_collapse_huge_page", fn_name=b"mm_collapse_huge_page")
     self.bpf.attach_kprobe(event=b"collapse_huge_page", fn_name=b"kprobe_collapse_huge_page")
-    self.bpf["collapse_huge_pages"].open_perf_buffer(self._collapse_huge_pages_eh, page_cnt=64)
-    self.bpf["trace_mm_collapse_huge_pages"].open_perf_buffer(self._trace_huge_pages_eh, page_cnt=64)
-    self.bpf["trace_mm_khugepaged_scan_pmds"].open_perf_buffer(self._trace_khugepaged_scan_eh, page_cnt=64)
+    self.transport.open(self.bpf, "collapse_huge_pages", self._collapse_huge_pages_eh, page_cnt=64)
+    self.transport.open(self.bpf, "trace_mm_collapse_huge_pages", self._trace_huge_pages_eh, page_cnt=64)
+    self.transport.open(self.bpf, "trace_mm_khugepaged_scan_pmds", self._trace_khugepaged_scan_eh, page_cnt=64)
+
+  def drains_events(self) -> bool:
+    return True
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
-    if len(self.collapse_huge_pages) == 0 or len(self.trace_mm_collapse_huge_pages) == 0 or len(self.trace_mm_khugepaged_scan_pmds) == 0:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(
+      self,
+      collapse_huge_pages: list[CollapseHugePageRuntimeData],
+      trace_mm_collapse_huge_pages: list[TraceMMCollapseHugePageRuntimeData],
+      trace_mm_khugepaged_scan_pmds: list[TraceMMKhugepagedScanPMDRuntimeData],
+  ) -> list[CollectionTable]:
+    if len(collapse_huge_pages) == 0 or len(trace_mm_collapse_huge_pages) == 0 or len(trace_mm_khugepaged_scan_pmds) == 0:
         return []
     return [
             CollapseHugePageDataTable.from_tables(
               collapse_table=cast(
                 CollapseHugePageDataTableRaw,
                 CollapseHugePageDataTableRaw.from_df_id(
-                  pl.DataFrame(self.collapse_huge_pages),
+                  pl.DataFrame(collapse_huge_pages),
                   collection_id = self.collection_id,),
               ),
               trace_mm_table=cast(
                 TraceMMCollapseHugePageDataTable,
                 TraceMMCollapseHugePageDataTable.from_df_id(
-                  pl.DataFrame(self.trace_mm_collapse_huge_pages),
+                  pl.DataFrame(trace_mm_collapse_huge_pages),
                   collection_id = self.collection_id,),
               ),
             ),
             TraceMMKhugepagedScanPMDDataTable.from_df_id(
-                pl.DataFrame(self.trace_mm_khugepaged_scan_pmds),
+                pl.DataFrame(trace_mm_khugepaged_scan_pmds),
                 collection_id = self.collection_id,),
         ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(
+      self.collapse_huge_pages.snapshot(),
+      self.trace_mm_collapse_huge_pages.snapshot(),
+      self.trace_mm_khugepaged_scan_pmds.snapshot(),
+    )
+
   def clear(self):
     self.collapse_huge_pages.clear()
     self.trace_mm_collapse_huge_pages.clear()
     self.trace_mm_khugepaged_scan_pmds.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    collapse_huge_pages = self.collapse_huge_pages.swap()
+    trace_mm_collapse_huge_pages = self.trace_mm_collapse_huge_pages.swap()
+    trace_mm_khugepaged_scan_pmds = self.trace_mm_khugepaged_scan_pmds.swap()
+    return lambda: self._tables(
+      collapse_huge_pages, trace_mm_collapse_huge_pages, trace_mm_khugepaged_scan_pmds
+    )
+
   def pop_data(self) -> list[CollectionTable]:
-    quanta_tables = self.data()
-    self.clear()
-    return quanta_tables
+    return self.swap_data()()
 
   def _trace_khugepaged_scan_eh(self, cpu, trace_mm_khugepaged_scan_pmd_struct, size):
       event = self.bpf["trace_mm_khugepaged_scan_pmds"].event(trace_mm_khugepaged_scan_pmd_struct)
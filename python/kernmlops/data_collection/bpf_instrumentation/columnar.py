@@ -0,0 +1,130 @@
+"""Columnar accumulation of BPF events for conversion to polars."""
+
+from array import array
+from collections.abc import Callable, Iterable, Mapping
+from functools import partial
+from threading import Lock
+from typing import Any, Final
+
+import numpy as np
+import polars as pl
+from data_schema import CollectionTable
+
+# fixed width polars types are stored in typed arrays, anything else in python lists
+_ARRAY_TYPECODES: Final[Mapping[type[pl.DataType], str]] = {
+  pl.Int8: "b",
+  pl.Int16: "h",
+  pl.Int32: "i",
+  pl.Int64: "q",
+  pl.UInt8: "B",
+  pl.UInt16: "H",
+  pl.UInt32: "I",
+  pl.UInt64: "Q",
+  pl.Float32: "f",
+  pl.Float64: "d",
+}
+
+
+class ColumnarAccumulator:
+  """Appends event fields into typed column arrays keyed by a table schema.
+
+  Popped columns are handed to polars without copying, new columns are started in their place.
+  """
+
+  def __init__(self, schema: pl.Schema | Mapping[str, pl.DataType]):
+    self.schema = pl.Schema(schema)
+    self._lock = Lock()
+    self._columns = self._new_columns()
+
+  @classmethod
+  def for_table(cls, table_type: type[CollectionTable]) -> "ColumnarAccumulator":
+    return ColumnarAccumulator(table_type.schema())
+
+  def _new_columns(self) -> list[array | list[Any]]:
+    return [
+      array(_ARRAY_TYPECODES[dtype.base_type()])
+      if dtype.base_type() in _ARRAY_TYPECODES
+      else list[Any]()
+      for dtype in self.schema.dtypes()
+    ]
+
+  def __len__(self) -> int:
+    return len(self._columns[0]) if self._columns else 0
+
+  def append(self, *values: Any) -> None:
+    """Appends one event, values are given in schema order."""
+    with self._lock:
+      row = len(self)
+      try:
+        for column, value in zip(self._columns, values, strict=True):
+          column.append(value)
+      except (OverflowError, TypeError, ValueError):
+        # keep columns aligned when a value does not fit its column type
+        for column in self._columns:
+          del column[row:]
+        raise
+
+  def _to_df(self, columns: list[array | list[Any]], *, copy: bool) -> pl.DataFrame:
+    def column_values(column: array | list[Any]) -> np.ndarray | list[Any]:
+      if not isinstance(column, array):
+        return column
+      values = np.frombuffer(column, dtype=column.typecode)
+      return values.copy() if copy else values
+
+    return pl.DataFrame([
+      pl.Series(name, column_values(column), dtype=dtype)
+      for (name, dtype), column in zip(self.schema.items(), columns)
+    ])
+
+  def to_df(self) -> pl.DataFrame:
+    """Returns a copy of the accumulated events."""
+    with self._lock:
+      return self._to_df(self._columns, copy=True)
+
+  def swap(self) -> Callable[[], pl.DataFrame]:
+    """Starts new columns and returns a function that converts the old ones to a DataFrame."""
+    with self._lock:
+      columns, self._columns = self._columns, self._new_columns()
+    return partial(self._to_df, columns, copy=False)
+
+  def pop_df(self) -> pl.DataFrame:
+    """Returns the accumulated events and clears the accumulator."""
+    return self.swap()()
+
+  def clear(self) -> None:
+    with self._lock:
+      self._columns = self._new_columns()
+
+
+class EventList[T]:
+  """List of events that is swapped out whole, appends never land in a list being converted."""
+
+  def __init__(self):
+    self._lock = Lock()
+    self._events = list[T]()
+
+  def __len__(self) -> int:
+    return len(self._events)
+
+  def append(self, event: T) -> None:
+    with self._lock:
+      self._events.append(event)
+
+  def extend(self, events: Iterable[T]) -> None:
+    with self._lock:
+      self._events.extend(events)
+
+  def snapshot(self) -> list[T]:
+    """Returns a copy of the accumulated events."""
+    with self._lock:
+      return list(self._events)
+
+  def swap(self) -> list[T]:
+    """Returns the accumulated events and starts a new list."""
+    with self._lock:
+      events, self._events = self._events, list[T]()
+    return events
+
+  def clear(self) -> None:
+    with self._lock:
+      self._events = list[T]()
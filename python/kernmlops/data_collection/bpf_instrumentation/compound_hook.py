@@ -1,17 +1,82 @@
-from dataclasses import dataclass
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Final, cast
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
-from data_schema import CollectionTable, CompoundTable
+from data_collection.bpf_instrumentation.columnar import ColumnarAccumulator
+from data_collection.bpf_instrumentation.core_object import CoreObject, load_prebuilt
+from data_collection.bpf_instrumentation.histogram import pop_percpu_counts
+from data_collection.bpf_instrumentation.target_filter import (
+    TARGET_FILTER,
+    TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
+from data_schema import CollectionTable, CompoundStackTable, CompoundTable
+from kernmlops_config import ConfigBase
+
+# every probe gets its own entry point so the shared program knows which function was hit
+PROBE_HANDLER: Final[str] = """
+int trace_event_EVENT_ID(struct pt_regs* ctx) {
+  return trace_function_call(ctx, EVENT_ID);
+}
+"""
+
+DEFAULT_KERNEL_EVENTS: Final[tuple[str, ...]] = (
+    "pick_next_task",
+    "enqueue_task_fair",
+    "pick_next_task_fair",
+    "check_preempt_wakeup",
+    "schedule",
+    "vfs_read",
+    "filemap_read",
+    "ext4_file_read_iter",
+    "write_cache_pages",
+    "submit_bh_wbc",
+    "__alloc_pages",
+    "mempool_alloc",
+    "swap_readpage",
+    "filemap_fault",
+    "blk_mq_start_request",
+    "blk_mq_dispatch_rq_list",
+    "blk_bio_list_merge",
+    "nvme_queue_rq",
+    "blk_stat_add",
+)
 
 
 @dataclass(frozen=True)
-class CompoundData:
-    timestamp: int           # ts_uptime_us
-    function: str           # function name
-    stack_hash: int         # hash of the stack trace
+class CompoundHookConfig(ConfigBase):
+    # kernel functions to probe, `function+0x10` probes at an offset into the function
+    kernel_events: list[str] = field(default_factory=lambda: list(DEFAULT_KERNEL_EVENTS))
+    # events: every call is sent to user space, counts: calls are counted by stack in kernel
+    mode: str = "events"
+    stack_trace_entries: int = 16384
+    # distinct (function, stack) pairs counted per poll interval
+    stack_count_entries: int = 10240
+
+    def validate(self) -> None:
+        if self.mode not in ("events", "counts"):
+            raise ValueError(f"compound mode must be events or counts, got {self.mode}")
+        if self.stack_trace_entries <= 0 or self.stack_count_entries <= 0:
+            raise ValueError(
+                f"compound stack_trace_entries and stack_count_entries must be positive, "
+                f"got {self.stack_trace_entries} and {self.stack_count_entries}"
+            )
+        if not self.kernel_events:
+            raise ValueError("compound kernel_events is empty, compound would write nothing")
+        duplicate_events = sorted({event for event in self.kernel_events if self.kernel_events.count(event) > 1})
+        if duplicate_events:
+            raise ValueError(f"compound kernel_events {duplicate_events} are listed more than once")
+        for event in self.kernel_events:
+            if "+" not in event:
+                continue
+            try:
+                int(event.split("+", maxsplit=1)[1], 16)
+            except ValueError:
+                raise ValueError(f"compound kernel event {event} must give its offset in hex") from None
 
 
 class CompoundBPFHook(BPFProgram):
@@ -19,146 +84,186 @@ class CompoundBPFHook(BPFProgram):
     def name(cls) -> str:
         return "compound"
 
-    def __init__(self):
-        bpf_text = open(Path(__file__).parent / "bpf/compound.bpf.c", "r").read()
+    @classmethod
+    def default_config(cls) -> ConfigBase:
+        return CompoundHookConfig()
 
-        # Replace the FILTER placeholder with '0' to accept all events
-        self.bpf_text = bpf_text.replace('FILTER', '0')
-        self.compound_data = list[CompoundData]()
+    @classmethod
+    def from_config(cls, config: ConfigBase) -> "CompoundBPFHook":
+        compound_config = cast(CompoundHookConfig, getattr(config, cls.name()))
+        compound_config.validate()
+        return CompoundBPFHook(
+            transport=EventTransport.from_config(cls.name(), config),
+            config=compound_config,
+            target_filter=TargetFilter.from_config(config),
+        )
 
-    def load(self, collection_id: str):
-        print(f"[DEBUG] Loading compound hook with collection_id {collection_id}")
-        self.collection_id = collection_id
+    def __init__(
+        self,
+        transport: EventTransport | None = None,
+        config: CompoundHookConfig | None = None,
+        target_filter: TargetFilter | None = None,
+    ):
+        self.transport = transport or EventTransport()
+        self.config = config or CompoundHookConfig()
+        self.target_filter = target_filter or TargetFilter()
+        self.bpf_text = open(Path(__file__).parent / "bpf/compound.bpf.c", "r").read()
+        # the event id of a sample is its index in kernel_events
+        self.kernel_events = list(self.config.kernel_events)
+        for event_id in range(len(self.kernel_events)):
+            self.bpf_text += PROBE_HANDLER.replace("EVENT_ID", str(event_id))
+        self.compound_data = ColumnarAccumulator.for_table(CompoundTable)
+        self.compound_stack_data = ColumnarAccumulator.for_table(CompoundStackTable)
+        # stack ids are never reused in counts mode, so each is symbolized once
+        self._symbolized_stacks = dict[int, str]()
 
-        # Define all kernel events we want to monitor
-        kernel_events= [
-            "pick_next_task",
-            "enqueue_task_fair",
-            "pick_next_task_fair",
-            "check_preempt_wakeup",
-            "schedule",
-            "vfs_read",
-            "filemap_read",
-            "ext4_file_read_iter",
-            "write_cache_pages",
-            "submit_bh_wbc",
-            "__alloc_pages",
-            "mempool_alloc",
-            "swap_readpage",
-            "filemap_fault",
-            "blk_mq_start_request",
-            "blk_mq_dispatch_rq_list",
-            "blk_bio_list_merge",
-            "nvme_queue_rq",
-            "blk_stat_add",
-            # Add more events as needed
-        ]
+    @property
+    def counts_stacks(self) -> bool:
+        return self.config.mode == "counts"
+
+    def cflags(self) -> list[str]:
+        return [
+            f"-DCOUNT_STACKS={1 if self.counts_stacks else 0}",
+            f"-DSTACK_TRACE_ENTRIES={self.config.stack_trace_entries}",
+            f"-DSTACK_COUNT_ENTRIES={self.config.stack_count_entries}",
+        ] + self.target_filter.cflags()
 
-        for event in kernel_events:
-            event_bpf = self.bpf_text.replace('USER_EVENT_NAME', f'"{event}"')
-            event_bpf_program = BPF(text=event_bpf)
+    def prepare(self):
+        # one compile for every probe, they all submit to the same buffer
+        self.bpf = load_prebuilt(
+            self.name(),
+            self.transport,
+            settings={"count_stacks": 1 if self.counts_stacks else 0} | self.target_filter.core_settings(),
+            max_entries={
+                "stack_traces": self.config.stack_trace_entries,
+                "compound_stack_counts": self.config.stack_count_entries,
+            } | self.target_filter.core_max_entries(),
+            pinned_maps=self.target_filter.pinned_maps(),
+            key_structs={"compound_stack_counts": "compound_stack_key"},
+            event_structs={"compound_events": "compound_perf_event"},
+        ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.cflags())
 
-            # Store the BPF program in a dictionary
-            if not hasattr(self, 'bpf_programs'):
-                self.bpf_programs = {}
-            self.bpf_programs[event] = event_bpf_program
+    def load(self, collection_id: str):
+        self.collection_id = collection_id
 
+        attached_events = 0
+        for event_id, event in enumerate(self.kernel_events):
             just_event_name = event.split('+')[0]
             offset = int(event.split('+')[1], 16) if '+' in event else 0x0
+            try:
+                if isinstance(self.bpf, CoreObject):
+                    # the prebuilt program reads the event id from the cookie of its probe
+                    self.bpf.attach_kprobe(
+                        event=just_event_name.encode(),
+                        fn_name=b"trace_event",
+                        event_off=offset,
+                        cookie=event_id,
+                    )
+                else:
+                    self.bpf.attach_kprobe(
+                        event=just_event_name.encode(),
+                        fn_name=f"trace_event_{event_id}".encode(),
+                        event_off=offset,
+                    )
+                attached_events += 1
+            except Exception:
+                # TODO(Patrick): use logging
+                print(f"warning: compound could not probe {event}, it may be inlined or missing from this kernel")
+        if attached_events == 0:
+            raise RuntimeError("compound could not probe any of its kernel_events")
 
-            # Attach the kprobe
-            event_bytes = just_event_name.encode()
-            self.bpf_programs[event].attach_kprobe(
-                event=event_bytes,
-                fn_name=b"trace_function_call",
-                event_off=offset
-            )
+        if not self.counts_stacks:
+            self.transport.open(self.bpf, "compound_events", self._compound_event_handler, page_cnt=64)
 
-            # Set up the perf buffer with a handler that knows its event name
-            self.bpf_programs[event]["compound_events"].open_perf_buffer(
-                self.create_event_handler(event),
-                page_cnt=64
-            )
+    def drains_events(self) -> bool:
+        return not self.counts_stacks
 
-        # Keep a reference to the primary BPF program for the regular methods
-        self.bpf = next(iter(self.bpf_programs.values()))
-
-    def poll(self):
-        # Poll all BPF programs
-        for event, program in self.bpf_programs.items():
-            program.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+        if self.counts_stacks:
+            self._poll_stack_counts()
+            return
+        self.transport.poll(self.bpf, timeout_ms)
 
     def close(self):
-        # Clean up all BPF programs
-        for event, program in self.bpf_programs.items():
-            program.cleanup()
+        if self.counts_stacks:
+            # counts of the last interval are still in the map
+            self._poll_stack_counts()
+        self.bpf.cleanup()
 
-    def data(self) -> list[CollectionTable]:
-        if not self.compound_data:
+    def event_counts(self) -> list[EventCounts]:
+        return self.transport.event_counts(self.bpf)
+
+    def _tables(self, compound_df: pl.DataFrame) -> list[CollectionTable]:
+        if compound_df.is_empty():
             return []
 
-        # Convert the dataclass objects to dictionaries
-        data_dicts = []
-        for data in self.compound_data:
-            data_dicts.append({
-                "timestamp": data.timestamp,
-                "function": data.function,
-                "stack_hash": data.stack_hash,
-            })
+        return [
+            CompoundTable.from_df_id(
+                compound_df,
+                collection_id=self.collection_id,
+            ),
+        ]
 
-        df = pl.DataFrame(data_dicts)
+    def _stack_tables(self, compound_stack_df: pl.DataFrame) -> list[CollectionTable]:
+        if compound_stack_df.is_empty():
+            return []
 
         return [
-            CompoundTable.from_df_id(
-                df,
+            CompoundStackTable.from_df_id(
+                compound_stack_df,
                 collection_id=self.collection_id,
             ),
         ]
 
+    def data(self) -> list[CollectionTable]:
+        if self.counts_stacks:
+            return self._stack_tables(self.compound_stack_data.to_df())
+        return self._tables(self.compound_data.to_df())
+
     def clear(self):
         self.compound_data.clear()
+        self.compound_stack_data.clear()
+
+    def swap_data(self) -> Callable[[], list[CollectionTable]]:
+        if self.counts_stacks:
+            compound_stack_df = self.compound_stack_data.swap()
+            return lambda: self._stack_tables(compound_stack_df())
+        compound_df = self.compound_data.swap()
+        return lambda: self._tables(compound_df())
 
     def pop_data(self) -> list[CollectionTable]:
-        compound_tables = self.data()
-        self.clear()
-        return compound_tables
+        return self.swap_data()()
 
-    def _compound_event_handler(self, cpu, data, size):
-        event = self.bpf["compound_events"].event(data)
+    def _symbolize_stack(self, stack_id: int) -> str:
+        stack = self._symbolized_stacks.get(stack_id)
+        if stack is None:
+            if stack_id < 0:
+                # the stack did not fit in the stack map or could not be walked
+                return "[unknown]"
+            frames = [
+                self.bpf.ksym(address, show_offset=False).decode("utf-8", errors="replace")
+                for address in self.bpf["stack_traces"].walk(stack_id)
+            ]
+            stack = ";".join(reversed(frames))
+            self._symbolized_stacks[stack_id] = stack
+        return stack
 
-        print(f"[DEBUG] Compound event received on CPU {cpu}")
-        event_name = event.event_name.decode('utf-8', errors='replace') if hasattr(event, 'event_name') else "unknown"
+    def _poll_stack_counts(self):
+        ts_uptime_us = int(time.clock_gettime_ns(time.CLOCK_BOOTTIME) / 1000)
+        for key, counts in pop_percpu_counts(self.bpf["compound_stack_counts"]):
+            count = sum(counts)
+            if count:
+                self.compound_stack_data.append(
+                    ts_uptime_us,
+                    self.kernel_events[key.event_id],
+                    key.stack_id,
+                    self._symbolize_stack(key.stack_id),
+                    count,
+                )
 
+    def _compound_event_handler(self, cpu, data, size):
+        event = self.bpf["compound_events"].event(data)
         try:
-            # Use the event name as function name for now
-            function_name = event_name
-
-            compound_data = CompoundData(
-                timestamp=event.timestamp,
-                function=function_name,
-                stack_hash=event.stack_hash,
-            )
-            self.compound_data.append(compound_data)
+            self.compound_data.append(event.timestamp, self.kernel_events[event.event_id], event.stack_hash)
         except Exception as e:
             print(f"[ERROR] Compound event handler failed: {e}")
-
-    def create_event_handler(self, event_name):
-        """Creates a handler function specific to a particular event"""
-        def handler(cpu, data, size):
-            try:
-                event = self.bpf_programs[event_name]["compound_events"].event(data)
-                print(f"[DEBUG] {event_name} event received on CPU {cpu}")
-
-                # Use event name as function name
-                function_name = event_name
-
-                compound_data = CompoundData(
-                    timestamp=event.timestamp,
-                    function=function_name,
-                    stack_hash=event.stack_hash,
-                )
-                self.compound_data.append(compound_data)
-            except Exception as e:
-                print(f"[ERROR] {event_name} handler failed: {e}")
-
-        return handler
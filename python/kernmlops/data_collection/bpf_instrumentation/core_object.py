@@ -0,0 +1,516 @@
+"""Prebuilt CO-RE objects loaded with libbpf, hooks that ship one skip compiling with BCC."""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+from collections.abc import Callable, Iterator, Mapping
+from functools import cache
+from pathlib import Path
+from typing import Any, Final
+
+from bcc import BPF
+from data_collection.bpf_instrumentation.raw_events import struct_ctype
+from data_collection.bpf_instrumentation.transport import EventTransport
+
+# sources next to their shared headers, `make bpf-objects` builds a .bpf.o for each
+CORE_OBJECT_DIR: Final[Path] = Path(__file__).parent / "bpf/core"
+
+# enum bpf_map_type in uapi/linux/bpf.h
+BPF_MAP_TYPE_PERCPU_HASH: Final[int] = 5
+BPF_MAP_TYPE_PERCPU_ARRAY: Final[int] = 6
+BPF_MAP_TYPE_STACK_TRACE: Final[int] = 7
+BPF_MAP_TYPE_RINGBUF: Final[int] = 27
+
+# makes every libbpf function return negative error codes, the default from libbpf 1.0 on
+LIBBPF_STRICT_ALL: Final[int] = 0xFFFFFFFF
+
+_RING_BUFFER_SAMPLE = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t)
+
+_SIZED_INTS: Final[Mapping[int, Any]] = {
+  1: ctypes.c_uint8,
+  2: ctypes.c_uint16,
+  4: ctypes.c_uint32,
+  8: ctypes.c_uint64,
+}
+
+
+class CoreSettings(ctypes.Structure):
+  # struct kernmlops_settings in bpf/core/kernmlops.bpf.h, hooks fill in the fields they use
+  _fields_ = [
+    ("aggregate_histograms", ctypes.c_uint32),
+    ("histogram_linear", ctypes.c_uint32),
+    ("histogram_linear_step", ctypes.c_uint32),
+    ("histogram_max_slot", ctypes.c_uint32),
+    ("count_stacks", ctypes.c_uint32),
+    ("filter_targets", ctypes.c_uint32),
+    ("filter_cgroup", ctypes.c_uint32),
+    ("collector_tgid", ctypes.c_uint32),
+    ("target_cgroup_level", ctypes.c_uint32),
+    ("target_cgroup_id", ctypes.c_uint64),
+  ]
+
+
+class _KprobeOpts(ctypes.Structure):
+  # struct bpf_kprobe_opts up to libbpf 1.1, later fields are left zero
+  _fields_ = [
+    ("sz", ctypes.c_size_t),
+    ("bpf_cookie", ctypes.c_uint64),
+    ("offset", ctypes.c_size_t),
+    ("retprobe", ctypes.c_bool),
+  ]
+
+
+class _PerfEventOpts(ctypes.Structure):
+  # struct bpf_perf_event_opts up to libbpf 1.2
+  _fields_ = [
+    ("sz", ctypes.c_size_t),
+    ("bpf_cookie", ctypes.c_uint64),
+  ]
+
+
+@cache
+def _libbpf() -> ctypes.CDLL | None:
+  library = ctypes.util.find_library("bpf") or "libbpf.so.1"
+  try:
+    libbpf = ctypes.CDLL(library, use_errno=True)
+  except OSError:
+    return None
+  pointer = ctypes.c_void_p
+  signatures: dict[str, tuple[Any, list[Any]]] = {
+    "libbpf_set_strict_mode": (ctypes.c_int, [ctypes.c_uint32]),
+    "libbpf_num_possible_cpus": (ctypes.c_int, []),
+    "bpf_object__open_file": (pointer, [ctypes.c_char_p, pointer]),
+    "bpf_object__load": (ctypes.c_int, [pointer]),
+    "bpf_object__close": (None, [pointer]),
+    "bpf_object__next_program": (pointer, [pointer, pointer]),
+    "bpf_object__find_program_by_name": (pointer, [pointer, ctypes.c_char_p]),
+    "bpf_object__next_map": (pointer, [pointer, pointer]),
+    "bpf_object__find_map_by_name": (pointer, [pointer, ctypes.c_char_p]),
+    "bpf_program__section_name": (ctypes.c_char_p, [pointer]),
+    "bpf_program__attach": (pointer, [pointer]),
+    "bpf_program__attach_kprobe_opts": (pointer, [pointer, ctypes.c_char_p, pointer]),
+    "bpf_program__attach_perf_event_opts": (pointer, [pointer, ctypes.c_int, pointer]),
+    "bpf_link__destroy": (ctypes.c_int, [pointer]),
+    "bpf_map__name": (ctypes.c_char_p, [pointer]),
+    "bpf_map__type": (ctypes.c_int, [pointer]),
+    "bpf_map__fd": (ctypes.c_int, [pointer]),
+    "bpf_map__key_size": (ctypes.c_uint32, [pointer]),
+    "bpf_map__value_size": (ctypes.c_uint32, [pointer]),
+    "bpf_map__max_entries": (ctypes.c_uint32, [pointer]),
+    "bpf_map__set_max_entries": (ctypes.c_int, [pointer, ctypes.c_uint32]),
+    "bpf_map__set_initial_value": (ctypes.c_int, [pointer, pointer, ctypes.c_size_t]),
+    "bpf_map__set_pin_path": (ctypes.c_int, [pointer, ctypes.c_char_p]),
+    "bpf_map_update_elem": (ctypes.c_int, [ctypes.c_int, pointer, pointer, ctypes.c_uint64]),
+    "bpf_map_lookup_elem": (ctypes.c_int, [ctypes.c_int, pointer, pointer]),
+    "bpf_map_delete_elem": (ctypes.c_int, [ctypes.c_int, pointer]),
+    "bpf_map_get_next_key": (ctypes.c_int, [ctypes.c_int, pointer, pointer]),
+    "bpf_map_lookup_and_delete_batch": (
+      ctypes.c_int, [ctypes.c_int, pointer, pointer, pointer, pointer, pointer, pointer],
+    ),
+    "ring_buffer__new": (pointer, [ctypes.c_int, _RING_BUFFER_SAMPLE, pointer, pointer]),
+    "ring_buffer__add": (ctypes.c_int, [pointer, ctypes.c_int, _RING_BUFFER_SAMPLE, pointer]),
+    "ring_buffer__poll": (ctypes.c_int, [pointer, ctypes.c_int]),
+    "ring_buffer__free": (None, [pointer]),
+  }
+  try:
+    for name, (restype, argtypes) in signatures.items():
+      function = getattr(libbpf, name)
+      function.restype = restype
+      function.argtypes = argtypes
+  except AttributeError:
+    # libbpf older than 0.7
+    return None
+  libbpf.libbpf_set_strict_mode(LIBBPF_STRICT_ALL)
+  return libbpf
+
+
+def libbpf_available() -> bool:
+  return _libbpf() is not None
+
+
+def prebuilt_object(hook_name: str) -> Path | None:
+  """Returns the CO-RE object of a hook if it has been built and libbpf can load it."""
+  object_path = CORE_OBJECT_DIR / f"{hook_name}.bpf.o"
+  if not object_path.is_file() or not libbpf_available():
+    return None
+  return object_path
+
+
+def _check(result: int, action: str) -> None:
+  # libbpf returns negative error codes
+  if result < 0:
+    raise OSError(-result, f"{action}: {os.strerror(-result)}")
+
+
+def _check_pointer(pointer: int | None, action: str) -> int:
+  # functions returning pointers set errno instead
+  if not pointer:
+    error = ctypes.get_errno() or errno.EINVAL
+    raise OSError(error, f"{action}: {os.strerror(error)}")
+  return pointer
+
+
+def _as_bytes(name: str | bytes) -> bytes:
+  return name.encode() if isinstance(name, str) else name
+
+
+class CoreMap:
+  """A map of a loaded CO-RE object, offers the part of a BCC table that hooks use.
+
+  Integer keys and values are typed by their size, `Key` and `event` types for structs are
+  generated from the object source, see `CoreObject`.
+  """
+
+  def __init__(
+      self,
+      core: "CoreObject",
+      bpf_map: int,
+      key_type: Any | None = None,
+      event_type: type[ctypes.Structure] | None = None,
+  ):
+    libbpf = core.libbpf
+    self._core = core
+    self.name = libbpf.bpf_map__name(bpf_map).decode()
+    self.map_type = libbpf.bpf_map__type(bpf_map)
+    self.map_fd = libbpf.bpf_map__fd(bpf_map)
+    self.max_entries = libbpf.bpf_map__max_entries(bpf_map)
+    self.value_size = libbpf.bpf_map__value_size(bpf_map)
+    key_size = libbpf.bpf_map__key_size(bpf_map)
+    self.Key = key_type or _SIZED_INTS.get(key_size, ctypes.c_uint8 * key_size)
+    if self.map_type in (BPF_MAP_TYPE_PERCPU_HASH, BPF_MAP_TYPE_PERCPU_ARRAY):
+      # per cpu values are each padded to 8 bytes, hooks only keep u64 counts in them
+      self.Leaf = ctypes.c_uint64 * core.possible_cpus
+    else:
+      self.Leaf = _SIZED_INTS.get(self.value_size, ctypes.c_uint8 * self.value_size)
+    self._event_type = event_type
+
+  def event(self, data: int) -> Any:
+    """Casts an event of a ring buffer to the struct it was registered with."""
+    if self._event_type is None:
+      raise TypeError(f"no event struct for {self.name}")
+    return ctypes.cast(data, ctypes.POINTER(self._event_type)).contents
+
+  def open_ring_buffer(self, callback: Callable[[Any, int, int], Any]) -> None:
+    """Registers `callback(ctx, data, size)` like BCC, the ring buffer is read by `ring_buffer_poll`."""
+    self._core.open_ring_buffer(self, callback)
+
+  def _lookup(self, key: Any, leaf: Any) -> int:
+    return self._core.libbpf.bpf_map_lookup_elem(self.map_fd, ctypes.byref(key), ctypes.byref(leaf))
+
+  def __getitem__(self, key: Any) -> Any:
+    leaf = self.Leaf()
+    result = self._lookup(key, leaf)
+    if result == -errno.ENOENT:
+      raise KeyError(key)
+    _check(result, f"reading {self.name}")
+    return leaf
+
+  def __setitem__(self, key: Any, leaf: Any) -> None:
+    result = self._core.libbpf.bpf_map_update_elem(self.map_fd, ctypes.byref(key), ctypes.byref(leaf), 0)
+    _check(result, f"updating {self.name}")
+
+  def __delitem__(self, key: Any) -> None:
+    result = self._core.libbpf.bpf_map_delete_elem(self.map_fd, ctypes.byref(key))
+    if result == -errno.ENOENT:
+      raise KeyError(key)
+    _check(result, f"deleting from {self.name}")
+
+  def keys(self) -> list[Any]:
+    keys = list[Any]()
+    key = self.Key()
+    next_key = self.Key()
+    previous = None
+    while self._core.libbpf.bpf_map_get_next_key(self.map_fd, previous, ctypes.byref(next_key)) == 0:
+      keys.append(self.Key.from_buffer_copy(next_key))
+      ctypes.pointer(key)[0] = next_key
+      previous = ctypes.byref(key)
+    return keys
+
+  def items(self) -> list[tuple[Any, Any]]:
+    items = list[tuple[Any, Any]]()
+    for key in self.keys():
+      leaf = self.Leaf()
+      # entries deleted since the keys were listed are skipped
+      if self._lookup(key, leaf) == 0:
+        items.append((key, leaf))
+    return items
+
+  def clear(self) -> None:
+    for key in self.keys():
+      self._core.libbpf.bpf_map_delete_elem(self.map_fd, ctypes.byref(key))
+
+  def items_lookup_and_delete_batch(self) -> list[tuple[Any, Any]]:
+    """Reads and deletes every entry like BCC, batch map operations need linux 5.6."""
+    libbpf = self._core.libbpf
+    keys = (self.Key * self.max_entries)()
+    leaves = (self.Leaf * self.max_entries)()
+    # hash maps resume from a bucket index
+    batch = ctypes.c_uint64()
+    in_batch = None
+    items = list[tuple[Any, Any]]()
+    while True:
+      count = ctypes.c_uint32(self.max_entries)
+      result = libbpf.bpf_map_lookup_and_delete_batch(
+        self.map_fd, in_batch, ctypes.byref(batch), keys, leaves, ctypes.byref(count), None,
+      )
+      if result < 0 and result != -errno.ENOENT:
+        _check(result, f"reading and clearing {self.name}")
+      items.extend(
+        (self.Key.from_buffer_copy(keys[entry]), self.Leaf.from_buffer_copy(leaves[entry]))
+        for entry in range(count.value)
+      )
+      if result == -errno.ENOENT:
+        return items
+      in_batch = ctypes.byref(batch)
+
+  def walk(self, stack_id: int) -> Iterator[int]:
+    """Returns the addresses of a stack in a stack trace map, innermost first."""
+    if self.map_type != BPF_MAP_TYPE_STACK_TRACE:
+      raise TypeError(f"{self.name} is not a stack trace map")
+    addresses = (ctypes.c_uint64 * (self.value_size // 8))()
+    if self._lookup(ctypes.c_uint32(stack_id), addresses) != 0:
+      return iter(())
+    return iter([address for address in addresses if address])
+
+
+class CoreObject:
+  """A loaded CO-RE object, offers the part of BCC's BPF interface that hooks use.
+
+  Programs whose section names a kernel function or tracepoint are attached when the object
+  is loaded, like BCC attaches `kprobe__` functions. Programs with a bare section, such as
+  `SEC("kprobe")`, are attached by the hook through `attach_kprobe` and `attach_kretprobe`.
+
+  `event_types` gives the event struct of each ring buffer and `key_types` the key struct of
+  hash maps. Ring buffers are sized to `ring_buffer_size` bytes, other maps are resized with
+  `max_entries`, and `settings` becomes the read only settings of the object, so branches it
+  disables are removed by the verifier. Maps in `pinned_maps` are shared with other objects
+  through their path in the BPF filesystem.
+  """
+
+  ksym = staticmethod(BPF.ksym)
+
+  def __init__(
+      self,
+      object_path: Path,
+      *,
+      settings: CoreSettings | None = None,
+      ring_buffer_size: int | None = None,
+      max_entries: Mapping[str, int] | None = None,
+      pinned_maps: Mapping[str, Path] | None = None,
+      key_types: Mapping[str, Any] | None = None,
+      event_types: Mapping[str, type[ctypes.Structure]] | None = None,
+  ):
+    libbpf = _libbpf()
+    if libbpf is None:
+      raise OSError(errno.ENOSYS, "libbpf is not available")
+    self.libbpf = libbpf
+    self.possible_cpus = libbpf.libbpf_num_possible_cpus()
+    self.open_perf_events = dict[tuple[int, int], dict[int, int]]()
+    self._links = list[int]()
+    self._ring_buffer: int | None = None
+    self._callbacks = list[Any]()
+    self._maps = dict[str, CoreMap]()
+    self._object = libbpf.bpf_object__open_file(str(object_path).encode(), None)
+    if not self._object:
+      raise OSError(ctypes.get_errno(), f"could not open {object_path}")
+    try:
+      bpf_map = libbpf.bpf_object__next_map(self._object, None)
+      while bpf_map:
+        if ring_buffer_size is not None and libbpf.bpf_map__type(bpf_map) == BPF_MAP_TYPE_RINGBUF:
+          name = libbpf.bpf_map__name(bpf_map).decode()
+          _check(libbpf.bpf_map__set_max_entries(bpf_map, ring_buffer_size), f"resizing {name}")
+        bpf_map = libbpf.bpf_object__next_map(self._object, bpf_map)
+      for map_name, entries in (max_entries or {}).items():
+        _check(libbpf.bpf_map__set_max_entries(self._map(map_name), entries), f"resizing {map_name}")
+      for map_name, pin_path in (pinned_maps or {}).items():
+        # libbpf reuses the map pinned there, or creates and pins it if there is none yet
+        _check(
+          libbpf.bpf_map__set_pin_path(self._map(map_name), str(pin_path).encode()),
+          f"pinning {map_name} at {pin_path}",
+        )
+      if settings is not None:
+        # kept in a section of their own, see kernmlops.bpf.h
+        _check(
+          libbpf.bpf_map__set_initial_value(
+            self._map(".rodata.settings"), ctypes.byref(settings), ctypes.sizeof(settings),
+          ),
+          f"setting {type(settings).__name__} of {object_path}",
+        )
+      _check(libbpf.bpf_object__load(self._object), f"loading {object_path}")
+      self._autoattach()
+    except OSError:
+      self.cleanup()
+      raise
+    bpf_map = libbpf.bpf_object__next_map(self._object, None)
+    while bpf_map:
+      name = libbpf.bpf_map__name(bpf_map).decode()
+      self._maps[name] = CoreMap(
+        self, bpf_map, (key_types or {}).get(name), (event_types or {}).get(name),
+      )
+      bpf_map = libbpf.bpf_object__next_map(self._object, bpf_map)
+
+  def _map(self, map_name: str) -> int:
+    bpf_map = self.libbpf.bpf_object__find_map_by_name(self._object, map_name.encode())
+    if not bpf_map:
+      raise KeyError(f"no map {map_name} in the object")
+    return bpf_map
+
+  def _program(self, fn_name: str | bytes) -> int:
+    program = self.libbpf.bpf_object__find_program_by_name(self._object, _as_bytes(fn_name))
+    if not program:
+      raise KeyError(f"no program {_as_bytes(fn_name).decode()} in the object")
+    return program
+
+  def _autoattach(self) -> None:
+    program = self.libbpf.bpf_object__next_program(self._object, None)
+    while program:
+      section = self.libbpf.bpf_program__section_name(program).decode()
+      if "/" in section:
+        link = self.libbpf.bpf_program__attach(program)
+        self._links.append(_check_pointer(link, f"attaching {section}"))
+      program = self.libbpf.bpf_object__next_program(self._object, program)
+
+  def __getitem__(self, map_name: str) -> CoreMap:
+    return self._maps[map_name]
+
+  def _attach_kprobe(
+      self, event: bytes, event_off: int, fn_name: str | bytes, cookie: int, retprobe: bool,
+  ) -> None:
+    opts = _KprobeOpts(
+      sz=ctypes.sizeof(_KprobeOpts), bpf_cookie=cookie, offset=event_off, retprobe=retprobe,
+    )
+    link = self.libbpf.bpf_program__attach_kprobe_opts(self._program(fn_name), event, ctypes.byref(opts))
+    probe = "kretprobe" if retprobe else "kprobe"
+    self._links.append(_check_pointer(link, f"attaching {probe} {event.decode()}+{event_off:#x}"))
+
+  def _attach_probes(
+      self,
+      event: str | bytes,
+      event_off: int,
+      fn_name: str | bytes,
+      event_re: str | bytes,
+      cookie: int,
+      retprobe: bool,
+  ) -> None:
+    if not event_re:
+      self._attach_kprobe(_as_bytes(event), event_off, fn_name, cookie, retprobe)
+      return
+    # like BCC, matching functions that cannot be probed are skipped unless none can
+    attached = 0
+    matches = BPF.get_kprobe_functions(_as_bytes(event_re))
+    for function in matches:
+      try:
+        self._attach_kprobe(function, 0, fn_name, cookie, retprobe)
+        attached += 1
+      except OSError:
+        continue
+    if attached == 0:
+      raise OSError(errno.ENOENT, f"could not attach {_as_bytes(fn_name).decode()} to {matches}")
+
+  def attach_kprobe(
+      self,
+      event: str | bytes = b"",
+      event_off: int = 0,
+      fn_name: str | bytes = b"",
+      event_re: str | bytes = b"",
+      cookie: int = 0,
+  ) -> None:
+    """Attaches a program to the entry of a kernel function, `cookie` is read with bpf_get_attach_cookie."""
+    self._attach_probes(event, event_off, fn_name, event_re, cookie, retprobe=False)
+
+  def attach_kretprobe(
+      self,
+      event: str | bytes = b"",
+      fn_name: str | bytes = b"",
+      event_re: str | bytes = b"",
+      cookie: int = 0,
+  ) -> None:
+    """Attaches a program to the return of a kernel function."""
+    self._attach_probes(event, 0, fn_name, event_re, cookie, retprobe=True)
+
+  def attach_perf_event(self, fn_name: str | bytes, perf_fd: int, cookie: int = 0) -> None:
+    """Runs a program on each sample of an open perf event, the object closes `perf_fd`."""
+    opts = _PerfEventOpts(sz=ctypes.sizeof(_PerfEventOpts), bpf_cookie=cookie)
+    try:
+      program = self._program(fn_name)
+      link = self.libbpf.bpf_program__attach_perf_event_opts(program, perf_fd, ctypes.byref(opts))
+      self._links.append(_check_pointer(link, f"attaching {_as_bytes(fn_name).decode()}"))
+    except (KeyError, OSError):
+      os.close(perf_fd)
+      raise
+
+  def open_ring_buffer(self, core_map: CoreMap, callback: Callable[[Any, int, int], Any]) -> None:
+    def sample(ctx, data, size) -> int:
+      callback(ctx, data, size)
+      return 0
+    ring_buffer_callback = _RING_BUFFER_SAMPLE(sample)
+    # libbpf calls back into these for as long as the ring buffer is open
+    self._callbacks.append(ring_buffer_callback)
+    if self._ring_buffer is None:
+      ring_buffer = self.libbpf.ring_buffer__new(core_map.map_fd, ring_buffer_callback, None, None)
+      self._ring_buffer = _check_pointer(ring_buffer, f"opening ring buffer {core_map.name}")
+    else:
+      _check(
+        self.libbpf.ring_buffer__add(self._ring_buffer, core_map.map_fd, ring_buffer_callback, None),
+        f"opening ring buffer {core_map.name}",
+      )
+
+  def ring_buffer_poll(self, timeout: int = -1) -> None:
+    if self._ring_buffer is not None:
+      result = self.libbpf.ring_buffer__poll(self._ring_buffer, timeout)
+      if result < 0 and result != -errno.EINTR:
+        _check(result, "polling ring buffers")
+
+  def cleanup(self) -> None:
+    if self._ring_buffer is not None:
+      self.libbpf.ring_buffer__free(self._ring_buffer)
+      self._ring_buffer = None
+    for link in self._links:
+      self.libbpf.bpf_link__destroy(link)
+    self._links.clear()
+    if self._object:
+      self.libbpf.bpf_object__close(self._object)
+      self._object = None
+
+
+def load_prebuilt(
+    hook_name: str,
+    transport: EventTransport,
+    *,
+    settings: Mapping[str, int] | None = None,
+    max_entries: Mapping[str, int] | None = None,
+    pinned_maps: Mapping[str, Path] | None = None,
+    key_structs: Mapping[str, str] | None = None,
+    event_structs: Mapping[str, str] | None = None,
+) -> CoreObject | None:
+  """Loads the prebuilt object of a hook, returns None if the hook has to be compiled with BCC.
+
+  Objects only stream through ring buffers. `pinned_maps` are shared with other objects through
+  their pin path. `key_structs` and `event_structs` name the C structs of map keys and ring
+  buffer events in the object source.
+  """
+  object_path = prebuilt_object(hook_name)
+  if object_path is None or not transport.prebuilt_objects or not transport.is_ring_buffer:
+    return None
+  object_source = object_path.with_suffix(".c")
+  try:
+    return CoreObject(
+      object_path,
+      settings=CoreSettings(**settings) if settings is not None else None,
+      ring_buffer_size=transport.ring_buffer_pages * os.sysconf("SC_PAGE_SIZE"),
+      max_entries=max_entries,
+      pinned_maps=pinned_maps,
+      key_types={
+        map_name: struct_ctype(object_source, struct_name)
+        for map_name, struct_name in (key_structs or {}).items()
+      },
+      event_types={
+        map_name: struct_ctype(object_source, struct_name)
+        for map_name, struct_name in (event_structs or {}).items()
+      },
+    )
+  except OSError as e:
+    # TODO(Patrick): use logging
+    print(f"warning: could not load {object_path}, compiling {hook_name} instead: {e}")
+    return None
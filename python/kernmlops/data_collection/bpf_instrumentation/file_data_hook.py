@@ -1,10 +1,19 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 
 import polars as pl
 from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable, FileDataTable
+from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
@@ -24,7 +33,16 @@ class FileDataBPFHook(BPFProgram):
   def name(cls) -> str:
     return "file_data"
 
-  def __init__(self):
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "FileDataBPFHook":
+    return FileDataBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+    self.transport = transport or EventTransport()
+    self.target_filter = target_filter or TargetFilter()
     bpf_text = open(Path(__file__).parent / "bpf/file_data.bpf.c", "r").read()
 
     # code substitutions
@@ -40,47 +58,67 @@ class FileDataBPFHook(BPFProgram):
         bpf_text = bpf_text.replace('TRACE_CREATE_1', '1')
         bpf_text = bpf_text.replace('TRACE_CREATE_2', '0')
         bpf_text = bpf_text.replace('TRACE_CREATE_3', '0')
-    # pid from userspace point of view is thread group from kernel pov
-    # bpf_text = bpf_text.replace('FILTER', 'tgid != %s' % args.pid)
-    self.bpf_text = bpf_text.replace('FILTER', '0')
-    self.file_open_data = list[FileOpenData]()
+    self.bpf_text = bpf_text
+    self.file_open_data = EventList[FileOpenData]()
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.target_filter.core_settings(),
+      max_entries=self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      event_structs={
+        "file_open_events": "file_open_perf_event",
+      },
+    ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
     self.bpf.attach_kprobe(event=b"vfs_create", fn_name=b"trace_create")
     self.bpf.attach_kprobe(event=b"vfs_open", fn_name=b"trace_open")
     if BPF.get_kprobe_functions(b"security_inode_create"):
         self.bpf.attach_kprobe(event=b"security_inode_create", fn_name=b"trace_security_inode_create")
-    self.bpf["file_open_events"].open_perf_buffer(self._file_open_event_handler, page_cnt=64)
+    self.transport.open(self.bpf, "file_open_events", self._file_open_event_handler, page_cnt=64)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    return True
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(self, file_open_data: list[FileOpenData]) -> list[CollectionTable]:
     return [
       FileDataTable.from_df_id(
-        pl.DataFrame(self.file_open_data),
+        pl.DataFrame(file_open_data),
         collection_id=self.collection_id,
       ),
     ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(self.file_open_data.snapshot())
+
   def clear(self):
     self.file_open_data.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    file_open_data = self.file_open_data.swap()
+    return lambda: self._tables(file_open_data)
+
   def pop_data(self) -> list[CollectionTable]:
-    file_tables = self.data()
-    self.clear()
-    return file_tables
+    return self.swap_data()()
 
   def _file_open_event_handler(self, cpu, file_open_perf_event, size):
     event = self.bpf["file_open_events"].event(file_open_perf_event)
     try:
         data = FileOpenData(
-            cpu=cpu,
+            cpu=event.cpu,
             pid=event.pid,
             tgid=event.tgid,
             ts_uptime_us=event.ts_uptime_us,
@@ -1,10 +1,18 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+    TARGET_FILTER,
+    TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable, FileOpeningTable
+from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
@@ -23,39 +31,62 @@ class FileOpeningBPFHook(BPFProgram):
     def name(cls) -> str:
         return "file_opening"
 
-    def __init__(self):
-        bpf_text = open(Path(__file__).parent / "bpf/file_opening.bpf.c", "r").read()
+    @classmethod
+    def from_config(cls, config: ConfigBase) -> "FileOpeningBPFHook":
+        return FileOpeningBPFHook(
+            transport=EventTransport.from_config(cls.name(), config),
+            target_filter=TargetFilter.from_config(config),
+        )
 
-        # Replace the FILTER placeholder with '0' to accept all events
-        self.bpf_text = bpf_text.replace('FILTER', '0')
-        self.file_opening_data = list[FileOpeningData]()
+    def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+        self.transport = transport or EventTransport()
+        self.target_filter = target_filter or TargetFilter()
+        self.bpf_text = open(Path(__file__).parent / "bpf/file_opening.bpf.c", "r").read()
+        self.file_opening_data = EventList[FileOpeningData]()
+
+    def prepare(self):
+        self.bpf = load_prebuilt(
+            self.name(),
+            self.transport,
+            settings=self.target_filter.core_settings(),
+            max_entries=self.target_filter.core_max_entries(),
+            pinned_maps=self.target_filter.pinned_maps(),
+            event_structs={
+                "file_opening_events": "file_opening_perf_event",
+            },
+        ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
     def load(self, collection_id: str):
         print(f"[DEBUG] Loading file_opening hook with collection_id {collection_id}")
         self.collection_id = collection_id
-        self.bpf = BPF(text=self.bpf_text)
 
         # Attach to the openat syscall
         self.bpf.attach_kprobe(event=b"__x64_sys_openat", fn_name=b"trace_sys_openat")
 
-        # Open perf buffer to receive events
-        self.bpf["file_opening_events"].open_perf_buffer(
-            self._file_opening_event_handler, page_cnt=64
+        # Open event buffer to receive events
+        self.transport.open(
+            self.bpf, "file_opening_events", self._file_opening_event_handler, page_cnt=64
         )
 
-    def poll(self):
-        self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    def drains_events(self) -> bool:
+        return True
+
+    def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+        self.transport.poll(self.bpf, timeout_ms)
 
     def close(self):
         self.bpf.cleanup()
 
-    def data(self) -> list[CollectionTable]:
-        if not self.file_opening_data:
+    def event_counts(self) -> list[EventCounts]:
+        return self.transport.event_counts(self.bpf)
+
+    def _tables(self, file_opening_data: list[FileOpeningData]) -> list[CollectionTable]:
+        if not file_opening_data:
             return []
 
         # Convert the dataclass objects to dictionaries and then to DataFrame
         data_dicts = []
-        for data in self.file_opening_data:
+        for data in file_opening_data:
             data_dicts.append({
                 "cpu": data.cpu,
                 "pid": data.pid,
@@ -75,20 +106,25 @@ class FileOpeningBPFHook(BPFProgram):
             ),
         ]
 
+    def data(self) -> list[CollectionTable]:
+        return self._tables(self.file_opening_data.snapshot())
+
     def clear(self):
         self.file_opening_data.clear()
 
+    def swap_data(self) -> Callable[[], list[CollectionTable]]:
+        file_opening_data = self.file_opening_data.swap()
+        return lambda: self._tables(file_opening_data)
+
     def pop_data(self) -> list[CollectionTable]:
-        file_tables = self.data()
-        self.clear()
-        return file_tables
+        return self.swap_data()()
 
     def _file_opening_event_handler(self, cpu, file_opening_perf_event, size):
         print(f"[DEBUG] File opening event received on CPU {cpu}")
         event = self.bpf["file_opening_events"].event(file_opening_perf_event)
         try:
             data = FileOpeningData(
-                cpu=cpu,
+                cpu=event.cpu,
                 pid=event.pid,
                 tgid=event.tgid,
                 ts_uptime_us=event.ts_uptime_us,
@@ -1,11 +1,19 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable
 from data_schema.generic_table import ProcessTraceDataTable
+from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
@@ -22,41 +30,74 @@ class TraceProcessHook(BPFProgram):
   def name(cls) -> str:
     return "process_trace"
 
-  def __init__(self):
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "TraceProcessHook":
+    return TraceProcessHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+    self.transport = transport or EventTransport()
+    self.target_filter = target_filter or TargetFilter()
     self.bpf_text = open(Path(__file__).parent / "bpf/fork_and_exit.bpf.c", "r").read()
-    self.trace_process = list[TraceProcessStat]()
+    self.trace_process = EventList[TraceProcessStat]()
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.target_filter.core_settings(),
+      max_entries=self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      event_structs={
+        "copy_task_events": "start_data",
+        "release_task_events": "stop_data",
+        "exec_events": "start_data",
+      },
+    ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
     self.bpf.attach_kretprobe(event=b"copy_process", fn_name=b"kretprobe_copy_process")
     self.bpf.attach_kprobe(event=b"do_exit", fn_name=b"kprobe_do_exit")
     self.bpf.attach_kretprobe(event=b"__set_task_comm", fn_name=b"kretprobe_exec")
-    self.bpf["copy_task_events"].open_perf_buffer(self._create_task_eh, page_cnt=128)
-    self.bpf["release_task_events"].open_perf_buffer(self._release_task_eh, page_cnt=128)
-    self.bpf["exec_events"].open_perf_buffer(self._exec_eh, page_cnt=128)
+    self.transport.open(self.bpf, "copy_task_events", self._create_task_eh, page_cnt=128)
+    self.transport.open(self.bpf, "release_task_events", self._release_task_eh, page_cnt=128)
+    self.transport.open(self.bpf, "exec_events", self._exec_eh, page_cnt=128)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    return True
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(self, trace_process: list[TraceProcessStat]) -> list[CollectionTable]:
     return [
             ProcessTraceDataTable.from_df_id(
-                pl.DataFrame(self.trace_process),
+                pl.DataFrame(trace_process),
                 collection_id=self.collection_id,
             ),
         ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(self.trace_process.snapshot())
+
   def clear(self):
     self.trace_process.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    trace_process = self.trace_process.swap()
+    return lambda: self._tables(trace_process)
+
   def pop_data(self) -> list[CollectionTable]:
-    tables = self.data()
-    self.clear()
-    return tables
+    return self.swap_data()()
 
   def _create_task_eh(self, cpu, start_data, size):
       event = self.bpf["copy_task_events"].event(start_data)
@@ -0,0 +1,110 @@
+"""In kernel histogram aggregation for hooks that otherwise stream every event."""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any, Final, Literal
+
+from data_collection.bpf_instrumentation.transport import (
+  generic_collector_config,
+  kernel_at_least,
+)
+from kernmlops_config import ConfigBase
+
+HistogramScale = Literal["log2", "linear"]
+
+# upper bound of the open ended last bucket
+HISTOGRAM_UNBOUNDED_US: Final[int] = 2**63 - 1
+
+# batch map operations were introduced in linux 5.6
+BATCH_MAP_OPS_MIN_KERNEL: Final[tuple[int, int]] = (5, 6)
+
+# Prepended to hook programs, templates aggregate into BPF_PERCPU_HASH maps with `#if AGGREGATE_HISTOGRAMS`.
+HISTOGRAM_SLOTS: Final[str] = """
+static inline u32 histogram_slot(u64 value) {
+#if HISTOGRAM_LINEAR
+  u64 slot = value / HISTOGRAM_LINEAR_STEP;
+  return slot < HISTOGRAM_MAX_SLOT ? slot : HISTOGRAM_MAX_SLOT;
+#else
+  return bpf_log2l(value);
+#endif
+}
+"""
+
+
+@dataclass(frozen=True)
+class HistogramAggregation:
+  """Replaces the event stream of a hook with per cpu histograms that are read and reset each poll.
+
+  Log2 bucket `n` holds values in [2^(n-1), 2^n), linear buckets are `linear_step_us` wide
+  and the last of `linear_buckets` is open ended.
+  """
+  enabled: bool = False
+  scale: HistogramScale = "log2"
+  linear_step_us: int = 100
+  linear_buckets: int = 64
+  max_entries: int = 10240
+
+  @classmethod
+  def from_config(cls, hook_name: str, config: ConfigBase) -> "HistogramAggregation":
+    generic_config = generic_collector_config(config)
+    scale = generic_config.histogram_scale
+    if scale not in ("log2", "linear"):
+      raise ValueError(f"unknown histogram scale {scale} for {hook_name}")
+    linear_step_us = int(generic_config.histogram_linear_step_us)
+    linear_buckets = int(generic_config.histogram_linear_buckets)
+    if linear_step_us <= 0 or linear_buckets <= 0:
+      raise ValueError(
+        f"histogram_linear_step_us and histogram_linear_buckets must be positive, "
+        f"got {linear_step_us} and {linear_buckets}"
+      )
+    return HistogramAggregation(
+      enabled=hook_name in generic_config.histogram_hooks,
+      scale=scale,
+      linear_step_us=linear_step_us,
+      linear_buckets=linear_buckets,
+    )
+
+  def cflags(self) -> list[str]:
+    return [
+      f"-DAGGREGATE_HISTOGRAMS={1 if self.enabled else 0}",
+      f"-DHISTOGRAM_LINEAR={1 if self.scale == 'linear' else 0}",
+      f"-DHISTOGRAM_LINEAR_STEP={self.linear_step_us}",
+      f"-DHISTOGRAM_MAX_SLOT={self.linear_buckets - 1}",
+      f"-DHISTOGRAM_MAX_ENTRIES={self.max_entries}",
+    ]
+
+  def core_settings(self) -> dict[str, int]:
+    """The `cflags` of a prebuilt CO-RE object, see CoreSettings."""
+    return {
+      "aggregate_histograms": 1 if self.enabled else 0,
+      "histogram_linear": 1 if self.scale == "linear" else 0,
+      "histogram_linear_step": self.linear_step_us,
+      "histogram_max_slot": self.linear_buckets - 1,
+    }
+
+  def bucket_bounds(self, bucket: int) -> tuple[int, int]:
+    """Returns the inclusive lower and exclusive upper bound of a bucket in microseconds."""
+    if self.scale == "linear":
+      if bucket >= self.linear_buckets - 1:
+        return (bucket * self.linear_step_us, HISTOGRAM_UNBOUNDED_US)
+      return (bucket * self.linear_step_us, (bucket + 1) * self.linear_step_us)
+    if bucket >= 63:
+      return (min(1 << (bucket - 1), HISTOGRAM_UNBOUNDED_US), HISTOGRAM_UNBOUNDED_US)
+    return ((1 << bucket) >> 1, 1 << bucket)
+
+  def pop_counts(self, histogram: Any) -> list[tuple[Any, Sequence[int]]]:
+    """Reads and resets a BPF_PERCPU_HASH histogram, returning each key with its per cpu counts."""
+    return pop_percpu_counts(histogram)
+
+
+def pop_percpu_counts(table: Any) -> list[tuple[Any, Sequence[int]]]:
+  """Reads and resets any BPF_PERCPU_HASH of counts, returning each key with its per cpu counts."""
+  if kernel_at_least(BATCH_MAP_OPS_MIN_KERNEL):
+    return [
+      (key, list(counts))
+      for key, counts in table.items_lookup_and_delete_batch()
+    ]
+  # counts between the read and clear are dropped
+  counts: list[tuple[Any, Sequence[int]]] = [(key, list(counts)) for key, counts in table.items()]
+  table.clear()
+  return counts
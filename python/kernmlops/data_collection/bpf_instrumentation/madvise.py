@@ -1,11 +1,19 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable
 from data_schema.generic_table import MadviseDataTable
+from kernmlops_config import ConfigBase
 
 ADVICE_ASSIGN_DICT = {
     -1: "MUNMAP",
@@ -50,14 +58,34 @@ class MadviseBPFHook(BPFProgram):
   def name(cls) -> str:
     return "madvise"
 
-  def __init__(self):
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "MadviseBPFHook":
+    return MadviseBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+    self.transport = transport or EventTransport()
+    self.target_filter = target_filter or TargetFilter()
     self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
     self.bpf_text = open(Path(__file__).parent / "bpf/madvise.bpf.c", "r").read()
-    self.madvise_stat = list[MadviseStat]()
+    self.madvise_stat = EventList[MadviseStat]()
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.target_filter.core_settings(),
+      max_entries=self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      event_structs={
+        "madvise_output": "madvise_output",
+      },
+    ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
     self.bpf.attach_kprobe(event=b"do_madvise",
                            fn_name=b"kprobe__do_madvise")
     self.bpf.attach_kretprobe(event=b"do_madvise",
@@ -66,29 +94,40 @@ class MadviseBPFHook(BPFProgram):
                            fn_name=b"kprobe__do_vmi_align_munmap")
     self.bpf.attach_kretprobe(event=b"do_vmi_align_munmap",
                               fn_name=b"kretprobe__do_vmi_align_munmap")
-    self.bpf["madvise_output"].open_perf_buffer(self._madvise_eh, page_cnt=64)
+    self.transport.open(self.bpf, "madvise_output", self._madvise_eh, page_cnt=64)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    return True
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(self, madvise_stat: list[MadviseStat]) -> list[CollectionTable]:
     return [
             MadviseDataTable.from_df_id(
-                pl.DataFrame(self.madvise_stat),
+                pl.DataFrame(madvise_stat),
                 collection_id=self.collection_id,
             ),
         ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(self.madvise_stat.snapshot())
+
   def clear(self):
     self.madvise_stat.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    madvise_stat = self.madvise_stat.swap()
+    return lambda: self._tables(madvise_stat)
+
   def pop_data(self) -> list[CollectionTable]:
-    tables = self.data()
-    self.clear()
-    return tables
+    return self.swap_data()()
 
   def _madvise_eh(self, cpu, madvise_struct, size):
       event = self.bpf["madvise_output"].event(madvise_struct)
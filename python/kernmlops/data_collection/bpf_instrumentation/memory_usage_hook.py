@@ -1,10 +1,11 @@
 import time
+from collections.abc import Callable, Mapping
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Mapping
 
 import polars as pl
-from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
 from data_schema import CollectionTable
 from data_schema.memory_usage import MemoryUsageTable
 
@@ -104,9 +105,9 @@ class MemoryUsageHook(BPFProgram):
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.memory_usage = list[MemoryUsageDataRaw]()
+    self.memory_usage = EventList[MemoryUsageDataRaw]()
 
-  def poll(self):
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
     self.memory_usage.append(
       MemoryUsageDataRaw(
         ts_uptime_us=int(time.clock_gettime_ns(time.CLOCK_BOOTTIME) / 1000),
@@ -117,21 +118,26 @@ class MemoryUsageHook(BPFProgram):
   def close(self):
     pass
 
-  def data(self) -> list[CollectionTable]:
+  def _tables(self, memory_usage: list[MemoryUsageDataRaw]) -> list[CollectionTable]:
     return [
       MemoryUsageTable.from_df_id(
         pl.DataFrame([
           raw_data.parse()
-          for raw_data in self.memory_usage
+          for raw_data in memory_usage
         ]),
         collection_id=self.collection_id,
       )
     ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(self.memory_usage.snapshot())
+
   def clear(self):
     self.memory_usage.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    memory_usage = self.memory_usage.swap()
+    return lambda: self._tables(memory_usage)
+
   def pop_data(self) -> list[CollectionTable]:
-    memory_table = self.data()
-    self.clear()
-    return memory_table
+    return self.swap_data()()
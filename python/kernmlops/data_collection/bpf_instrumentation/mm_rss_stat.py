@@ -1,11 +1,19 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable
 from data_schema.generic_table import TraceMMRSSStatDataTable
+from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
@@ -24,38 +32,69 @@ class TraceRSSStatBPFHook(BPFProgram):
   def name(cls) -> str:
     return "mm_rss_stat"
 
-  def __init__(self):
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "TraceRSSStatBPFHook":
+    return TraceRSSStatBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+    self.transport = transport or EventTransport()
+    self.target_filter = target_filter or TargetFilter()
     self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
     self.bpf_text = open(Path(__file__).parent / "bpf/mm_trace_rss_stat.bpf.c", "r").read()
-    self.trace_rss_stat = list[TraceRSSStat]()
+    self.trace_rss_stat = EventList[TraceRSSStat]()
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.target_filter.core_settings(),
+      max_entries=self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      event_structs={
+        "rss_stat_output": "rss_stat_output",
+      },
+    ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
     #self.bpf.attach_raw_tracepoint(tp=b"mm_trace_rss_stat", fn_name=b"mm_trace_rss_stat")
-    self.bpf["rss_stat_output"].open_perf_buffer(self._mm_trace_rss_stat_eh, page_cnt=256)
+    self.transport.open(self.bpf, "rss_stat_output", self._mm_trace_rss_stat_eh, page_cnt=256)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    return True
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(self, trace_rss_stat: list[TraceRSSStat]) -> list[CollectionTable]:
     return [
             TraceMMRSSStatDataTable.from_df_id(
-                pl.DataFrame(self.trace_rss_stat),
+                pl.DataFrame(trace_rss_stat),
                 collection_id=self.collection_id,
             ),
         ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(self.trace_rss_stat.snapshot())
+
   def clear(self):
     self.trace_rss_stat.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    trace_rss_stat = self.trace_rss_stat.swap()
+    return lambda: self._tables(trace_rss_stat)
+
   def pop_data(self) -> list[CollectionTable]:
-    quanta_tables = self.data()
-    self.clear()
-    return quanta_tables
+    return self.swap_data()()
 
   def _mm_trace_rss_stat_eh(self, cpu, rss_stat_struct, size):
       event = self.bpf["rss_stat_output"].event(rss_stat_struct)
@@ -1,7 +1,11 @@
-from data_collection.bpf_instrumentation.perf.perf_config import CustomHWConfigManager
+from data_collection.bpf_instrumentation.perf.perf_config import (
+  CustomHWConfigManager,
+  PerfHookConfig,
+)
 from data_collection.bpf_instrumentation.perf.perf_hook import PerfBPFHook
 
 __all__ = [
   "CustomHWConfigManager",
   "PerfBPFHook",
+  "PerfHookConfig",
 ]
@@ -1,11 +1,12 @@
 import os
 import subprocess
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from functools import cache
 from pathlib import Path
 from typing import Final, Mapping
 
-from data_schema.perf import CustomHWEventID, PerfCollectionTable
+from data_schema.perf import CustomHWEventID, PerfCollectionTable, perf_table_types
+from kernmlops_config import ConfigBase
 
 # https://stackoverflow.com/questions/14626395/how-to-properly-convert-a-c-ioctl-call-to-a-python-fcntl-ioctl-call
 # https://github.com/torvalds/linux/blob/0a9b9d17f3a781dea03baca01c835deaa07f7cc3/include/uapi/linux/perf_event.h#L551
@@ -14,6 +15,57 @@ PERF_EVENT_IOC_DISABLE: Final[int] = ord('$') << (4*2) | 1
 PERF_IOC_FLAG_GROUP: Final[int] = 1
 
 
+@dataclass(frozen=True)
+class PerfHookConfig(ConfigBase):
+  # perf tables to collect, empty collects every counter the machine supports
+  counters: list[str] = field(default_factory=list)
+  # samples per second of each counter on each cpu
+  sample_freq: int = 1000
+  counter_sample_freqs: dict[str, int] = field(default_factory=dict)
+  # events between samples, a counter listed here ignores its sample frequency
+  counter_sample_periods: dict[str, int] = field(default_factory=dict)
+  # cpus to count on, empty counts on every online cpu
+  cpus: list[int] = field(default_factory=list)
+  # counters are written as per interval rates, the cumulative samples are opt in
+  rate_tables: bool = True
+  cumulative_tables: bool = False
+  rate_interval_ms: int = 100
+  # sample: bpf programs sample every counter, read: whole counter groups are read every poll
+  mode: str = "sample"
+
+  def validate(self) -> None:
+    if self.mode not in ("sample", "read"):
+      raise ValueError(f"perf mode must be sample or read, got {self.mode}")
+    if not self.rate_tables and not self.cumulative_tables:
+      raise ValueError("perf rate_tables and cumulative_tables are both disabled, perf would write nothing")
+    if self.rate_interval_ms <= 0:
+      raise ValueError(f"perf rate_interval_ms must be positive, got {self.rate_interval_ms}")
+    configured_counters = set(self.counters) | set(self.counter_sample_freqs) | set(self.counter_sample_periods)
+    unknown_counters = configured_counters - set(perf_table_types)
+    if unknown_counters:
+      raise ValueError(f"unknown perf counters {sorted(unknown_counters)}, known counters are {sorted(perf_table_types)}")
+    for name, value in [
+      ("sample_freq", self.sample_freq),
+      *[(f"counter_sample_freqs.{counter}", freq) for counter, freq in self.counter_sample_freqs.items()],
+      *[(f"counter_sample_periods.{counter}", period) for counter, period in self.counter_sample_periods.items()],
+    ]:
+      if value <= 0:
+        raise ValueError(f"perf {name} must be positive, got {value}")
+    online_cpus = os.cpu_count() or 1
+    invalid_cpus = [cpu for cpu in self.cpus if cpu < 0 or cpu >= online_cpus]
+    if invalid_cpus:
+      raise ValueError(f"perf cpus {invalid_cpus} are not between 0 and {online_cpus - 1}")
+
+  def enabled(self, counter: type[PerfCollectionTable]) -> bool:
+    return not self.counters or counter.name() in self.counters
+
+  def sampling(self, counter: type[PerfCollectionTable]) -> tuple[int, int]:
+    """Returns the sample period and frequency of a counter, one of them is zero."""
+    if counter.name() in self.counter_sample_periods:
+      return (self.counter_sample_periods[counter.name()], 0)
+    return (0, self.counter_sample_freqs.get(counter.name(), self.sample_freq))
+
+
 @dataclass(frozen=True)
 class CustomHWConfigUmask:
   id: str
@@ -1,64 +1,90 @@
-from dataclasses import dataclass
+import time
+from collections.abc import Callable
 from fcntl import ioctl
+from functools import cache, partial
 from pathlib import Path
-from typing import Any, Final
+from typing import Final, cast
 
 import polars as pl
-from bcc import BPF, PerfType
+from bcc import PerfType
+from bcc.utils import get_online_cpus
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import ColumnarAccumulator
+from data_collection.bpf_instrumentation.core_object import CoreObject, load_prebuilt
 from data_collection.bpf_instrumentation.perf.perf_config import (
   PERF_EVENT_IOC_DISABLE,
   PERF_EVENT_IOC_ENABLE,
   PERF_IOC_FLAG_GROUP,
   CustomHWConfigManager,
+  PerfHookConfig,
 )
-from data_schema import CollectionTable
-from data_schema.perf import PerfCollectionTable, perf_table_types
+from data_collection.bpf_instrumentation.perf.perf_rates import PerfRateStage
+from data_collection.bpf_instrumentation.perf.perf_read import (
+  PerfCounterGroups,
+  perf_event_open,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
+from data_schema import UPTIME_TIMESTAMP, CollectionTable
+from data_schema.perf import (
+  PerfCollectionTable,
+  perf_rate_table_types,
+  perf_table_types,
+)
+from kernmlops_config import ConfigBase
 
 PERF_HANDLER: Final[str] = """
+#if USE_RINGBUF
+BPF_RINGBUF_OUTPUT(NAME, RINGBUF_PAGES);
+#else
 BPF_PERF_OUTPUT(NAME);
+#endif
 int NAME_on(struct bpf_perf_event_data* ctx) {
   struct bpf_perf_event_value value_buf;
   if (bpf_perf_prog_read_value(ctx, (void*)&value_buf, sizeof(struct bpf_perf_event_value))) {
     return 0;
   }
-  struct perf_event_data data;
-  __builtin_memset(&data, 0, sizeof(data));
+  struct perf_event_data* data;
+#if USE_RINGBUF
+  data = NAME.ringbuf_reserve(sizeof(struct perf_event_data));
+  if (!data) {
+    count_lost_event();
+    return 0;
+  }
+#else
+  struct perf_event_data counter_event;
+  data = &counter_event;
+#endif
+  __builtin_memset(data, 0, sizeof(struct perf_event_data));
   u32 pid = bpf_get_current_pid_tgid();
   u32 tgid = bpf_get_current_pid_tgid() >> 32;
   u64 ts = bpf_ktime_get_ns();
-  data.pid = pid;
-  data.tgid = tgid;
-  data.ts_uptime_us = ts / 1000;
-  data.count = value_buf.counter;
-  data.enabled_time_us = value_buf.enabled / 1000;
-  data.running_time_us = value_buf.running / 1000;
-  NAME.perf_submit(ctx, &data, sizeof(data));
+  data->cpu = bpf_get_smp_processor_id();
+  data->pid = pid;
+  data->tgid = tgid;
+  data->ts_uptime_us = ts / 1000;
+  data->count = value_buf.counter;
+  data->enabled_time_us = value_buf.enabled / 1000;
+  data->running_time_us = value_buf.running / 1000;
+#if USE_RINGBUF
+  NAME.ringbuf_submit(data, 0);
+  count_submitted_event();
+#else
+  count_perf_submit(NAME.perf_submit(ctx, data, sizeof(struct perf_event_data)));
+#endif
   return 0;
 }
 """
 
-@dataclass(frozen=True)
-class PerfData:
-  cpu: int
-  pid: int
-  tgid: int
-  ts_uptime_us: int
-  cumulative_count: int
-  pmu_enabled_time_us: int
-  pmu_running_time_us: int
-
-  @classmethod
-  def from_event(cls, cpu: int, event: Any):
-    return PerfData(
-        cpu=cpu,
-        pid=event.pid,
-        tgid=event.tgid,
-        ts_uptime_us=event.ts_uptime_us,
-        cumulative_count=event.count,
-        pmu_enabled_time_us=event.enabled_time_us,
-        pmu_running_time_us=event.running_time_us,
-    )
+# cumulative_count is renamed per counter by PerfCollectionTable.from_df_id
+PERF_DATA_SCHEMA: Final[pl.Schema] = pl.Schema({
+  "cpu": pl.Int64(),
+  "pid": pl.Int64(),
+  "tgid": pl.Int64(),
+  UPTIME_TIMESTAMP: pl.Int64(),
+  "cumulative_count": pl.Int64(),
+  "pmu_enabled_time_us": pl.Int64(),
+  "pmu_running_time_us": pl.Int64(),
+})
 
 
 class PerfBPFHook(BPFProgram):
@@ -67,72 +93,184 @@ class PerfBPFHook(BPFProgram):
   def name(cls) -> str:
     return "perf"
 
-  def __init__(self):
-    self._perf_data = dict[str, list[PerfData]]()
+  @classmethod
+  def default_config(cls) -> ConfigBase:
+    return PerfHookConfig()
+
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "PerfBPFHook":
+    perf_config = cast(PerfHookConfig, getattr(config, cls.name()))
+    perf_config.validate()
+    return PerfBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      config=perf_config,
+    )
+
+  def __init__(self, transport: EventTransport | None = None, config: PerfHookConfig | None = None):
+    self.transport = transport or EventTransport()
+    self.config = config or PerfHookConfig()
+    self._closed = False
+    self._perf_data = dict[str, ColumnarAccumulator]()
     self.bpf_text = open(Path(__file__).parent / "../bpf/perf.bpf.c", "r").read()
     self.loaded_hw_event_configs = dict[type[PerfCollectionTable], int]()
     self.group_fds: dict[int, int] | None = None
+    self.counter_groups: PerfCounterGroups | None = None
 
-    # add perf handlers
+    # add perf handlers, counters that are read directly need no bpf program
     def init_perf_handler(perf_event: type[PerfCollectionTable]):
       if perf_event.ev_type() == PerfType.RAW:
         hw_config_value = CustomHWConfigManager.get_hw_config(perf_event)
-        if hw_config_value is not None:
-          self.bpf_text += PERF_HANDLER.replace("NAME", perf_event.name())
-          self._perf_data[perf_event.name()] = list[PerfData]()
-          self.loaded_hw_event_configs[perf_event] = hw_config_value
-        else:
+        if hw_config_value is None:
           print(f"info: could not enable perf counter for {perf_event.name()}")
+          return
       else:
+        hw_config_value = perf_event.ev_config()
+      if self.config.mode == "sample":
         self.bpf_text += PERF_HANDLER.replace("NAME", perf_event.name())
-        self._perf_data[perf_event.name()] = list[PerfData]()
-        self.loaded_hw_event_configs[perf_event] = perf_event.ev_config()
+      self._perf_data[perf_event.name()] = ColumnarAccumulator(PERF_DATA_SCHEMA)
+      self.loaded_hw_event_configs[perf_event] = hw_config_value
 
+    # only the chosen counters get a handler, unused handlers would still be compiled and loaded
     for perf_event in list(perf_table_types.values()):
-      init_perf_handler(perf_event)
+      if self.config.enabled(perf_event):
+        init_perf_handler(perf_event)
+
+    self._rate_stages = {
+      event_name: PerfRateStage(perf_rate_table_types[event_name], self.config.rate_interval_ms * 1000)
+      for event_name in self._perf_data
+      if self.config.rate_tables and event_name in perf_rate_table_types
+    }
 
   def _attach_perf_event(
       self,
       ev_type: int,
       ev_config: int,
       fn_name: bytes,
+      sample_period: int,
       sample_freq: int,
+      counter: int,
   ) -> None:
+    if isinstance(self.bpf, CoreObject):
+      self._attach_core_perf_event(ev_type, ev_config, sample_period, sample_freq, counter)
+      return
     if self.group_fds is None:
-      self.bpf.attach_perf_event(
-        ev_type=ev_type,
-        ev_config=ev_config,
-        fn_name=fn_name,
-        sample_freq=sample_freq,
-        cpu=-1,
-        group_fd=-1,
-      )
-      self.group_fds = self.bpf.open_perf_events[(ev_type, ev_config)]
+      # the first counter leads a group on each cpu, the others join it
+      group_fds = dict[int, int]()
+      for cpu in self.config.cpus or [-1]:
+        self.bpf.attach_perf_event(
+          ev_type=ev_type,
+          ev_config=ev_config,
+          fn_name=fn_name,
+          sample_period=sample_period,
+          sample_freq=sample_freq,
+          cpu=cpu,
+          group_fd=-1,
+        )
+        group_fds.update(self.bpf.open_perf_events[(ev_type, ev_config)])
+      # bcc replaces the fds of an event on every attach, keep all of them so cleanup closes them
+      self.bpf.open_perf_events[(ev_type, ev_config)] = group_fds
+      self.group_fds = group_fds
     else:
+      followers = dict[int, int]()
       for cpu, group_fd in self.group_fds.items():
         self.bpf.attach_perf_event(
           ev_type=ev_type,
           ev_config=ev_config,
           fn_name=fn_name,
+          sample_period=sample_period,
           sample_freq=sample_freq,
           cpu=cpu,
           group_fd=group_fd,
         )
+        followers.update(self.bpf.open_perf_events[(ev_type, ev_config)])
+      self.bpf.open_perf_events[(ev_type, ev_config)] = followers
 
+  def _attach_core_perf_event(
+      self,
+      ev_type: int,
+      ev_config: int,
+      sample_period: int,
+      sample_freq: int,
+      counter: int,
+  ) -> None:
+    assert isinstance(self.bpf, CoreObject)
+    # the prebuilt program is shared by every counter, its cookie tells them apart
+    cpus = self.config.cpus or get_online_cpus()
+    perf_fds = dict[int, int]()
+    for cpu in cpus:
+      group_fd = -1 if self.group_fds is None else self.group_fds[cpu]
+      perf_fds[cpu] = perf_event_open(
+        ev_type,
+        ev_config,
+        cpu=cpu,
+        group_fd=group_fd,
+        sample_period=sample_period,
+        sample_freq=sample_freq,
+      )
+      self.bpf.attach_perf_event(b"perf_sample", perf_fds[cpu], cookie=counter)
+    self.bpf.open_perf_events[(ev_type, ev_config)] = perf_fds
+    if self.group_fds is None:
+      self.group_fds = perf_fds
+
+  def prepare(self):
+    if self.config.mode == "sample":
+      self.bpf = load_prebuilt(
+        self.name(),
+        self.transport,
+        event_structs={"perf_samples": "perf_sample_event"},
+      ) or self.transport.compile(self.bpf_text)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
-    # sample frequency is in hertz
-    for event, hw_config in self.loaded_hw_event_configs.items():
+    if self.config.mode == "read":
+      self._open_counter_groups()
+      return
+    for counter, (event, hw_config) in enumerate(self.loaded_hw_event_configs.items()):
+      # sample frequency is in hertz, a sample period counts events
+      sample_period, sample_freq = self.config.sampling(event)
       self._attach_perf_event(
         ev_type=event.ev_type(),
         ev_config=hw_config,
         fn_name=bytes(f"{str(event.name())}_on", encoding="utf-8"),
-        sample_freq=1000,
+        sample_period=sample_period,
+        sample_freq=sample_freq,
+        counter=counter,
       )
-    for event_name in self._perf_data.keys():
-      self.bpf[event_name].open_perf_buffer(self._perf_handler(event_name), page_cnt=64)
+    if isinstance(self.bpf, CoreObject):
+      self._counter_names = [event.name() for event in self.loaded_hw_event_configs]
+      self.transport.open(self.bpf, "perf_samples", self._core_perf_handler, page_cnt=64)
+      return
+    for event_name in self._perf_data:
+      self.transport.open(self.bpf, event_name, self._perf_handler(event_name), page_cnt=64)
+
+  def _open_counter_groups(self) -> None:
+    # counting events are not inherited per task, so each cpu counts everything that runs on it
+    self.counter_groups = PerfCounterGroups(
+      events=[(event.ev_type(), hw_config) for event, hw_config in self.loaded_hw_event_configs.items()],
+      cpus=self.config.cpus or get_online_cpus(),
+    )
+    self.group_fds = self.counter_groups.leader_fds
+    self._read_counter_groups()
+
+  def _read_counter_groups(self) -> None:
+    if self.counter_groups is None:
+      return
+    # same clock as bpf_ktime_get_ns, so readings line up with the sampled tables
+    ts_uptime_us = time.clock_gettime_ns(time.CLOCK_MONOTONIC) // 1000
+    event_names = [event.name() for event in self.loaded_hw_event_configs]
+    for cpu in self.counter_groups.leader_fds:
+      reading = self.counter_groups.read(cpu)
+      for event_name, count in zip(event_names, reading.counts):
+        # group readings are system wide, there is no task to attribute them to
+        self._perf_data[event_name].append(
+          cpu,
+          -1,
+          -1,
+          ts_uptime_us,
+          count,
+          reading.enabled_time_ns // 1000,
+          reading.running_time_ns // 1000,
+        )
 
   def disable_counters(self) -> None:
     if self.group_fds is None:
@@ -146,36 +284,108 @@ class PerfBPFHook(BPFProgram):
     for _, group_fd in self.group_fds.items():
       ioctl(group_fd, PERF_EVENT_IOC_ENABLE, PERF_IOC_FLAG_GROUP)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    # read mode is a sampler, it reads every counter group once per poll
+    return self.config.mode == "sample"
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    if self.config.mode == "read":
+      self._read_counter_groups()
+      return
+    self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
+    # the next swap is the last, it also writes the rates of the interval still open
+    self._closed = True
+    if self.counter_groups is not None:
+      self._read_counter_groups()
+      self.counter_groups.close()
+      self.counter_groups = None
+      self.group_fds = None
+      return
     self.bpf.cleanup()
 
+  def event_counts(self) -> list[EventCounts]:
+    if self.config.mode == "read":
+      return []
+    return self.transport.event_counts(self.bpf)
+
   def data(self) -> list[CollectionTable]:
     return [
       perf_table_types[event_name].from_df_id(
-        pl.DataFrame(self._perf_data[event_name]),
+        self._perf_data[event_name].to_df(),
         collection_id=self.collection_id,
       )
-      for event_name in self._perf_data.keys()
+      for event_name in self._perf_data
       if event_name in perf_table_types and len(self._perf_data[event_name]) > 0
     ]
 
   def clear(self):
-    for key in self._perf_data.keys():
+    for key in self._perf_data:
       self._perf_data[key].clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    final = self._closed
+    perf_dfs = {
+      event_name: self._perf_data[event_name].swap()
+      for event_name in self._perf_data
+      if event_name in perf_table_types
+    }
+    rate_tickets = {
+      event_name: rate_stage.take_ticket()
+      for event_name, rate_stage in self._rate_stages.items()
+    }
+
+    def build_tables(tables: list[CollectionTable], event_names: list[str]) -> list[CollectionTable]:
+      if not event_names:
+        return tables
+      event_name = event_names[0]
+      try:
+        # converted once for both tables
+        samples = cache(perf_dfs[event_name])
+        if event_name in rate_tickets:
+          rate_table = self._rate_stages[event_name].build(rate_tickets[event_name], samples, final)
+          if rate_table is not None:
+            tables.append(rate_table)
+        if self.config.cumulative_tables and len(samples()) > 0:
+          tables.append(perf_table_types[event_name].from_df_id(samples(), collection_id=self.collection_id))
+      finally:
+        # every counter is built even if an earlier one failed, later flushes of a counter wait on its
+        # rate ticket, failures are raised chained once all of them ran
+        build_tables(tables, event_names[1:])
+      return tables
+    return partial(build_tables, list[CollectionTable](), list(perf_dfs))
+
   def pop_data(self) -> list[CollectionTable]:
-    miss_tables = self.data()
-    self.clear()
-    return miss_tables
+    return self.swap_data()()
 
   def _perf_handler(self, event_name: str):
     def _perf_event_handler(cpu, perf_event_data, size):
       event = self.bpf[event_name].event(perf_event_data)
       try:
-          self._perf_data[event_name].append(PerfData.from_event(cpu, event))
+          self._perf_data[event_name].append(
+            event.cpu,
+            event.pid,
+            event.tgid,
+            event.ts_uptime_us,
+            event.count,
+            event.enabled_time_us,
+            event.running_time_us,
+          )
       except Exception as _:
         pass
     return _perf_event_handler
+
+  def _core_perf_handler(self, cpu, perf_event_data, size):
+    event = self.bpf["perf_samples"].event(perf_event_data)
+    # counters are attached in the order of loaded_hw_event_configs
+    event_name = self._counter_names[event.counter]
+    self._perf_data[event_name].append(
+      event.cpu,
+      event.pid,
+      event.tgid,
+      event.ts_uptime_us,
+      event.count,
+      event.enabled_time_us,
+      event.running_time_us,
+    )
@@ -0,0 +1,80 @@
+"""Per interval perf counter rates computed while collecting."""
+
+from collections.abc import Callable
+from threading import Condition
+
+import polars as pl
+from data_schema import UPTIME_TIMESTAMP, cumulative_pma_deltas
+from data_schema.perf import PerfRateTable, pma_deltas_as_rates
+
+# counter column of samples before PerfCollectionTable.from_df_id renames it
+SAMPLE_COUNTER_COLUMN = "cumulative_count"
+
+
+class PerfRateStage:
+  """Turns the samples of one counter into rate table rows, flush by flush.
+
+  Deltas continue from the last reading of each cpu in the previous flush, so builders must run
+  in the order their data was swapped out even though flushes are built on a worker pool. Every
+  swap takes a ticket and `build` waits for the builders of earlier tickets.
+
+  Rows of the interval still being sampled are held back until the next flush, or until the
+  final flush once the hook is closed.
+  """
+
+  def __init__(self, rate_table_type: type[PerfRateTable], interval_us: int):
+    self.rate_table_type = rate_table_type
+    self.interval_us = interval_us
+    self._condition = Condition()
+    self._next_ticket = 0
+    self._ticket = 0
+    self._last_readings: pl.DataFrame | None = None
+    self._pending_deltas: pl.DataFrame | None = None
+
+  def take_ticket(self) -> int:
+    """Called when samples are swapped out, swaps are serialized by the output lock."""
+    ticket = self._next_ticket
+    self._next_ticket += 1
+    return ticket
+
+  def build(self, ticket: int, samples: Callable[[], pl.DataFrame], final: bool) -> PerfRateTable | None:
+    with self._condition:
+      self._condition.wait_for(lambda: self._ticket == ticket)
+      try:
+        return self._build(samples(), final)
+      finally:
+        # later flushes must not wait forever on one that failed
+        self._ticket += 1
+        self._condition.notify_all()
+
+  def _build(self, samples: pl.DataFrame, final: bool) -> PerfRateTable | None:
+    name = self.rate_table_type.count_column_name()
+    readings = samples.with_columns(pl.lit(False).alias("carried"))
+    if self._last_readings is not None:
+      readings = pl.concat([self._last_readings.with_columns(pl.lit(True).alias("carried")), readings])
+    if len(readings) > 0:
+      self._last_readings = readings.sort(
+        UPTIME_TIMESTAMP, maintain_order=True
+      ).group_by("cpu").last().drop("carried")
+
+    deltas = cumulative_pma_deltas(
+      readings,
+      counter_column=SAMPLE_COUNTER_COLUMN,
+      counter_column_rename=name,
+    ).filter(
+      ~pl.col("carried")
+    ).select(
+      "cpu", "tgid", UPTIME_TIMESTAMP, f"{name}_raw", "span_duration_us", "span_running_us",
+    ).collect()
+    if self._pending_deltas is not None:
+      deltas = pl.concat([self._pending_deltas, deltas])
+    self._pending_deltas = None
+    if not final and len(deltas) > 0:
+      open_interval_us = deltas[UPTIME_TIMESTAMP].max() // self.interval_us * self.interval_us  # pyright: ignore [reportOperatorIssue]
+      self._pending_deltas = deltas.filter(pl.col(UPTIME_TIMESTAMP) >= open_interval_us)
+      deltas = deltas.filter(pl.col(UPTIME_TIMESTAMP) < open_interval_us)
+    if len(deltas) == 0:
+      return None
+    return self.rate_table_type.from_df(
+      pma_deltas_as_rates(deltas.lazy(), counter_column_rename=name, interval_us=self.interval_us).collect()
+    )
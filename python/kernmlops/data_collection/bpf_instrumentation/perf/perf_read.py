@@ -0,0 +1,151 @@
+"""Perf events opened with perf_event_open, counter groups are read directly without BPF programs."""
+
+import ctypes
+import os
+import platform
+import struct
+from dataclasses import dataclass
+from fcntl import ioctl
+from typing import Final
+
+from data_collection.bpf_instrumentation.perf.perf_config import (
+  PERF_EVENT_IOC_DISABLE,
+  PERF_EVENT_IOC_ENABLE,
+  PERF_IOC_FLAG_GROUP,
+)
+
+# From perf_event_read_format in uapi/linux/perf_event.h
+PERF_FORMAT_TOTAL_TIME_ENABLED: Final[int] = 1 << 0
+PERF_FORMAT_TOTAL_TIME_RUNNING: Final[int] = 1 << 1
+PERF_FORMAT_GROUP: Final[int] = 1 << 3
+
+PERF_FLAG_FD_CLOEXEC: Final[int] = 1 << 3
+
+# the freq bit of the perf_event_attr flags, sample_period is then a frequency
+PERF_ATTR_FLAG_FREQ: Final[int] = 1 << 10
+
+_SYS_PERF_EVENT_OPEN: Final[dict[str, int]] = {
+  "x86_64": 298,
+  "aarch64": 241,
+  "ppc64le": 319,
+  "s390x": 331,
+}
+
+
+class PerfEventAttr(ctypes.Structure):
+  # perf_event_attr in uapi/linux/perf_event.h up to config3, the bitfield flags are one u64
+  _fields_ = [
+    ("type", ctypes.c_uint32),
+    ("size", ctypes.c_uint32),
+    ("config", ctypes.c_uint64),
+    ("sample_period", ctypes.c_uint64),
+    ("sample_type", ctypes.c_uint64),
+    ("read_format", ctypes.c_uint64),
+    ("flags", ctypes.c_uint64),
+    ("wakeup_events", ctypes.c_uint32),
+    ("bp_type", ctypes.c_uint32),
+    ("config1", ctypes.c_uint64),
+    ("config2", ctypes.c_uint64),
+    ("branch_sample_type", ctypes.c_uint64),
+    ("sample_regs_user", ctypes.c_uint64),
+    ("sample_stack_user", ctypes.c_uint32),
+    ("clockid", ctypes.c_int32),
+    ("sample_regs_intr", ctypes.c_uint64),
+    ("aux_watermark", ctypes.c_uint32),
+    ("sample_max_stack", ctypes.c_uint16),
+    ("reserved_2", ctypes.c_uint16),
+    ("aux_sample_size", ctypes.c_uint32),
+    ("reserved_3", ctypes.c_uint32),
+    ("sig_data", ctypes.c_uint64),
+    ("config3", ctypes.c_uint64),
+  ]
+
+
+def perf_event_open(
+    ev_type: int,
+    ev_config: int,
+    *,
+    cpu: int,
+    group_fd: int,
+    sample_period: int = 0,
+    sample_freq: int = 0,
+) -> int:
+  """Opens an event on `cpu` for every task, members of a group are read through its leader.
+
+  The event only counts unless it is given a `sample_period` or a `sample_freq` in hertz.
+  """
+  syscall_number = _SYS_PERF_EVENT_OPEN.get(platform.machine())
+  if syscall_number is None:
+    raise OSError(f"perf_event_open is not known for {platform.machine()}")
+  attr = PerfEventAttr()
+  attr.type = ev_type
+  attr.size = ctypes.sizeof(PerfEventAttr)
+  attr.config = ev_config
+  attr.read_format = PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING | PERF_FORMAT_GROUP
+  if sample_freq > 0:
+    attr.flags |= PERF_ATTR_FLAG_FREQ
+    attr.sample_period = sample_freq
+  else:
+    attr.sample_period = sample_period
+  libc = ctypes.CDLL(None, use_errno=True)
+  fd = libc.syscall(
+    syscall_number, ctypes.byref(attr), -1, cpu, group_fd, PERF_FLAG_FD_CLOEXEC,
+  )
+  if fd < 0:
+    errno = ctypes.get_errno()
+    raise OSError(errno, f"perf_event_open of {ev_type}:{ev_config} on cpu {cpu}: {os.strerror(errno)}")
+  return fd
+
+
+@dataclass(frozen=True)
+class GroupReading:
+  enabled_time_ns: int
+  running_time_ns: int
+  # counts in the order the events were opened
+  counts: list[int]
+
+
+class PerfCounterGroups:
+  """One group of counters per cpu, every poll reads a whole group with a single `read`."""
+
+  def __init__(self, events: list[tuple[int, int]], cpus: list[int]):
+    self.events = events
+    self.leader_fds = dict[int, int]()
+    self._fds = list[int]()
+    self._read_size = 8 * (3 + len(events))
+    try:
+      for cpu in cpus:
+        leader_fd = -1
+        for ev_type, ev_config in events:
+          fd = perf_event_open(ev_type, ev_config, cpu=cpu, group_fd=leader_fd)
+          self._fds.append(fd)
+          if leader_fd == -1:
+            leader_fd = fd
+        self.leader_fds[cpu] = leader_fd
+    except OSError:
+      self.close()
+      raise
+
+  def read(self, cpu: int) -> GroupReading:
+    # { u64 nr; u64 time_enabled; u64 time_running; { u64 value; } values[nr]; }
+    data = os.read(self.leader_fds[cpu], self._read_size)
+    nr, enabled_time_ns, running_time_ns, *counts = struct.unpack(f"={len(data) // 8}Q", data)
+    return GroupReading(
+      enabled_time_ns=enabled_time_ns,
+      running_time_ns=running_time_ns,
+      counts=counts[:nr],
+    )
+
+  def enable(self) -> None:
+    for leader_fd in self.leader_fds.values():
+      ioctl(leader_fd, PERF_EVENT_IOC_ENABLE, PERF_IOC_FLAG_GROUP)
+
+  def disable(self) -> None:
+    for leader_fd in self.leader_fds.values():
+      ioctl(leader_fd, PERF_EVENT_IOC_DISABLE, PERF_IOC_FLAG_GROUP)
+
+  def close(self) -> None:
+    for fd in self._fds:
+      os.close(fd)
+    self._fds.clear()
+    self.leader_fds.clear()
@@ -1,14 +1,16 @@
 import os
 import signal
+from collections.abc import Callable, Mapping
 from dataclasses import dataclass, fields
 from functools import cache
-from typing import Any, Mapping
+from typing import Any
 
 # TODO(Patrick): experiment without osquery
 import osquery
 import osquery.extensions
 import polars as pl
-from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
 from data_schema import CollectionTable
 from data_schema.generic_table import ProcessMetadataTable
 from osquery.extensions.ttypes import ExtensionStatus
@@ -42,14 +44,17 @@ class ProcessMetadataHook(BPFProgram):
 
   def __init__(self):
     self.collector_pid = os.getpid()
-    self.process_metadata = list[Mapping[str, Any]]()
+    self.process_metadata = EventList[Mapping[str, Any]]()
 
-  def load(self, collection_id: str):
-    self.collection_id = collection_id
+  def prepare(self):
+    # starting osqueryd is slow, the process snapshot is still taken by load
     self.osquery_instance = osquery.SpawnInstance()
     self.osquery_instance.open()
     self.osquery_client = self.osquery_instance.client
 
+  def load(self, collection_id: str):
+    self.collection_id = collection_id
+
     initial_processes_query = self.osquery_client.query(
       f"SELECT {self._query_select_columns()} FROM processes"
     )
@@ -57,9 +62,9 @@ class ProcessMetadataHook(BPFProgram):
     assert isinstance(initial_processes_query.status, ExtensionStatus)
     assert initial_processes_query.status.code == 0
     assert isinstance(initial_processes_query.response, list)
-    self.process_metadata = initial_processes_query.response
+    self.process_metadata.extend(initial_processes_query.response)
 
-  def poll(self):
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
     new_processes_query = self.osquery_client.query(
       f"SELECT {self._query_select_columns()} FROM processes WHERE pid > {self.collector_pid}"
     )
@@ -73,13 +78,13 @@ class ProcessMetadataHook(BPFProgram):
     self.osquery_instance.instance.send_signal(signal.SIGINT)  # pyright: ignore [reportOptionalMemberAccess]
     self.osquery_instance.instance.wait()  # pyright: ignore [reportOptionalMemberAccess]
 
-  def data(self) -> list[CollectionTable]:
-    if len(self.process_metadata) == 0:
+  def _tables(self, process_metadata: list[Mapping[str, Any]]) -> list[CollectionTable]:
+    if len(process_metadata) == 0:
         return []
     return [
       ProcessMetadataTable.from_df_id(
         pl.DataFrame(
-          self.process_metadata
+          process_metadata
         ).unique(
           "pid"
         ).cast({
@@ -95,10 +100,15 @@ class ProcessMetadataHook(BPFProgram):
       )
     ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(self.process_metadata.snapshot())
+
   def clear(self):
     self.process_metadata.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    process_metadata = self.process_metadata.swap()
+    return lambda: self._tables(process_metadata)
+
   def pop_data(self) -> list[CollectionTable]:
-    process_table = self.data()
-    self.clear()
-    return process_table
+    return self.swap_data()()
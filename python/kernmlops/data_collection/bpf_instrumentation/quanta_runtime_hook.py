@@ -1,51 +1,110 @@
-from dataclasses import dataclass
+import time
+from collections.abc import Callable
 from pathlib import Path
 
 import polars as pl
 from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import ColumnarAccumulator
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.histogram import (
+  HISTOGRAM_SLOTS,
+  HistogramAggregation,
+)
+from data_collection.bpf_instrumentation.raw_events import RawEventArena, struct_dtype
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import UPTIME_TIMESTAMP, CollectionTable
-from data_schema.quanta_runtime import QuantaQueuedTable, QuantaRuntimeTable
+from data_schema.quanta_runtime import (
+  QuantaQueuedHistogramTable,
+  QuantaQueuedTable,
+  QuantaRuntimeHistogramTable,
+  QuantaRuntimeTable,
+)
+from kernmlops_config import ConfigBase
 
 # Note: collecting blocked time is not useful since parent processes blocking on children
 # obfuscates the meaning
 
-@dataclass(frozen=True)
-class QuantaRuntimeData:
-  cpu: int
-  pid: int
-  tgid: int
-  quanta_end_uptime_us: int
-  quanta_run_length_us: int
-
 class QuantaRuntimeBPFHook(BPFProgram):
 
   @classmethod
   def name(cls) -> str:
     return "quanta_runtime"
 
-  def __init__(self):
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "QuantaRuntimeBPFHook":
+    return QuantaRuntimeBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      histograms=HistogramAggregation.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(
+      self,
+      transport: EventTransport | None = None,
+      histograms: HistogramAggregation | None = None,
+      target_filter: TargetFilter | None = None,
+  ):
+    self.transport = transport or EventTransport()
+    self.histograms = histograms or HistogramAggregation()
+    self.target_filter = target_filter or TargetFilter()
     self.is_support_raw_tp = False #  BPF.support_raw_tracepoint()
-    bpf_text = open(Path(__file__).parent / "bpf/sched_quanta_runtime.bpf.c", "r").read()
+    bpf_source = Path(__file__).parent / "bpf/sched_quanta_runtime.bpf.c"
+    bpf_text = open(bpf_source, "r").read()
 
     # code substitutions
     if BPF.kernel_struct_has_field(b'task_struct', b'__state') == 1:
         bpf_text = bpf_text.replace('STATE_FIELD', '__state')
     else:
         bpf_text = bpf_text.replace('STATE_FIELD', 'state')
-    # pid from userspace point of view is thread group from kernel pov
-    # bpf_text = bpf_text.replace('FILTER', 'tgid != %s' % args.pid)
-    self.bpf_text = bpf_text.replace('FILTER', '0')
     if self.is_support_raw_tp:
         bpf_text = bpf_text.replace('USE_TRACEPOINT', '1')
     else:
         bpf_text = bpf_text.replace('USE_TRACEPOINT', '0')
-    self.quanta_runtime_data = list[QuantaRuntimeData]()
-    self.quanta_queue_data = list[QuantaRuntimeData]()
+    self.bpf_text = bpf_text
+    event_dtype = struct_dtype(bpf_source, "quanta_runtime_perf_event_t")
+    self.quanta_runtime_data = RawEventArena(event_dtype, {
+      "cpu": "cpu",
+      "pid": "pid",
+      "tgid": "tgid",
+      UPTIME_TIMESTAMP: "quanta_end_uptime_us",
+      "quanta_run_length_us": "quanta_run_length_us",
+    })
+    self.quanta_queue_data = RawEventArena(event_dtype, {
+      "cpu": "cpu",
+      "pid": "pid",
+      "tgid": "tgid",
+      UPTIME_TIMESTAMP: "quanta_end_uptime_us",
+      "quanta_queued_time_us": "quanta_run_length_us",
+    })
+    self.quanta_runtime_histogram_data = ColumnarAccumulator.for_table(QuantaRuntimeHistogramTable)
+    self.quanta_queue_histogram_data = ColumnarAccumulator.for_table(QuantaQueuedHistogramTable)
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.histograms.core_settings() | self.target_filter.core_settings(),
+      max_entries={
+        "quanta_runtime_histogram": self.histograms.max_entries,
+        "quanta_queue_histogram": self.histograms.max_entries,
+      } | self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      key_structs={
+        "quanta_runtime_histogram": "quanta_histogram_key",
+        "quanta_queue_histogram": "quanta_histogram_key",
+      },
+    ) or self.transport.compile(
+      TARGET_FILTER + HISTOGRAM_SLOTS + self.bpf_text,
+      cflags=self.histograms.cflags() + self.target_filter.cflags(),
+    )
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
     if not self.is_support_raw_tp:
       self.bpf.attach_kprobe(event=b"ttwu_do_activate", fn_name=b"trace_ttwu_do_wakeup")
       self.bpf.attach_kprobe(event=b"wake_up_new_task", fn_name=b"trace_wake_up_new_task")
@@ -53,61 +112,79 @@ class QuantaRuntimeBPFHook(BPFProgram):
         event_re=rb'^finish_task_switch$|^finish_task_switch\.isra\.\d$',
         fn_name=b"trace_run"
       )
-    self.bpf["quanta_runtimes"].open_perf_buffer(self._runtime_event_handler, page_cnt=64)
-    self.bpf["quanta_queue_times"].open_perf_buffer(self._queue_event_handler, page_cnt=64)
+    if self.histograms.enabled:
+      return
+    self.transport.open(self.bpf, "quanta_runtimes", self._runtime_event_handler, page_cnt=64)
+    self.transport.open(self.bpf, "quanta_queue_times", self._queue_event_handler, page_cnt=64)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    return not self.histograms.enabled
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    if self.histograms.enabled:
+      self._poll_histograms()
+    else:
+      self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(self, runtime_df: pl.DataFrame, queue_df: pl.DataFrame) -> list[CollectionTable]:
     return [
-      QuantaRuntimeTable.from_df_id(
-        pl.DataFrame(self.quanta_runtime_data).rename({
-          "quanta_end_uptime_us": UPTIME_TIMESTAMP,
-        }),
-        collection_id=self.collection_id,
-      ),
-      QuantaQueuedTable.from_df_id(
-        pl.DataFrame(self.quanta_queue_data).rename({
-          "quanta_end_uptime_us": UPTIME_TIMESTAMP,
-          "quanta_run_length_us": "quanta_queued_time_us",
-        }),
-        collection_id=self.collection_id,
-      )
+      QuantaRuntimeTable.from_df_id(runtime_df, collection_id=self.collection_id),
+      QuantaQueuedTable.from_df_id(queue_df, collection_id=self.collection_id),
     ]
 
+  def _histogram_tables(self, runtime_df: pl.DataFrame, queue_df: pl.DataFrame) -> list[CollectionTable]:
+    return [
+      QuantaRuntimeHistogramTable.from_df_id(runtime_df, collection_id=self.collection_id),
+      QuantaQueuedHistogramTable.from_df_id(queue_df, collection_id=self.collection_id),
+    ]
+
+  def data(self) -> list[CollectionTable]:
+    if self.histograms.enabled:
+      return self._histogram_tables(
+        self.quanta_runtime_histogram_data.to_df(), self.quanta_queue_histogram_data.to_df()
+      )
+    return self._tables(self.quanta_runtime_data.to_df(), self.quanta_queue_data.to_df())
+
   def clear(self):
     self.quanta_runtime_data.clear()
     self.quanta_queue_data.clear()
+    self.quanta_runtime_histogram_data.clear()
+    self.quanta_queue_histogram_data.clear()
+
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    if self.histograms.enabled:
+      runtime_histogram_df = self.quanta_runtime_histogram_data.swap()
+      queue_histogram_df = self.quanta_queue_histogram_data.swap()
+      return lambda: self._histogram_tables(runtime_histogram_df(), queue_histogram_df())
+    runtime_df = self.quanta_runtime_data.swap()
+    queue_df = self.quanta_queue_data.swap()
+    return lambda: self._tables(runtime_df(), queue_df())
 
   def pop_data(self) -> list[CollectionTable]:
-    quanta_tables = self.data()
-    self.clear()
-    return quanta_tables
+    return self.swap_data()()
+
+  def _poll_histograms(self):
+    ts_uptime_us = int(time.clock_gettime_ns(time.CLOCK_BOOTTIME) / 1000)
+    for histogram_name, histogram_data in (
+      ("quanta_runtime_histogram", self.quanta_runtime_histogram_data),
+      ("quanta_queue_histogram", self.quanta_queue_histogram_data),
+    ):
+      for key, counts in self.histograms.pop_counts(self.bpf[histogram_name]):
+        bucket_low_us, bucket_high_us = self.histograms.bucket_bounds(key.slot)
+        for cpu, count in enumerate(counts):
+          if count:
+            histogram_data.append(
+              cpu, key.tgid, ts_uptime_us, key.slot, bucket_low_us, bucket_high_us, count
+            )
 
   def _runtime_event_handler(self, cpu, quanta_runtime_perf_event, size):
-    event = self.bpf["quanta_runtimes"].event(quanta_runtime_perf_event)
-    self.quanta_runtime_data.append(
-      QuantaRuntimeData(
-        cpu=cpu,
-        pid=event.pid,
-        tgid=event.tgid,
-        quanta_end_uptime_us=event.quanta_end_uptime_us,
-        quanta_run_length_us=event.quanta_run_length_us,
-      )
-    )
+    self.quanta_runtime_data.append(quanta_runtime_perf_event, size)
 
   def _queue_event_handler(self, cpu, quanta_runtime_perf_event, size):
-    event = self.bpf["quanta_queue_times"].event(quanta_runtime_perf_event)
-    self.quanta_queue_data.append(
-      QuantaRuntimeData(
-        cpu=cpu,
-        pid=event.pid,
-        tgid=event.tgid,
-        quanta_end_uptime_us=event.quanta_end_uptime_us,
-        quanta_run_length_us=event.quanta_run_length_us,
-      )
-    )
+    self.quanta_queue_data.append(quanta_runtime_perf_event, size)
@@ -0,0 +1,189 @@
+"""Batch decoding of raw BPF event bytes with NumPy structured dtypes."""
+
+import ctypes
+import re
+from collections.abc import Callable, Mapping
+from functools import partial
+from pathlib import Path
+from threading import Lock
+from typing import Any, Final
+
+import numpy as np
+import polars as pl
+
+# fixed width types usable in BPF event structs, matches the layout of x86_64 and arm64
+_C_TYPES: Final[Mapping[str, str]] = {
+  "u8": "u1",
+  "u16": "<u2",
+  "u32": "<u4",
+  "u64": "<u8",
+  "s8": "i1",
+  "s16": "<i2",
+  "s32": "<i4",
+  "s64": "<i8",
+  "__u8": "u1",
+  "__u16": "<u2",
+  "__u32": "<u4",
+  "__u64": "<u8",
+  "__s8": "i1",
+  "__s16": "<i2",
+  "__s32": "<i4",
+  "__s64": "<i8",
+  "char": "i1",
+  "short": "<i2",
+  "int": "<i4",
+  "long": "<i8",
+  "unsigned char": "u1",
+  "unsigned short": "<u2",
+  "unsigned int": "<u4",
+  "unsigned long": "<u8",
+  "long long": "<i8",
+  "unsigned long long": "<u8",
+  "bool": "?",
+}
+
+# array lengths from kernel headers that event structs commonly use
+_C_CONSTANTS: Final[Mapping[str, int]] = {
+  "TASK_COMM_LEN": 16,
+}
+
+_STRUCT_PATTERN: Final[re.Pattern[str]] = re.compile(
+  r"struct\s+(?P<tag>\w+)?\s*\{(?P<body>[^{}]*)\}\s*(?P<typedef>\w+)?\s*;"
+)
+_FIELD_PATTERN: Final[re.Pattern[str]] = re.compile(
+  r"^(?P<type>[A-Za-z_][\w ]*?)\s+(?P<name>[A-Za-z_]\w*)\s*(?:\[\s*(?P<length>\w+)\s*\])?$"
+)
+
+
+def _strip_comments(c_text: str) -> str:
+  return re.sub(r"//[^\n]*|/\*.*?\*/", "", c_text, flags=re.DOTALL)
+
+
+def _struct_fields(
+    bpf_source: str | Path,
+    struct_name: str,
+    constants: Mapping[str, int] | None,
+) -> list[tuple[str, str, int | None]]:
+  # the name, C type and array length of every field in declaration order
+  c_text = _strip_comments(Path(bpf_source).read_text())
+  body = next(
+    (
+      struct.group("body")
+      for struct in _STRUCT_PATTERN.finditer(c_text)
+      if struct_name in (struct.group("tag"), struct.group("typedef"))
+    ),
+    None,
+  )
+  if body is None:
+    raise ValueError(f"struct {struct_name} not found in {bpf_source}")
+  known_constants = {**_C_CONSTANTS, **(constants or {})}
+
+  fields = list[tuple[str, str, int | None]]()
+  for declaration in body.split(";"):
+    declaration = " ".join(declaration.split())
+    if not declaration:
+      continue
+    field = _FIELD_PATTERN.match(declaration)
+    c_type = field.group("type") if field else None
+    if field is None or c_type is None or c_type not in _C_TYPES:
+      raise ValueError(f"unsupported field '{declaration}' in struct {struct_name}")
+    length = field.group("length")
+    count = None
+    if length is not None:
+      count = int(length) if length.isdigit() else known_constants.get(length)
+      if count is None:
+        raise ValueError(f"unknown array length {length} in struct {struct_name}")
+    fields.append((field.group("name"), c_type, count))
+  return fields
+
+
+def struct_dtype(
+    bpf_source: str | Path,
+    struct_name: str,
+    constants: Mapping[str, int] | None = None,
+) -> np.dtype:
+  """Generates the NumPy dtype laid out like a C struct from a BPF program source file.
+
+  The struct may be named by its tag or its typedef, `char` arrays become fixed width bytes.
+  """
+  names = list[str]()
+  formats = list[str]()
+  for name, c_type, count in _struct_fields(bpf_source, struct_name, constants):
+    if count is None:
+      formats.append(_C_TYPES[c_type])
+    else:
+      formats.append(f"S{count}" if c_type == "char" else f"({count},){_C_TYPES[c_type]}")
+    names.append(name)
+  return np.dtype({"names": names, "formats": formats}, align=True)
+
+
+def struct_ctype(
+    bpf_source: str | Path,
+    struct_name: str,
+    constants: Mapping[str, int] | None = None,
+) -> type[ctypes.Structure]:
+  """Generates the ctypes structure of a C struct from a BPF program source file, see `struct_dtype`.
+
+  Fields of the structure read like the events BCC decodes, `char` arrays read as bytes.
+  """
+  fields = list[tuple[str, Any]]()
+  for name, c_type, count in _struct_fields(bpf_source, struct_name, constants):
+    field_type = np.ctypeslib.as_ctypes_type(np.dtype(_C_TYPES[c_type])) if c_type != "char" else ctypes.c_char
+    fields.append((name, field_type if count is None else field_type * count))
+  return type(struct_name, (ctypes.Structure,), {"_fields_": fields})
+
+
+class RawEventArena:
+  """Copies raw event bytes into a growable arena and decodes them as one batch.
+
+  Appending an event is a single memcpy, decoding is vectorized over all events with `dtype`.
+  `columns` maps output columns to struct fields, in output order.
+  """
+
+  def __init__(self, dtype: np.dtype, columns: Mapping[str, str]):
+    self.dtype = dtype
+    self.columns = dict(columns)
+    self._lock = Lock()
+    self._arena = bytearray()
+
+  def __len__(self) -> int:
+    return len(self._arena) // self.dtype.itemsize
+
+  def append(self, data: int, size: int) -> None:
+    """Appends the event at address `data`, perf buffers may pad `size` past the struct."""
+    if size < self.dtype.itemsize:
+      raise ValueError(f"event of {size} bytes is smaller than its {self.dtype.itemsize} byte struct")
+    event = ctypes.string_at(data, self.dtype.itemsize)
+    with self._lock:
+      self._arena += event
+
+  def _to_df(self, arena: bytearray) -> pl.DataFrame:
+    events = np.frombuffer(arena, dtype=self.dtype)
+    series = list[pl.Series]()
+    for name, field in self.columns.items():
+      values = events[field]
+      if values.dtype == np.uint64:
+        # BPF programs store -1 sentinels in u64 fields, every table column is signed
+        values = values.astype(np.int64)
+      series.append(pl.Series(name, values))
+    return pl.DataFrame(series)
+
+  def to_df(self) -> pl.DataFrame:
+    """Returns a copy of the accumulated events."""
+    with self._lock:
+      arena = bytearray(self._arena)
+    return self._to_df(arena)
+
+  def swap(self) -> Callable[[], pl.DataFrame]:
+    """Starts a new arena and returns a function that decodes the old one to a DataFrame."""
+    with self._lock:
+      arena, self._arena = self._arena, bytearray()
+    return partial(self._to_df, arena)
+
+  def pop_df(self) -> pl.DataFrame:
+    """Returns the accumulated events and clears the arena."""
+    return self.swap()()
+
+  def clear(self) -> None:
+    with self._lock:
+      self._arena = bytearray()
@@ -1,10 +1,17 @@
-from dataclasses import dataclass
+from collections.abc import Callable
 from pathlib import Path
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import ColumnarAccumulator
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+    TARGET_FILTER,
+    TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable, SchedulerCoreTable
+from kernmlops_config import ConfigBase
 
 # Define constants for event types
 PICK_ENTRY = 0
@@ -21,29 +28,36 @@ EVENT_NAMES = {
     PICK_WHILE_DIFFERENT_GROUPS: "while_different_groups",
 }
 
-@dataclass(frozen=True)
-class SchedulerCoreData:
-    cpu: int
-    pid: int
-    tgid: int
-    ts_uptime_us: int
-    comm: str
-    flags: int
-    mode: int
-    event_name: str
-
-
 class SchedulerCoreBPFHook(BPFProgram):
     @classmethod
     def name(cls) -> str:
         return "scheduler_core"
 
-    def __init__(self):
-        bpf_text = open(Path(__file__).parent / "bpf/scheduler_core.bpf.c", "r").read()
-
-        # Replace the FILTER placeholder with '0' to accept all events
-        self.bpf_text = bpf_text.replace('FILTER', '0')
-        self.scheduler_core_data = list[SchedulerCoreData]()
+    @classmethod
+    def from_config(cls, config: ConfigBase) -> "SchedulerCoreBPFHook":
+        return SchedulerCoreBPFHook(
+            transport=EventTransport.from_config(cls.name(), config),
+            target_filter=TargetFilter.from_config(config),
+        )
+
+    def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+        self.transport = transport or EventTransport()
+        self.target_filter = target_filter or TargetFilter()
+        self.bpf_text = open(Path(__file__).parent / "bpf/scheduler_core.bpf.c", "r").read()
+        self.scheduler_core_data = ColumnarAccumulator.for_table(SchedulerCoreTable)
+
+    def prepare(self):
+        event_bpf = self.bpf_text
+        self.bpf = load_prebuilt(
+            self.name(),
+            self.transport,
+            settings=self.target_filter.core_settings(),
+            max_entries=self.target_filter.core_max_entries(),
+            pinned_maps=self.target_filter.pinned_maps(),
+            event_structs={
+                "scheduler_core_events": "scheduler_core_perf_event",
+            },
+        ) or self.transport.compile(TARGET_FILTER + event_bpf, cflags=self.target_filter.cflags())
 
     def load(self, collection_id: str):
         print(f"[DEBUG] Loading scheduler_core hook with collection_id {collection_id}")
@@ -58,8 +72,6 @@ class SchedulerCoreBPFHook(BPFProgram):
             ("while_different_groups", 0x1d3),
         ]
 
-        event_bpf = self.bpf_text
-        self.bpf = BPF(text=event_bpf)
         # Create a version of the BPF program for each event
         for event, offset in kernel_events:
             # Attach the kprobe
@@ -69,54 +81,51 @@ class SchedulerCoreBPFHook(BPFProgram):
                 event_off=offset,
             )
 
-        # Set up the perf buffer with a handler that knows its event name
-        self.bpf["scheduler_core_events"].open_perf_buffer(
+        # Set up the event buffer with a handler that knows its event name
+        self.transport.open(
+                self.bpf,
+                "scheduler_core_events",
                 self._scheduler_core_event_handler,
                 page_cnt=64
             )
 
-    def poll(self):
+    def drains_events(self) -> bool:
+        return True
+
+    def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
         # Poll all BPF programs
-        self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+        self.transport.poll(self.bpf, timeout_ms)
 
     def close(self):
         # Clean up all BPF programs
         self.bpf.cleanup()
 
-    def data(self) -> list[CollectionTable]:
-        if not self.scheduler_core_data:
-            return []
+    def event_counts(self) -> list[EventCounts]:
+        return self.transport.event_counts(self.bpf)
 
-        # Convert the dataclass objects to dictionaries and then to DataFrame
-        data_dicts = []
-        for data in self.scheduler_core_data:
-            data_dicts.append({
-                "cpu": data.cpu,
-                "pid": data.pid,
-                "tgid": data.tgid,
-                "ts_uptime_us": data.ts_uptime_us,  # Use the correct column name
-                "comm": data.comm,
-                "flags": data.flags,
-                "mode": data.mode,
-                "event_name": data.event_name,
-            })
-
-        df = pl.DataFrame(data_dicts)
+    def _tables(self, scheduler_core_df: pl.DataFrame) -> list[CollectionTable]:
+        if scheduler_core_df.is_empty():
+            return []
 
         return [
             SchedulerCoreTable.from_df_id(
-                df,
+                scheduler_core_df,
                 collection_id=self.collection_id,
             ),
         ]
 
+    def data(self) -> list[CollectionTable]:
+        return self._tables(self.scheduler_core_data.to_df())
+
     def clear(self):
         self.scheduler_core_data.clear()
 
+    def swap_data(self) -> Callable[[], list[CollectionTable]]:
+        scheduler_core_df = self.scheduler_core_data.swap()
+        return lambda: self._tables(scheduler_core_df())
+
     def pop_data(self) -> list[CollectionTable]:
-        scheduler_core_tables = self.data()
-        self.clear()
-        return scheduler_core_tables
+        return self.swap_data()()
 
     def _scheduler_core_event_handler(self, cpu, data, size):
         event = self.bpf["scheduler_core_events"].event(data)
@@ -125,19 +134,18 @@ class SchedulerCoreBPFHook(BPFProgram):
         # This requires modifying the BPF C code to include event_type in the data
         event_name = event.event_name.decode('utf-8', errors='replace') if hasattr(event, 'event_name') else "unknown"
 
-        print(f"[DEBUG] Scheduler core event '{event_name}' received on CPU {cpu}")
+        print(f"[DEBUG] Scheduler core event '{event_name}' received on CPU {event.cpu}")
 
         try:
-            core_data = SchedulerCoreData(
-                cpu=cpu,
-                pid=event.pid,
-                tgid=event.tgid,
-                ts_uptime_us=event.ts_uptime_us,
-                comm=event.comm.decode('utf-8', errors='replace'),
-                flags=event.flags,
-                mode=event.mode,
-                event_name=EVENT_NAMES.get(event.event_type, "unknown"),
+            self.scheduler_core_data.append(
+                event.cpu,
+                event.pid,
+                event.tgid,
+                event.ts_uptime_us,
+                event.comm.decode('utf-8', errors='replace'),
+                event.flags,
+                event.mode,
+                EVENT_NAMES.get(event.event_type, "unknown"),
             )
-            self.scheduler_core_data.append(core_data)
         except Exception as e:
             print(f"[ERROR] Scheduler event handler failed: {e}")
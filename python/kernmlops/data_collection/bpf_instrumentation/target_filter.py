@@ -0,0 +1,295 @@
+"""Kernel side filter that keeps only the events of the processes a collection targets."""
+
+import ctypes
+import errno
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Final, Literal
+
+from bcc import BPF, libbcc
+from data_collection.bpf_instrumentation.core_object import CoreObject, load_prebuilt
+from data_collection.bpf_instrumentation.transport import (
+  EventTransport,
+  generic_collector_config,
+)
+from kernmlops_config import ConfigBase
+
+TargetType = Literal["all", "benchmark", "cgroup", "pids"]
+
+CGROUP_ROOT: Final[Path] = Path("/sys/fs/cgroup")
+BPF_FS_ROOT: Final[Path] = Path("/sys/fs/bpf")
+
+# Prepended to hook programs, templates drop events with `if (target_filtered(tgid) || ...)`.
+TARGET_FILTER: Final[str] = """
+#include <linux/sched.h>
+
+#if FILTER_TARGETS
+// thread groups whose events are kept, created and kept up to date by TARGET_TRACKER
+BPF_TABLE_PINNED("hash", u32, u8, target_tgids, TARGET_MAX_ENTRIES, TARGET_TGIDS_PATH);
+#endif
+
+static inline bool target_current_cgroup() {
+#if FILTER_CGROUP
+  return bpf_get_current_ancestor_cgroup_id(TARGET_CGROUP_LEVEL) == TARGET_CGROUP_ID;
+#else
+  return false;
+#endif
+}
+
+static inline bool target_filtered(u32 tgid) {
+  if (tgid == COLLECTOR_TGID)
+    return true;
+#if FILTER_TARGETS
+  if (target_tgids.lookup(&tgid))
+    return false;
+  // processes moved into the cgroup after the collection started are tracked once they hit a probe
+  if (tgid == bpf_get_current_pid_tgid() >> 32 && target_current_cgroup()) {
+    u8 tracked = 1;
+    target_tgids.update(&tgid, &tracked);
+    return false;
+  }
+  return true;
+#else
+  return false;
+#endif
+}
+"""
+
+# Loaded once per collection before any hook, owns the target_tgids map the hooks share.
+TARGET_TRACKER: Final[str] = """
+#include <linux/err.h>
+#include <linux/sched.h>
+#include <linux/sched/signal.h>
+
+// children of tracked processes are tracked as they fork and every thread group is dropped again
+// once all of its threads exited
+BPF_HASH(target_tgids, u32, u8, TARGET_MAX_ENTRIES);
+
+static inline bool target_current_cgroup() {
+#if FILTER_CGROUP
+  return bpf_get_current_ancestor_cgroup_id(TARGET_CGROUP_LEVEL) == TARGET_CGROUP_ID;
+#else
+  return false;
+#endif
+}
+
+static inline void track_child(u32 child_pid, u32 child_tgid) {
+  u32 parent_tgid = bpf_get_current_pid_tgid() >> 32;
+  // new threads join the thread group of their parent, only new processes are tracked
+  if (child_tgid == parent_tgid || child_pid != child_tgid)
+    return;
+  if (target_tgids.lookup(&parent_tgid) || target_current_cgroup()) {
+    u8 tracked = 1;
+    target_tgids.update(&child_tgid, &tracked);
+  }
+}
+
+#if USE_RAW_FORK_TRACEPOINT
+RAW_TRACEPOINT_PROBE(sched_process_fork) {
+  // TP_PROTO(struct task_struct *parent, struct task_struct *child)
+  struct task_struct* child = (struct task_struct*)ctx->args[1];
+  track_child(child->pid, child->tgid);
+  return 0;
+}
+#else
+// the sched_process_fork tracepoint only reports the child pid, which is a thread id for new threads
+int kretprobe__copy_process(struct pt_regs* ctx) {
+  struct task_struct* child;
+  if (IS_ERR(child = (struct task_struct*)PT_REGS_RC(ctx)))
+    return 0;
+  track_child(child->pid, child->tgid);
+  return 0;
+}
+#endif
+
+TRACEPOINT_PROBE(sched, sched_process_exit) {
+  // the group leader can exit before its threads, the tgid is dropped once the last thread exits
+  // so that a recycled pid is not taken for a target
+  struct task_struct* task = (struct task_struct*)bpf_get_current_task();
+  if (task->signal->live.counter == 0) {
+    u32 tgid = bpf_get_current_pid_tgid() >> 32;
+    target_tgids.delete(&tgid);
+  }
+  return 0;
+}
+"""
+
+
+def _parent_tgids() -> dict[int, int]:
+  parents = dict[int, int]()
+  for stat_file in Path("/proc").glob("[0-9]*/stat"):
+    try:
+      stat = stat_file.read_text()
+    except OSError:
+      # the process exited
+      continue
+    # the command name is in parentheses and may itself hold spaces or parentheses
+    parents[int(stat_file.parent.name)] = int(stat[stat.rindex(")") + 2:].split()[1])
+  return parents
+
+
+@dataclass(frozen=True)
+class TargetFilter:
+  """Selects the processes whose events hooks keep, the collector itself is always dropped.
+
+  `benchmark` keeps the processes the collector starts once hooks are loaded, `cgroup` keeps
+  processes in a cgroup v2 hierarchy and `pids` keeps the given processes. Descendants of kept
+  processes are tracked in kernel as they fork, by the one TargetTracker of the collection.
+  """
+  target: TargetType = "all"
+  cgroup: str = ""
+  pids: tuple[int, ...] = ()
+  collector_tgid: int = field(default_factory=os.getpid)
+  max_entries: int = 65536
+
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "TargetFilter":
+    generic_config = generic_collector_config(config)
+    target = generic_config.target
+    if target not in ("all", "benchmark", "cgroup", "pids"):
+      raise ValueError(f"unknown collection target {target}")
+    target_filter = TargetFilter(
+      target=target,
+      cgroup=generic_config.target_cgroup.strip("/"),
+      pids=tuple(int(pid) for pid in generic_config.target_pids),
+    )
+    if target == "cgroup" and not target_filter.cgroup_path().is_dir():
+      raise ValueError(f"target cgroup {target_filter.cgroup_path()} does not exist")
+    if target == "pids" and not target_filter.pids:
+      raise ValueError("target pids is selected but target_pids is empty")
+    return target_filter
+
+  @property
+  def filters_targets(self) -> bool:
+    return self.target != "all"
+
+  def cgroup_path(self) -> Path:
+    return CGROUP_ROOT / self.cgroup
+
+  def cgroup_id(self) -> int:
+    # the id bpf_get_current_ancestor_cgroup_id returns is the inode of the cgroup v2 directory
+    return os.stat(self.cgroup_path()).st_ino if self.target == "cgroup" else 0
+
+  def cgroup_level(self) -> int:
+    # the root cgroup is level 0
+    return len(Path(self.cgroup).parts) if self.target == "cgroup" else 0
+
+  def pin_path(self) -> Path:
+    """Where the tracker pins target_tgids, unique to the collector so collections never share it."""
+    return BPF_FS_ROOT / f"kernmlops_{self.collector_tgid}_target_tgids"
+
+  def cflags(self) -> list[str]:
+    return [
+      f"-DFILTER_TARGETS={1 if self.filters_targets else 0}",
+      f"-DFILTER_CGROUP={1 if self.target == 'cgroup' else 0}",
+      f"-DTARGET_CGROUP_ID={self.cgroup_id()}ULL",
+      f"-DTARGET_CGROUP_LEVEL={self.cgroup_level()}",
+      f"-DTARGET_MAX_ENTRIES={self.max_entries}",
+      f'-DTARGET_TGIDS_PATH="{self.pin_path()}"',
+      f"-DCOLLECTOR_TGID={self.collector_tgid}",
+    ]
+
+  def core_settings(self) -> dict[str, int]:
+    """The `cflags` of a prebuilt CO-RE object, see CoreSettings."""
+    return {
+      "filter_targets": 1 if self.filters_targets else 0,
+      "filter_cgroup": 1 if self.target == "cgroup" else 0,
+      "collector_tgid": self.collector_tgid,
+      "target_cgroup_level": self.cgroup_level(),
+      "target_cgroup_id": self.cgroup_id(),
+    }
+
+  def core_max_entries(self) -> dict[str, int]:
+    return {"target_tgids": self.max_entries} if self.filters_targets else {}
+
+  def pinned_maps(self) -> dict[str, Path]:
+    return {"target_tgids": self.pin_path()} if self.filters_targets else {}
+
+  def target_tgids(self) -> set[int]:
+    """Returns the processes that are already targets when hooks are loaded."""
+    match self.target:
+      case "benchmark":
+        # the collector is dropped itself, but what it starts from now on is tracked
+        return {self.collector_tgid}
+      case "cgroup":
+        tgids = set[int]()
+        for cgroup_dir, _, _ in os.walk(self.cgroup_path()):
+          procs = Path(cgroup_dir) / "cgroup.procs"
+          if procs.is_file():
+            tgids.update(int(tgid) for tgid in procs.read_text().split())
+        return tgids
+      case "pids":
+        children = dict[int, list[int]]()
+        for tgid, parent_tgid in _parent_tgids().items():
+          children.setdefault(parent_tgid, []).append(tgid)
+        tgids = set[int]()
+        pending = list(self.pids)
+        while pending:
+          tgid = pending.pop()
+          if tgid not in tgids:
+            tgids.add(tgid)
+            pending.extend(children.get(tgid, []))
+        return tgids
+      case _:
+        return set()
+
+
+class TargetTracker:
+  """Creates the target_tgids map every filtered hook shares and tracks forks and exits into it.
+
+  Loaded once before hooks are prepared, so hooks open the pinned map instead of each keeping
+  a map and fork probes of their own. Closed after the hooks, it unpins the map.
+  """
+
+  def __init__(self, target_filter: TargetFilter | None = None, transport: EventTransport | None = None):
+    self.target_filter = target_filter or TargetFilter()
+    self.transport = transport or EventTransport()
+    self.bpf: BPF | CoreObject | None = None
+
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "TargetTracker":
+    return TargetTracker(
+      target_filter=TargetFilter.from_config(config),
+      transport=EventTransport.from_config("target_tracker", config),
+    )
+
+  def load(self) -> None:
+    """Pins target_tgids and seeds it with the processes that are already targets."""
+    if not self.target_filter.filters_targets:
+      return
+    if not BPF_FS_ROOT.is_mount():
+      raise OSError(errno.ENOENT, f"filtering by target pins a map, mount the BPF filesystem at {BPF_FS_ROOT}")
+    pin_path = self.target_filter.pin_path()
+    # left behind by a collector that crashed and whose pid was reused
+    pin_path.unlink(missing_ok=True)
+    bpf = load_prebuilt(
+      "target_tracker",
+      self.transport,
+      settings=self.target_filter.core_settings(),
+      max_entries=self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+    )
+    if bpf is None:
+      bpf = self.transport.compile(
+        TARGET_TRACKER,
+        cflags=self.target_filter.cflags() + [
+          f"-DUSE_RAW_FORK_TRACEPOINT={1 if BPF.support_raw_tracepoint() else 0}",
+        ],
+      )
+      if libbcc.lib.bpf_obj_pin(bpf["target_tgids"].map_fd, str(pin_path).encode()) < 0:
+        error = ctypes.get_errno()
+        bpf.cleanup()
+        raise OSError(error, f"could not pin target_tgids at {pin_path}: {os.strerror(error)}")
+    self.bpf = bpf
+    target_tgids = bpf["target_tgids"]
+    for tgid in self.target_filter.target_tgids():
+      target_tgids[target_tgids.Key(tgid)] = target_tgids.Leaf(1)
+
+  def close(self) -> None:
+    if self.bpf is None:
+      return
+    # hooks still holding the map keep it alive until they close
+    self.target_filter.pin_path().unlink(missing_ok=True)
+    self.bpf.cleanup()
+    self.bpf = None
@@ -0,0 +1,154 @@
+"""Shared transport for streaming events from BPF programs to user space."""
+
+import platform
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Final, Literal, cast
+
+from bcc import BPF
+from kernmlops_config import ConfigBase
+
+if TYPE_CHECKING:
+  from data_collection import GenericCollectorConfig
+  from data_collection.bpf_instrumentation.core_object import CoreObject
+
+TransportType = Literal["perf_buffer", "ring_buffer"]
+
+# BPF ring buffers were introduced in linux 5.8
+RING_BUFFER_MIN_KERNEL: Final[tuple[int, int]] = (5, 8)
+
+# ring buffers are shared by all cpus, hooks that need the cpu must record it in the event
+RING_BUFFER_CPU: Final[int] = -1
+
+# Prepended to every hook program, submit sites report whether each event reached user space.
+EVENT_COUNTERS: Final[str] = """
+#define EVENT_SUBMITTED 0
+#define EVENT_LOST      1
+
+BPF_PERCPU_ARRAY(event_counts, u64, 2);
+
+static inline void count_event(u32 outcome) {
+  u64* count = event_counts.lookup(&outcome);
+  if (count)
+    (*count)++;
+}
+
+static inline void count_submitted_event() {
+  count_event(EVENT_SUBMITTED);
+}
+
+static inline void count_lost_event() {
+  count_event(EVENT_LOST);
+}
+
+static inline void count_perf_submit(int submit_result) {
+  count_event(submit_result < 0 ? EVENT_LOST : EVENT_SUBMITTED);
+}
+"""
+EVENT_SUBMITTED: Final[int] = 0
+EVENT_LOST: Final[int] = 1
+
+
+@dataclass(frozen=True)
+class EventCounts:
+  """Cumulative number of events a hook submitted and lost on one cpu."""
+  cpu: int
+  submitted_events: int
+  lost_events: int
+
+
+def generic_collector_config(config: ConfigBase) -> "GenericCollectorConfig":
+  """The generic section of a collector config, whose type hooks can only import when type checking."""
+  return cast("GenericCollectorConfig", vars(config)["generic"])
+
+
+def kernel_at_least(version: tuple[int, int]) -> bool:
+  release = platform.release().split("-", maxsplit=1)[0].split(".")
+  try:
+    kernel_version = (int(release[0]), int(release[1]))
+  except (IndexError, ValueError):
+    return False
+  return kernel_version >= version
+
+
+def ring_buffer_supported() -> bool:
+  return kernel_at_least(RING_BUFFER_MIN_KERNEL)
+
+
+@dataclass(frozen=True)
+class EventTransport:
+  """Opens and polls the event outputs of a hook using perf buffers or BPF ring buffers.
+
+  BPF templates select their output maps and submit path with `#if USE_RINGBUF`,
+  ring buffers are sized with `RINGBUF_PAGES`. With `prebuilt_objects`, ring buffer hooks
+  load the CO-RE object built by `make bpf-objects` instead of compiling, see core_object.py.
+  """
+  transport: TransportType = "perf_buffer"
+  ring_buffer_pages: int = 1024
+  prebuilt_objects: bool = False
+
+  @classmethod
+  def from_config(cls, hook_name: str, config: ConfigBase) -> "EventTransport":
+    generic_config = generic_collector_config(config)
+    transport = generic_config.hook_event_transports.get(hook_name, generic_config.event_transport)
+    if transport not in ("perf_buffer", "ring_buffer"):
+      raise ValueError(f"unknown event transport {transport} for {hook_name}")
+    ring_buffer_pages = int(generic_config.ring_buffer_pages)
+    if ring_buffer_pages <= 0 or ring_buffer_pages & (ring_buffer_pages - 1):
+      raise ValueError(f"ring_buffer_pages must be a power of 2, got {ring_buffer_pages}")
+    if transport == "ring_buffer" and not ring_buffer_supported():
+      # TODO(Patrick): use logging
+      print(f"info: kernel does not support BPF ring buffers, using perf buffers for {hook_name}")
+      transport = "perf_buffer"
+    return EventTransport(
+      transport=transport,
+      ring_buffer_pages=ring_buffer_pages,
+      prebuilt_objects=bool(generic_config.prebuilt_bpf_objects),
+    )
+
+  def compile(self, bpf_text: str, cflags: list[str] | None = None) -> BPF:
+    return BPF(text=EVENT_COUNTERS + bpf_text, cflags=self.cflags() + (cflags or []))
+
+  @property
+  def is_ring_buffer(self) -> bool:
+    return self.transport == "ring_buffer"
+
+  def cflags(self) -> list[str]:
+    return [
+      f"-DUSE_RINGBUF={1 if self.is_ring_buffer else 0}",
+      f"-DRINGBUF_PAGES={self.ring_buffer_pages}",
+    ]
+
+  def open(
+      self,
+      bpf: "BPF | CoreObject",
+      output_name: str,
+      handler: Callable[[int, Any, int], None],
+      *,
+      page_cnt: int = 64,
+  ) -> None:
+    """Registers a perf buffer style handler, `handler(cpu, data, size)`, for an output."""
+    if self.is_ring_buffer:
+      bpf[output_name].open_ring_buffer(
+        lambda _ctx, data, size: handler(RING_BUFFER_CPU, data, size)
+      )
+    else:
+      # prebuilt objects only stream through ring buffers
+      # drops are counted in kernel by count_perf_submit, this only silences bcc's warning
+      cast(BPF, bpf)[output_name].open_perf_buffer(handler, page_cnt=page_cnt, lost_cb=lambda _lost: None)
+
+  def poll(self, bpf: "BPF | CoreObject", timeout_ms: int) -> None:
+    if self.is_ring_buffer:
+      bpf.ring_buffer_poll(timeout=timeout_ms)
+    else:
+      cast(BPF, bpf).perf_buffer_poll(timeout=timeout_ms)
+
+  def event_counts(self, bpf: "BPF | CoreObject") -> list[EventCounts]:
+    """Reads the per cpu submitted and lost event counters of a compiled or prebuilt program."""
+    counters = bpf["event_counts"]
+    submitted = counters[counters.Key(EVENT_SUBMITTED)]
+    lost = counters[counters.Key(EVENT_LOST)]
+    return [
+      EventCounts(cpu=cpu, submitted_events=int(submitted[cpu]), lost_events=int(lost[cpu]))
+      for cpu in range(len(submitted))
+    ]
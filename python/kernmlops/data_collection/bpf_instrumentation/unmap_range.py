@@ -1,11 +1,19 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable
 from data_schema.generic_table import UnmapRangeDataTable
+from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
@@ -22,39 +30,70 @@ class UnmapRangeBPFHook(BPFProgram):
   def name(cls) -> str:
     return "unmap_range"
 
-  def __init__(self):
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "UnmapRangeBPFHook":
+    return UnmapRangeBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+    self.transport = transport or EventTransport()
+    self.target_filter = target_filter or TargetFilter()
     self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
     self.bpf_text = open(Path(__file__).parent / "bpf/unmap_range.bpf.c", "r").read()
-    self.unmap_range_stat = list[UnmapRangeStat]()
+    self.unmap_range_stat = EventList[UnmapRangeStat]()
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.target_filter.core_settings(),
+      max_entries=self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      event_structs={
+        "unmap_range_output": "unmap_range_output",
+      },
+    ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
     self.bpf.attach_kprobe(event=b"unmap_page_range", fn_name=b"kprobe__unmap_page_range")
     self.bpf.attach_kprobe(event=b"__unmap_hugepage_range", fn_name=b"kprobe__unmap_hugepage_range")
-    self.bpf["unmap_range_output"].open_perf_buffer(self._unmap_range_eh, page_cnt=64)
+    self.transport.open(self.bpf, "unmap_range_output", self._unmap_range_eh, page_cnt=64)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    return True
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(self, unmap_range_stat: list[UnmapRangeStat]) -> list[CollectionTable]:
     return [
             UnmapRangeDataTable.from_df_id(
-                pl.DataFrame(self.unmap_range_stat),
+                pl.DataFrame(unmap_range_stat),
                 collection_id=self.collection_id,
             ),
         ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(self.unmap_range_stat.snapshot())
+
   def clear(self):
     self.unmap_range_stat.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    unmap_range_stat = self.unmap_range_stat.swap()
+    return lambda: self._tables(unmap_range_stat)
+
   def pop_data(self) -> list[CollectionTable]:
-    tables = self.data()
-    self.clear()
-    return tables
+    return self.swap_data()()
 
   def _unmap_range_eh(self, cpu, unmap_range_struct, size):
       event = self.bpf["unmap_range_output"].event(unmap_range_struct)
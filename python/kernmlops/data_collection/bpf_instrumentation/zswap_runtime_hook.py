@@ -1,11 +1,19 @@
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.columnar import EventList
+from data_collection.bpf_instrumentation.core_object import load_prebuilt
+from data_collection.bpf_instrumentation.target_filter import (
+  TARGET_FILTER,
+  TargetFilter,
+)
+from data_collection.bpf_instrumentation.transport import EventCounts, EventTransport
 from data_schema import CollectionTable
 from data_schema.generic_table import ZswapRuntimeDataTable
+from kernmlops_config import ConfigBase
 
 
 @dataclass(frozen=True)
@@ -22,44 +30,77 @@ class ZswapRuntimeBPFHook(BPFProgram):
   def name(cls) -> str:
     return "zswap_runtime"
 
-  def __init__(self):
+  @classmethod
+  def from_config(cls, config: ConfigBase) -> "ZswapRuntimeBPFHook":
+    return ZswapRuntimeBPFHook(
+      transport=EventTransport.from_config(cls.name(), config),
+      target_filter=TargetFilter.from_config(config),
+    )
+
+  def __init__(self, transport: EventTransport | None = None, target_filter: TargetFilter | None = None):
+    self.transport = transport or EventTransport()
+    self.target_filter = target_filter or TargetFilter()
     self.bpf_text = open(Path(__file__).parent / "bpf/zswap_runtime.bpf.c", "r").read()
-    self.trace_process = list[ZswapRuntimeStat]()
+    self.trace_process = EventList[ZswapRuntimeStat]()
+
+  def prepare(self):
+    self.bpf = load_prebuilt(
+      self.name(),
+      self.transport,
+      settings=self.target_filter.core_settings(),
+      max_entries=self.target_filter.core_max_entries(),
+      pinned_maps=self.target_filter.pinned_maps(),
+      event_structs={
+        "zswap_store_events": "zswap_event",
+        "zswap_load_events": "zswap_event",
+        "zswap_invalidate_events": "zswap_event",
+      },
+    ) or self.transport.compile(TARGET_FILTER + self.bpf_text, cflags=self.target_filter.cflags())
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
     self.bpf.attach_kprobe(event=b"zswap_store", fn_name=b"trace_zswap_store_entry")
     self.bpf.attach_kretprobe(event=b"zswap_store", fn_name=b"trace_zswap_store_return")
     self.bpf.attach_kprobe(event=b"zswap_load", fn_name=b"trace_zswap_load_entry")
     self.bpf.attach_kretprobe(event=b"zswap_load", fn_name=b"trace_zswap_load_return")
     self.bpf.attach_kprobe(event=b"zswap_invalidate", fn_name=b"trace_zswap_invalidate_entry")
     self.bpf.attach_kretprobe(event=b"zswap_invalidate", fn_name=b"trace_zswap_invalidate_return")
-    self.bpf["zswap_store_events"].open_perf_buffer(self._zswap_store_eh, page_cnt=128)
-    self.bpf["zswap_load_events"].open_perf_buffer(self._zswap_load_eh, page_cnt=128)
-    self.bpf["zswap_invalidate_events"].open_perf_buffer(self._zswap_invalidate_eh, page_cnt=128)
+    self.transport.open(self.bpf, "zswap_store_events", self._zswap_store_eh, page_cnt=128)
+    self.transport.open(self.bpf, "zswap_load_events", self._zswap_load_eh, page_cnt=128)
+    self.transport.open(self.bpf, "zswap_invalidate_events", self._zswap_invalidate_eh, page_cnt=128)
 
-  def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+  def drains_events(self) -> bool:
+    return True
+
+  def poll(self, timeout_ms: int = POLL_TIMEOUT_MS):
+    self.transport.poll(self.bpf, timeout_ms)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def event_counts(self) -> list[EventCounts]:
+    return self.transport.event_counts(self.bpf)
+
+  def _tables(self, trace_process: list[ZswapRuntimeStat]) -> list[CollectionTable]:
     return [
             ZswapRuntimeDataTable.from_df_id(
-                pl.DataFrame(self.trace_process),
+                pl.DataFrame(trace_process),
                 collection_id=self.collection_id,
             ),
         ]
 
+  def data(self) -> list[CollectionTable]:
+    return self._tables(self.trace_process.snapshot())
+
   def clear(self):
     self.trace_process.clear()
 
+  def swap_data(self) -> Callable[[], list[CollectionTable]]:
+    trace_process = self.trace_process.swap()
+    return lambda: self._tables(trace_process)
+
   def pop_data(self) -> list[CollectionTable]:
-    tables = self.data()
-    self.clear()
-    return tables
+    return self.swap_data()()
 
   def _zswap_store_eh(self, cpu, start_data, size):
       event = self.bpf["zswap_store_events"].event(start_data)
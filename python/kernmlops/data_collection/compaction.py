@@ -0,0 +1,107 @@
+import json
+import os
+from collections.abc import Callable
+from pathlib import Path
+from typing import Final
+
+import polars as pl
+import pyarrow.parquet as pq
+from data_collection.table_writer import JOURNAL_SUFFIX
+from data_collection.write_options import TableWriteOptions
+from data_schema import UPTIME_TIMESTAMP, dataset
+
+# sort keys in priority order, tables are sorted by the first timestamp they have and then by cpu
+SORT_TIMESTAMPS: Final[tuple[str, ...]] = (UPTIME_TIMESTAMP, "start_ts_ns", "ts_ns")
+SORT_TIEBREAKERS: Final[tuple[str, ...]] = ("cpu",)
+COMPACTED_ROW_GROUP_ROWS: Final[int] = 128 * 1024
+
+# key value metadata of compacted files
+SORTED_BY_KEY: Final[str] = "kernmlops.sorted_by"
+COMPACTED_FROM_KEY: Final[str] = "kernmlops.compacted_from"
+
+
+def sort_columns(columns: list[str]) -> list[str]:
+  timestamp = next((column for column in SORT_TIMESTAMPS if column in columns), None)
+  if timestamp is None:
+    return []
+  return [timestamp] + [column for column in SORT_TIEBREAKERS if column in columns]
+
+
+def compact_partition(
+    partition: Path,
+    ids: tuple[int, int] | None = None,
+    write_options: TableWriteOptions | None = None,
+    row_group_rows: int = COMPACTED_ROW_GROUP_ROWS,
+) -> Path | None:
+  """Merges the parts of one table of one collection into a single sorted `part-0.parquet`.
+
+  Row groups hold `row_group_rows` sorted rows with statistics, so time range filters skip
+  most of a file. Tables only become parquet once their collection closes them, so partitions
+  still holding a journal are skipped. Compacted partitions are left alone, returns the
+  compacted file when it was written.
+  """
+  if any(partition.glob(f"*{JOURNAL_SUFFIX}")):
+    return None
+  parts = dataset.partition_files(partition)
+  if not parts:
+    return None
+  compacted_path = dataset.part_file(partition)
+  if compacted_path.exists():
+    metadata = pl.read_parquet_metadata(compacted_path)
+    if SORTED_BY_KEY in metadata:
+      # finish removing the parts of a compaction that was interrupted after the rename
+      compacted_from = set(json.loads(metadata.get(COMPACTED_FROM_KEY, "[]")))
+      for part in parts:
+        if part != compacted_path and part.name in compacted_from:
+          part.unlink()
+      if all(part == compacted_path or part.name in compacted_from for part in parts):
+        return None
+
+  write_options = write_options or TableWriteOptions()
+  table = pl.concat([pl.scan_parquet(part) for part in parts], how="diagonal_relaxed")
+  columns = table.collect_schema().names()
+  sorted_by = sort_columns(columns)
+  if sorted_by:
+    table = table.sort(sorted_by)
+  arrow_table = table.collect().to_arrow()
+  schema_metadata = {
+    **(pq.read_schema(parts[0]).metadata or {}),
+    SORTED_BY_KEY.encode(): json.dumps(sorted_by).encode(),
+    COMPACTED_FROM_KEY.encode(): json.dumps([part.name for part in parts]).encode(),
+  }
+  arrow_table = arrow_table.replace_schema_metadata(schema_metadata)
+
+  partial_path = partition / f".{compacted_path.name}.compacting"
+  writer_kwargs = write_options.writer_kwargs(arrow_table.schema)
+  # statistics are what lets readers skip row groups outside a time range
+  writer_kwargs["write_statistics"] = True
+  with pq.ParquetWriter(partial_path, arrow_table.schema, **writer_kwargs) as writer:
+    writer.write_table(arrow_table, row_group_size=row_group_rows)
+  if ids is not None:
+    os.chown(partial_path, ids[0], ids[1])
+  partial_path.replace(compacted_path)
+  for part in parts:
+    if part != compacted_path:
+      part.unlink()
+  return compacted_path
+
+
+def compact_dataset(
+    dataset_dir: Path,
+    collection_ids: list[str] | None = None,
+    ids: tuple[int, int] | None = None,
+    write_options: Callable[[str], TableWriteOptions] | None = None,
+    row_group_rows: int = COMPACTED_ROW_GROUP_ROWS,
+) -> list[Path]:
+  """Compacts every table of the given collections, or all collections, returning written files.
+
+  Safe to rerun and to run next to a collection that is still writing.
+  """
+  compacted = list[Path]()
+  for table_name in dataset.table_names(dataset_dir):
+    table_options = write_options(table_name) if write_options is not None else None
+    for partition in dataset.table_partitions(dataset_dir, table_name, collection_ids=collection_ids):
+      compacted_path = compact_partition(partition, ids, table_options, row_group_rows)
+      if compacted_path is not None:
+        compacted.append(compacted_path)
+  return compacted
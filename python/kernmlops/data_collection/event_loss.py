@@ -0,0 +1,53 @@
+import time
+from threading import Lock
+
+import polars as pl
+from data_collection.bpf_instrumentation import BPFProgram
+from data_schema import UPTIME_TIMESTAMP, CollectionLossTable, CollectionTable
+
+
+class EventLossTracker:
+  """Turns the cumulative per cpu event counters of hooks into per interval collection_loss rows."""
+
+  def __init__(self, bpf_programs: list[BPFProgram]):
+    self.bpf_programs = bpf_programs
+    self.submitted_events = 0
+    self.lost_events = 0
+    self._last_counts = dict[tuple[str, int], tuple[int, int]]()
+    self._lock = Lock()
+
+  def loss_rate(self) -> float:
+    total_events = self.submitted_events + self.lost_events
+    return self.lost_events / total_events if total_events > 0 else 0.0
+
+  def pop_data(self, collection_id: str) -> list[CollectionTable]:
+    """Returns the events submitted and lost since the last call, must be called before hooks close."""
+    ts_uptime_us = int(time.clock_gettime_ns(time.CLOCK_BOOTTIME) / 1000)
+    rows = list[dict[str, str | int]]()
+    with self._lock:
+      for bpf_program in self.bpf_programs:
+        for counts in bpf_program.event_counts():
+          key = (bpf_program.name(), counts.cpu)
+          last_submitted, last_lost = self._last_counts.get(key, (0, 0))
+          self._last_counts[key] = (counts.submitted_events, counts.lost_events)
+          submitted_events = counts.submitted_events - last_submitted
+          lost_events = counts.lost_events - last_lost
+          self.submitted_events += submitted_events
+          self.lost_events += lost_events
+          if submitted_events == 0 and lost_events == 0:
+            continue
+          rows.append({
+            "hook": bpf_program.name(),
+            "cpu": counts.cpu,
+            UPTIME_TIMESTAMP: ts_uptime_us,
+            "submitted_events": submitted_events,
+            "lost_events": lost_events,
+          })
+    if not rows:
+      return []
+    return [
+      CollectionLossTable.from_df_id(
+        pl.DataFrame(rows),
+        collection_id=collection_id,
+      )
+    ]
@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from data_collection.bpf_instrumentation import BPFProgram
+
+
+@dataclass(frozen=True)
+class HookLoadTime:
+  name: str
+  prepare_sec: float
+  load_sec: float
+
+
+def _close_hooks(bpf_programs: list[BPFProgram]) -> None:
+  for bpf_program in bpf_programs:
+    try:
+      bpf_program.close()
+    except OSError as e:
+      # TODO(Patrick): use logging
+      print(f"warning: could not close {bpf_program.name()} after a failed load: {e}")
+
+
+def load_hooks(bpf_programs: list[BPFProgram], collection_id: str, workers: int = 1) -> list[HookLoadTime]:
+  """Prepares hooks on `workers` threads, then loads them one at a time in order.
+
+  Preparing is where hooks load or compile their programs or start helper processes. Attaching
+  stays sequential and quick so hooks start collecting in a known order and close together.
+  If a hook fails to prepare or load, every hook that was prepared is closed before the error
+  is raised. Returns the time each hook spent in both steps.
+  """
+  def prepare(bpf_program: BPFProgram) -> float:
+    start = time.perf_counter()
+    bpf_program.prepare()
+    return time.perf_counter() - start
+
+  with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="hook-prepare") as prepare_pool:
+    # waits for every hook before raising the first failure
+    prepare_futures = [prepare_pool.submit(prepare, bpf_program) for bpf_program in bpf_programs]
+  prepared = [
+    bpf_program
+    for bpf_program, future in zip(bpf_programs, prepare_futures)
+    if future.exception() is None
+  ]
+
+  load_times = list[HookLoadTime]()
+  try:
+    prepare_secs = [future.result() for future in prepare_futures]
+    for bpf_program, prepare_sec in zip(bpf_programs, prepare_secs):
+      start = time.perf_counter()
+      bpf_program.load(collection_id)
+      load_times.append(HookLoadTime(
+        name=bpf_program.name(),
+        prepare_sec=prepare_sec,
+        load_sec=time.perf_counter() - start,
+      ))
+  except BaseException:
+    _close_hooks(prepared)
+    raise
+  return load_times
@@ -0,0 +1,135 @@
+import heapq
+import time
+import traceback
+from collections.abc import Callable, Mapping
+from threading import Event, Lock, Thread
+from typing import Any, Final
+
+from data_collection.bpf_instrumentation import BPFProgram
+from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS
+
+# idle drains back off to this timeout, it also bounds how long stopping takes
+MAX_DRAIN_TIMEOUT_MS: Final[int] = 100
+
+
+class HookPollError(RuntimeError):
+  """Raised in place of the error of a hook that failed to poll, once it has been recorded."""
+
+
+class HookPoller:
+  """Polls every hook from its own thread instead of round robin with a fixed sleep.
+
+  Event hooks block on their buffers and wake as soon as events are ready, the wait grows
+  while a hook is idle and resets once it returns early. Event hooks given a sample interval
+  are drained on that timer instead. Samplers share a scheduler thread that runs each at
+  its own interval, hooks without one use `sample_interval`.
+
+  A hook that fails to poll is reported and stops every thread, `failures` holds its error so
+  the collection can end instead of running on without the hook.
+  """
+
+  def __init__(
+      self,
+      bpf_programs: list[BPFProgram],
+      sample_interval: float,
+      hook_sample_intervals: Mapping[str, float] | None = None,
+  ):
+    self.bpf_programs = bpf_programs
+    self.sample_interval = sample_interval
+    self.hook_sample_intervals = dict(hook_sample_intervals or {})
+    # a zero interval would poll in a busy loop
+    for hook_name, interval in self.hook_sample_intervals.items():
+      if interval <= 0:
+        raise ValueError(f"sample interval of {hook_name} must be positive, got {interval}")
+    if sample_interval <= 0 and any(self.interval(sampler) <= 0 for sampler in self._samplers()):
+      raise ValueError(
+        f"samplers without a sample interval poll every poll_rate, it must be positive, got {sample_interval}"
+      )
+    self.failures = dict[str, BaseException]()
+    self._failures_lock = Lock()
+    self._stop_event = Event()
+    self._threads = list[Thread]()
+
+  def _event_hooks(self) -> list[BPFProgram]:
+    return [bpf_program for bpf_program in self.bpf_programs if bpf_program.drains_events()]
+
+  def _samplers(self) -> list[BPFProgram]:
+    return [bpf_program for bpf_program in self.bpf_programs if not bpf_program.drains_events()]
+
+  def interval(self, bpf_program: BPFProgram) -> float:
+    return float(self.hook_sample_intervals.get(bpf_program.name(), self.sample_interval))
+
+  def failed(self) -> bool:
+    return bool(self.failures)
+
+  def start(self) -> None:
+    for bpf_program in self._event_hooks():
+      drain = self._drain_on_timer if bpf_program.name() in self.hook_sample_intervals else self._drain
+      self._threads.append(
+        Thread(target=self._run, args=(drain, bpf_program), name=f"drain-{bpf_program.name()}")
+      )
+    samplers = self._samplers()
+    if samplers:
+      self._threads.append(Thread(target=self._run, args=(self._sample, samplers), name="samplers"))
+    for thread in self._threads:
+      thread.start()
+
+  def stop(self) -> None:
+    """Stops polling and drains whatever is left in the event buffers of hooks that did not fail."""
+    self._stop_event.set()
+    for thread in self._threads:
+      thread.join()
+    self._threads.clear()
+    for bpf_program in self._event_hooks():
+      if bpf_program.name() not in self.failures:
+        self._run(self._poll, bpf_program, 0)
+
+  def _run(self, poll_loop: Callable[..., None], *args: Any) -> None:
+    try:
+      poll_loop(*args)
+    except HookPollError:
+      # already reported by _poll
+      return
+
+  def _poll(self, bpf_program: BPFProgram, timeout_ms: int = POLL_TIMEOUT_MS) -> None:
+    try:
+      bpf_program.poll(timeout_ms=timeout_ms)
+    except Exception as e:
+      with self._failures_lock:
+        self.failures[bpf_program.name()] = e
+      self._stop_event.set()
+      # TODO(Patrick): use logging
+      print(f"error: polling {bpf_program.name()} failed, stopping the collection")
+      traceback.print_exception(e)
+      raise HookPollError(f"polling {bpf_program.name()} failed") from e
+
+  def _drain(self, bpf_program: BPFProgram) -> None:
+    timeout_ms = POLL_TIMEOUT_MS
+    while not self._stop_event.is_set():
+      poll_start = time.monotonic()
+      self._poll(bpf_program, timeout_ms)
+      if (time.monotonic() - poll_start) * 1000 < timeout_ms:
+        timeout_ms = POLL_TIMEOUT_MS
+      else:
+        timeout_ms = min(timeout_ms * 2, MAX_DRAIN_TIMEOUT_MS)
+
+  def _drain_on_timer(self, bpf_program: BPFProgram) -> None:
+    interval = self.interval(bpf_program)
+    next_drain = time.monotonic()
+    while not self._stop_event.is_set():
+      self._poll(bpf_program, 0)
+      next_drain = max(next_drain + interval, time.monotonic())
+      self._stop_event.wait(max(next_drain - time.monotonic(), 0))
+
+  def _sample(self, samplers: list[BPFProgram]) -> None:
+    # (next sample time, tie breaker, sampler) ordered by the sampler due first
+    schedule = [(time.monotonic(), index, sampler) for index, sampler in enumerate(samplers)]
+    heapq.heapify(schedule)
+    while not self._stop_event.is_set():
+      next_sample, index, sampler = heapq.heappop(schedule)
+      if self._stop_event.wait(max(next_sample - time.monotonic(), 0)):
+        return
+      self._poll(sampler)
+      # keep a fixed rate regardless of how long sampling took, without bursting to catch up
+      next_sample = max(next_sample + self.interval(sampler), time.monotonic())
+      heapq.heappush(schedule, (next_sample, index, sampler))
@@ -0,0 +1,255 @@
+import fcntl
+import os
+from collections.abc import Callable
+from pathlib import Path
+from threading import Condition, Lock
+from typing import Final
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data_collection.write_options import TableWriteOptions
+from data_import import CollectionCatalog
+from data_schema import CollectionTable, collection_id_column, dataset
+
+# tables are streamed into an Arrow IPC journal while collecting and rewritten to parquet on close
+JOURNAL_SUFFIX: Final[str] = ".arrows"
+_JOURNAL_OPTIONS: Final[pa.ipc.IpcWriteOptions] = pa.ipc.IpcWriteOptions(compression="lz4")
+
+
+def finalize_journal(
+    journal_path: Path,
+    ids: tuple[int, int] | None = None,
+    write_options: TableWriteOptions | None = None,
+) -> Path | None:
+  """Rewrites a table journal into parquet next to it with one row group per flush.
+
+  A journal cut short by a crash keeps every batch written before the last incomplete one.
+  """
+  write_options = write_options or TableWriteOptions()
+  parquet_path = journal_path.with_suffix(".parquet")
+  partial_path = journal_path.with_suffix(".parquet.partial")
+  with pa.OSFile(str(journal_path), "rb") as journal:
+    try:
+      reader = pa.ipc.open_stream(journal)
+    except (pa.ArrowInvalid, OSError):
+      # TODO(Patrick): use logging
+      print(f"warning: {journal_path} has no complete schema and cannot be recovered")
+      return None
+    writer_kwargs = write_options.writer_kwargs(reader.schema)
+    with pq.ParquetWriter(partial_path, reader.schema, **writer_kwargs) as writer:
+      while True:
+        try:
+          batch = reader.read_next_batch()
+        except StopIteration:
+          break
+        except (pa.ArrowInvalid, OSError):
+          # TODO(Patrick): use logging
+          print(f"warning: {journal_path} is truncated, recovered the batches before the cut")
+          break
+        writer.write_batch(batch)
+  partial_path.replace(parquet_path)
+  if ids is not None:
+    os.chown(parquet_path, ids[0], ids[1])
+  journal_path.unlink()
+  return parquet_path
+
+
+def _lock_journal(journal_path: Path) -> int | None:
+  """Takes the lock a collector holds on its journals, None if the journal is still being written."""
+  try:
+    fd = os.open(journal_path, os.O_RDONLY)
+  except FileNotFoundError:
+    return None
+  try:
+    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+  except BlockingIOError:
+    os.close(fd)
+    return None
+  # the collector may have finalized and unlinked it between the open and the lock
+  if not journal_path.exists():
+    os.close(fd)
+    return None
+  return fd
+
+
+def recover_partial_tables(
+    dataset_dir: Path,
+    ids: tuple[int, int] | None = None,
+    write_options: Callable[[str], TableWriteOptions] | None = None,
+    catalog: CollectionCatalog | None = None,
+) -> list[Path]:
+  """Finalizes the journals of collections that did not shut down cleanly.
+
+  Only the partitions `catalog` lists for incomplete collections are visited, without a catalog
+  every partition of the dataset is. Journals of collections that are still running are locked
+  by their collector and left alone, every other visited collection is finished in `catalog` so
+  later runs skip it.
+  """
+  if catalog is not None:
+    partitions = catalog.incomplete_partitions()
+  else:
+    partitions = [
+      partition
+      for table_name in dataset.table_names(dataset_dir)
+      for partition in dataset.table_partitions(dataset_dir, table_name)
+    ]
+  recovered = list[Path]()
+  interrupted_ids = set[str]()
+  running_ids = set[str]()
+  for partition in partitions:
+    collection_id = dataset.partition_values(partition)[dataset.COLLECTION_ID_PARTITION]
+    interrupted_ids.add(collection_id)
+    for journal_path in sorted(partition.glob(f"*{JOURNAL_SUFFIX}")):
+      fd = _lock_journal(journal_path)
+      if fd is None:
+        if journal_path.exists():
+          running_ids.add(collection_id)
+        continue
+      try:
+        table_name = dataset.partition_values(journal_path).get(dataset.TABLE_PARTITION, journal_path.stem)
+        table_options = write_options(table_name) if write_options is not None else None
+        parquet_path = finalize_journal(journal_path, ids, table_options)
+      finally:
+        os.close(fd)
+      if parquet_path is not None:
+        # TODO(Patrick): use logging
+        print(f"info: recovered {parquet_path} from an interrupted collection")
+        recovered.append(parquet_path)
+  if catalog is not None:
+    for collection_id in sorted(interrupted_ids - running_ids):
+      catalog.finish_collection(collection_id)
+  return recovered
+
+
+class _TableJournal:
+
+  def __init__(self, path: Path, schema: pa.Schema):
+    self.path = path
+    self.schema = schema
+    self.lock = Lock()
+    self._sink = pa.OSFile(str(path), "wb")
+    # held until the journal is finalized, recovery skips journals it cannot lock
+    fcntl.flock(self._sink.fileno(), fcntl.LOCK_EX)
+    self._writer = pa.ipc.new_stream(self._sink, schema, options=_JOURNAL_OPTIONS)
+
+  def write(self, table: pa.Table) -> None:
+    with self.lock:
+      if table.schema != self.schema:
+        table = table.cast(self.schema)
+      self._writer.write_table(table)
+      # make the batch durable so a crash loses at most the flush in progress
+      self._sink.flush()
+
+  def close(self) -> None:
+    """Ends the stream, the journal stays locked until `release`."""
+    with self.lock:
+      self._writer.close()
+      self._sink.flush()
+
+  def release(self) -> None:
+    self._sink.close()
+
+
+class TableStreamWriter:
+  """Streams every flush of a collection into a single file per table.
+
+  Tables are written to the `table=/benchmark=/collection_id=` partitions of `dataset_dir`.
+  Flushes are appended to a journal per table that stays readable up to its last complete
+  flush, `close` turns each journal into `part-0.parquet` laid out by `write_options`.
+  `collection_id` is also stored in the key value metadata of every file and the rows of each
+  flush are counted in `catalog`.
+
+  Flushes built concurrently take a ticket when their data is swapped out and `write_flush`
+  appends them in ticket order, so the row groups of every table stay in collection order.
+  """
+
+  def __init__(
+      self,
+      dataset_dir: Path,
+      benchmark: str,
+      collection_id: str,
+      ids: tuple[int, int] | None = None,
+      write_options: Callable[[str], TableWriteOptions] | None = None,
+      catalog: CollectionCatalog | None = None,
+  ):
+    self.dataset_dir = dataset_dir
+    self.benchmark = benchmark
+    self.collection_id = collection_id
+    self.ids = ids
+    self.write_options = write_options
+    self.catalog = catalog
+    self._lock = Lock()
+    self._journals = dict[str, _TableJournal]()
+    self._flush_order = Condition()
+    self._next_flush_ticket = 0
+    self._flush_ticket = 0
+
+  def _make_partition(self, name: str) -> Path:
+    partition = dataset.partition_dir(self.dataset_dir, name, self.benchmark, self.collection_id)
+    # table=, benchmark= and collection_id= directories are all handed to the user
+    for directory in reversed(partition.relative_to(self.dataset_dir).parents[:-1]):
+      self._make_dir(self.dataset_dir / directory)
+    self._make_dir(partition)
+    return partition
+
+  def _make_dir(self, directory: Path) -> None:
+    if directory.is_dir():
+      return
+    directory.mkdir(parents=True, exist_ok=True)
+    if self.ids is not None:
+      os.chown(directory, self.ids[0], self.ids[1])
+
+  def _journal(self, name: str, schema: pa.Schema) -> _TableJournal:
+    with self._lock:
+      if name not in self._journals:
+        journal_path = dataset.part_file(self._make_partition(name)).with_suffix(JOURNAL_SUFFIX)
+        self._journals[name] = _TableJournal(journal_path, schema)
+        if self.ids is not None:
+          os.chown(journal_path, self.ids[0], self.ids[1])
+      return self._journals[name]
+
+  def write(self, collection_table: CollectionTable) -> None:
+    # recorded once per file instead of per row, readers materialize it from the metadata
+    table = collection_table.table.to_arrow().replace_schema_metadata({
+      collection_id_column(): self.collection_id,
+    })
+    journal = self._journal(collection_table.name(), table.schema)
+    journal.write(table)
+    if self.catalog is not None:
+      self.catalog.add_rows(self.collection_id, collection_table.name(), table.num_rows, journal.path.parent)
+
+  def take_flush_ticket(self) -> int:
+    """Called when the data of a flush is swapped out, swaps are serialized by the output lock."""
+    with self._flush_order:
+      ticket = self._next_flush_ticket
+      self._next_flush_ticket += 1
+      return ticket
+
+  def write_flush(self, ticket: int, collection_tables: list[CollectionTable]) -> None:
+    """Writes the tables of a flush once the flushes of every earlier ticket are written."""
+    with self._flush_order:
+      self._flush_order.wait_for(lambda: self._flush_ticket == ticket)
+    try:
+      for collection_table in collection_tables:
+        self.write(collection_table)
+    finally:
+      # later flushes must not wait forever on one that failed
+      with self._flush_order:
+        self._flush_ticket += 1
+        self._flush_order.notify_all()
+
+  def close(self) -> list[Path]:
+    """Finalizes every table, returning the parquet files written."""
+    with self._lock:
+      journals, self._journals = self._journals, dict[str, _TableJournal]()
+    parquet_paths = list[Path]()
+    for name, journal in journals.items():
+      journal.close()
+      table_options = self.write_options(name) if self.write_options is not None else None
+      try:
+        parquet_path = finalize_journal(journal.path, self.ids, table_options)
+      finally:
+        journal.release()
+      if parquet_path is not None:
+        parquet_paths.append(parquet_path)
+    return parquet_paths
@@ -0,0 +1,167 @@
+"""Parquet encoding and compression of collected tables."""
+
+import io
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field, fields
+from typing import TYPE_CHECKING, Any, Final, Literal, cast
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from kernmlops_config import ConfigBase
+
+if TYPE_CHECKING:
+  from data_collection import GenericCollectorConfig
+
+ParquetCompression = Literal["none", "snappy", "gzip", "brotli", "lz4", "zstd"]
+
+_COMPRESSIONS: Final[tuple[str, ...]] = ("none", "snappy", "gzip", "brotli", "lz4", "zstd")
+
+
+@dataclass(frozen=True)
+class TableWriteOptions:
+  """How a table is laid out in parquet.
+
+  Columns listed for an encoding that a table does not have, or whose type the encoding does not
+  support, are skipped. Delta encoding only applies to integers and byte stream split to floats.
+  Without `dictionary_columns` every column lacking an explicit encoding is dictionary encoded,
+  parquet falls back to plain pages for columns with too many distinct values.
+  """
+  compression: ParquetCompression = "zstd"
+  compression_level: int | None = None
+  dictionary_columns: tuple[str, ...] | None = None
+  delta_columns: tuple[str, ...] = ()
+  byte_stream_split_columns: tuple[str, ...] = ()
+  statistics: bool = True
+
+  @classmethod
+  def from_config(cls, table_name: str, config: ConfigBase) -> "TableWriteOptions":
+    """Reads the output defaults of a collector config with `table_write_options` overrides."""
+    generic_config = cast("GenericCollectorConfig", getattr(config, "generic", config))
+    options: dict[str, Any] = {
+      "compression": generic_config.output_compression,
+      "compression_level": generic_config.output_compression_level,
+      "dictionary_columns": generic_config.output_dictionary_columns,
+      "delta_columns": generic_config.output_delta_columns,
+      "byte_stream_split_columns": generic_config.output_byte_stream_split_columns,
+      "statistics": generic_config.output_statistics,
+    }
+    overrides = generic_config.table_write_options.get(table_name, {})
+    unknown_options = set(overrides) - {option.name for option in fields(cls)}
+    if unknown_options:
+      raise ValueError(f"unknown write options {sorted(unknown_options)} for table {table_name}")
+    options.update(overrides)
+    if options["compression"] not in _COMPRESSIONS:
+      raise ValueError(f"unknown compression {options['compression']} for table {table_name}")
+    return TableWriteOptions(
+      compression=options["compression"],
+      compression_level=options["compression_level"],
+      dictionary_columns=(
+        tuple(options["dictionary_columns"]) if options["dictionary_columns"] is not None else None
+      ),
+      delta_columns=tuple(options["delta_columns"]),
+      byte_stream_split_columns=tuple(options["byte_stream_split_columns"]),
+      statistics=bool(options["statistics"]),
+    )
+
+  def writer_kwargs(self, schema: pa.Schema) -> dict[str, Any]:
+    """Returns the `pyarrow.parquet.ParquetWriter` arguments for a table with `schema`."""
+    column_types = {column.name: column.type for column in schema}
+    column_encoding = {
+      name: "DELTA_BINARY_PACKED"
+      for name in self.delta_columns
+      if name in column_types and pa.types.is_integer(column_types[name])
+    }
+    column_encoding.update({
+      name: "BYTE_STREAM_SPLIT"
+      for name in self.byte_stream_split_columns
+      if name in column_types and pa.types.is_floating(column_types[name])
+    })
+    dictionary_columns = self.dictionary_columns if self.dictionary_columns is not None else column_types
+    kwargs: dict[str, Any] = {
+      "compression": self.compression,
+      "compression_level": self.compression_level,
+      "use_dictionary": [
+        name for name in dictionary_columns
+        if name in column_types and name not in column_encoding
+      ],
+      "write_statistics": self.statistics,
+    }
+    if column_encoding:
+      kwargs["column_encoding"] = column_encoding
+    return kwargs
+
+
+@dataclass(frozen=True)
+class WriteBenchmark:
+  table_name: str
+  rows: int
+  bytes: int
+  write_sec: float
+  encoded_bytes: dict[str, int] = field(default_factory=dict)
+
+  def bytes_per_event(self) -> float:
+    return self.bytes / self.rows if self.rows else 0.0
+
+  def rows_per_sec(self) -> float:
+    return self.rows / self.write_sec if self.write_sec else 0.0
+
+  def mb_per_sec(self) -> float:
+    return self.bytes / self.write_sec / 1_000_000 if self.write_sec else 0.0
+
+
+def benchmark_table_write(
+    table_name: str,
+    table: pl.DataFrame | pa.Table,
+    options: TableWriteOptions | None = None,
+    trials: int = 3,
+) -> WriteBenchmark:
+  """Writes `table` in memory with `options`, or polars defaults, keeping the fastest trial.
+
+  `encoded_bytes` is the compressed size of each column so wasteful columns stand out.
+  """
+  arrow_table = table.to_arrow() if isinstance(table, pl.DataFrame) else table
+  write_sec = float("inf")
+  written = b""
+  for _ in range(max(trials, 1)):
+    sink = io.BytesIO()
+    start = time.perf_counter()
+    if options is None:
+      pl.from_arrow(arrow_table).write_parquet(sink)  # pyright: ignore [reportAttributeAccessIssue]
+    else:
+      with pq.ParquetWriter(sink, arrow_table.schema, **options.writer_kwargs(arrow_table.schema)) as writer:
+        writer.write_table(arrow_table)
+    write_sec = min(write_sec, time.perf_counter() - start)
+    written = sink.getvalue()
+
+  metadata = pq.ParquetFile(pa.BufferReader(written)).metadata
+  encoded_bytes = dict[str, int]()
+  for row_group in range(metadata.num_row_groups):
+    for column in range(metadata.num_columns):
+      column_chunk = metadata.row_group(row_group).column(column)
+      encoded_bytes[column_chunk.path_in_schema] = (
+        encoded_bytes.get(column_chunk.path_in_schema, 0) + column_chunk.total_compressed_size
+      )
+  return WriteBenchmark(
+    table_name=table_name,
+    rows=arrow_table.num_rows,
+    bytes=len(written),
+    write_sec=write_sec,
+    encoded_bytes=encoded_bytes,
+  )
+
+
+def benchmark_table_writes(
+    tables: Mapping[str, pl.DataFrame],
+    config: ConfigBase,
+    trials: int = 3,
+) -> list[tuple[WriteBenchmark, WriteBenchmark]]:
+  """Compares polars default parquet output of each table with its configured write options."""
+  return [
+    (
+      benchmark_table_write(table_name, table, None, trials),
+      benchmark_table_write(table_name, table, TableWriteOptions.from_config(table_name, config), trials),
+    )
+    for table_name, table in tables.items()
+  ]
@@ -1,16 +1,57 @@
 from pathlib import Path
 
 import polars as pl
+from data_import.catalog import CollectionCatalog
+from data_schema import collection_id_column, dataset, read_table_parquet
+
+
+def scan_table(
+    name: str,
+    benchmark: str | None = None,
+    collection_ids: list[str] | None = None,
+    *,
+    data_dir: Path | str = Path("data/curated"),
+) -> pl.LazyFrame:
+    """Lazily scans one table of a hive partitioned dataset.
+
+    Only the partitions of `benchmark` and `collection_ids` are listed, filters and column
+    selections on the returned frame are pushed down into the parquet scans. Partitions are
+    looked up in the catalog of the dataset.
+    """
+    if isinstance(data_dir, str):
+        data_dir = Path(data_dir)
+    partitions = CollectionCatalog(data_dir).table_paths(name, benchmark, collection_ids).values()
+    scans = list[pl.LazyFrame]()
+    for partition in partitions:
+        files = dataset.partition_files(partition)
+        if not files:
+            continue
+        partition_values = dataset.partition_values(partition)
+        scans.append(
+            pl.scan_parquet(files).with_columns(
+                pl.lit(partition_values[dataset.BENCHMARK_PARTITION]).alias(dataset.BENCHMARK_PARTITION),
+                pl.lit(partition_values[dataset.COLLECTION_ID_PARTITION]).alias(collection_id_column()),
+            )
+        )
+    if not scans:
+        return pl.LazyFrame()
+    # collections recorded by different versions may not share every column
+    return pl.concat(scans, how="diagonal_relaxed")
 
 
 def read_parquet_dir(data_dir: Path | str, *, benchmark_name: str | None = None) -> dict[str, pl.DataFrame]:
     if isinstance(data_dir, str):
         data_dir = Path(data_dir)
+    if dataset.is_dataset(data_dir):
+        return {
+            name: scan_table(name, benchmark_name, data_dir=data_dir).collect()
+            for name in dataset.table_names(data_dir)
+        }
     kernmlops_dfs = dict[str, pl.DataFrame]()
     dataframe_dirs = [x for x in data_dir.iterdir() if x.is_dir()]
     for dataframe_dir in dataframe_dirs:
         dfs = [
-          pl.read_parquet(x) for x in dataframe_dir.iterdir()
+          read_table_parquet(x, x.name.split(".")[0]) for x in dataframe_dir.iterdir()
           if x.is_file() and x.suffix == ".parquet" and
           (benchmark_name is None or x.suffixes[-2] == f".{benchmark_name}")
         ]
@@ -19,5 +60,7 @@ def read_parquet_dir(data_dir: Path | str, *, benchmark_name: str | None = None)
 
 
 __all__ = [
+    "CollectionCatalog",
     "read_parquet_dir",
+    "scan_table",
 ]
@@ -0,0 +1,266 @@
+"""SQLite index of the collections in a dataset so runs are found without walking the tree."""
+
+import json
+import os
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Final
+
+import polars as pl
+from data_schema import dataset
+
+CATALOG_FILE: Final[str] = "catalog.sqlite"
+
+_SCHEMA: Final[str] = """
+CREATE TABLE IF NOT EXISTS collections (
+    collection_id TEXT PRIMARY KEY,
+    benchmark TEXT NOT NULL,
+    hooks TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    kernel_version TEXT NOT NULL,
+    start_time_sec REAL NOT NULL,
+    collection_time_sec REAL,
+    submitted_events INTEGER NOT NULL DEFAULT 0,
+    lost_events INTEGER NOT NULL DEFAULT 0,
+    event_loss_rate REAL NOT NULL DEFAULT 0,
+    complete INTEGER NOT NULL DEFAULT 0,
+    updated_time_sec REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS collections_by_benchmark ON collections (benchmark, start_time_sec);
+CREATE TABLE IF NOT EXISTS collection_tables (
+    collection_id TEXT NOT NULL REFERENCES collections (collection_id),
+    table_name TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    path TEXT NOT NULL,
+    PRIMARY KEY (collection_id, table_name)
+);
+"""
+
+
+class CollectionCatalog:
+    """Catalog kept at the root of a dataset, `run_collect` updates it on every flush.
+
+    Table paths are stored relative to the dataset so it can be moved as a whole. Collections
+    recorded before the catalog existed are indexed once when it is created, lookups only read
+    the catalog after that.
+    """
+
+    def __init__(self, dataset_dir: Path | str):
+        self.dataset_dir = Path(dataset_dir)
+        self.path = self.dataset_dir / CATALOG_FILE
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    def _connect(self) -> closing[sqlite3.Connection]:
+        created = not self.exists()
+        self.dataset_dir.mkdir(parents=True, exist_ok=True)
+        # several flush threads and readers share the file, wait out their writes
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.executescript(_SCHEMA)
+        if created:
+            try:
+                self.rebuild()
+            except BaseException:
+                connection.close()
+                raise
+        return closing(connection)
+
+    def _query(self, sql: str, parameters: tuple[Any, ...] = ()) -> Iterator[tuple[Any, ...]]:
+        if not self.dataset_dir.is_dir():
+            return iter([])
+        with self._connect() as connection:
+            return iter(connection.execute(sql, parameters).fetchall())
+
+    def start_collection(
+        self,
+        *,
+        collection_id: str,
+        benchmark: str,
+        hooks: list[str],
+        hostname: str,
+        kernel_version: str,
+        start_time_sec: float,
+    ) -> None:
+        with self._connect() as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO collections "
+                "(collection_id, benchmark, hooks, hostname, kernel_version, start_time_sec, updated_time_sec) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (collection_id, benchmark, json.dumps(hooks), hostname, kernel_version, start_time_sec, time.time()),
+            )
+
+    def add_rows(self, collection_id: str, table_name: str, rows: int, path: Path) -> None:
+        """Counts rows flushed to a table of a collection."""
+        relative_path = os.path.relpath(path, self.dataset_dir)
+        with self._connect() as connection, connection:
+            connection.execute(
+                "INSERT INTO collection_tables (collection_id, table_name, rows, path) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (collection_id, table_name) DO UPDATE SET rows = rows + excluded.rows, path = excluded.path",
+                (collection_id, table_name, rows, relative_path),
+            )
+            connection.execute(
+                "UPDATE collections SET updated_time_sec = ? WHERE collection_id = ?",
+                (time.time(), collection_id),
+            )
+
+    def finish_collection(
+        self,
+        collection_id: str,
+        *,
+        collection_time_sec: float | None = None,
+        submitted_events: int = 0,
+        lost_events: int = 0,
+        event_loss_rate: float = 0.0,
+    ) -> None:
+        """Marks a collection complete, without `collection_time_sec` it ran until its last flush."""
+        with self._connect() as connection, connection:
+            connection.execute(
+                "UPDATE collections SET collection_time_sec = COALESCE(?, updated_time_sec - start_time_sec), "
+                "submitted_events = ?, lost_events = ?, "
+                "event_loss_rate = ?, complete = 1, updated_time_sec = ? WHERE collection_id = ?",
+                (collection_time_sec, submitted_events, lost_events, event_loss_rate, time.time(), collection_id),
+            )
+
+    def collections(self, benchmark: str | None = None, prefix: str | None = None) -> pl.DataFrame:
+        """Returns matching collections with their total rows, newest first."""
+        schema = {
+            "collection_id": pl.String(),
+            "benchmark": pl.String(),
+            "hooks": pl.List(pl.String()),
+            "hostname": pl.String(),
+            "kernel_version": pl.String(),
+            "start_time_sec": pl.Float64(),
+            "collection_time_sec": pl.Float64(),
+            "submitted_events": pl.Int64(),
+            "lost_events": pl.Int64(),
+            "event_loss_rate": pl.Float64(),
+            "complete": pl.Boolean(),
+            "rows": pl.Int64(),
+        }
+        rows = [
+            (*row[:2], json.loads(row[2]), *row[3:10], bool(row[10]), row[11])
+            for row in self._query(
+                "SELECT c.collection_id, c.benchmark, c.hooks, c.hostname, c.kernel_version, c.start_time_sec, "
+                "c.collection_time_sec, c.submitted_events, c.lost_events, c.event_loss_rate, c.complete, "
+                "COALESCE(SUM(t.rows), 0) FROM collections c "
+                "LEFT JOIN collection_tables t ON c.collection_id = t.collection_id "
+                "WHERE (? IS NULL OR c.benchmark = ?) AND (? IS NULL OR c.collection_id LIKE ? || '%') "
+                "GROUP BY c.collection_id ORDER BY c.start_time_sec DESC",
+                (benchmark, benchmark, prefix, prefix),
+            )
+        ]
+        return pl.DataFrame(rows, schema=schema, orient="row")
+
+    def resolve(self, prefix: str) -> str:
+        """Returns the collection id starting with `prefix`."""
+        matches = {
+            row[0]
+            for row in self._query(
+                "SELECT collection_id FROM collections WHERE collection_id LIKE ? || '%' LIMIT 2", (prefix,)
+            )
+        }
+        if len(matches) != 1:
+            raise ValueError(f"{len(matches) or 'no'} collections match {prefix} in {self.dataset_dir}")
+        return matches.pop()
+
+    def latest(self, benchmark: str | None = None) -> str | None:
+        latest = next(
+            self._query(
+                "SELECT collection_id FROM collections WHERE (? IS NULL OR benchmark = ?) "
+                "ORDER BY start_time_sec DESC LIMIT 1",
+                (benchmark, benchmark),
+            ),
+            None,
+        )
+        return latest[0] if latest else None
+
+    def table_paths(
+        self,
+        table_name: str | None = None,
+        benchmark: str | None = None,
+        collection_ids: list[str] | None = None,
+    ) -> dict[tuple[str, str], Path]:
+        """Returns the partition of each matching (collection id, table name)."""
+        ids = json.dumps(collection_ids) if collection_ids is not None else None
+        return {
+            (collection_id, name): self.dataset_dir / path
+            for collection_id, name, path in self._query(
+                "SELECT t.collection_id, t.table_name, t.path FROM collection_tables t "
+                "JOIN collections c ON c.collection_id = t.collection_id "
+                "WHERE (? IS NULL OR t.table_name = ?) AND (? IS NULL OR c.benchmark = ?) "
+                "AND (? IS NULL OR t.collection_id IN (SELECT value FROM json_each(?))) "
+                "ORDER BY c.start_time_sec, t.collection_id",
+                (table_name, table_name, benchmark, benchmark, ids, ids),
+            )
+        }
+
+    def incomplete_partitions(self) -> list[Path]:
+        """Returns the partitions of collections that have not finished, running or interrupted."""
+        return [
+            self.dataset_dir / path
+            for (path,) in self._query(
+                "SELECT t.path FROM collection_tables t JOIN collections c ON c.collection_id = t.collection_id "
+                "WHERE c.complete = 0 ORDER BY c.start_time_sec, t.collection_id"
+            )
+        ]
+
+    def rebuild(self) -> int:
+        """Indexes every collection found in the dataset, returning how many were found.
+
+        Runs when the catalog is created, `collect list --rebuild` runs it again to pick up
+        partitions copied into the dataset since.
+        """
+        collection_ids = set[str]()
+        for table_name in dataset.table_names(self.dataset_dir):
+            for partition in dataset.table_partitions(self.dataset_dir, table_name):
+                files = dataset.partition_files(partition)
+                if not files:
+                    continue
+                partition_values = dataset.partition_values(partition)
+                collection_id = partition_values[dataset.COLLECTION_ID_PARTITION]
+                if collection_id not in collection_ids:
+                    collection_ids.add(collection_id)
+                    self._index_collection(collection_id, partition_values[dataset.BENCHMARK_PARTITION], partition)
+                rows = pl.scan_parquet(files).select(pl.len()).collect().item()
+                with self._connect() as connection, connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO collection_tables (collection_id, table_name, rows, path) "
+                        "VALUES (?, ?, ?, ?)",
+                        (collection_id, table_name, rows, str(partition.relative_to(self.dataset_dir))),
+                    )
+        return len(collection_ids)
+
+    def _index_collection(self, collection_id: str, benchmark: str, partition: Path) -> None:
+        system_info_partition = dataset.partition_dir(self.dataset_dir, "system_info", benchmark, collection_id)
+        system_info_files = dataset.partition_files(system_info_partition)
+        if not system_info_files:
+            self.start_collection(
+                collection_id=collection_id,
+                benchmark=benchmark,
+                hooks=[],
+                hostname="",
+                kernel_version="",
+                # the first partition found stands in for the system_info the collection never wrote
+                start_time_sec=partition.stat().st_mtime,
+            )
+            return
+        system_info = pl.read_parquet(system_info_files[0]).row(0, named=True)
+        self.start_collection(
+            collection_id=collection_id,
+            benchmark=benchmark,
+            hooks=list(system_info.get("hooks") or []),
+            hostname=system_info.get("hostname", ""),
+            kernel_version=system_info.get("kernel_version", ""),
+            start_time_sec=system_info["start_time_sec"] + system_info["uptime_sec"],
+        )
+        self.finish_collection(
+            collection_id,
+            collection_time_sec=system_info.get("collection_time_sec", 0.0),
+            submitted_events=system_info.get("submitted_events", 0),
+            lost_events=system_info.get("lost_events", 0),
+            event_loss_rate=system_info.get("event_loss_rate", 0.0),
+        )
@@ -4,9 +4,16 @@ import os
 from pwd import getpwnam
 from typing import Callable
 
-from data_schema import perf
-from data_schema.block_io import BlockIOLatencyTable, BlockIOQueueTable, BlockIOTable
+from data_schema import dataset, perf
+from data_schema.block_io import (
+    BlockIOLatencyHistogramTable,
+    BlockIOLatencyTable,
+    BlockIOQueueTable,
+    BlockIOTable,
+)
+from data_schema.collection_loss import CollectionLossTable
 from data_schema.compound import (
+    CompoundStackTable,
     CompoundTable,  # Assuming CompoundTable is defined in compound.py
 )
 from data_schema.file_data import FileDataTable
@@ -14,7 +21,12 @@ from data_schema.file_opening import FileOpeningTable  # New import added here
 from data_schema.generic_table import ProcessMetadataTable
 from data_schema.huge_pages import CollapseHugePageDataTable
 from data_schema.memory_usage import MemoryUsageTable
-from data_schema.quanta_runtime import QuantaQueuedTable, QuantaRuntimeTable
+from data_schema.quanta_runtime import (
+    QuantaQueuedHistogramTable,
+    QuantaQueuedTable,
+    QuantaRuntimeHistogramTable,
+    QuantaRuntimeTable,
+)
 from data_schema.scheduler_core import SchedulerCoreTable
 from data_schema.schema import (
     UPTIME_TIMESTAMP,
@@ -22,26 +34,39 @@ from data_schema.schema import (
     CollectionGraph,
     CollectionTable,
     GraphEngine,
+    LazyCollectionTable,
     SystemInfoTable,
+    cast_to_schema,
     collection_id_column,
+    cumulative_pma_as_cdf,
     cumulative_pma_as_pdf,
+    cumulative_pma_deltas,
+    filter_table_scan,
+    read_table_parquet,
+    scan_table_parquet,
+    with_collection_id,
 )
 
 table_types: list[type[CollectionTable]] = [
     SystemInfoTable,
+    CollectionLossTable,
     QuantaRuntimeTable,
     QuantaQueuedTable,
+    QuantaRuntimeHistogramTable,
+    QuantaQueuedHistogramTable,
     ProcessMetadataTable,
     FileDataTable,
     MemoryUsageTable,
     BlockIOLatencyTable,
     BlockIOQueueTable,
     BlockIOTable,
+    BlockIOLatencyHistogramTable,
     CollapseHugePageDataTable,
     FileOpeningTable, # New table added here
     SchedulerCoreTable,  # Assuming SchedulerCoreTable is defined in scheduler_core.py
     CompoundTable,  # Assuming CompoundTable is defined in compound.py
-] + list(perf.perf_table_types.values())
+    CompoundStackTable,
+] + list(perf.perf_table_types.values()) + list(perf.perf_rate_table_types.values())
 
 def demote(user_id: int | None = None, group_id: int | None = None) -> Callable[[], None]:
     def no_op():
@@ -80,14 +105,24 @@ def get_user_group_ids() -> tuple[int, int]:
 __all__ = [
     "UPTIME_TIMESTAMP",
     "collection_id_column",
+    "cast_to_schema",
+    "cumulative_pma_as_cdf",
     "cumulative_pma_as_pdf",
+    "cumulative_pma_deltas",
+    "filter_table_scan",
+    "read_table_parquet",
+    "scan_table_parquet",
+    "with_collection_id",
     "demote",
     "get_user_group_ids",
     "table_types",
+    "dataset",
     "perf",
     "CollectionTable",
     "CollectionData",
     "CollectionGraph",
+    "CollectionLossTable",
     "GraphEngine",
+    "LazyCollectionTable",
     "SystemInfoTable",
 ]
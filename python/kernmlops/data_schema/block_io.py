@@ -5,6 +5,7 @@ from data_schema.schema import (
     CollectionGraph,
     CollectionTable,
     GraphEngine,
+    cast_to_schema,
 )
 
 # from: https://github.com/iovisor/bcc/blob/8d85dcfac86bb7402a20bea5ceba373e5e019b6c/tools/biolatency.py#L328
@@ -76,12 +77,11 @@ class BlockIOQueueTable(CollectionTable):
             "block_io_flags": pl.Int64(),
             "queue_length_segment_ios": pl.Int64(),
             "queue_length_4k_ios": pl.Int64(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "BlockIOQueueTable":
-        return BlockIOQueueTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return BlockIOQueueTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -115,12 +115,11 @@ class BlockIOLatencyTable(CollectionTable):
             "block_latency_us": pl.Int64(),
             "block_io_latency_us": pl.Int64(),
             "block_io_flags": pl.Int64(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "BlockIOLatencyTable":
-        return BlockIOLatencyTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return BlockIOLatencyTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -136,6 +135,57 @@ class BlockIOLatencyTable(CollectionTable):
         return []
 
 
+class BlockIOLatencyHistogramTable(CollectionTable):
+    """Per interval histograms of block io latencies per device and operation, aggregated in kernel."""
+
+    @classmethod
+    def name(cls) -> str:
+        return "block_io_latency_histogram"
+
+    @classmethod
+    def schema(cls) -> pl.Schema:
+        return pl.Schema({
+            "device": pl.Int64(),
+            "block_io_op": pl.Int64(),
+            UPTIME_TIMESTAMP: pl.Int64(),
+            "bucket": pl.Int64(),
+            "bucket_low_us": pl.Int64(),
+            "bucket_high_us": pl.Int64(),
+            "block_latency_count": pl.Int64(),
+            "block_io_latency_count": pl.Int64(),
+        })
+
+    @classmethod
+    def from_df(cls, table: pl.DataFrame) -> "BlockIOLatencyHistogramTable":
+        return BlockIOLatencyHistogramTable(table=cast_to_schema(table, cls.schema()))
+
+    def __init__(self, table: pl.DataFrame):
+        self._table = table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        return self._table
+
+    def filtered_table(self) -> pl.DataFrame:
+        return self.table
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return []
+
+    def distribution(self) -> pl.DataFrame:
+        """Returns the latency histograms of each device and operation summed over the whole collection."""
+        return self.table.group_by(
+            ["device", "block_io_op", "bucket", "bucket_low_us", "bucket_high_us"]
+        ).agg(
+            pl.sum("block_latency_count"),
+            pl.sum("block_io_latency_count"),
+        ).with_columns(
+            pl.col("block_io_op").replace_strict(
+                req_opf, default="Unknown", return_dtype=pl.String()
+            ).alias("block_io_op_string")
+        ).sort(["device", "block_io_op", "bucket"])
+
+
 class BlockIOTable(CollectionTable):
     """Best effort merged table of BlockIOQueueTable and BlockIOLatencyTable."""
 
@@ -160,12 +210,11 @@ class BlockIOTable(CollectionTable):
             "block_io_flags_string": pl.String(),
             "queue_length_segment_ios": pl.Int64(),
             "queue_length_4k_ios": pl.Int64(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "BlockIOTable":
-        return BlockIOTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return BlockIOTable(table=cast_to_schema(table, cls.schema()))
 
     @classmethod
     def from_tables(cls, queue_table: BlockIOQueueTable, latency_table: BlockIOLatencyTable) -> "BlockIOTable":
@@ -179,7 +228,6 @@ class BlockIOTable(CollectionTable):
             "block_latency_us",
             "block_io_latency_us",
             "block_io_flags",
-            "collection_id",
         ]).rename({
             UPTIME_TIMESTAMP: "finish_ts_uptime_us",
         })
@@ -191,7 +239,6 @@ class BlockIOTable(CollectionTable):
                 "segments",
                 "block_io_bytes",
                 "block_io_flags",
-                "collection_id",
             ],
             how="inner",
         ).filter(
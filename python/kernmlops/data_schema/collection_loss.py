@@ -0,0 +1,64 @@
+import polars as pl
+from data_schema.schema import (
+    UPTIME_TIMESTAMP,
+    CollectionGraph,
+    CollectionTable,
+    cast_to_schema,
+)
+
+
+class CollectionLossTable(CollectionTable):
+
+    @classmethod
+    def name(cls) -> str:
+        return "collection_loss"
+
+    @classmethod
+    def schema(cls) -> pl.Schema:
+        return pl.Schema({
+            "hook": pl.String(),
+            "cpu": pl.Int64(),
+            UPTIME_TIMESTAMP: pl.Int64(),
+            "submitted_events": pl.Int64(),
+            "lost_events": pl.Int64(),
+        })
+
+    @classmethod
+    def from_df(cls, table: pl.DataFrame) -> "CollectionLossTable":
+        return CollectionLossTable(table=cast_to_schema(table, cls.schema()))
+
+    def __init__(self, table: pl.DataFrame):
+        self._table = table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        return self._table
+
+    def filtered_table(self) -> pl.DataFrame:
+        return self.table
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return []
+
+    def total_lost_events(self) -> int:
+        """Returns the number of events dropped across all hooks and cpus."""
+        return int(self.table["lost_events"].sum())
+
+    def loss_rate(self) -> float:
+        """Returns the fraction of events produced in kernel that never reached the collector."""
+        lost_events = self.total_lost_events()
+        total_events = int(self.table["submitted_events"].sum()) + lost_events
+        return lost_events / total_events if total_events > 0 else 0.0
+
+    def per_hook_loss(self) -> pl.DataFrame:
+        """Returns the submitted events, lost events and loss rate of each hook."""
+        return self.table.group_by(
+            "hook"
+        ).agg(
+            pl.sum("submitted_events"),
+            pl.sum("lost_events"),
+        ).with_columns(
+            (
+                pl.col("lost_events") / (pl.col("submitted_events") + pl.col("lost_events"))
+            ).fill_nan(0.0).alias("loss_rate")
+        ).sort("loss_rate", descending=True)
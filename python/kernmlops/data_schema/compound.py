@@ -1,7 +1,9 @@
 import polars as pl
 from data_schema.schema import (
+    UPTIME_TIMESTAMP,
     CollectionGraph,
     CollectionTable,
+    cast_to_schema,
 )
 
 
@@ -17,12 +19,11 @@ class CompoundTable(CollectionTable):
             "timestamp": pl.Int64(),
             "function": pl.String(),
             "stack_hash": pl.Int64(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "CompoundTable":
-        return CompoundTable(table=table.cast(cls.schema(), strict=True))
+        return CompoundTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -43,3 +44,64 @@ class CompoundTable(CollectionTable):
             pl.count().alias("frequency"),
             pl.first("function").alias("function")
         ).sort("frequency", descending=True)
+
+
+class CompoundStackTable(CollectionTable):
+    """Per interval calls of each probed function by kernel stack, aggregated in kernel.
+
+    `stack` is the symbolized stack in folded form, outermost frame first and separated by `;`,
+    its innermost frame is the probed function. Stacks that could not be recorded are `[unknown]`.
+    """
+
+    @classmethod
+    def name(cls) -> str:
+        return "compound_stacks"
+
+    @classmethod
+    def schema(cls) -> pl.Schema:
+        return pl.Schema({
+            UPTIME_TIMESTAMP: pl.Int64(),
+            "function": pl.String(),
+            "stack_hash": pl.Int64(),
+            "stack": pl.String(),
+            "count": pl.Int64(),
+        })
+
+    @classmethod
+    def from_df(cls, table: pl.DataFrame) -> "CompoundStackTable":
+        return CompoundStackTable(table=cast_to_schema(table, cls.schema()))
+
+    def __init__(self, table: pl.DataFrame):
+        self._table = table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        return self._table
+
+    def filtered_table(self) -> pl.DataFrame:
+        return self.table
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return []
+
+    def stack_analysis(self) -> pl.DataFrame:
+        """Returns the unique stack traces of each function and their frequencies."""
+        return self.table.group_by("function", "stack_hash").agg(
+            pl.sum("count").alias("frequency"),
+            pl.first("stack").alias("stack"),
+        ).sort("frequency", descending=True)
+
+    def folded_stacks(self) -> pl.DataFrame:
+        """Returns the calls of each function and stack summed over the collection, ready for a flame graph."""
+        return self.table.group_by("function", "stack").agg(
+            pl.sum("count").alias("count"),
+        ).select(
+            pl.when(
+                pl.col("stack") == "[unknown]"
+            ).then(
+                pl.concat_str(pl.col("stack"), pl.col("function"), separator=";")
+            ).otherwise(
+                pl.col("stack")
+            ).alias("folded_stack"),
+            "count",
+        ).sort("count", descending=True)
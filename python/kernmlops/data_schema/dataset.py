@@ -0,0 +1,72 @@
+# Hive partitioned layout of collected tables: table=<name>/benchmark=<name>/collection_id=<id>/part-*.parquet
+
+from pathlib import Path
+from typing import Final
+
+TABLE_PARTITION: Final[str] = "table"
+BENCHMARK_PARTITION: Final[str] = "benchmark"
+# same name as the collection id column so the partition can stand in for it
+COLLECTION_ID_PARTITION: Final[str] = "collection_id"
+
+
+def partition_dir(dataset_dir: Path, table_name: str, benchmark: str, collection_id: str) -> Path:
+    return (
+        dataset_dir /
+        f"{TABLE_PARTITION}={table_name}" /
+        f"{BENCHMARK_PARTITION}={benchmark}" /
+        f"{COLLECTION_ID_PARTITION}={collection_id}"
+    )
+
+
+def partition_values(path: Path) -> dict[str, str]:
+    """Returns the `key=value` directories of a path inside a dataset."""
+    return dict(
+        part.split("=", 1)
+        for part in path.parts
+        if "=" in part
+    )
+
+
+def is_dataset(data_dir: Path) -> bool:
+    return any(data_dir.glob(f"{TABLE_PARTITION}=*"))
+
+
+def table_names(dataset_dir: Path) -> list[str]:
+    return sorted(
+        table_dir.name.split("=", 1)[1]
+        for table_dir in dataset_dir.glob(f"{TABLE_PARTITION}=*")
+        if table_dir.is_dir()
+    )
+
+
+def table_partitions(
+    dataset_dir: Path,
+    table_name: str,
+    benchmark: str | None = None,
+    collection_ids: list[str] | None = None,
+) -> list[Path]:
+    """Lists the collection directories of a table, only visiting the requested partitions."""
+    table_dir = dataset_dir / f"{TABLE_PARTITION}={table_name}"
+    benchmark_dirs = (
+        [table_dir / f"{BENCHMARK_PARTITION}={benchmark}"]
+        if benchmark is not None
+        else sorted(table_dir.glob(f"{BENCHMARK_PARTITION}=*"))
+    )
+    partitions = list[Path]()
+    for benchmark_dir in benchmark_dirs:
+        if collection_ids is None:
+            partitions.extend(sorted(benchmark_dir.glob(f"{COLLECTION_ID_PARTITION}=*")))
+        else:
+            partitions.extend(
+                benchmark_dir / f"{COLLECTION_ID_PARTITION}={collection_id}"
+                for collection_id in collection_ids
+            )
+    return [partition for partition in partitions if partition.is_dir()]
+
+
+def part_file(partition: Path, part: int = 0) -> Path:
+    return partition / f"part-{part}.parquet"
+
+
+def partition_files(partition: Path) -> list[Path]:
+    return sorted(partition.glob("part-*.parquet"))
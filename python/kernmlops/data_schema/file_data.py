@@ -3,6 +3,7 @@ from data_schema.schema import (
     UPTIME_TIMESTAMP,
     CollectionGraph,
     CollectionTable,
+    cast_to_schema,
 )
 
 
@@ -22,12 +23,11 @@ class FileDataTable(CollectionTable):
             "file_inode": pl.Int64(),
             "file_size_bytes": pl.Int64(),
             "file_name": pl.String(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "FileDataTable":
-        return FileDataTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return FileDataTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
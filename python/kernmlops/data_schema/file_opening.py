@@ -3,6 +3,7 @@ from data_schema.schema import (
     UPTIME_TIMESTAMP,
     CollectionGraph,
     CollectionTable,
+    cast_to_schema,
 )
 
 
@@ -22,12 +23,11 @@ class FileOpeningTable(CollectionTable):
             "filename": pl.String(),
             "flags": pl.Int64(),
             "mode": pl.Int64(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "FileOpeningTable":
-        return FileOpeningTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return FileOpeningTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -6,6 +6,7 @@ from data_schema.generic_table import (
 from data_schema.schema import (
     CollectionGraph,
     CollectionTable,
+    collection_id_column,
 )
 
 
@@ -40,8 +41,8 @@ class CollapseHugePageDataTable(CollectionTable):
             "start_ts_ns",
             "end_ts_ns",
             "mm",
-            "collection_id",
-        ])
+            collection_id_column(),
+        ], strict=False)
         return cls.from_df(pl.concat([collapse_df, trace_mm_df], how="horizontal"))
 
     def __init__(self, table: pl.DataFrame):
@@ -3,12 +3,22 @@ from typing import Mapping
 from data_schema.perf.perf_schema import (
     CustomHWEventID,
     PerfCollectionTable,
+    PerfRateTable,
+    pma_deltas_as_rates,
+)
+from data_schema.perf.pmu_benchmark import (
+    benchmark_cumulative_pma,
+    synthetic_pmu_table,
 )
 from data_schema.perf.tlb_perf import (
     DTLBPerfTable,
+    DTLBRatePerfTable,
     DTLBWalkDurationPerfTable,
+    DTLBWalkDurationRatePerfTable,
     ITLBPerfTable,
+    ITLBRatePerfTable,
     TLBFlushPerfTable,
+    TLBFlushRatePerfTable,
 )
 
 perf_table_types: Mapping[str, type[PerfCollectionTable]] = {
@@ -18,8 +28,24 @@ perf_table_types: Mapping[str, type[PerfCollectionTable]] = {
     DTLBWalkDurationPerfTable.name(): DTLBWalkDurationPerfTable,
 }
 
+# keyed by the name of the perf table the rates are computed from
+perf_rate_table_types: Mapping[str, type[PerfRateTable]] = {
+    rate_table.perf_table_type().name(): rate_table
+    for rate_table in [
+        DTLBRatePerfTable,
+        ITLBRatePerfTable,
+        TLBFlushRatePerfTable,
+        DTLBWalkDurationRatePerfTable,
+    ]
+}
+
 __all__ = [
   "perf_table_types",
+  "perf_rate_table_types",
+  "pma_deltas_as_rates",
+  "benchmark_cumulative_pma",
+  "synthetic_pmu_table",
   "CustomHWEventID",
   "PerfCollectionTable",
+  "PerfRateTable",
 ]
@@ -9,9 +9,10 @@ from data_schema.schema import (
   CollectionGraph,
   CollectionTable,
   GraphEngine,
-  collection_id_column,
+  cast_to_schema,
   cumulative_pma_as_cdf,
   cumulative_pma_as_pdf,
+  cumulative_pma_deltas,
 )
 
 
@@ -49,6 +50,29 @@ class PerfHWCacheConfig:
     return (cache.value) | (op.value << 8) | (result.value << 16)
 
 
+def pma_deltas_as_rates(deltas: pl.LazyFrame, *, counter_column_rename: str, interval_us: int) -> pl.LazyFrame:
+    """Sums readings from `cumulative_pma_deltas` into `interval_us` wide intervals per cpu and tgid.
+
+    Each reading is attributed to the tgid it was taken in. The rate is counted events per
+    second the counter was running, null when it never ran in the interval.
+    """
+    return deltas.group_by(
+        "cpu",
+        "tgid",
+        (pl.col(UPTIME_TIMESTAMP) // interval_us * interval_us).alias(UPTIME_TIMESTAMP),
+    ).agg(
+        pl.sum(f"{counter_column_rename}_raw").alias(counter_column_rename),
+        pl.sum("span_duration_us").alias("pmu_enabled_time_us"),
+        pl.sum("span_running_us").alias("pmu_running_time_us"),
+    ).with_columns(
+        pl.when(
+            pl.col("pmu_running_time_us") > 0
+        ).then(
+            pl.col(counter_column_rename) * 1_000_000.0 / pl.col("pmu_running_time_us")
+        ).alias(f"{counter_column_rename}_per_sec"),
+    ).sort(UPTIME_TIMESTAMP, "cpu", "tgid")
+
+
 class PerfCollectionTable(CollectionTable, Protocol):
 
     @classmethod
@@ -81,9 +105,7 @@ class PerfCollectionTable(CollectionTable, Protocol):
     @classmethod
     def from_df_id(cls, table: pl.DataFrame, collection_id: str) -> "CollectionTable":
         return cls.from_df(
-            table=table.with_columns(
-                pl.lit(collection_id).alias(collection_id_column())
-            ).rename({
+            table=table.rename({
                 "cumulative_count": cls.cumulative_column_name(),
             })
         )
@@ -95,7 +117,6 @@ class PerfCollectionTable(CollectionTable, Protocol):
             "pid": pl.Int64(),
             "tgid": pl.Int64(),
             UPTIME_TIMESTAMP: pl.Int64(),
-            "collection_id": pl.String(),
             cls.cumulative_column_name(): pl.Int64(),
             "pmu_enabled_time_us": pl.Int64(),
             "pmu_running_time_us": pl.Int64(),
@@ -122,20 +143,119 @@ class PerfCollectionTable(CollectionTable, Protocol):
             counter_column_rename=self.name(),
         )
 
+    # same rows as the matching PerfRateTable written during collection
+    def as_rates(self, interval_us: int) -> pl.DataFrame:
+        return pma_deltas_as_rates(
+            cumulative_pma_deltas(
+                self.filtered_table(),
+                counter_column=self.cumulative_column_name(),
+                counter_column_rename=self.name(),
+            ),
+            counter_column_rename=self.name(),
+            interval_us=interval_us,
+        ).collect()
+
+
+class PerfRateTable(CollectionTable):
+    """Counted events of a perf counter per interval, cpu and tgid, computed while collecting.
+
+    `<counter>_per_sec` is normalized by the time the counter was running, so it is not skewed
+    by multiplexing.
+    """
+
+    @classmethod
+    def perf_table_type(cls) -> type[PerfCollectionTable]: ...
+
+    @classmethod
+    def name(cls) -> str:
+        return f"{cls.perf_table_type().name()}_rate"
+
+    @classmethod
+    def count_column_name(cls) -> str:
+        return cls.perf_table_type().name()
+
+    @classmethod
+    def rate_column_name(cls) -> str:
+        return f"{cls.count_column_name()}_per_sec"
+
+    @classmethod
+    def schema(cls) -> pl.Schema:
+        return pl.Schema({
+            "cpu": pl.Int64(),
+            "tgid": pl.Int64(),
+            UPTIME_TIMESTAMP: pl.Int64(),
+            cls.count_column_name(): pl.Int64(),
+            "pmu_enabled_time_us": pl.Int64(),
+            "pmu_running_time_us": pl.Int64(),
+            cls.rate_column_name(): pl.Float64(),
+        })
+
+    @classmethod
+    def from_df(cls, table: pl.DataFrame) -> "PerfRateTable":
+        return cls(table=cast_to_schema(table, cls.schema()))
+
+    def __init__(self, table: pl.DataFrame):
+        self._table = table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        return self._table
+
+    def filtered_table(self) -> pl.DataFrame:
+        return self.table
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return []
+
+    def total(self) -> int:
+        return self.filtered_table().select(pl.sum(self.count_column_name())).item()
+
+    def per_cpu_rates(self) -> pl.DataFrame:
+        """Rates of each interval and cpu summed over tgids, in events per msec."""
+        return self.filtered_table().group_by(
+            "cpu", UPTIME_TIMESTAMP
+        ).agg(
+            pl.sum(self.count_column_name()),
+            pl.sum("pmu_running_time_us"),
+        ).filter(
+            pl.col("pmu_running_time_us") > 0
+        ).with_columns(
+            (pl.col(self.count_column_name()) * 1_000.0 / pl.col("pmu_running_time_us")).alias("per_msec"),
+        ).sort(UPTIME_TIMESTAMP)
+
 
 class RatePerfGraph(CollectionGraph, Protocol):
 
     graph_engine: GraphEngine
-    _perf_table: PerfCollectionTable
+    _perf_table: PerfCollectionTable | None
+    _rate_table: PerfRateTable | None
 
     @classmethod
     def perf_table_type(cls) -> type[PerfCollectionTable]: ...
 
+    @classmethod
+    def rate_table_type(cls) -> type[PerfRateTable] | None:
+        """Rates written during collection, preferred over deriving them from cumulative samples."""
+        return None
+
     @classmethod
     def trend_graph(cls) -> type[CollectionGraph] | None:
         """Returns a graph to use for trend lines."""
         return None
 
+    @classmethod
+    def with_graph_engine(cls, graph_engine: GraphEngine) -> CollectionGraph | None:
+        rate_table_type = cls.rate_table_type()
+        rate_table = graph_engine.collection_data.get(rate_table_type) if rate_table_type is not None else None
+        perf_table = graph_engine.collection_data.get(cls.perf_table_type()) if rate_table is None else None
+        if rate_table is None and perf_table is None:
+            return None
+        return cls(
+            graph_engine=graph_engine,
+            perf_table=perf_table,
+            rate_table=rate_table,
+        )
+
     @classmethod
     def base_name(cls) -> str:
         return f"{cls.perf_table_type().component_name()} Performance"
@@ -146,10 +266,12 @@ class RatePerfGraph(CollectionGraph, Protocol):
     def __init__(
         self,
         graph_engine: GraphEngine,
-        perf_table: PerfCollectionTable,
+        perf_table: PerfCollectionTable | None = None,
+        rate_table: PerfRateTable | None = None,
     ):
         self.graph_engine = graph_engine
         self._perf_table = perf_table
+        self._rate_table = rate_table
 
     @property
     def collection_data(self) -> CollectionData:
@@ -159,26 +281,33 @@ class RatePerfGraph(CollectionGraph, Protocol):
         return "Benchmark Runtime (sec)"
 
     def y_axis(self) -> str:
-        return f"{self._perf_table.component_name()} {self._perf_table.measured_event_name()}/msec"
+        perf_table_type = self.perf_table_type()
+        return f"{perf_table_type.component_name()} {perf_table_type.measured_event_name()}/msec"
 
     def plot(self) -> None:
-        pdf_df = self._perf_table.as_pdf()
-        print(f"Total {self._perf_table.component_name()} {self._perf_table.measured_event_name()}: {self._perf_table.total_cumulative()}")
+        perf_table_type = self.perf_table_type()
+        if self._rate_table is not None:
+            total = self._rate_table.total()
+            rate_df = self._rate_table.per_cpu_rates()
+        else:
+            assert self._perf_table is not None
+            total = self._perf_table.total_cumulative()
+            # readings where the counter was multiplexed out the whole span have no estimate
+            rate_df = self._perf_table.as_pdf().drop_nulls(perf_table_type.name()).with_columns(
+                (pl.col(perf_table_type.name()) / (pl.col("span_duration_us") / 1_000.0)).alias("per_msec"),
+            )
+        print(f"Total {perf_table_type.component_name()} {perf_table_type.measured_event_name()}: {total}")
 
         # group by and plot by cpu
-        def plot_rate(pdf_df: pl.DataFrame) -> None:
-            pdf_df_by_cpu = pdf_df.group_by("cpu")
-            for cpu, pdf_df_group in pdf_df_by_cpu:
+        def plot_rate(rate_df: pl.DataFrame) -> None:
+            rate_df_by_cpu = rate_df.group_by("cpu")
+            for cpu, rate_df_group in rate_df_by_cpu:
                 self.graph_engine.plot(
-                    self.collection_data.normalize_uptime_sec(pdf_df_group),
-                    (
-                        pdf_df_group.select(self._perf_table.name()) / (
-                            pdf_df_group.select("span_duration_us") / 1_000.0
-                        )
-                    ).to_series().to_list(),
+                    self.collection_data.normalize_uptime_sec(rate_df_group),
+                    rate_df_group.select("per_msec").to_series().to_list(),
                     label=f"CPU {cpu[0]}",
                 )
-        plot_rate(pdf_df)
+        plot_rate(rate_df)
 
     def plot_trends(self) -> None:
         trend_graph_type = self.trend_graph()
@@ -0,0 +1,104 @@
+"""Compares the per cpu loop and single plan conversions of cumulative pmu readings."""
+
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+from data_schema.schema import UPTIME_TIMESTAMP, cumulative_pma_deltas
+
+COUNTER_COLUMN = "cumulative_count"
+COUNTER_COLUMN_RENAME = "count"
+
+
+def synthetic_pmu_table(rows: int, cpus: int, *, reset_rate: float = 0.0001, seed: int = 0) -> pl.DataFrame:
+    """Cumulative readings spread over `cpus`, multiplexed about half the time and occasionally reset."""
+    rng = np.random.default_rng(seed)
+    cpu = rng.integers(0, cpus, rows)
+    enabled = rng.integers(900, 1_100, rows)
+    running = (enabled * rng.uniform(0.25, 1.0, rows)).astype(np.int64)
+    running[rng.random(rows) < 0.01] = 0
+    counts = rng.integers(0, 10_000, rows) * (running > 0)
+    table = pl.DataFrame({
+        "cpu": cpu,
+        "pid": rng.integers(0, 1 << 15, rows),
+        "tgid": rng.integers(0, 1 << 15, rows),
+        UPTIME_TIMESTAMP: np.arange(rows, dtype=np.int64) * 10,
+        "counts": counts,
+        "enabled": enabled,
+        "running": running,
+        "reset": rng.random(rows) < reset_rate,
+    }).with_columns(
+        pl.col("reset").cum_sum().over("cpu").alias("epoch"),
+    )
+    cumulative = pl.col("counts", "enabled", "running").cum_sum().over("cpu", "epoch")
+    return table.with_columns(cumulative).select(
+        "cpu",
+        "pid",
+        "tgid",
+        UPTIME_TIMESTAMP,
+        pl.col("counts").alias(COUNTER_COLUMN),
+        pl.col("enabled").alias("pmu_enabled_time_us"),
+        pl.col("running").alias("pmu_running_time_us"),
+    )
+
+
+def cumulative_pma_deltas_by_cpu(table: pl.DataFrame, *, counter_column: str, counter_column_rename: str) -> pl.DataFrame:
+    """Reference conversion building one plan per cpu, as `cumulative_pma_as_pdf` used to."""
+    def delta(column: str) -> pl.Expr:
+        delta = pl.col(column) - pl.col(column).shift(1, fill_value=0)
+        return pl.when(delta < 0).then(pl.col(column)).otherwise(delta)
+
+    by_cpu_dfs = [
+        by_cpu_df.lazy().sort(UPTIME_TIMESTAMP).with_columns(
+            delta(counter_column).alias(f"{counter_column_rename}_raw"),
+            delta("pmu_enabled_time_us").alias("span_duration_us"),
+            delta("pmu_running_time_us").alias("span_running_us"),
+        ).with_columns(
+            pl.when(
+                pl.col("span_running_us") > 0
+            ).then(
+                pl.col(f"{counter_column_rename}_raw") * pl.col("span_duration_us") / pl.col("span_running_us")
+            ).alias(counter_column_rename),
+        )
+        for _, by_cpu_df in table.group_by("cpu")
+    ]
+    return pl.concat(by_cpu_dfs).collect()
+
+
+@dataclass(frozen=True)
+class PmuDeltaBenchmark:
+    rows: int
+    cpus: int
+    by_cpu_sec: float
+    single_plan_sec: float
+    equal: bool
+
+    def speedup(self) -> float:
+        return self.by_cpu_sec / self.single_plan_sec if self.single_plan_sec else 0.0
+
+
+def benchmark_cumulative_pma(table: pl.DataFrame, trials: int = 3) -> PmuDeltaBenchmark:
+    """Times both conversions of `table`, keeping the fastest trial, and checks they agree."""
+    by_cpu_sec = float("inf")
+    single_plan_sec = float("inf")
+    by_cpu = pl.DataFrame()
+    single_plan = pl.DataFrame()
+    for _ in range(max(trials, 1)):
+        start = time.perf_counter()
+        by_cpu = cumulative_pma_deltas_by_cpu(
+            table, counter_column=COUNTER_COLUMN, counter_column_rename=COUNTER_COLUMN_RENAME,
+        )
+        by_cpu_sec = min(by_cpu_sec, time.perf_counter() - start)
+        start = time.perf_counter()
+        single_plan = cumulative_pma_deltas(
+            table, counter_column=COUNTER_COLUMN, counter_column_rename=COUNTER_COLUMN_RENAME,
+        ).collect()
+        single_plan_sec = min(single_plan_sec, time.perf_counter() - start)
+    return PmuDeltaBenchmark(
+        rows=len(table),
+        cpus=table["cpu"].n_unique(),
+        by_cpu_sec=by_cpu_sec,
+        single_plan_sec=single_plan_sec,
+        equal=by_cpu.sort("cpu", UPTIME_TIMESTAMP).equals(single_plan.sort("cpu", UPTIME_TIMESTAMP)),
+    )
@@ -6,11 +6,13 @@ from data_schema.perf.perf_schema import (
     CustomHWEventID,
     PerfCollectionTable,
     PerfHWCacheConfig,
+    PerfRateTable,
     RatePerfGraph,
 )
 from data_schema.schema import (
     CollectionGraph,
     GraphEngine,
+    cast_to_schema,
 )
 
 
@@ -46,7 +48,7 @@ class DTLBPerfTable(PerfCollectionTable):
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "DTLBPerfTable":
-        return DTLBPerfTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return DTLBPerfTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -62,24 +64,28 @@ class DTLBPerfTable(PerfCollectionTable):
         return [DTLBRateGraph, DTLBCumulativeGraph]
 
 
+class DTLBRatePerfTable(PerfRateTable):
+
+    @classmethod
+    def perf_table_type(cls) -> type[PerfCollectionTable]:
+        return DTLBPerfTable
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return [DTLBRateGraph]
+
+
 class DTLBRateGraph(RatePerfGraph):
     @classmethod
     def perf_table_type(cls) -> type[PerfCollectionTable]:
         return DTLBPerfTable
 
     @classmethod
-    def trend_graph(cls) -> type[CollectionGraph] | None:
-        return MemoryUsageGraph
+    def rate_table_type(cls) -> type[PerfRateTable] | None:
+        return DTLBRatePerfTable
 
     @classmethod
-    def with_graph_engine(cls, graph_engine: GraphEngine) -> CollectionGraph | None:
-        perf_table = graph_engine.collection_data.get(cls.perf_table_type())
-        if perf_table is not None:
-            return DTLBRateGraph(
-                graph_engine=graph_engine,
-                perf_table=perf_table
-            )
-        return None
+    def trend_graph(cls) -> type[CollectionGraph] | None:
+        return MemoryUsageGraph
 
 
 class DTLBCumulativeGraph(CumulativePerfGraph):
@@ -134,7 +140,7 @@ class ITLBPerfTable(PerfCollectionTable):
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "ITLBPerfTable":
-        return ITLBPerfTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return ITLBPerfTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -150,24 +156,28 @@ class ITLBPerfTable(PerfCollectionTable):
         return [ITLBRateGraph, ITLBCumulativeGraph]
 
 
+class ITLBRatePerfTable(PerfRateTable):
+
+    @classmethod
+    def perf_table_type(cls) -> type[PerfCollectionTable]:
+        return ITLBPerfTable
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return [ITLBRateGraph]
+
+
 class ITLBRateGraph(RatePerfGraph):
     @classmethod
     def perf_table_type(cls) -> type[PerfCollectionTable]:
         return ITLBPerfTable
 
     @classmethod
-    def trend_graph(cls) -> type[CollectionGraph] | None:
-        return MemoryUsageGraph
+    def rate_table_type(cls) -> type[PerfRateTable] | None:
+        return ITLBRatePerfTable
 
     @classmethod
-    def with_graph_engine(cls, graph_engine: GraphEngine) -> CollectionGraph | None:
-        perf_table = graph_engine.collection_data.get(cls.perf_table_type())
-        if perf_table is not None:
-            return ITLBRateGraph(
-                graph_engine=graph_engine,
-                perf_table=perf_table
-            )
-        return None
+    def trend_graph(cls) -> type[CollectionGraph] | None:
+        return MemoryUsageGraph
 
 
 class ITLBCumulativeGraph(CumulativePerfGraph):
@@ -221,7 +231,7 @@ class TLBFlushPerfTable(PerfCollectionTable):
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "TLBFlushPerfTable":
-        return TLBFlushPerfTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return TLBFlushPerfTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -237,24 +247,28 @@ class TLBFlushPerfTable(PerfCollectionTable):
         return [TLBFlushRateGraph, TLBFlushCumulativeGraph]
 
 
+class TLBFlushRatePerfTable(PerfRateTable):
+
+    @classmethod
+    def perf_table_type(cls) -> type[PerfCollectionTable]:
+        return TLBFlushPerfTable
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return [TLBFlushRateGraph]
+
+
 class TLBFlushRateGraph(RatePerfGraph):
     @classmethod
     def perf_table_type(cls) -> type[PerfCollectionTable]:
         return TLBFlushPerfTable
 
     @classmethod
-    def trend_graph(cls) -> type[CollectionGraph] | None:
-        return MemoryUsageGraph
+    def rate_table_type(cls) -> type[PerfRateTable] | None:
+        return TLBFlushRatePerfTable
 
     @classmethod
-    def with_graph_engine(cls, graph_engine: GraphEngine) -> CollectionGraph | None:
-        perf_table = graph_engine.collection_data.get(cls.perf_table_type())
-        if perf_table is not None:
-            return TLBFlushRateGraph(
-                graph_engine=graph_engine,
-                perf_table=perf_table
-            )
-        return None
+    def trend_graph(cls) -> type[CollectionGraph] | None:
+        return MemoryUsageGraph
 
 
 class TLBFlushCumulativeGraph(CumulativePerfGraph):
@@ -307,7 +321,7 @@ class DTLBWalkDurationPerfTable(PerfCollectionTable):
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "DTLBWalkDurationPerfTable":
-        return DTLBWalkDurationPerfTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return DTLBWalkDurationPerfTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -321,3 +335,10 @@ class DTLBWalkDurationPerfTable(PerfCollectionTable):
 
     def graphs(self) -> list[type[CollectionGraph]]:
         return []
+
+
+class DTLBWalkDurationRatePerfTable(PerfRateTable):
+
+    @classmethod
+    def perf_table_type(cls) -> type[PerfCollectionTable]:
+        return DTLBWalkDurationPerfTable
@@ -8,10 +8,12 @@ from data_schema.schema import (
     CollectionGraph,
     CollectionTable,
     GraphEngine,
+    LazyCollectionTable,
+    cast_to_schema,
 )
 
 
-class QuantaRuntimeTable(CollectionTable):
+class QuantaRuntimeTable(LazyCollectionTable):
 
     @classmethod
     def name(cls) -> str:
@@ -25,45 +27,57 @@ class QuantaRuntimeTable(CollectionTable):
             "tgid": pl.Int64(),
             UPTIME_TIMESTAMP: pl.Int64(),
             "quanta_run_length_us": pl.Int64(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "QuantaRuntimeTable":
-        return QuantaRuntimeTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return QuantaRuntimeTable(table=cast_to_schema(table, cls.schema()))
 
-    def __init__(self, table: pl.DataFrame):
-        self._table = table
+    @classmethod
+    def from_lazy(cls, table: pl.LazyFrame) -> "QuantaRuntimeTable":
+        return QuantaRuntimeTable(table=cast_to_schema(table, cls.schema()))
 
-    @property
-    def table(self) -> pl.DataFrame:
-        return self._table
+    max_run_length_us = 60_000
 
-    def filtered_table(self) -> pl.DataFrame:
+    def filter_plan(self, table: pl.LazyFrame) -> pl.LazyFrame:
         # filter out invalid data points due to data loss
         # these are probably due to hardware threads not running
-        initial_datapoints = len(self.table)
-        max_run_length = 60_000
-        quanta_df = self.table.filter(
-          pl.col("quanta_run_length_us") < max_run_length
+        return table.filter(
+          pl.col("quanta_run_length_us") < self.max_run_length_us
         )
-        datapoints_removed = initial_datapoints - len(quanta_df)
-        # TODO(Patrick): use logging
-        print(f"Filtered out {datapoints_removed} datapoints with max run length {max_run_length}us")
-        return quanta_df
+
+    def filter_summary(self, datapoints_removed: int) -> str | None:
+        return f"Filtered out {datapoints_removed} datapoints with max run length {self.max_run_length_us}us"
 
     def graphs(self) -> list[type[CollectionGraph]]:
         return [QuantaRuntimeGraph]
 
     def total_runtime_us(self) -> int:
         """Returns the total amount of runtime recorded across all cpus."""
-        return self.filtered_table().select(
-            "quanta_run_length_us"
-        ).sum()["quanta_run_length_us"].to_list()[0]
+        return self._total_runtime_us_plan().collect().item()
 
     def per_cpu_total_runtime_sec(self) -> pl.DataFrame:
         """Returns the total amount of runtime recorded per cpu."""
-        return self.filtered_table().group_by(
+        return self._per_cpu_total_runtime_sec_plan().collect()
+
+    def top_k_runtime(self, k: int) -> pl.DataFrame:
+        """Returns the pids and execution time of the k processes with the most execution time."""
+        return self._top_k_runtime_plan(k).collect()
+
+    def runtime_summary(self, k: int) -> tuple[int, pl.DataFrame, pl.DataFrame]:
+        """Returns the total runtime, runtime per cpu, and top k processes in one pass over the table."""
+        total_runtime_us, per_cpu_total_runtime_sec, top_k_runtime = pl.collect_all([
+            self._total_runtime_us_plan(),
+            self._per_cpu_total_runtime_sec_plan(),
+            self._top_k_runtime_plan(k),
+        ])
+        return total_runtime_us.item(), per_cpu_total_runtime_sec, top_k_runtime
+
+    def _total_runtime_us_plan(self) -> pl.LazyFrame:
+        return self.filtered_lazy_table().select(pl.sum("quanta_run_length_us"))
+
+    def _per_cpu_total_runtime_sec_plan(self) -> pl.LazyFrame:
+        return self.filtered_lazy_table().group_by(
             "cpu"
         ).agg(
             pl.sum("quanta_run_length_us")
@@ -72,10 +86,9 @@ class QuantaRuntimeTable(CollectionTable):
             (pl.col("quanta_run_length_us") / 1_000_000.0).alias("cpu_total_runtime_sec"),
         ]).sort("cpu_total_runtime_sec")
 
-    def top_k_runtime(self, k: int) -> pl.DataFrame:
-        """Returns the pids and execution time of the k processes with the most execution time."""
+    def _top_k_runtime_plan(self, k: int) -> pl.LazyFrame:
         # in kernel space thread id and pid meanings are swapped
-        return self.filtered_table().select(
+        return self.filtered_lazy_table().select(
             [pl.col("tgid").alias("pid"), "quanta_run_length_us"]
         ).group_by(
             "pid"
@@ -84,7 +97,7 @@ class QuantaRuntimeTable(CollectionTable):
         ).limit(k)
 
 
-class QuantaQueuedTable(CollectionTable):
+class QuantaQueuedTable(LazyCollectionTable):
 
     @classmethod
     def name(cls) -> str:
@@ -98,44 +111,56 @@ class QuantaQueuedTable(CollectionTable):
             "tgid": pl.Int64(),
             UPTIME_TIMESTAMP: pl.Int64(),
             "quanta_queued_time_us": pl.Int64(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "QuantaQueuedTable":
-        return QuantaQueuedTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return QuantaQueuedTable(table=cast_to_schema(table, cls.schema()))
 
-    def __init__(self, table: pl.DataFrame):
-        self._table = table
+    @classmethod
+    def from_lazy(cls, table: pl.LazyFrame) -> "QuantaQueuedTable":
+        return QuantaQueuedTable(table=cast_to_schema(table, cls.schema()))
 
-    @property
-    def table(self) -> pl.DataFrame:
-        return self._table
+    max_queue_time_us = 1_000_000
 
-    def filtered_table(self) -> pl.DataFrame:
+    def filter_plan(self, table: pl.LazyFrame) -> pl.LazyFrame:
         # filter out outliers
-        initial_datapoints = len(self.table)
-        max_queue_time_us = 1_000_000
-        quanta_df = self.table.filter(
-          pl.col("quanta_queued_time_us") < max_queue_time_us
+        return table.filter(
+          pl.col("quanta_queued_time_us") < self.max_queue_time_us
         )
-        datapoints_removed = initial_datapoints - len(quanta_df)
-        # TODO(Patrick): use logging
-        print(f"Filtered out {datapoints_removed} datapoints with max queue time {max_queue_time_us}us")
-        return quanta_df
+
+    def filter_summary(self, datapoints_removed: int) -> str | None:
+        return f"Filtered out {datapoints_removed} datapoints with max queue time {self.max_queue_time_us}us"
 
     def graphs(self) -> list[type[CollectionGraph]]:
         return [QuantaQueuedGraph]
 
     def total_queued_time_us(self) -> int:
         """Returns the total amount of queued time recorded across all cpus."""
-        return self.filtered_table().select(
-            "quanta_queued_time_us"
-        ).sum()["quanta_queued_time_us"].to_list()[0]
+        return self._total_queued_time_us_plan().collect().item()
 
     def per_cpu_total_runtime_sec(self) -> pl.DataFrame:
         """Returns the total amount of Queued time recorded per cpu."""
-        return self.filtered_table().group_by(
+        return self._per_cpu_total_queued_time_sec_plan().collect()
+
+    def top_k_queued_time(self, k: int) -> pl.DataFrame:
+        """Returns the pids and execution time of the k processes with the most queued time."""
+        return self._top_k_queued_time_plan(k).collect()
+
+    def queued_time_summary(self, k: int) -> tuple[int, pl.DataFrame, pl.DataFrame]:
+        """Returns the total queued time, queued time per cpu, and top k processes in one pass over the table."""
+        total_queued_time_us, per_cpu_total_queued_time_sec, top_k_queued_time = pl.collect_all([
+            self._total_queued_time_us_plan(),
+            self._per_cpu_total_queued_time_sec_plan(),
+            self._top_k_queued_time_plan(k),
+        ])
+        return total_queued_time_us.item(), per_cpu_total_queued_time_sec, top_k_queued_time
+
+    def _total_queued_time_us_plan(self) -> pl.LazyFrame:
+        return self.filtered_lazy_table().select(pl.sum("quanta_queued_time_us"))
+
+    def _per_cpu_total_queued_time_sec_plan(self) -> pl.LazyFrame:
+        return self.filtered_lazy_table().group_by(
             "cpu"
         ).agg(
             pl.sum("quanta_queued_time_us")
@@ -144,10 +169,9 @@ class QuantaQueuedTable(CollectionTable):
             (pl.col("quanta_queued_time_us") / 1_000_000.0).alias("cpu_total_queued_time_sec"),
         ]).sort("cpu_total_queued_time_sec")
 
-    def top_k_queued_time(self, k: int) -> pl.DataFrame:
-        """Returns the pids and execution time of the k processes with the most queued time."""
+    def _top_k_queued_time_plan(self, k: int) -> pl.LazyFrame:
         # in kernel space thread id and pid meanings are swapped
-        return self.filtered_table().select(
+        return self.filtered_lazy_table().select(
             [pl.col("tgid").alias("pid"), "quanta_queued_time_us"]
         ).group_by(
             "pid"
@@ -156,6 +180,96 @@ class QuantaQueuedTable(CollectionTable):
         ).limit(k)
 
 
+class QuantaRuntimeHistogramTable(CollectionTable):
+    """Per interval histogram of quanta run lengths per cpu and thread group, aggregated in kernel."""
+
+    @classmethod
+    def name(cls) -> str:
+        return "quanta_runtime_histogram"
+
+    @classmethod
+    def schema(cls) -> pl.Schema:
+        return pl.Schema({
+            "cpu": pl.Int64(),
+            "tgid": pl.Int64(),
+            UPTIME_TIMESTAMP: pl.Int64(),
+            "bucket": pl.Int64(),
+            "bucket_low_us": pl.Int64(),
+            "bucket_high_us": pl.Int64(),
+            "count": pl.Int64(),
+        })
+
+    @classmethod
+    def from_df(cls, table: pl.DataFrame) -> "QuantaRuntimeHistogramTable":
+        return QuantaRuntimeHistogramTable(table=cast_to_schema(table, cls.schema()))
+
+    def __init__(self, table: pl.DataFrame):
+        self._table = table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        return self._table
+
+    def filtered_table(self) -> pl.DataFrame:
+        return self.table
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return []
+
+    def distribution(self) -> pl.DataFrame:
+        """Returns the quanta run lengths histogram summed over the whole collection."""
+        return self.table.group_by(
+            ["bucket", "bucket_low_us", "bucket_high_us"]
+        ).agg(
+            pl.sum("count")
+        ).sort("bucket")
+
+
+class QuantaQueuedHistogramTable(CollectionTable):
+    """Per interval histogram of quanta queued times per cpu and thread group, aggregated in kernel."""
+
+    @classmethod
+    def name(cls) -> str:
+        return "quanta_queued_time_histogram"
+
+    @classmethod
+    def schema(cls) -> pl.Schema:
+        return pl.Schema({
+            "cpu": pl.Int64(),
+            "tgid": pl.Int64(),
+            UPTIME_TIMESTAMP: pl.Int64(),
+            "bucket": pl.Int64(),
+            "bucket_low_us": pl.Int64(),
+            "bucket_high_us": pl.Int64(),
+            "count": pl.Int64(),
+        })
+
+    @classmethod
+    def from_df(cls, table: pl.DataFrame) -> "QuantaQueuedHistogramTable":
+        return QuantaQueuedHistogramTable(table=cast_to_schema(table, cls.schema()))
+
+    def __init__(self, table: pl.DataFrame):
+        self._table = table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        return self._table
+
+    def filtered_table(self) -> pl.DataFrame:
+        return self.table
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return []
+
+    def distribution(self) -> pl.DataFrame:
+        """Returns the quanta queued times histogram summed over the whole collection."""
+        return self.table.group_by(
+            ["bucket", "bucket_low_us", "bucket_high_us"]
+        ).agg(
+            pl.sum("count")
+        ).sort("bucket")
+
+
 class QuantaRuntimeGraph(CollectionGraph):
 
     @classmethod
@@ -208,7 +322,7 @@ class QuantaRuntimeGraph(CollectionGraph):
         quanta_df = quanta_table.filtered_table()
         start_uptime_sec = self.collection_data.start_uptime_sec
         collector_pid = self.collection_data.pid
-        top_k = quanta_table.top_k_runtime(k=3)
+        _, per_cpu_total_runtime_sec, top_k = quanta_table.runtime_summary(k=3)
         print(top_k)
         pid_labels: Mapping[int, str] = self._get_pid_labels(top_k["pid"].to_list() + [collector_pid], collector_pid)
         print(json.dumps(pid_labels, indent=4))
@@ -224,7 +338,7 @@ class QuantaRuntimeGraph(CollectionGraph):
                 (collector_runtimes.select("quanta_run_length_us") / 1_000.0).to_series().to_list(),
                 label="Collector Process" if collector_pid == pid else label[:35],
             )
-        print(f"Total processor time per cpu:\n{quanta_table.per_cpu_total_runtime_sec()}")
+        print(f"Total processor time per cpu:\n{per_cpu_total_runtime_sec}")
 
     def _get_pid_labels(self, pids: list[int], collector_pid: int | None = None) -> Mapping[int, str]:
         process_table = self.collection_data.get(ProcessMetadataTable)
@@ -303,7 +417,7 @@ class QuantaQueuedGraph(CollectionGraph):
         quanta_df = quanta_table.filtered_table()
         start_uptime_sec = self.collection_data.start_uptime_sec
         collector_pid = self.collection_data.pid
-        top_k = quanta_table.top_k_queued_time(k=3)
+        _, per_cpu_total_queued_time_sec, top_k = quanta_table.queued_time_summary(k=3)
         print(top_k)
         pid_labels: Mapping[int, str] = self._get_pid_labels(top_k["pid"].to_list() + [collector_pid], collector_pid)
         print(json.dumps(pid_labels, indent=4))
@@ -319,7 +433,7 @@ class QuantaQueuedGraph(CollectionGraph):
                 (collector_runtimes.select("quanta_queued_time_us") / 1_000.0).to_series().to_list(),
                 label="Collector Process" if collector_pid == pid else label[:35],
             )
-        print(f"Total processor time per cpu:\n{quanta_table.per_cpu_total_runtime_sec()}")
+        print(f"Total processor time per cpu:\n{per_cpu_total_queued_time_sec}")
 
     def _get_pid_labels(self, pids: list[int], collector_pid: int | None = None) -> Mapping[int, str]:
         process_table = self.collection_data.get(ProcessMetadataTable)
@@ -3,6 +3,7 @@ from data_schema.schema import (
     UPTIME_TIMESTAMP,
     CollectionGraph,
     CollectionTable,
+    cast_to_schema,
 )
 
 
@@ -23,12 +24,11 @@ class SchedulerCoreTable(CollectionTable):
             "flags": pl.Int64(),
             "mode": pl.Int64(),
             "event_name": pl.String(),
-            "collection_id": pl.String(),
         })
 
     @classmethod
     def from_df(cls, table: pl.DataFrame) -> "SchedulerCoreTable":
-        return SchedulerCoreTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+        return SchedulerCoreTable(table=cast_to_schema(table, cls.schema()))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
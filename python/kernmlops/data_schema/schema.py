@@ -1,20 +1,104 @@
 # Abstract definition of CollectionTable and logical collection
 
+from collections.abc import Callable, Iterator, Mapping
 from pathlib import Path
-from typing import Final, Mapping, cast
+from typing import Final, cast
 
 import plotext
 import polars as pl
+from data_schema import dataset
 from matplotlib import pyplot
 from typing_extensions import Protocol
 
 UPTIME_TIMESTAMP: Final[str] = "ts_uptime_us"
 
+# timestamp columns a time range can be pushed down to, with their units per microsecond
+_TIME_RANGE_COLUMNS: Final[Mapping[str, int]] = {
+    UPTIME_TIMESTAMP: 1,
+    "start_ts_ns": 1_000,
+    "ts_ns": 1_000,
+}
+
 
 def collection_id_column() -> str:
     return "collection_id"
 
 
+def with_collection_id(table: pl.DataFrame, collection_id: str | None) -> pl.DataFrame:
+    """Materializes the collection id column, tables written before it moved to file metadata keep theirs."""
+    if collection_id is None or collection_id_column() in table.columns:
+        return table
+    return table.with_columns(pl.lit(collection_id).alias(collection_id_column()))
+
+
+def read_table_parquet(path: Path, collection_id: str | None = None) -> pl.DataFrame:
+    """Reads a table file, adding the collection id stored in its key value metadata as a column.
+
+    `collection_id` is used for files without the metadata key.
+    """
+    metadata = pl.read_parquet_metadata(path)
+    return with_collection_id(
+        pl.read_parquet(path),
+        metadata.get(collection_id_column(), collection_id),
+    )
+
+
+def scan_table_parquet(paths: list[Path], collection_id: str | None = None) -> pl.LazyFrame:
+    """Lazily scans the files of one table, see `read_table_parquet`.
+
+    Only the footer of the first file is read up front, filters and projections applied to the
+    result are pushed down into the parquet reader.
+    """
+    metadata = pl.read_parquet_metadata(paths[0])
+    collection_id = metadata.get(collection_id_column(), collection_id)
+    table = pl.scan_parquet(paths) if len(paths) == 1 else pl.concat(
+        [pl.scan_parquet(path) for path in paths], how="diagonal_relaxed"
+    )
+    if collection_id is None or collection_id_column() in table.collect_schema().names():
+        return table
+    return table.with_columns(pl.lit(collection_id).alias(collection_id_column()))
+
+
+def filter_table_scan(
+    table: pl.LazyFrame,
+    *,
+    time_range_us: tuple[int, int] | None = None,
+    pids: list[int] | None = None,
+    tgids: list[int] | None = None,
+    columns: list[str] | None = None,
+) -> pl.LazyFrame:
+    """Restricts a table scan to rows in `[start, end)` uptime microseconds and of the given processes.
+
+    Each filter only applies to tables with the matching column, the time range uses the first of
+    `ts_uptime_us`, `start_ts_ns` and `ts_ns` present. `columns` lists the columns to keep where
+    the table has them.
+    """
+    table_columns = table.collect_schema().names()
+    if time_range_us is not None:
+        time_column = next((column for column in _TIME_RANGE_COLUMNS if column in table_columns), None)
+        if time_column is not None:
+            scale = _TIME_RANGE_COLUMNS[time_column]
+            table = table.filter(
+                pl.col(time_column).is_between(time_range_us[0] * scale, time_range_us[1] * scale, closed="left")
+            )
+    if pids is not None and "pid" in table_columns:
+        table = table.filter(pl.col("pid").is_in(pids))
+    if tgids is not None and "tgid" in table_columns:
+        table = table.filter(pl.col("tgid").is_in(tgids))
+    if columns is not None:
+        table = table.select([column for column in table_columns if column in columns])
+    return table
+
+
+def cast_to_schema[F: (pl.DataFrame, pl.LazyFrame)](table: F, schema: pl.Schema) -> F:
+    """Strictly casts the schema columns present in `table`, tables loaded with a projection lack the rest."""
+    columns = table.collect_schema().names()
+    return table.cast(
+        {name: dtype for name, dtype in schema.items() if name in columns},  # pyright: ignore [reportArgumentType]
+        strict=True,
+    )
+
+
 def _type_map(table_types: list[type["CollectionTable"]]) -> Mapping[str, type["CollectionTable"]]:
     return {
         table_type.name(): table_type
@@ -54,20 +138,83 @@ class CollectionTable(Protocol):
 
     @classmethod
     def from_df_id(cls, table: pl.DataFrame, collection_id: str) -> "CollectionTable":
-        return cls.from_df(
-            table=table.with_columns(pl.lit(collection_id).alias(collection_id_column()))
-        )
+        # the id is constant per collection, it is written to file metadata instead of every row
+        return cls.from_df(table=table)
+
+    @classmethod
+    def from_lazy(cls, table: pl.LazyFrame) -> "CollectionTable":
+        # tables that can stay lazy override this, see LazyCollectionTable
+        return cls.from_df(table=table.collect())
 
     @property
     def table(self) -> pl.DataFrame: ...
 
+    @property
+    def lazy_table(self) -> pl.LazyFrame:
+        return self.table.lazy()
+
     def filtered_table(self) -> pl.DataFrame:
         # Best effort filter to remove invalid data points
         ...
 
+    def filtered_lazy_table(self) -> pl.LazyFrame:
+        return self.filtered_table().lazy()
+
     def graphs(self) -> list[type[CollectionGraph]]: ...
 
 
+class LazyCollectionTable(CollectionTable):
+    """Table backed by a lazy plan, it is only collected when `table` or `filtered_table` is used.
+
+    Subclasses describe their filter with `filter_plan`, the filtered plan and both collected
+    frames are kept so aggregates built on `filtered_lazy_table` can share one `pl.collect_all`.
+    """
+
+    def __init__(self, table: pl.DataFrame | pl.LazyFrame):
+        self._lazy_table = table.lazy()
+        self._table = table if isinstance(table, pl.DataFrame) else None
+        self._filtered_lazy_table: pl.LazyFrame | None = None
+        self._filtered_table: pl.DataFrame | None = None
+
+    @property
+    def lazy_table(self) -> pl.LazyFrame:
+        if self._table is not None:
+            return self._table.lazy()
+        return self._lazy_table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        if self._table is None:
+            self._table = self._lazy_table.collect()
+        return self._table
+
+    def filter_plan(self, table: pl.LazyFrame) -> pl.LazyFrame:
+        return table
+
+    def filter_summary(self, datapoints_removed: int) -> str | None:
+        """Message printed when the filtered table is first collected."""
+        return None
+
+    def filtered_lazy_table(self) -> pl.LazyFrame:
+        if self._filtered_table is not None:
+            return self._filtered_table.lazy()
+        if self._filtered_lazy_table is None:
+            self._filtered_lazy_table = self.filter_plan(self.lazy_table)
+        return self._filtered_lazy_table
+
+    def filtered_table(self) -> pl.DataFrame:
+        if self._filtered_table is None:
+            datapoints, filtered_table = pl.collect_all([
+                self.lazy_table.select(pl.len()), self.filtered_lazy_table(),
+            ])
+            self._filtered_table = filtered_table
+            summary = self.filter_summary(datapoints.item() - len(filtered_table))
+            if summary:
+                # TODO(Patrick): use logging
+                print(summary)
+        return self._filtered_table
+
+
 # TODO(Patrick): Add simple class for holding tables from multiple collections
 class CollectionsTable[T: CollectionTable]:
     pass
@@ -138,6 +285,41 @@ class SystemInfoTable(CollectionTable):
             "cores"
         ][0]
 
+    @property
+    def event_loss_rate(self) -> float:
+        if "event_loss_rate" not in self.table.columns:
+            return 0.0
+        return self.table[
+            "event_loss_rate"
+        ][0]
+
+    @property
+    def event_loss_exceeded(self) -> bool:
+        if "event_loss_exceeded" not in self.table.columns:
+            return False
+        return self.table[
+            "event_loss_exceeded"
+        ][0]
+
+
+class _LazyCollectionTables(Mapping[str, CollectionTable]):
+    """Tables of a collection that are only read, and then kept, once they are looked up."""
+
+    def __init__(self, loaders: Mapping[str, Callable[[], CollectionTable]]):
+        self._loaders = loaders
+        self._tables = dict[str, CollectionTable]()
+
+    def __getitem__(self, name: str) -> CollectionTable:
+        if name not in self._tables:
+            self._tables[name] = self._loaders[name]()
+        return self._tables[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._loaders)
+
+    def __len__(self) -> int:
+        return len(self._loaders)
+
 
 class CollectionData:
 
@@ -190,8 +372,13 @@ class CollectionData:
     def graph(self, out_dir: Path | None = None, *, use_matplot: bool = False, no_trends: bool = False) -> None:
         # TODO(Patrick) use verbosity for filtering graphs
         graph_engine = GraphEngine(collection_data=self, use_matplot=use_matplot)
+        # tables with the same data in different forms share graphs, draw them once
+        graph_types = set[type[CollectionGraph]]()
         for _, collection_table in self.tables.items():
             for graph_type in collection_table.graphs():
+                if graph_type in graph_types:
+                    continue
+                graph_types.add(graph_type)
                 graph = graph_type.with_graph_engine(graph_engine)
                 if not graph:
                     continue
@@ -242,23 +429,68 @@ class CollectionData:
         data_dir: Path,
         collection_id: str,
         table_types: list[type[CollectionTable]],
+        *,
+        time_range_us: tuple[int, int] | None = None,
+        pids: list[int] | None = None,
+        tgids: list[int] | None = None,
+        tables: list[str] | None = None,
+        columns: list[str] | None = None,
     ) -> "CollectionData":
-        collection_tables = dict[str, CollectionTable]()
-        type_map = _type_map(table_types)
-        dataframe_dirs = [
-            x for x in data_dir.iterdir()
-            if x.is_dir() and x.name in type_map
-        ]
-        for dataframe_dir in dataframe_dirs:
-            dfs = [
-                pl.read_parquet(x) for x in dataframe_dir.iterdir()
-                if x.is_file() and x.suffix == ".parquet" and x.name.startswith(collection_id)
+        """Loads a collection, each table is scanned the first time it is accessed.
+
+        Tables built on `LazyCollectionTable` stay lazy until their data is used.
+        `time_range_us`, `pids`, `tgids` and `columns` are pushed down into the parquet scans of
+        the tables they apply to, see `filter_table_scan`. `tables` limits which tables are
+        loaded at all. System info is always loaded in full.
+        """
+        type_map = {
+            name: table_type
+            for name, table_type in _type_map(table_types).items()
+            if tables is None or name in tables or table_type is SystemInfoTable
+        }
+        table_files = dict[str, tuple[list[Path], str]]()
+        if dataset.is_dataset(data_dir):
+            for name in type_map:
+                partitions = [
+                    partition for partition in dataset.table_partitions(data_dir, name)
+                    if dataset.partition_values(partition)[dataset.COLLECTION_ID_PARTITION].startswith(collection_id)
+                ]
+                # Throw explainable error
+                assert len(partitions) <= 1
+                if partitions:
+                    partition_id = dataset.partition_values(partitions[0])[dataset.COLLECTION_ID_PARTITION]
+                    files = dataset.partition_files(partitions[0])
+                    if files:
+                        table_files[name] = (files, partition_id)
+        else:
+            dataframe_dirs = [
+                x for x in data_dir.iterdir()
+                if x.is_dir() and x.name in type_map
             ]
-            # Throw explainable error
-            assert len(dfs) <= 1
-            if dfs:
-                collection_tables[dataframe_dir.name] = type_map[dataframe_dir.name].from_df(dfs[0])
-        return CollectionData(collection_tables)
+            for dataframe_dir in dataframe_dirs:
+                files = [
+                    x for x in dataframe_dir.iterdir()
+                    if x.is_file() and x.suffix == ".parquet" and x.name.startswith(collection_id)
+                ]
+                # Throw explainable error
+                assert len(files) <= 1
+                if files:
+                    table_files[dataframe_dir.name] = (files, files[0].name.split(".")[0])
+
+        def table_loader(table_type: type[CollectionTable], files: list[Path], file_id: str) -> Callable[[], CollectionTable]:
+            def load() -> CollectionTable:
+                table = scan_table_parquet(files, file_id)
+                if table_type is not SystemInfoTable:
+                    table = filter_table_scan(
+                        table, time_range_us=time_range_us, pids=pids, tgids=tgids, columns=columns,
+                    )
+                return table_type.from_lazy(table)
+            return load
+
+        return CollectionData(_LazyCollectionTables({
+            name: table_loader(type_map[name], files, file_id)
+            for name, (files, file_id) in table_files.items()
+        }))
 
 
 class GraphEngine:
@@ -389,7 +621,39 @@ class GraphEngine:
         self._cleared = True
 
 
-def cumulative_pma_as_pdf(table: pl.DataFrame, *, counter_column: str, counter_column_rename: str) -> pl.DataFrame:
+def _pmu_delta(column: str) -> pl.Expr:
+    # a counter below its previous reading was reset, it has counted from zero since
+    delta = pl.col(column) - pl.col(column).shift(1, fill_value=0).over("cpu")
+    return pl.when(delta < 0).then(pl.col(column)).otherwise(delta)
+
+
+def cumulative_pma_deltas(
+    table: pl.DataFrame | pl.LazyFrame,
+    *,
+    counter_column: str,
+    counter_column_rename: str,
+) -> pl.LazyFrame:
+    """Converts cumulative pmu readings of all cpus into per reading counts in a single plan.
+
+    Counts are scaled by enabled over running time to estimate the events missed while the
+    counter was multiplexed out, readings where it never ran have null counts.
+    `span_duration_us` is the time the counter was enabled since the previous reading.
+    """
+    # readings arrive in time order, windows keep that order within each cpu
+    return table.lazy().sort(UPTIME_TIMESTAMP, maintain_order=True).with_columns(
+        _pmu_delta(counter_column).alias(f"{counter_column_rename}_raw"),
+        _pmu_delta("pmu_enabled_time_us").alias("span_duration_us"),
+        _pmu_delta("pmu_running_time_us").alias("span_running_us"),
+    ).with_columns(
+        pl.when(
+            pl.col("span_running_us") > 0
+        ).then(
+            pl.col(f"{counter_column_rename}_raw") * pl.col("span_duration_us") / pl.col("span_running_us")
+        ).alias(counter_column_rename),
+    )
+
+
+def _pma_select(table: pl.DataFrame, counter_column: str, counter_column_rename: str) -> list[str]:
     cumulative_columns = [
         counter_column,
         "pmu_enabled_time_us",
@@ -401,63 +665,22 @@ def cumulative_pma_as_pdf(table: pl.DataFrame, *, counter_column: str, counter_c
         if column not in cumulative_columns
     ]
     final_select.extend([counter_column_rename, "span_duration_us"])
-    by_cpu_pdf_dfs = [
-        by_cpu_df.lazy().sort(UPTIME_TIMESTAMP).with_columns(
-            pl.col(counter_column).shift(1, fill_value=0).alias(f"{counter_column}_shifted"),
-            pl.col("pmu_running_time_us").shift(1, fill_value=0).alias("pmu_running_time_us_shifted"),
-            pl.col("pmu_enabled_time_us").shift(1, fill_value=0).alias("pmu_enabled_time_us_shifted"),
-        ).with_columns(
-            (pl.col(counter_column) - pl.col(f"{counter_column}_shifted")).alias(f"{counter_column_rename}_raw"),
-            (pl.col("pmu_running_time_us") - pl.col("pmu_running_time_us_shifted")).alias("span_duration_us"),
-        ).with_columns(
-            (
-                (
-                    pl.col("span_duration_us")
-                ) / (
-                    pl.col("pmu_enabled_time_us") - pl.col("pmu_enabled_time_us_shifted")
-                )
-            ).alias("sampling_scaling"),
-        ).with_columns(
-            (pl.col(f"{counter_column_rename}_raw") * pl.col("sampling_scaling")).alias(counter_column_rename),
-        ).select(final_select)
-        for _, by_cpu_df in table.group_by("cpu")
-    ]
-    return pl.concat(by_cpu_pdf_dfs).collect()
+    return final_select
+
+
+def cumulative_pma_as_pdf(table: pl.DataFrame, *, counter_column: str, counter_column_rename: str) -> pl.DataFrame:
+    return cumulative_pma_deltas(
+        table, counter_column=counter_column, counter_column_rename=counter_column_rename,
+    ).select(
+        _pma_select(table, counter_column, counter_column_rename)
+    ).collect()
 
 
 def cumulative_pma_as_cdf(table: pl.DataFrame, *, counter_column: str, counter_column_rename: str) -> pl.DataFrame:
-    cumulative_columns = [
-        counter_column,
-        "pmu_enabled_time_us",
-        "pmu_running_time_us",
-    ]
-    final_select = [
-        column
-        for column in table.columns
-        if column not in cumulative_columns
-    ]
-    final_select.extend([counter_column_rename, "span_duration_us"])
-    by_cpu_cdf_dfs = [
-        by_cpu_df.lazy().sort(UPTIME_TIMESTAMP).with_columns(
-            pl.col(counter_column).shift(1, fill_value=0).alias(f"{counter_column}_shifted"),
-            pl.col("pmu_running_time_us").shift(1, fill_value=0).alias("pmu_running_time_us_shifted"),
-            pl.col("pmu_enabled_time_us").shift(1, fill_value=0).alias("pmu_enabled_time_us_shifted"),
-        ).with_columns(
-            (pl.col(counter_column) - pl.col(f"{counter_column}_shifted")).alias(f"{counter_column_rename}_raw"),
-            (pl.col("pmu_running_time_us") - pl.col("pmu_running_time_us_shifted")).alias("span_duration_us"),
-        ).with_columns(
-            (
-                (
-                    pl.col("span_duration_us")
-                ) / (
-                    pl.col("pmu_enabled_time_us") - pl.col("pmu_enabled_time_us_shifted")
-                )
-            ).alias("sampling_scaling"),
-        ).with_columns(
-            (pl.col(f"{counter_column_rename}_raw") * pl.col("sampling_scaling")).alias(f"{counter_column_rename}_pdf"),
-        ).with_columns(
-            pl.col(f"{counter_column_rename}_pdf").cum_sum().alias(counter_column_rename),
-        ).select(final_select)
-        for _, by_cpu_df in table.group_by("cpu")
-    ]
-    return pl.concat(by_cpu_cdf_dfs).collect()
+    return cumulative_pma_deltas(
+        table, counter_column=counter_column, counter_column_rename=counter_column_rename,
+    ).with_columns(
+        pl.col(counter_column_rename).fill_null(0).cum_sum().over("cpu"),
+    ).select(
+        _pma_select(table, counter_column, counter_column_rename)
+    ).collect()